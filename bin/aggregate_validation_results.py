@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+"""Aggregate per-(sample, taxid) validation stats into validation_results.json.
+
+Inputs, read from ``--input-dir``:
+
+  *_extraction_stats.json   extracted read counts per (sample, taxid)
+  *.blast_stats.json        BLAST validation stats per (sample, taxid)
+  *.minimap2_stats.json     minimap2 validation stats per (sample, taxid)
+  *.report.txt              Kraken2 reports, read only for species names
+
+Writes ``validation_results.json`` and ``validation_summary.tsv``.
+
+Without ``--state`` every input is parsed (batch mode: one aggregation). With
+``--state`` the parsed entries and the taxid -> species map are kept in a JSON
+state file between calls, and a file is parsed again only when its name, mtime
+or size differ from the last time it was seen. A realtime aggregation then
+reads just the stats files that changed since the previous one, however many
+(sample, taxid) pairs the run has accumulated. A file that fails to parse is
+not recorded, so it is retried on the next call. The state file is locked for
+the whole read-fold-write so overlapping calls serialise.
+"""
+
+import argparse
+import fcntl
+import json
+import os
+import sys
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+STATE_VERSION = 1
+
+# (kind, filename suffix). Checked in order; extraction first because its
+# suffix is the most specific.
+KINDS = [
+    ("extraction", "_extraction_stats.json"),
+    ("blast", ".blast_stats.json"),
+    ("minimap2", ".minimap2_stats.json"),
+    ("kraken", ".report.txt"),
+]
+
+TSV_HEADER = "sample_id\ttaxid\tspecies\tmethod\tkraken_reads\thits\thit_rate\tavg_identity\tavg_coverage\tstatus\n"
+
+
+def write_atomic(filepath: str, text: str) -> None:
+    """Write text via a temporary file and rename."""
+    dir_name = os.path.dirname(filepath) or "."
+    os.makedirs(dir_name, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=dir_name, prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+        os.replace(tmp_path, filepath)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def new_state() -> Dict[str, Any]:
+    return {
+        "state_version": STATE_VERSION,
+        # filename -> [mtime_ns, size] of the version last folded in
+        "files": {},
+        # kind -> "sample_id|taxid" -> parsed stats
+        "entries": {"extraction": {}, "blast": {}, "minimap2": {}},
+        # taxid -> species name, first seen in any Kraken2 report
+        "kraken_names": {},
+    }
+
+
+def classify(name: str) -> Optional[str]:
+    for kind, suffix in KINDS:
+        if name.endswith(suffix):
+            return kind
+    return None
+
+
+def fingerprint(path: str) -> List[int]:
+    # Staged inputs are symlinks; stat() follows them to the producing task's
+    # file, whose mtime and size change whenever a new version is emitted.
+    st = os.stat(path)
+    return [st.st_mtime_ns, st.st_size]
+
+
+def parse_kraken_names(path: str) -> Dict[str, str]:
+    """Species-level taxid -> name from a Kraken2 report
+    (percent, cumul_reads, reads, rank, taxid, name)."""
+    names = {}
+    with open(path) as fh:
+        for line in fh:
+            parts = line.strip().split("\t")
+            if len(parts) >= 6 and parts[3].strip() == "S":
+                names.setdefault(parts[4].strip(), parts[5].strip())
+    return names
+
+
+def fold_inputs(state: Dict[str, Any], input_dir: str) -> Tuple[Dict[str, int], Dict[str, int], int]:
+    """Parse new or changed inputs into the state.
+
+    Returns (parse totals, parse failures, files skipped as unchanged).
+    """
+    totals = {"extraction": 0, "blast": 0, "minimap2": 0}
+    failures = {"extraction": 0, "blast": 0, "minimap2": 0}
+    skipped = 0
+
+    for name in sorted(os.listdir(input_dir)):
+        kind = classify(name)
+        if kind is None:
+            continue
+        path = os.path.join(input_dir, name)
+        try:
+            fp = fingerprint(path)
+        except OSError as e:
+            print(f"Warning: cannot stat {path}: {e}", file=sys.stderr)
+            continue
+        if state["files"].get(name) == fp:
+            skipped += 1
+            continue
+
+        if kind == "kraken":
+            try:
+                for tid, species in parse_kraken_names(path).items():
+                    state["kraken_names"].setdefault(tid, species)
+            except Exception as e:
+                print(f"Warning: Failed to parse Kraken2 report {path}: {e}", file=sys.stderr)
+                continue
+            state["files"][name] = fp
+            continue
+
+        totals[kind] += 1
+        try:
+            with open(path) as fh:
+                data = json.load(fh)
+            key = f"{data.get('sample_id', 'unknown')}|{data.get('taxid', 0)}"
+        except Exception as e:
+            failures[kind] += 1
+            print(f"Warning: Failed to parse {path}: {e}", file=sys.stderr)
+            continue
+        state["entries"][kind][key] = data
+        state["files"][name] = fp
+
+    return totals, failures, skipped
+
+
+def load_taxon_names(path: Optional[str]) -> Dict[str, str]:
+    """The authoritative {taxid: name} map Nanometa Live writes from the
+    watchlist. Present at launch and independent of which per-batch reports
+    reach a realtime aggregation, so it seeds the lookup ahead of Kraken2."""
+    names: Dict[str, str] = {}
+    if path and os.path.exists(path):
+        try:
+            with open(path) as fh:
+                for tid, name in json.load(fh).items():
+                    if name:
+                        names[str(tid)] = name
+        except Exception as e:
+            print(f"Warning: could not read taxon names {path}: {e}", file=sys.stderr)
+    return names
+
+
+def build_results(state: Dict[str, Any], taxid_to_species: Dict[str, str]) -> Dict[str, Dict[str, Any]]:
+    """Assemble the per-sample, per-taxid results from the parsed entries.
+
+    BLAST entries are laid down first and minimap2 folds into an existing
+    (sample, taxid) entry as extra fields, so a pair validated by both stays
+    a 'blast' entry rather than being replaced by a minimap2-only one.
+    """
+    results: Dict[str, Dict[str, Any]] = {}
+    extraction = state["entries"]["extraction"]
+
+    def split(key: str) -> Tuple[str, str]:
+        sample_id, taxid = key.rsplit("|", 1)
+        return sample_id, str(taxid)
+
+    for key, data in state["entries"]["blast"].items():
+        sample_id, taxid = split(key)
+        ext_data = extraction.get(key, {})
+        reads = ext_data.get("extracted_reads", data.get("total_reads", 0))
+        results.setdefault(sample_id, {})[taxid] = {
+            "taxid": int(taxid),
+            "species": taxid_to_species.get(taxid, ""),
+            "validation_method": "blast",
+            "kraken_reads": reads,
+            "extracted_reads": reads,
+            "blast_hits": data.get("blast_hits", 0),
+            "hit_rate": data.get("hit_rate", 0.0),
+            "avg_identity": data.get("avg_identity", 0.0),
+            "avg_coverage": data.get("avg_coverage", 0.0),
+            "validation_status": data.get("validation_status", "unknown"),
+        }
+
+    for key, data in state["entries"]["minimap2"].items():
+        sample_id, taxid = split(key)
+        sample = results.setdefault(sample_id, {})
+        if taxid in sample:
+            sample[taxid]["minimap2_mapped"] = data.get("mapped_reads", 0)
+            sample[taxid]["minimap2_hit_rate"] = data.get("hit_rate", 0.0)
+            sample[taxid]["minimap2_identity"] = data.get("avg_identity", 0.0)
+            sample[taxid]["minimap2_status"] = data.get("validation_status", "unknown")
+            continue
+        ext_data = extraction.get(key, {})
+        reads = ext_data.get("extracted_reads", data.get("total_reads", 0))
+        sample[taxid] = {
+            "taxid": int(taxid),
+            "species": taxid_to_species.get(taxid, ""),
+            "validation_method": "minimap2",
+            "kraken_reads": reads,
+            "extracted_reads": reads,
+            "mapped_reads": data.get("mapped_reads", 0),
+            "hit_rate": data.get("hit_rate", 0.0),
+            "avg_identity": data.get("avg_identity", 0.0),
+            "avg_coverage": data.get("avg_coverage", 0.0),
+            "avg_mapq": data.get("avg_mapq", 0.0),
+            "ref_name": data.get("ref_name", ""),
+            "ref_length": data.get("ref_length", 0),
+            "validation_status": data.get("validation_status", "unknown"),
+        }
+
+    return results
+
+
+def summarise(results: Dict[str, Dict[str, Any]]) -> Dict[str, int]:
+    statuses = [r.get("validation_status") for sample in results.values() for r in sample.values()]
+    return {
+        "total_samples": len(results),
+        "total_taxids_validated": len(statuses),
+        "confirmed": statuses.count("confirmed"),
+        "uncertain": statuses.count("uncertain"),
+        "rejected": statuses.count("rejected"),
+    }
+
+
+def summary_tsv(results: Dict[str, Dict[str, Any]]) -> str:
+    lines = [TSV_HEADER]
+    for sample_id, taxids in results.items():
+        for taxid, data in taxids.items():
+            hits = data.get("blast_hits", data.get("mapped_reads", 0))
+            lines.append(
+                f"{sample_id}\t{taxid}\t{data.get('species', '')}\t{data.get('validation_method', 'unknown')}\t"
+                f"{data.get('kraken_reads', 0)}\t{hits}\t{data.get('hit_rate', 0.0):.4f}\t"
+                f"{data.get('avg_identity', 0.0):.2f}\t{data.get('avg_coverage', 0.0):.4f}\t"
+                f"{data.get('validation_status', 'unknown')}\n"
+            )
+    return "".join(lines)
+
+
+@contextmanager
+def locked_state(path: Optional[str]) -> Iterator[Dict[str, Any]]:
+    """Yield the carried-forward state under an exclusive lock and save it on exit."""
+    if not path:
+        yield new_state()
+        return
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path + ".lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        state = new_state()
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path) as f:
+                loaded = json.load(f)
+            if loaded.get("state_version") == STATE_VERSION:
+                state = loaded
+            else:
+                print(f"WARNING: ignoring {path} with unknown state_version", file=sys.stderr)
+        yield state
+        write_atomic(path, json.dumps(state, separators=(",", ":")) + "\n")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--input-dir", default=".", help="Directory holding the staged inputs")
+    parser.add_argument("--validation-method", required=True)
+    parser.add_argument("--pipeline-version", default="dev")
+    parser.add_argument("--hit-threshold", type=float, default=0.5)
+    parser.add_argument("--identity-threshold", type=float, default=90.0)
+    parser.add_argument("--taxon-names", help="JSON {taxid: name} map that takes precedence over Kraken2 names")
+    parser.add_argument("--state", help="Carried-forward state JSON (created if missing)")
+    parser.add_argument("--outdir", default=".")
+    args = parser.parse_args()
+
+    with locked_state(args.state) as state:
+        totals, failures, skipped = fold_inputs(state, args.input_dir)
+        taxid_to_species = dict(state["kraken_names"])
+        taxid_to_species.update(load_taxon_names(args.taxon_names))
+        results = build_results(state, taxid_to_species)
+
+    # Report parse failure summary
+    total_files = sum(totals.values())
+    total_failures = sum(failures.values())
+    if total_failures > 0:
+        print(f"WARNING: {total_failures}/{total_files} validation stats files failed to parse:", file=sys.stderr)
+        for category, count in failures.items():
+            if count > 0:
+                print(f"  - {category}: {count}/{totals[category]} failed", file=sys.stderr)
+    if total_files > 0 and total_failures == total_files and not results:
+        print("ERROR: All validation stats files failed to parse - results will be empty!", file=sys.stderr)
+
+    summary = summarise(results)
+    output = {
+        "pipeline_version": args.pipeline_version,
+        "validation_method": args.validation_method,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "thresholds": {"hit_rate": args.hit_threshold, "identity": args.identity_threshold},
+        "results": results,
+        "summary": summary,
+    }
+    write_atomic(os.path.join(args.outdir, "validation_results.json"), json.dumps(output, indent=2))
+    write_atomic(os.path.join(args.outdir, "validation_summary.tsv"), summary_tsv(results))
+
+    print(
+        f"Aggregated validation results: {summary['total_samples']} samples, "
+        f"{summary['total_taxids_validated']} taxids "
+        f"({total_files} stats files parsed, {skipped} unchanged inputs skipped)",
+        file=sys.stderr,
+    )
+    print(
+        f"  Confirmed: {summary['confirmed']}, Uncertain: {summary['uncertain']}, Rejected: {summary['rejected']}",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,498 @@
+#!/usr/bin/env python3
+"""Run-so-far consensus for a (sample, taxid) from per-batch base counts.
+
+CONSENSUS_VALIDATION calls a consensus from one batch's reads. Calling it over
+every batch so far by merging the growing per-batch BAMs would cost the whole
+run's data on every batch. Instead each batch's alignments (reference name,
+position, CIGAR and read sequence of every mapped primary or supplementary
+record) are folded into a per-position base-count matrix -- A, C, G, T and N
+per reference position, uint32 -- and the depth-masked consensus is called
+from the matrix. Each position's call is kept beside the matrix and redone
+only over the windows a batch's alignments cover, with per-contig totals
+(callable positions, their depth, first and last) adjusted to match, so a
+batch costs its own alignments, whatever the run or reference length.
+
+Depth is the number of read bases at a position, as ``samtools depth`` counts
+it: deletions and reference skips add nothing, and insertions are not
+represented. A position at or above ``--min-depth`` is called as its most
+frequent base (A, C, G, T order breaks ties); anything below is N. The
+reported window is the contig with the most such positions, trimmed to its
+first and last callable position, as in CONSENSUS_VALIDATION.
+
+With ``--state`` the matrix and calls are carried between calls in flat
+binary files beside a JSON index, keyed by batch id: each call folds in only
+the batches the state has not seen. The files are mapped copy-on-write, so a
+call reads only the pages its windows touch, and saved by rewriting those
+windows in place: the new bytes and index go to a journal first, which a
+later call replays if a task is killed before the index is written. A state
+that is not a prefix of this call's batch list is ignored and the call
+recomputes from its inputs, writing a new generation of the files, and saves
+only when at least as complete as the state it replaces. A changed
+``--min-depth`` re-calls every position once.
+"""
+
+import argparse
+import fcntl
+import gzip
+import json
+import mmap
+import os
+import re
+import sys
+import tempfile
+from array import array
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+STATE_VERSION = 2
+
+BASES = "ACGTN"
+# Read bases -> matrix column; IUPAC codes and anything else count as N.
+BASE_CODES = bytes(
+    {ord("A"): 0, ord("C"): 1, ord("G"): 2, ord("T"): 3,
+     ord("a"): 0, ord("c"): 1, ord("g"): 2, ord("t"): 3}.get(i, 4) for i in range(256)
+)
+# Stored calls -> consensus bases; 0 marks a position below the minimum depth.
+CALL_BASES = bytes(ord("N") if i == 0 else i for i in range(256))
+CIGAR_OP = re.compile(rb"(\d+)([MIDNSHP=X])")
+COUNT_TYPE = "I" if array("I").itemsize == 4 else "L"
+
+Alignment = Tuple[str, int, List[Tuple[bytes, bytes]], bytes]
+Window = Tuple[int, int]
+
+
+def write_atomic(filepath: str, text: str) -> None:
+    """Write text via a temporary file and rename."""
+    dir_name = os.path.dirname(filepath) or "."
+    os.makedirs(dir_name, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=dir_name, prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+        os.replace(tmp_path, filepath)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def merge_windows(windows: Sequence[Window]) -> List[Window]:
+    """Sort and merge overlapping or adjacent [start, end) windows."""
+    merged: List[List[int]] = []
+    for start, end in sorted(windows):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [(start, end) for start, end in merged]
+
+
+class BaseCounts:
+    """Per-position A/C/G/T/N counts and depth-masked calls for every contig.
+
+    ``counts`` holds five uint32 per position and ``calls`` the called base
+    of each position, or 0 below ``min_depth``. ``summary`` holds, per contig,
+    [callable positions, depth summed over them, first, last callable
+    position]. Counts only grow, so a callable position stays callable and
+    ``first``/``last`` only move outwards. ``dirty`` records the windows
+    changed since the matrix was loaded, for ``save_state``.
+    """
+
+    def __init__(self, min_depth: int) -> None:
+        self.min_depth = min_depth
+        self.contigs: List[Tuple[str, int]] = []
+        self.offsets: Dict[str, int] = {}
+        self.lengths: Dict[str, int] = {}
+        self.total_length = 0
+        self.counts: Dict[str, Union[array, memoryview]] = {}
+        self.calls: Dict[str, Union[bytearray, memoryview]] = {}
+        self.summary: Dict[str, List[int]] = {}
+        self.dirty: Dict[str, List[Window]] = {}
+
+    @classmethod
+    def mapped(cls, min_depth: int, contigs: List[Tuple[str, int]], summary: Dict[str, List[int]],
+               counts: Optional[mmap.mmap], calls: Optional[mmap.mmap]) -> "BaseCounts":
+        """A matrix over copy-on-write mappings of saved count and call files."""
+        matrix = cls(min_depth)
+        counts_view = memoryview(counts).cast(COUNT_TYPE) if counts is not None else None
+        calls_view = memoryview(calls) if calls is not None else None
+        for name, length in contigs:
+            offset = matrix.total_length
+            matrix.offsets[name] = offset
+            matrix.lengths[name] = length
+            matrix.contigs.append((name, length))
+            matrix.total_length += length
+            matrix.counts[name] = counts_view[offset * 5:(offset + length) * 5] if length else array(COUNT_TYPE)
+            matrix.calls[name] = calls_view[offset:offset + length] if length else bytearray()
+            matrix.summary[name] = list(summary[name])
+        return matrix
+
+    def add_contig(self, name: str, length: int) -> None:
+        if name in self.offsets:
+            known = self.lengths[name]
+            if known != length:
+                raise ValueError(f"contig {name} is {length} bp here but {known} bp in earlier batches")
+            return
+        self.offsets[name] = self.total_length
+        self.lengths[name] = length
+        self.contigs.append((name, length))
+        self.total_length += length
+        self.counts[name] = array(COUNT_TYPE, bytes(4 * length * 5))
+        self.calls[name] = bytearray(length)
+        self.summary[name] = [0, 0, 0, 0]
+        self.dirty.setdefault(name, []).append((0, length))
+        if self.min_depth <= 0:
+            self._call(name, 0, length)
+
+    def add_batch(self, alignments: List[Alignment]) -> None:
+        """Count one batch's alignments and re-call the windows they cover."""
+        windows: Dict[str, List[Window]] = {}
+        for rname, pos, ops, _ in alignments:
+            span = sum(int(n) for n, op in ops if op in b"M=XDN")
+            end = min(pos - 1 + span, self.lengths[rname])
+            if end > pos - 1:
+                windows.setdefault(rname, []).append((pos - 1, end))
+        windows = {name: merge_windows(spans) for name, spans in windows.items()}
+        for name, spans in windows.items():
+            for start, end in spans:
+                self._uncall(name, start, end)
+        for alignment in alignments:
+            self.add_alignment(*alignment)
+        for name, spans in windows.items():
+            for start, end in spans:
+                self._call(name, start, end)
+            self.dirty.setdefault(name, []).extend(spans)
+
+    def add_alignment(self, rname: str, pos: int, ops: List[Tuple[bytes, bytes]], seq: bytes) -> None:
+        """Count the read bases of one alignment at the positions they align to."""
+        counts = self.counts[rname]
+        codes = seq.translate(BASE_CODES)
+        index = (pos - 1) * 5
+        q = 0
+        for length, op in ops:
+            n = int(length)
+            if op in b"M=X":
+                for code in codes[q:q + n]:
+                    counts[index + code] += 1
+                    index += 5
+                q += n
+            elif op in b"IS":
+                q += n
+            elif op in b"DN":
+                index += 5 * n
+
+    def _uncall(self, name: str, start: int, end: int) -> None:
+        """Take the callable positions in [start, end) out of the contig's totals."""
+        counts, calls, summary = self.counts[name], self.calls[name], self.summary[name]
+        for position in range(start, end):
+            if calls[position]:
+                summary[0] -= 1
+                summary[1] -= sum(counts[position * 5:position * 5 + 5])
+
+    def _call(self, name: str, start: int, end: int) -> None:
+        """Call [start, end) from the counts and add it to the contig's totals."""
+        counts, calls, summary = self.counts[name], self.calls[name], self.summary[name]
+        min_depth = self.min_depth
+        for position in range(start, end):
+            column = counts[position * 5:position * 5 + 5]
+            depth = sum(column)
+            if depth >= min_depth:
+                summary[0] += 1
+                summary[1] += depth
+                if not summary[2] or position + 1 < summary[2]:
+                    summary[2] = position + 1
+                summary[3] = max(summary[3], position + 1)
+                calls[position] = ord(BASES[max(range(5), key=lambda i: (column[i], -i))])
+            else:
+                calls[position] = 0
+
+    def recall(self, min_depth: int) -> None:
+        """Re-call every position at a new minimum depth."""
+        self.min_depth = min_depth
+        for name, length in self.contigs:
+            self.summary[name] = [0, 0, 0, 0]
+            self._call(name, 0, length)
+            self.dirty.setdefault(name, []).append((0, length))
+
+
+def fold_alignments(matrix: BaseCounts, path: str) -> None:
+    """Fold one batch's ``@SQ name length`` / ``rname pos cigar seq`` file."""
+    alignments: List[Alignment] = []
+    with gzip.open(path, "rb") as f:
+        for line in f:
+            cols = line.rstrip(b"\r\n").split(b"\t")
+            if cols[0] == b"@SQ":
+                if len(cols) >= 3:
+                    matrix.add_contig(cols[1].decode(), int(cols[2]))
+            elif len(cols) >= 4 and cols[0] != b"*" and cols[3] != b"*":
+                rname = cols[0].decode()
+                if rname in matrix.offsets:
+                    alignments.append((rname, int(cols[1]), CIGAR_OP.findall(cols[2]), cols[3]))
+    matrix.add_batch(alignments)
+
+
+def reads_of(stats_path: str) -> Tuple[int, int]:
+    """(total_reads, mapped_reads) of one batch's consensus stats JSON."""
+    try:
+        with open(stats_path) as f:
+            stats = json.load(f)
+        return int(stats.get("total_reads", 0)), int(stats.get("mapped_reads", 0))
+    except (OSError, ValueError):
+        return 0, 0
+
+
+def new_state(min_depth: int) -> Dict[str, Any]:
+    return {
+        "state_version": STATE_VERSION,
+        "batches": [],
+        "contigs": [],
+        "summary": {},
+        "min_depth": min_depth,
+        "generation": 0,
+        "total_reads": 0,
+        "mapped_reads": 0,
+    }
+
+
+def fold_batches(state: Dict[str, Any], matrix: BaseCounts, batches: List[Tuple[str, str, str]]) -> List[str]:
+    """Fold the batches the state has not seen. Returns the ids folded."""
+    known = set(state["batches"])
+    folded = []
+    for batch_id, alignments_path, stats_path in batches:
+        if batch_id in known:
+            continue
+        known.add(batch_id)
+        fold_alignments(matrix, alignments_path)
+        total, mapped = reads_of(stats_path)
+        state["total_reads"] += total
+        state["mapped_reads"] += mapped
+        state["batches"].append(batch_id)
+        folded.append(batch_id)
+    state["contigs"] = [[name, length] for name, length in matrix.contigs]
+    state["summary"] = matrix.summary
+    return folded
+
+
+def call_consensus(matrix: BaseCounts) -> Dict[str, Any]:
+    """Depth-masked consensus over the contig with the most callable positions."""
+    best = None
+    for name, _ in matrix.contigs:
+        callable_positions = matrix.summary[name][0]
+        if callable_positions > 0 and (best is None or callable_positions > best[1]):
+            best = (name, callable_positions)
+
+    if best is None:
+        return {"ref_name": "unknown", "ref_length": 0, "covered_start": 0, "covered_end": 0,
+                "mean_depth": 0.0, "sequence": ""}
+
+    name, _ = best
+    covered, depth_sum, first, last = matrix.summary[name]
+    sequence = bytes(matrix.calls[name][first - 1:last]).translate(CALL_BASES).decode()
+    return {"ref_name": name, "ref_length": matrix.lengths[name], "covered_start": first, "covered_end": last,
+            "mean_depth": depth_sum / covered, "sequence": sequence}
+
+
+def counts_path(state_path: str, generation: int) -> str:
+    return f"{state_path}.g{generation}.counts"
+
+
+def calls_path(state_path: str, generation: int) -> str:
+    return f"{state_path}.g{generation}.calls"
+
+
+def journal_path(state_path: str) -> str:
+    return f"{state_path}.journal"
+
+
+def map_private(path: str, size: int) -> Optional[mmap.mmap]:
+    """Copy-on-write mapping of the first ``size`` bytes of ``path`` (None if empty)."""
+    if size == 0:
+        return None
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size < size:
+            raise EOFError(path)
+        return mmap.mmap(f.fileno(), size, access=mmap.ACCESS_COPY)
+
+
+def replay_journal(path: str) -> None:
+    """Finish a save that wrote its journal but may not have written its index."""
+    journal = journal_path(path)
+    if not os.path.exists(journal):
+        return
+    with open(journal, "rb") as f:
+        header = json.loads(f.readline())
+        generation = header["index"]["generation"]
+        for kind, offset, length in header["writes"]:
+            target = counts_path(path, generation) if kind == "counts" else calls_path(path, generation)
+            apply_write(target, offset, f.read(length))
+    write_atomic(path, json.dumps(header["index"], separators=(",", ":")) + "\n")
+    os.unlink(journal)
+
+
+def apply_write(target: str, offset: int, data: bytes) -> None:
+    fd = os.open(target, os.O_WRONLY | os.O_CREAT, 0o644)
+    try:
+        os.pwrite(fd, data, offset)
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def locked_state(path: Optional[str], min_depth: int) -> Iterator[Tuple[Optional[Dict[str, Any]], Optional[BaseCounts]]]:
+    """Yield the carried-forward state and matrix (None if absent) under an exclusive lock."""
+    if not path:
+        yield None, None
+        return
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path + ".lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        replay_journal(path)
+        state, matrix = None, None
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path) as f:
+                loaded = json.load(f)
+            if loaded.get("state_version") == STATE_VERSION:
+                contigs = [(name, length) for name, length in loaded["contigs"]]
+                size = sum(length for _, length in contigs)
+                try:
+                    counts = map_private(counts_path(path, loaded["generation"]), size * 5 * 4)
+                    calls = map_private(calls_path(path, loaded["generation"]), size)
+                    matrix = BaseCounts.mapped(loaded["min_depth"], contigs, loaded["summary"], counts, calls)
+                    state = loaded
+                except (OSError, EOFError):
+                    print(f"WARNING: ignoring {path}: its count or call file is missing or short", file=sys.stderr)
+                if matrix is not None and matrix.min_depth != min_depth:
+                    matrix.recall(min_depth)
+                    state["min_depth"] = min_depth
+                    state["summary"] = matrix.summary
+            else:
+                print(f"WARNING: ignoring {path} with unknown state_version", file=sys.stderr)
+        yield state, matrix
+
+
+def save_state(path: str, state: Dict[str, Any], matrix: BaseCounts, in_place: bool) -> None:
+    """Save the state; ``in_place`` rewrites only the matrix's dirty windows.
+
+    In place, the new bytes and index go to a journal before they are written
+    over the current generation, so a killed task leaves a journal that the
+    next call replays. Otherwise the whole matrix goes to a new generation,
+    written before the index that names it.
+    """
+    if in_place:
+        generation = state["generation"]
+        writes = []
+        data = []
+        for name, windows in matrix.dirty.items():
+            offset = matrix.offsets[name]
+            for start, end in merge_windows(windows):
+                chunk = matrix.counts[name][start * 5:end * 5].tobytes()
+                writes.append(["counts", (offset + start) * 5 * 4, len(chunk)])
+                data.append(chunk)
+                chunk = bytes(matrix.calls[name][start:end])
+                writes.append(["calls", offset + start, len(chunk)])
+                data.append(chunk)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix=".", suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(json.dumps({"index": state, "writes": writes}, separators=(",", ":")).encode() + b"\n")
+            for chunk in data:
+                f.write(chunk)
+        os.replace(tmp_path, journal_path(path))
+        for (kind, offset, _), chunk in zip(writes, data):
+            apply_write(counts_path(path, generation) if kind == "counts" else calls_path(path, generation), offset, chunk)
+        write_atomic(path, json.dumps(state, separators=(",", ":")) + "\n")
+        os.unlink(journal_path(path))
+        return
+
+    previous = state["generation"]
+    state["generation"] = previous + 1
+    for target, chunks in ((counts_path(path, state["generation"]), (matrix.counts[name] for name, _ in matrix.contigs)),
+                           (calls_path(path, state["generation"]), (matrix.calls[name] for name, _ in matrix.contigs))):
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix=".", suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            for chunk in chunks:
+                f.write(chunk)
+        os.replace(tmp_path, target)
+    write_atomic(path, json.dumps(state, separators=(",", ":")) + "\n")
+    for stale in (counts_path(path, previous), calls_path(path, previous)):
+        if os.path.exists(stale):
+            os.unlink(stale)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--prefix", required=True, help="Output file prefix")
+    parser.add_argument("--sample-id", required=True)
+    parser.add_argument("--taxid", required=True)
+    parser.add_argument("--batch-ids", nargs="+", required=True, help="One id per batch, in accumulation order")
+    parser.add_argument("--batch-files", nargs="+", required=True,
+                        help="Per-batch consensus alignment tables (.consensus_alignments.tsv.gz), in id order")
+    parser.add_argument("--batch-stats", nargs="+", required=True, help="Per-batch consensus stats JSONs, in id order")
+    parser.add_argument("--state", help="Carried-forward state JSON (created if missing)")
+    parser.add_argument("--min-depth", type=int, default=10)
+    args = parser.parse_args()
+
+    if not (len(args.batch_ids) == len(args.batch_files) == len(args.batch_stats)):
+        print("ERROR: --batch-ids, --batch-files and --batch-stats must have the same length", file=sys.stderr)
+        sys.exit(1)
+    batches = list(zip(args.batch_ids, args.batch_files, args.batch_stats))
+    input_ids = list(dict.fromkeys(args.batch_ids))
+
+    try:
+        with locked_state(args.state, args.min_depth) as (carried, carried_matrix):
+            state, matrix = carried, carried_matrix
+            if state is not None and state["batches"] != input_ids[:len(state["batches"])]:
+                print(f"State holds batches {state['batches']} that are not a prefix of this call's; "
+                      "recomputing from inputs", file=sys.stderr)
+                state, matrix = None, None
+            stale = carried is not None and state is None and len(input_ids) < len(carried["batches"])
+            if state is None:
+                state, matrix = new_state(args.min_depth), BaseCounts(args.min_depth)
+                if carried is not None:
+                    state["generation"] = carried["generation"]
+
+            folded = fold_batches(state, matrix, batches)
+            if args.state and not stale:
+                save_state(args.state, state, matrix, in_place=state is carried)
+    except ValueError as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    call = call_consensus(matrix)
+    sequence = call["sequence"]
+    trimmed = sequence.strip("N")
+    with open(f"{args.prefix}.consensus.fasta", "w") as out:
+        if trimmed:
+            out.write(f">{args.prefix} ref={call['ref_name']} region={call['covered_start']}-{call['covered_end']}\n")
+            for i in range(0, len(trimmed), 70):
+                out.write(trimmed[i:i + 70] + "\n")
+        else:
+            out.write(f">{args.prefix} no_consensus\n")
+
+    stats = {
+        "sample_id": args.sample_id,
+        "taxid": int(args.taxid),
+        "validation_method": "consensus",
+        "ref_name": call["ref_name"],
+        "ref_length": call["ref_length"],
+        "covered_start": call["covered_start"],
+        "covered_end": call["covered_end"],
+        "span": len(trimmed),
+        "mean_depth": round(call["mean_depth"], 2),
+        "min_depth_threshold": args.min_depth,
+        "n_count": trimmed.count("N"),
+        "consensus_length": len(trimmed),
+        "total_reads": state["total_reads"],
+        "mapped_reads": state["mapped_reads"],
+        "num_batches": len(state["batches"]),
+    }
+    with open(f"{args.prefix}.consensus_stats.json", "w") as out:
+        json.dump(stats, out, indent=2)
+        out.write("\n")
+
+    print(f"Folded {len(folded)} new batch(es); {len(state['batches'])} in total; "
+          f"consensus {len(trimmed)} bp over {call['ref_name']}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""Extract the reads of every watched taxid from one batch in a single pass.
+
+The Kraken2 per-read output is read once into a read_id -> taxid map covering
+only the watched taxids (counting classified reads on the way), then the FASTQ
+is streamed once and each record is routed to its taxid's output. Output is
+compressed in fixed-size chunks on a thread pool -- zlib releases the GIL --
+and each chunk is written as its own gzip member in order, which is a valid
+gzip stream (as pigz and bgzip produce) that every reader accepts.
+
+With ``--clade-index`` (taxid -> watched taxid, built from the batch's
+Kraken2 report by the validation subworkflow) reads assigned anywhere in a
+watched taxon's subtree -- strains, subspecies -- are extracted with it. The
+index only adds entries to the lookup map, so clade extraction costs the same
+single pass as exact matching.
+
+For each watched taxid an extraction stats JSON is always written; the FASTQ
+only when at least one read was assigned to the taxid, so validators are not
+scheduled on empty input.
+"""
+
+import argparse
+import gzip
+import json
+import os
+import sys
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import IO, Deque, Dict, List, Tuple
+
+CHUNK_BYTES = 4 * 1024 * 1024
+
+
+def open_text(path: str) -> IO[bytes]:
+    with open(path, "rb") as f:
+        magic = f.read(2)
+    return gzip.open(path, "rb") if magic == b"\x1f\x8b" else open(path, "rb")
+
+
+def read_clade_index(path: str, taxids: List[str]) -> Dict[str, str]:
+    """Lookup map from the clade index, restricted to this task's taxids."""
+    watched = {taxid: taxid for taxid in taxids}
+    with open(path) as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) >= 2 and fields[1] in watched and fields[0] not in watched:
+                watched[fields[0]] = fields[1]
+    return watched
+
+
+def read_assignments(kraken_output: str, watched: Dict[str, str]) -> Tuple[Dict[bytes, str], Dict[str, int], int]:
+    """Map read ids to their watched taxid.
+
+    Returns (read_id -> output taxid, reads per watched taxid, classified reads).
+    Counts are of assignment lines, as the per-taxid extraction counted them.
+    """
+    assignments: Dict[bytes, str] = {}
+    counts = {taxid: 0 for taxid in set(watched.values())}
+    classified = 0
+    with open(kraken_output, "rb") as f:
+        for line in f:
+            cols = line.rstrip(b"\r\n").split(b"\t")
+            if len(cols) < 3 or cols[0] != b"C":
+                continue
+            classified += 1
+            target = watched.get(cols[2].decode())
+            if target is not None:
+                assignments[cols[1]] = target
+                counts[target] += 1
+    return assignments, counts, classified
+
+
+class ChunkedGzipWriter:
+    """Per-taxid gzip outputs compressed on a shared pool, written in order."""
+
+    def __init__(self, paths: Dict[str, str], workers: int, level: int) -> None:
+        self.paths = paths
+        self.level = level
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.max_pending = 2 * workers
+        self.buffers: Dict[str, List[bytes]] = {taxid: [] for taxid in paths}
+        self.sizes: Dict[str, int] = {taxid: 0 for taxid in paths}
+        self.pending: Deque[Tuple[str, Future]] = deque()
+        self.handles: Dict[str, IO[bytes]] = {}
+
+    def write(self, taxid: str, record: bytes) -> None:
+        self.buffers[taxid].append(record)
+        self.sizes[taxid] += len(record)
+        if self.sizes[taxid] >= CHUNK_BYTES:
+            self._submit(taxid)
+
+    def _submit(self, taxid: str) -> None:
+        data = b"".join(self.buffers[taxid])
+        self.buffers[taxid] = []
+        self.sizes[taxid] = 0
+        self.pending.append((taxid, self.pool.submit(gzip.compress, data, self.level, mtime=0)))
+        while len(self.pending) > self.max_pending:
+            self._drain_one()
+
+    def _drain_one(self) -> None:
+        taxid, future = self.pending.popleft()
+        if taxid not in self.handles:
+            self.handles[taxid] = open(self.paths[taxid], "wb")
+        self.handles[taxid].write(future.result())
+
+    def close(self) -> None:
+        for taxid in self.paths:
+            if self.sizes[taxid]:
+                self._submit(taxid)
+        while self.pending:
+            self._drain_one()
+        self.pool.shutdown()
+        for handle in self.handles.values():
+            handle.close()
+
+
+def route_reads(reads: str, assignments: Dict[bytes, str], writer: ChunkedGzipWriter) -> Dict[str, int]:
+    """Stream the FASTQ once, sending each assigned record to its taxid's output."""
+    written: Dict[str, int] = {}
+    with open_text(reads) as f:
+        while True:
+            header = f.readline()
+            if not header:
+                break
+            record = header + f.readline() + f.readline() + f.readline()
+            # Same name rule as seqtk subseq: the id ends at the first whitespace.
+            name = header[1:].split(None, 1)[0] if len(header) > 1 else b""
+            taxid = assignments.get(name)
+            if taxid is not None:
+                if not record.endswith(b"\n"):
+                    record += b"\n"
+                writer.write(taxid, record)
+                written[taxid] = written.get(taxid, 0) + 1
+    return written
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reads", required=True, help="Classified reads FASTQ (optionally gzipped)")
+    parser.add_argument("--kraken-output", required=True, help="Kraken2 per-read output")
+    parser.add_argument("--taxids", nargs="+", required=True, help="Watched taxids")
+    parser.add_argument("--clade-index", help="TSV of taxid -> watched taxid; extracts whole subtrees")
+    parser.add_argument("--prefix", required=True, help="Output file prefix")
+    parser.add_argument("--sample-id", required=True)
+    parser.add_argument("--threads", type=int, default=1, help="Compression threads")
+    parser.add_argument("--compression-level", type=int, default=6)
+    args = parser.parse_args()
+
+    taxids = list(dict.fromkeys(str(t) for t in args.taxids))
+    watched = read_clade_index(args.clade_index, taxids) if args.clade_index else {taxid: taxid for taxid in taxids}
+    assignments, counts, classified = read_assignments(args.kraken_output, watched)
+
+    paths = {taxid: f"{args.prefix}_taxid{taxid}.fastq.gz" for taxid in taxids if counts[taxid] > 0}
+    written: Dict[str, int] = {}
+    if paths:
+        writer = ChunkedGzipWriter(paths, max(1, args.threads), args.compression_level)
+        written = route_reads(args.reads, assignments, writer)
+        writer.close()
+        # A taxid whose assigned reads are all missing from the FASTQ still
+        # gets a (valid, empty) file, as seqtk subseq | gzip produced.
+        for path in paths.values():
+            if not os.path.exists(path):
+                with open(path, "wb") as f:
+                    f.write(gzip.compress(b"", args.compression_level, mtime=0))
+
+    for taxid in taxids:
+        extracted = counts[taxid]
+        stats = {
+            "sample_id": args.sample_id,
+            "taxid": int(taxid),
+            "extracted_reads": extracted,
+            "total_classified_reads": classified,
+            "extraction_rate": round(extracted / classified, 6) if classified > 0 else 0.0,
+            "include_descendants": bool(args.clade_index),
+            "source_file": os.path.basename(args.reads),
+            "kraken_output": os.path.basename(args.kraken_output),
+        }
+        with open(f"{args.prefix}_taxid{taxid}_extraction_stats.json", "w") as out:
+            json.dump(stats, out, indent=4)
+            out.write("\n")
+        if extracted > 0:
+            print(f"Extracted {extracted} reads for taxid {taxid} from sample {args.prefix} "
+                  f"({written.get(taxid, 0)} found in the FASTQ)", file=sys.stderr)
+        else:
+            print(f"No reads found for taxid {taxid} in sample {args.prefix}; "
+                  "skipping validation for this batch", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
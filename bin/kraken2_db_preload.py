@@ -0,0 +1,447 @@
+#!/usr/bin/env python3
+"""Warm a Kraken2 database into the page cache and verify what stayed resident.
+
+KRAKEN2_DB_PRELOAD used to ``dd`` ``hash.k2d`` sequentially and report
+success without looking at the page cache afterwards. On a node whose cache
+cannot hold the database (cgroup memory limits, a busy node, a network
+filesystem that does not cache) the read costs minutes and warms little,
+and ``kraken2 --memory-mapping`` then faults every lookup in from disk.
+
+This preloader:
+
+  * advises the kernel (``posix_fadvise(WILLNEED)``) and, with
+    ``--method read``, reads every file in parallel ranges, one ``pread``
+    stream per thread, so a striped or network filesystem sees several
+    requests in flight instead of one;
+  * measures residency with ``mincore(2)`` before and after, per file;
+  * writes a JSON report (bytes, resident bytes before/after, seconds,
+    throughput). Low residency after a full read is reported
+    (``low_residency``), not acted on: mincore() sees only this task's view
+    of the cache, and per-process loading needs a full database copy per
+    fork, which a node that could not cache one copy holds even less.
+
+The size guard compares ``hash.k2d`` with ``--max-fraction`` of the memory
+this task can actually use: MemAvailable, capped by the cgroup memory limit
+(``memory.max``; ``memory.limit_in_bytes`` on cgroup v1), since page cache
+is charged to the cgroup. Above it, nothing is read (pages would be evicted
+as fast as they load).
+
+Locking is not done here: an ``mlock`` ends with the process that holds it,
+and this one exits when the cache is warm. ``lock_budgeted`` is used by
+``kraken2_server.py``, which keeps the database mapped for the session; the
+report carries RLIMIT_MEMLOCK so a lock budget can be sized for the node.
+"""
+
+import argparse
+import ctypes
+import ctypes.util
+import json
+import mmap
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+VERSION = "1.0.0"
+
+DB_FILES = ("hash.k2d", "opts.k2d", "taxo.k2d")
+# Files every kraken2 process touches whole; they are locked first.
+LOCK_ORDER = ("opts.k2d", "taxo.k2d", "hash.k2d")
+MIB = 1024 * 1024
+READ_BUFFER = 4 * MIB
+
+_PROT_READ = 0x1
+_MAP_SHARED = 0x1
+_MAP_FAILED = ctypes.c_void_p(-1).value
+# mincore() sets bit 0 for a resident page; other bits are platform extras.
+_RESIDENT_BIT = bytes(b & 1 for b in range(256))
+
+
+def _libc() -> Optional[ctypes.CDLL]:
+    name = ctypes.util.find_library("c")
+    try:
+        libc = ctypes.CDLL(name, use_errno=True)
+    except OSError:
+        return None
+    libc.mmap.restype = ctypes.c_void_p
+    libc.mmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int,
+                          ctypes.c_int, ctypes.c_int, ctypes.c_long]
+    libc.munmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+    libc.mincore.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_void_p]
+    libc.mlock.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+    return libc
+
+
+LIBC = _libc()
+
+
+def parse_size(text: str) -> int:
+    """Parse a byte count with an optional K/M/G/T suffix (powers of 1024)."""
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMGT]?)i?B?\s*", str(text), re.IGNORECASE)
+    if not match:
+        raise ValueError(f"not a size: {text!r}")
+    scale = 1024 ** " KMGT".index(match.group(2).upper() or " ")
+    return int(float(match.group(1)) * scale)
+
+
+def mem_available() -> Optional[int]:
+    """MemAvailable in bytes, or total RAM where /proc/meminfo is absent."""
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def cgroup_memory_limit() -> Optional[int]:
+    """Tightest memory limit on this process's cgroup, in bytes; None if unlimited.
+
+    Walks from the process's own cgroup up to the mount root, so a limit
+    set on a parent (a batch scheduler's job slice) counts too. cgroup v2
+    (``memory.max``) first, then the v1 memory controller.
+    """
+    try:
+        with open("/proc/self/cgroup") as f:
+            entries = [line.rstrip("\n").split(":", 2) for line in f]
+    except OSError:
+        return None
+    if os.path.isfile("/sys/fs/cgroup/cgroup.controllers"):
+        mount, limit_file = "/sys/fs/cgroup", "memory.max"
+        relative = next((path for hid, _, path in entries if hid == "0"), None)
+    else:
+        mount, limit_file = "/sys/fs/cgroup/memory", "memory.limit_in_bytes"
+        relative = next((path for _, controllers, path in entries if "memory" in controllers.split(",")), None)
+    if relative is None or not os.path.isdir(mount):
+        return None
+    directory = os.path.normpath(os.path.join(mount, relative.lstrip("/")))
+    # Inside a cgroup namespace the listed path need not exist under the
+    # mount; the mount root is then the process's own cgroup.
+    if not os.path.isdir(directory):
+        directory = mount
+    limits = []
+    while True:
+        limits.append(_read_limit(os.path.join(directory, limit_file)))
+        if directory == mount:
+            break
+        directory = os.path.dirname(directory)
+    limits = [limit for limit in limits if limit is not None]
+    return min(limits) if limits else None
+
+
+def _read_limit(path: str) -> Optional[int]:
+    """A cgroup memory limit file's value; None for "max" or v1's near-LONG_MAX."""
+    try:
+        with open(path) as f:
+            value = f.read().strip()
+    except OSError:
+        return None
+    return int(value) if value.isdigit() and int(value) < 1 << 60 else None
+
+
+def memlock_limit() -> Optional[int]:
+    """Soft RLIMIT_MEMLOCK in bytes; None when unlimited or unknown."""
+    try:
+        import resource
+        soft, _ = resource.getrlimit(resource.RLIMIT_MEMLOCK)
+    except (ImportError, AttributeError, ValueError, OSError):
+        return None
+    return None if soft == resource.RLIM_INFINITY else soft
+
+
+# ---------------------------------------------------------------------------
+# Residency
+# ---------------------------------------------------------------------------
+
+def map_shared(path: str) -> Optional[Tuple[int, int]]:
+    """Map ``path`` read-only and shared; (address, length) or None.
+
+    The pages of a shared file mapping are the page cache's own, so an
+    ``mlock`` on them pins the pages every ``kraken2 --memory-mapping``
+    reads. Python's ``mmap`` only exposes an address for a writable buffer,
+    and a private writable mapping that is locked gets a private anonymous
+    copy of every page instead. The mapping lives until ``LIBC.munmap``.
+    """
+    size = os.path.getsize(path)
+    if LIBC is None or size == 0:
+        return None
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        addr = LIBC.mmap(None, size, _PROT_READ, _MAP_SHARED, fd, 0)
+    finally:
+        os.close(fd)
+    if addr in (None, _MAP_FAILED):
+        return None
+    return addr, size
+
+
+def resident_bytes(path: str) -> Optional[int]:
+    """Bytes of ``path`` currently in the page cache (mincore), or None.
+
+    Maps the file without touching it, so the measurement itself faults
+    nothing in.
+    """
+    size = os.path.getsize(path)
+    if size == 0:
+        return 0
+    mapping = map_shared(path)
+    if mapping is None:
+        return None
+    addr, size = mapping
+    try:
+        pages = (size + mmap.PAGESIZE - 1) // mmap.PAGESIZE
+        vec = (ctypes.c_ubyte * pages)()
+        if LIBC.mincore(addr, size, vec) != 0:
+            return None
+        resident = bytes(vec).translate(_RESIDENT_BIT).count(1)
+    finally:
+        LIBC.munmap(addr, size)
+    return min(size, resident * mmap.PAGESIZE)
+
+
+# ---------------------------------------------------------------------------
+# Warming
+# ---------------------------------------------------------------------------
+
+def advise_willneed(fd: int, size: int) -> bool:
+    """Start asynchronous readahead of the whole file; False if unsupported."""
+    if not hasattr(os, "posix_fadvise"):
+        return False
+    try:
+        os.posix_fadvise(fd, 0, size, os.POSIX_FADV_WILLNEED)
+    except OSError:
+        return False
+    return True
+
+
+def ranges(size: int, chunk: int) -> List[Tuple[int, int]]:
+    """Split [0, size) into (offset, length) pieces of at most ``chunk``."""
+    return [(offset, min(chunk, size - offset)) for offset in range(0, size, chunk)]
+
+
+def read_parallel(path: str, threads: int, chunk: int) -> int:
+    """Read ``path`` once through the page cache in parallel ranges.
+
+    Each range is a sequential ``pread`` loop into a per-thread buffer, so
+    the kernel's readahead still sees sequential streams. Returns the bytes
+    read.
+    """
+    size = os.path.getsize(path)
+    local = threading.local()
+    fd = os.open(path, os.O_RDONLY)
+
+    def read_range(piece: Tuple[int, int]) -> int:
+        if not hasattr(local, "buffer"):
+            local.buffer = bytearray(READ_BUFFER)
+        offset, length = piece
+        end = offset + length
+        done = 0
+        while offset < end:
+            view = memoryview(local.buffer)[:min(READ_BUFFER, end - offset)]
+            n = os.preadv(fd, [view], offset) if hasattr(os, "preadv") else len(os.pread(fd, len(view), offset))
+            if n <= 0:
+                break
+            offset += n
+            done += n
+        return done
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, threads)) as pool:
+            return sum(pool.map(read_range, ranges(size, chunk)))
+    finally:
+        os.close(fd)
+
+
+def lock_budgeted(maps: Sequence[Tuple[str, int, int]], budget: Optional[int]) -> int:
+    """mlock mapped database files within ``budget`` bytes (None = all).
+
+    ``maps`` holds (file name, address, length) of live mappings. Files are
+    locked in LOCK_ORDER -- the small option and taxonomy files every run
+    reads whole, then as much of ``hash.k2d`` as the budget leaves, from the
+    start, page-aligned. Returns the bytes locked; a refused lock is
+    reported on stderr and ends locking.
+    """
+    if LIBC is None:
+        return 0
+    order = {name: i for i, name in enumerate(LOCK_ORDER)}
+    remaining = budget
+    locked = 0
+    for name, addr, length in sorted(maps, key=lambda m: order.get(m[0], len(order))):
+        want = length if remaining is None else min(length, remaining - remaining % mmap.PAGESIZE)
+        if want <= 0:
+            break
+        if LIBC.mlock(ctypes.c_void_p(addr), ctypes.c_size_t(want)) != 0:
+            err = ctypes.get_errno()
+            print(f"WARNING: mlock of {want} bytes of {name} failed ({os.strerror(err)}); "
+                  "pages stay mapped but can be evicted", file=sys.stderr)
+            break
+        locked += want
+        if remaining is not None:
+            remaining -= want
+    return locked
+
+
+# ---------------------------------------------------------------------------
+# Preload
+# ---------------------------------------------------------------------------
+
+def _fraction(part: Optional[int], whole: int) -> Optional[float]:
+    if part is None:
+        return None
+    return round(part / whole, 4) if whole else 1.0
+
+
+def preload(
+    db: str,
+    method: str = "read",
+    threads: int = 4,
+    chunk: int = 64 * MIB,
+    max_fraction: float = 0.7,
+    min_resident_fraction: float = 0.9,
+) -> Dict[str, Any]:
+    """Warm the database files and return the residency report."""
+    cgroup_limit = cgroup_memory_limit()
+    available = mem_available()
+    if cgroup_limit is not None:
+        available = cgroup_limit if available is None else min(available, cgroup_limit)
+    report: Dict[str, Any] = {
+        "version": VERSION,
+        "db": os.path.realpath(db),
+        "method": method,
+        "threads": threads,
+        "mem_available_bytes": mem_available(),
+        "cgroup_memory_limit_bytes": cgroup_limit,
+        "memory_budget_bytes": available,
+        "memlock_limit_bytes": memlock_limit(),
+        "files": [],
+    }
+    paths = [(name, os.path.join(db, name)) for name in DB_FILES if os.path.isfile(os.path.join(db, name))]
+    hash_path = os.path.join(db, "hash.k2d")
+    if not os.path.isfile(hash_path):
+        report.update(status="skipped", reason="hash.k2d not found in database directory",
+                      low_residency=False, memory_mapping=True, memory_mapping_reason="no database to measure")
+        return report
+
+    hash_bytes = os.path.getsize(hash_path)
+    skip = available is not None and hash_bytes > available * max_fraction
+
+    start = time.monotonic()
+    for name, path in paths:
+        size = os.path.getsize(path)
+        entry: Dict[str, Any] = {"name": name, "bytes": size, "resident_bytes_before": resident_bytes(path)}
+        file_start = time.monotonic()
+        if not skip:
+            fd = os.open(path, os.O_RDONLY)
+            try:
+                entry["advised"] = advise_willneed(fd, size)
+            finally:
+                os.close(fd)
+            if method == "read":
+                entry["bytes_read"] = read_parallel(path, threads, chunk)
+        seconds = time.monotonic() - file_start
+        entry["seconds"] = round(seconds, 3)
+        entry["throughput_mib_s"] = round(entry.get("bytes_read", 0) / MIB / seconds, 1) if seconds > 0 else None
+        entry["resident_bytes_after"] = resident_bytes(path)
+        entry["resident_fraction"] = _fraction(entry["resident_bytes_after"], size)
+        report["files"].append(entry)
+    seconds = time.monotonic() - start
+
+    total = sum(f["bytes"] for f in report["files"])
+    read = sum(f.get("bytes_read", 0) for f in report["files"])
+    measured = all(f["resident_bytes_after"] is not None for f in report["files"])
+    before = sum(f["resident_bytes_before"] for f in report["files"]) if measured else None
+    after = sum(f["resident_bytes_after"] for f in report["files"]) if measured else None
+    hash_fraction = next(f["resident_fraction"] for f in report["files"] if f["name"] == "hash.k2d")
+    report.update(
+        total_bytes=total,
+        bytes_read=read,
+        resident_bytes_before=before,
+        resident_bytes_after=after,
+        resident_fraction=_fraction(after, total),
+        seconds=round(seconds, 3),
+        throughput_mib_s=round(read / MIB / seconds, 1) if seconds > 0 else None,
+    )
+
+    # Mapping stays on in every case: the alternative loads the whole hash
+    # into each fork, which fits wherever one cached copy does not even less.
+    limit = "cgroup memory limit" if available == cgroup_limit else "available memory"
+    if skip:
+        report.update(
+            status="skipped",
+            reason=f"hash.k2d ({hash_bytes // 1024 ** 3} GiB) exceeds {max_fraction:.0%} of "
+                   f"the {limit} ({available // 1024 ** 3} GiB)",
+            low_residency=False,
+            memory_mapping=True,
+            memory_mapping_reason="database larger than the page cache can hold; mapping is the only option",
+        )
+    elif hash_fraction is None:
+        report.update(status="preloaded", low_residency=False, memory_mapping=True,
+                      memory_mapping_reason="residency could not be measured (no mincore)")
+    elif method == "read" and hash_fraction < min_resident_fraction:
+        report.update(
+            status="preloaded",
+            low_residency=True,
+            memory_mapping=True,
+            memory_mapping_reason=f"only {hash_fraction:.0%} of hash.k2d stayed resident after a full read "
+                                  f"(the {limit} is {(available or 0) // MIB} MiB); mapped lookups may "
+                                  "fault from disk, but per-process loading would need more memory",
+        )
+    else:
+        report.update(status="preloaded", low_residency=False, memory_mapping=True,
+                      memory_mapping_reason=f"{hash_fraction:.0%} of hash.k2d resident")
+    return report
+
+
+def status_line(report: Dict[str, Any]) -> str:
+    """One-line summary, in the preload_status.txt format."""
+    if report["status"] == "skipped":
+        return f"skipped: {report['reason']}"
+    after = report.get("resident_bytes_after")
+    resident = "residency unknown" if after is None else \
+        f"{after // MIB} MiB resident ({report['resident_fraction']:.0%})"
+    return f"preloaded: {report['bytes_read'] // MIB} MiB read in {report['seconds']}s, {resident}"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", required=True, help="Kraken2 database directory")
+    parser.add_argument("--method", choices=("read", "advise"), default="read",
+                        help="read: parallel reads after fadvise; advise: fadvise(WILLNEED) only")
+    parser.add_argument("--threads", type=int, default=4, help="Parallel read streams per file")
+    parser.add_argument("--chunk-size", default="64M", help="Range read by one thread at a time")
+    parser.add_argument("--max-fraction", type=float, default=0.7,
+                        help="Skip when hash.k2d exceeds this fraction of MemAvailable or the cgroup limit")
+    parser.add_argument("--min-resident-fraction", type=float, default=0.9,
+                        help="Report low residency below this hash.k2d fraction after a read")
+    parser.add_argument("--report", default="preload_report.json", help="JSON report path")
+    parser.add_argument("--status", default="preload_status.txt", help="One-line status path")
+    args = parser.parse_args()
+
+    report = preload(
+        args.db,
+        method=args.method,
+        threads=args.threads,
+        chunk=parse_size(args.chunk_size),
+        max_fraction=args.max_fraction,
+        min_resident_fraction=args.min_resident_fraction,
+    )
+    with open(args.report, "w") as f:
+        json.dump(report, f, indent=2)
+    line = status_line(report)
+    with open(args.status, "w") as f:
+        f.write(line + "\n")
+    print(line, file=sys.stderr)
+    if report.get("low_residency"):
+        print(f"WARNING: {report['memory_mapping_reason']}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
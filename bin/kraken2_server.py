@@ -0,0 +1,500 @@
+#!/usr/bin/env python3
+"""Long-lived Kraken2 classification service for realtime batches.
+
+KRAKEN2_INCREMENTAL_CLASSIFIER starts a fresh ``kraken2`` per batch. Kraken2
+has no daemon mode, so every run maps or reads ``hash.k2d`` again, and when
+the page cache has dropped the database in between that load dominates the
+run for a small batch. This service holds the database resident for the
+session instead: it maps ``hash.k2d``, ``opts.k2d`` and ``taxo.k2d``, faults
+every page in, optionally ``mlock``s them (all, or a ``--lock-budget``; see
+``kraken2_db_preload.lock_budgeted``), and re-advises them before each
+batch. Each batch is then classified with ``kraken2 --memory-mapping``
+against those resident pages, so a batch costs its classification time.
+
+Requests arrive over one of two local transports (no network):
+
+  spool directory   <spool>/<id>.request.json
+                    {"id": ..., "workdir": ..., "reads": [...],
+                     "report": ..., "output": ..., "args": [...]}
+                    <spool>/shutdown.json  {"expected_requests": N}
+  unix socket       one JSON object per line:
+                    {"op": "classify", ...request fields...}
+                    {"op": "status"} | {"op": "shutdown"}
+
+Spool writers MUST create each request under a dot-prefixed name and rename
+it into place; dotfiles are never read. The reply for a spooled request is
+written to ``<spool>/replies/<id>.json`` the same way, once kraken2 has
+finished:
+
+  {"id": ..., "exit_code": 0, "seconds": 1.2, "stderr": "<last lines>"}
+
+``report`` and ``output`` are relative to ``workdir``, which is also the
+working directory kraken2 runs in, so the files land where the requester
+expects them under the names it chose -- the same files a per-batch kraken2
+run writes. ``args`` are passed through (``--paired``, ``--gzip-compressed``,
+``--classified-out`` and the like).
+
+While serving, ``<spool>/server.json`` holds the database, pid and a
+heartbeat refreshed every poll; requesters use it to tell a live service
+from a dead one. The ``classify`` and ``shutdown`` subcommands are the local
+stand-in client; ``serve --kraken2`` points the service at another
+executable, e.g. a stand-in classifier for tests.
+"""
+
+import argparse
+import asyncio
+import json
+import mmap
+import os
+import shlex
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from kraken2_db_preload import LIBC, lock_budgeted, map_shared, parse_size, resident_bytes
+
+VERSION = "1.0.0"
+
+REQUEST_SUFFIX = ".request.json"
+SHUTDOWN_NAME = "shutdown.json"
+SERVER_NAME = "server.json"
+REPLY_DIR = "replies"
+DB_FILES = ("hash.k2d", "opts.k2d", "taxo.k2d")
+STDERR_TAIL_LINES = 20
+
+
+def write_atomic(filepath: str, data: Any) -> None:
+    """Write JSON via a temporary dotfile and rename."""
+    dir_name = os.path.dirname(filepath) or "."
+    os.makedirs(dir_name, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=dir_name, prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_path, filepath)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+# ---------------------------------------------------------------------------
+# Database residency
+# ---------------------------------------------------------------------------
+
+class ResidentDatabase:
+    """Keep the Kraken2 database files mapped and their pages in memory."""
+
+    def __init__(self, db: str, lock: bool = False, lock_budget: Optional[int] = None) -> None:
+        self.db = os.path.realpath(db)
+        self.lock = lock or lock_budget is not None
+        self.lock_budget = lock_budget
+        self.maps: Dict[str, mmap.mmap] = {}
+        # Shared read-only libc mappings, (name, address, length), that hold
+        # the locks; see kraken2_db_preload.map_shared.
+        self.lock_maps: List[Tuple[str, int, int]] = []
+        self.locked_bytes = 0
+        self.mapped_bytes = 0
+        self.resident_bytes: Optional[int] = None
+
+    def load(self) -> float:
+        """Map and fault in every database file. Returns the seconds taken."""
+        start = time.monotonic()
+        for name in DB_FILES:
+            path = os.path.join(self.db, name)
+            if not os.path.exists(path) or os.path.getsize(path) == 0:
+                continue
+            with open(path, "rb") as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.maps[name] = mapped
+            self.mapped_bytes += len(mapped)
+            self._touch(mapped)
+            if self.lock:
+                lock_map = map_shared(path)
+                if lock_map is not None:
+                    self.lock_maps.append((name, *lock_map))
+        if self.lock:
+            self.locked_bytes = lock_budgeted(self.lock_maps, self.lock_budget)
+        sizes = [resident_bytes(os.path.join(self.db, name)) for name in self.maps]
+        self.resident_bytes = None if None in sizes else sum(sizes)
+        return time.monotonic() - start
+
+    @staticmethod
+    def _touch(mapped: mmap.mmap) -> None:
+        if hasattr(mmap, "MADV_WILLNEED"):
+            mapped.madvise(mmap.MADV_WILLNEED)
+        for offset in range(0, len(mapped), mmap.PAGESIZE):
+            mapped[offset]
+
+    def refresh(self) -> None:
+        """Re-advise the mappings; cheap when the pages are still resident."""
+        if (self.locked_bytes and self.locked_bytes == self.mapped_bytes) or not hasattr(mmap, "MADV_WILLNEED"):
+            return
+        for mapped in self.maps.values():
+            mapped.madvise(mmap.MADV_WILLNEED)
+
+    def close(self) -> None:
+        """Release the locked mappings and the mappings themselves."""
+        for _, addr, length in self.lock_maps:
+            LIBC.munmap(addr, length)
+        self.lock_maps = []
+        for mapped in self.maps.values():
+            mapped.close()
+        self.maps = {}
+
+
+# ---------------------------------------------------------------------------
+# Service
+# ---------------------------------------------------------------------------
+
+class Kraken2Service:
+    """Classify batches against a resident database, one kraken2 per request."""
+
+    def __init__(
+        self,
+        database: ResidentDatabase,
+        kraken2: str = "kraken2",
+        threads: int = 1,
+        workers: int = 1,
+        spool: Optional[str] = None,
+        socket_path: Optional[str] = None,
+        poll_interval: float = 0.2,
+        max_idle_seconds: float = 0.0,
+    ) -> None:
+        self.database = database
+        # Requests run in their own working directories.
+        self.kraken2 = os.path.abspath(kraken2) if os.sep in kraken2 else kraken2
+        self.threads = threads
+        self.spool = spool
+        self.socket_path = socket_path
+        self.poll_interval = poll_interval
+        self.max_idle_seconds = max_idle_seconds
+        self.executor = ThreadPoolExecutor(max_workers=max(1, workers))
+
+        self.in_flight: Set[str] = set()
+        self.served = 0
+        self.failed = 0
+        self.classify_seconds = 0.0
+        self.load_seconds = 0.0
+        self.shutdown_requested = False
+        self.expected_requests: Optional[int] = None
+        self.started = time.time()
+        self.last_activity = time.monotonic()
+
+    # -- classification ---------------------------------------------------
+
+    def command(self, request: Dict[str, Any]) -> List[str]:
+        return [
+            self.kraken2,
+            "--db", self.database.db,
+            "--threads", str(request.get("threads") or self.threads),
+            "--memory-mapping",
+            "--report", request["report"],
+            "--output", request["output"],
+            *[str(a) for a in request.get("args", [])],
+            *[str(r) for r in request["reads"]],
+        ]
+
+    def classify(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Run kraken2 for one request. Never raises; failures go in the reply."""
+        self.database.refresh()
+        start = time.monotonic()
+        try:
+            proc = subprocess.run(
+                self.command(request), cwd=request["workdir"],
+                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+            )
+            exit_code, stderr = proc.returncode, proc.stderr
+        except (OSError, KeyError, TypeError) as e:
+            exit_code, stderr = 127, f"kraken2_server: {e}"
+        seconds = time.monotonic() - start
+        self.classify_seconds += seconds
+        self.last_activity = time.monotonic()
+        if exit_code == 0:
+            self.served += 1
+        else:
+            self.failed += 1
+        return {
+            "id": request.get("id"),
+            "exit_code": exit_code,
+            "seconds": round(seconds, 3),
+            "stderr": "\n".join(stderr.splitlines()[-STDERR_TAIL_LINES:]),
+        }
+
+    def _serve_spooled(self, path: str, request_id: str) -> None:
+        try:
+            with open(path) as f:
+                request = json.load(f)
+            request.setdefault("id", request_id)
+            reply = self.classify(request)
+        except (OSError, ValueError) as e:
+            self.failed += 1
+            reply = {"id": request_id, "exit_code": 1, "seconds": 0.0, "stderr": f"malformed request: {e}"}
+        write_atomic(os.path.join(self.spool, REPLY_DIR, f"{request_id}.json"), reply)
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        self.in_flight.discard(request_id)
+
+    # -- transports -------------------------------------------------------
+
+    def scan_spool(self) -> None:
+        """Dispatch every complete request currently in the spool."""
+        if not self.spool:
+            return
+        with os.scandir(self.spool) as entries:
+            for entry in sorted(entries, key=lambda e: e.name):
+                if entry.name.startswith(".") or not entry.is_file():
+                    continue
+                if entry.name == SHUTDOWN_NAME:
+                    if not self.shutdown_requested:
+                        self._read_shutdown(entry.path)
+                elif entry.name.endswith(REQUEST_SUFFIX):
+                    request_id = entry.name[:-len(REQUEST_SUFFIX)]
+                    if request_id not in self.in_flight:
+                        self.in_flight.add(request_id)
+                        self.last_activity = time.monotonic()
+                        self.executor.submit(self._serve_spooled, entry.path, request_id)
+
+    def _read_shutdown(self, path: str) -> None:
+        try:
+            with open(path) as f:
+                self.expected_requests = json.load(f).get("expected_requests")
+        except (OSError, ValueError):
+            self.expected_requests = None
+        self.shutdown_requested = True
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Serve JSON-lines requests on the unix socket."""
+        loop = asyncio.get_running_loop()
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            try:
+                request = json.loads(line)
+                op = request.get("op")
+                if op == "classify":
+                    reply = {"ok": True, **await loop.run_in_executor(self.executor, self.classify, request)}
+                elif op == "status":
+                    reply = {"ok": True, **self.status()}
+                elif op == "shutdown":
+                    self.shutdown_requested = True
+                    self.expected_requests = request.get("expected_requests")
+                    reply = {"ok": True}
+                else:
+                    reply = {"ok": False, "error": f"unknown op: {op}"}
+            except (ValueError, KeyError, TypeError) as e:
+                reply = {"ok": False, "error": str(e)}
+            writer.write((json.dumps(reply) + "\n").encode())
+            await writer.drain()
+        writer.close()
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "db": self.database.db,
+            "mapped_bytes": self.database.mapped_bytes,
+            "locked_bytes": self.database.locked_bytes,
+            "resident_bytes_after_load": self.database.resident_bytes,
+            "load_seconds": round(self.load_seconds, 3),
+            "requests_served": self.served,
+            "requests_failed": self.failed,
+            "in_flight": len(self.in_flight),
+            "mean_classify_seconds": round(self.classify_seconds / max(1, self.served + self.failed), 3),
+        }
+
+    def heartbeat(self) -> None:
+        if self.spool:
+            write_atomic(os.path.join(self.spool, SERVER_NAME), {
+                "version": VERSION,
+                "pid": os.getpid(),
+                "started": self.started,
+                "heartbeat": time.time(),
+                **self.status(),
+            })
+
+    # -- main loop --------------------------------------------------------
+
+    async def run(self) -> Dict[str, Any]:
+        self.load_seconds = self.database.load()
+        print(f"Database resident: {self.database.mapped_bytes} bytes mapped "
+              f"({self.database.locked_bytes} locked) in {self.load_seconds:.1f}s")
+        server = None
+        if self.socket_path:
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+            server = await asyncio.start_unix_server(self.handle_client, path=self.socket_path)
+
+        try:
+            while True:
+                self.scan_spool()
+                self.heartbeat()
+                if self.shutdown_requested:
+                    # Requesters rename every request into place before the
+                    # sentinel is written, so one more scan picks them up.
+                    self.scan_spool()
+                    break
+                now = time.monotonic()
+                if self.max_idle_seconds > 0 and not self.in_flight and now - self.last_activity > self.max_idle_seconds:
+                    print(f"No requests for {self.max_idle_seconds:.0f}s and no shutdown request; exiting")
+                    break
+                await asyncio.sleep(self.poll_interval)
+        finally:
+            if server is not None:
+                server.close()
+                await server.wait_closed()
+                if os.path.exists(self.socket_path):
+                    os.unlink(self.socket_path)
+            self.executor.shutdown(wait=True)
+            self.database.close()
+            if self.spool:
+                for name in (SERVER_NAME, SHUTDOWN_NAME):
+                    try:
+                        os.unlink(os.path.join(self.spool, name))
+                    except FileNotFoundError:
+                        pass
+
+        summary = self.status()
+        summary["expected_requests"] = self.expected_requests
+        if self.expected_requests is not None and self.served + self.failed < self.expected_requests:
+            print(
+                f"WARNING: shutdown expected {self.expected_requests} request(s), "
+                f"received {self.served + self.failed}",
+                file=sys.stderr,
+            )
+        return summary
+
+
+# ---------------------------------------------------------------------------
+# Stand-in client
+# ---------------------------------------------------------------------------
+
+def spool_write(spool: str, name: str, payload: Dict[str, Any]) -> str:
+    """Write ``payload`` into the spool under a dotfile, then rename into place."""
+    os.makedirs(spool, exist_ok=True)
+    target = os.path.join(spool, name)
+    fd, tmp_path = tempfile.mkstemp(dir=spool, prefix=".", suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(payload, f)
+    os.replace(tmp_path, target)
+    return target
+
+
+def wait_for_reply(spool: str, request_id: str, timeout: float, poll_interval: float = 0.2) -> Dict[str, Any]:
+    """Poll for a spooled request's reply."""
+    path = os.path.join(spool, REPLY_DIR, f"{request_id}.json")
+    deadline = time.monotonic() + timeout if timeout > 0 else None
+    while not os.path.exists(path):
+        if deadline is not None and time.monotonic() > deadline:
+            raise TimeoutError(f"no reply for {request_id} after {timeout:.0f}s")
+        time.sleep(poll_interval)
+    with open(path) as f:
+        reply = json.load(f)
+    os.unlink(path)
+    return reply
+
+
+def socket_request(socket_path: str, request: Dict[str, Any]) -> Dict[str, Any]:
+    async def _send() -> Dict[str, Any]:
+        reader, writer = await asyncio.open_unix_connection(socket_path)
+        writer.write((json.dumps(request) + "\n").encode())
+        await writer.drain()
+        reply = json.loads(await reader.readline())
+        writer.close()
+        await writer.wait_closed()
+        return reply
+
+    return asyncio.run(_send())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    serve = sub.add_parser("serve", help="Hold the database resident and classify until shutdown")
+    serve.add_argument("--db", required=True, help="Kraken2 database directory")
+    serve.add_argument("--spool", help="Spool directory to watch for *.request.json")
+    serve.add_argument("--socket", help="Unix socket path to listen on")
+    serve.add_argument("--threads", type=int, default=1, help="kraken2 --threads per request")
+    serve.add_argument("--workers", type=int, default=1, help="Requests classified concurrently")
+    serve.add_argument("--kraken2", default="kraken2", help="kraken2 executable (a stand-in for tests)")
+    serve.add_argument("--lock", action="store_true", help="mlock the database pages (needs RLIMIT_MEMLOCK)")
+    serve.add_argument("--lock-budget", type=parse_size,
+                       help="mlock at most this much (e.g. 8G): opts/taxo.k2d, then the start of hash.k2d")
+    serve.add_argument("--poll-interval", type=float, default=0.2, help="Seconds between spool scans")
+    serve.add_argument("--max-idle-seconds", type=float, default=0.0,
+                       help="Exit after this long without a request (0 = wait for shutdown)")
+    serve.add_argument("--summary", help="Write the end-of-session summary JSON here")
+
+    classify = sub.add_parser("classify", help="Classify one batch through a running service")
+    classify.add_argument("--spool")
+    classify.add_argument("--socket")
+    classify.add_argument("--id", help="Request id (default: derived from pid and time)")
+    classify.add_argument("--workdir", default=".", help="Directory kraken2 runs in and writes to")
+    classify.add_argument("--report", required=True)
+    classify.add_argument("--output", required=True)
+    classify.add_argument("--timeout", type=float, default=0.0, help="Seconds to wait for the reply (0 = forever)")
+    classify.add_argument("--kraken2-args", default="", help="Further kraken2 options, as one string")
+    classify.add_argument("reads", nargs="+")
+
+    stop = sub.add_parser("shutdown", help="Ask a running service to drain and exit")
+    stop.add_argument("--spool")
+    stop.add_argument("--socket")
+    stop.add_argument("--expected-requests", type=int)
+
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        if not args.spool and not args.socket:
+            parser.error("serve needs --spool and/or --socket")
+        if args.spool:
+            os.makedirs(os.path.join(args.spool, REPLY_DIR), exist_ok=True)
+        service = Kraken2Service(
+            database=ResidentDatabase(args.db, lock=args.lock, lock_budget=args.lock_budget),
+            kraken2=args.kraken2,
+            threads=args.threads,
+            workers=args.workers,
+            spool=args.spool,
+            socket_path=args.socket,
+            poll_interval=args.poll_interval,
+            max_idle_seconds=args.max_idle_seconds,
+        )
+        summary = asyncio.run(service.run())
+        print(f"Kraken2 service stopped: {json.dumps(summary)}")
+        if args.summary:
+            write_atomic(args.summary, summary)
+        return
+
+    if not args.spool and not args.socket:
+        parser.error(f"{args.command} needs --spool or --socket")
+
+    if args.command == "classify":
+        request = {
+            "id": args.id or f"{os.getpid()}.{time.time_ns()}",
+            "workdir": os.path.abspath(args.workdir),
+            "report": args.report,
+            "output": args.output,
+            "args": shlex.split(args.kraken2_args),
+            "reads": [os.path.abspath(r) for r in args.reads],
+        }
+        if args.socket:
+            reply = socket_request(args.socket, {"op": "classify", **request})
+        else:
+            spool_write(args.spool, f"{request['id']}{REQUEST_SUFFIX}", request)
+            reply = wait_for_reply(args.spool, request["id"], args.timeout)
+        if reply.get("stderr"):
+            print(reply["stderr"], file=sys.stderr)
+        sys.exit(reply.get("exit_code", 1))
+    elif args.command == "shutdown":
+        if args.socket:
+            print(json.dumps(socket_request(args.socket, {"op": "shutdown", "expected_requests": args.expected_requests})))
+        else:
+            print(spool_write(args.spool, SHUTDOWN_NAME, {"expected_requests": args.expected_requests}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""Split one combined-reference minimap2 PAF into per-taxid validation results.
+
+In combined-reference mode a batch's extracted reads, for every watched taxid,
+are mapped in one minimap2 run against a single index of all watchlist
+genomes. Read names carry the taxid they were extracted for (``<taxid>|<read>``)
+and reference contigs the taxid they belong to (``<taxid>|<contig>``), so one
+streaming pass over the PAF routes each alignment to its taxid:
+
+* alignments of a taxid's reads to that taxid's own contigs are written, with
+  the original read and contig names, to ``<prefix>_taxid<taxid>.paf`` and
+  summarised in ``<prefix>_taxid<taxid>.minimap2_stats.json``, the same files
+  and statistics MINIMAP2_VALIDATION produces per taxid;
+* a read whose best alignment passing the MAPQ floor lands on another
+  watchlist genome is counted as a cross-taxon assignment in
+  ``<prefix>.cross_taxon.json``.
+
+Mapping is competitive: a read that maps better to another watchlist organism
+no longer counts as a hit for the taxid Kraken2 gave it, which is exactly what
+the cross-taxon table reports.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+from typing import Any, Dict, IO, List, Tuple
+
+
+def write_atomic(filepath: str, text: str) -> None:
+    """Write text via a temporary file and rename."""
+    dir_name = os.path.dirname(filepath) or "."
+    os.makedirs(dir_name, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=dir_name, prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+        os.replace(tmp_path, filepath)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def read_counts(path: str) -> Dict[str, int]:
+    """Extracted reads per taxid (``taxid<TAB>count``)."""
+    counts: Dict[str, int] = {}
+    with open(path) as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) >= 2:
+                counts[fields[0]] = counts.get(fields[0], 0) + int(fields[1])
+    return counts
+
+
+def split_name(name: str) -> Tuple[str, str]:
+    """``<taxid>|<name>`` -> (taxid, name)."""
+    taxid, sep, rest = name.partition("|")
+    return (taxid, rest) if sep else ("", name)
+
+
+def identity_of(cols: List[str]) -> float:
+    """dv:f: divergence if present, else nmatch/alen; -1 when neither is usable."""
+    for tag in cols[12:]:
+        if tag.startswith("dv:f:"):
+            return (1.0 - float(tag.split(":")[2])) * 100
+    alen = float(cols[10])
+    return float(cols[9]) / alen * 100 if alen > 0 else -1.0
+
+
+def stats_for(rows: List[Tuple[int, str, List[str]]], total_reads: int, args: argparse.Namespace) -> Dict[str, Any]:
+    """The MINIMAP2_VALIDATION statistics for one taxid's own alignments.
+
+    ``rows`` are (target start, restored PAF line, restored columns). The
+    per-taxid module sorts its PAF by target start (``sort -k8,8n``) and
+    merges intervals in that order; reads are deduplicated on their first
+    passing alignment in the same order, so both are reproduced here.
+    """
+    rows.sort(key=lambda row: (row[0], row[1]))
+    ref_max_name, ref_max_len = "", 0
+    seen = set()
+    hits = 0
+    mapq_sum = id_sum = cov_sum = 0.0
+    id_n = cov_n = 0
+    aligned_bp = covered_bp = 0
+    cur_start = cur_end = 0
+    have_iv = False
+    for _, _, cols in rows:
+        tlen = int(float(cols[6]))
+        if tlen > ref_max_len:
+            ref_max_len, ref_max_name = tlen, cols[5]
+        mapq = int(float(cols[11]))
+        if mapq < args.min_mapq:
+            continue
+        tstart, tend = int(float(cols[7])), int(float(cols[8]))
+        if tstart < tend <= tlen:
+            aligned_bp += tend - tstart
+            if not have_iv:
+                cur_start, cur_end, have_iv = tstart, tend, True
+            elif tstart > cur_end:
+                covered_bp += cur_end - cur_start
+                cur_start, cur_end = tstart, tend
+            elif tend > cur_end:
+                cur_end = tend
+        if cols[0] in seen:
+            continue
+        seen.add(cols[0])
+        hits += 1
+        mapq_sum += mapq
+        identity = identity_of(cols)
+        if identity >= 0:
+            id_sum += identity
+            id_n += 1
+        qlen = int(float(cols[1]))
+        if qlen > 0:
+            cov_sum += abs(int(float(cols[3])) - int(float(cols[2]))) / qlen
+            cov_n += 1
+    if have_iv:
+        covered_bp += cur_end - cur_start
+    if not ref_max_name:
+        ref_max_name, ref_max_len = "unknown", 0
+
+    hit_rate = hits / total_reads if total_reads > 0 else 0.0
+    avg_mapq = mapq_sum / hits if hits else 0.0
+    avg_id = id_sum / id_n if id_n else 0.0
+    avg_cov = cov_sum / cov_n if cov_n else 0.0
+    genome_breadth = covered_bp / ref_max_len if ref_max_len > 0 else 0.0
+    local_depth = aligned_bp / covered_bp if covered_bp > 0 else 0.0
+    concentrated = genome_breadth <= 0.05 and local_depth >= 10 and covered_bp >= 200
+
+    if (hit_rate >= args.hit_threshold and avg_id >= args.identity_threshold and hits >= args.min_reads
+            and (genome_breadth >= args.min_breadth or concentrated)):
+        status = "confirmed"
+    elif hit_rate >= args.hit_threshold * 0.5 or avg_id >= args.identity_threshold * 0.9:
+        status = "uncertain"
+    else:
+        status = "rejected"
+
+    return {
+        "total_reads": total_reads,
+        "hits": hits,
+        "hit_rate": hit_rate,
+        "avg_mapq": avg_mapq,
+        "avg_id": avg_id,
+        "avg_cov": avg_cov,
+        "genome_breadth": genome_breadth,
+        "status": status,
+        "ref_name": ref_max_name,
+        "ref_length": ref_max_len,
+    }
+
+
+def render_stats(stats: Dict[str, Any], args: argparse.Namespace, taxid: str) -> str:
+    """Byte-for-byte the JSON the per-taxid module's awk block prints."""
+    return (
+        "{\n"
+        f'  "sample_id": "{args.sample_id}",\n'
+        f'  "taxid": {taxid},\n'
+        '  "validation_method": "minimap2",\n'
+        f'  "total_reads": {stats["total_reads"]},\n'
+        f'  "mapped_reads": {stats["hits"]},\n'
+        f'  "hit_rate": {stats["hit_rate"]:.6f},\n'
+        f'  "avg_mapq": {stats["avg_mapq"]:.2f},\n'
+        f'  "avg_identity": {stats["avg_id"]:.2f},\n'
+        f'  "avg_coverage": {stats["avg_cov"]:.4f},\n'
+        f'  "genome_breadth": {stats["genome_breadth"]:.6f},\n'
+        f'  "validation_status": "{stats["status"]}",\n'
+        f'  "ref_name": "{stats["ref_name"]}",\n'
+        f'  "ref_length": {stats["ref_length"]},\n'
+        f'  "parameters": {{"preset": "{args.preset}", "min_mapq": {args.min_mapq}}}\n'
+        "}\n"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--paf", required=True, help="Combined PAF with taxid-prefixed read and contig names")
+    parser.add_argument("--read-counts", required=True, help="TSV of taxid -> extracted reads in this batch")
+    parser.add_argument("--prefix", required=True, help="Output prefix; per-taxid files are <prefix>_taxid<taxid>.*")
+    parser.add_argument("--sample-id", required=True)
+    parser.add_argument("--batch-id", default=None)
+    parser.add_argument("--preset", default="map-ont")
+    parser.add_argument("--min-mapq", type=int, default=10)
+    parser.add_argument("--hit-threshold", type=float, default=0.5)
+    parser.add_argument("--identity-threshold", type=float, default=90.0)
+    parser.add_argument("--min-reads", type=int, default=10)
+    parser.add_argument("--min-breadth", type=float, default=0.05)
+    args = parser.parse_args()
+
+    counts = read_counts(args.read_counts)
+    rows: Dict[str, List[Tuple[int, str, List[str]]]] = {taxid: [] for taxid in counts}
+    handles: Dict[str, IO[str]] = {taxid: open(f"{args.prefix}_taxid{taxid}.paf", "w") for taxid in counts}
+    cross: Dict[str, Dict[str, int]] = {}
+    best_seen = set()
+
+    with open(args.paf) as f:
+        for line in f:
+            cols = line.rstrip("\n").split("\t")
+            if len(cols) < 12:
+                continue
+            read_taxid, cols[0] = split_name(cols[0])
+            target_taxid, cols[5] = split_name(cols[5])
+            if read_taxid not in rows:
+                continue
+            # minimap2 reports a read's primary alignment first, so the first
+            # passing row decides which watchlist genome the read belongs to.
+            if int(float(cols[11])) >= args.min_mapq and cols[0] not in best_seen:
+                best_seen.add(cols[0])
+                if target_taxid != read_taxid:
+                    by_target = cross.setdefault(read_taxid, {})
+                    by_target[target_taxid] = by_target.get(target_taxid, 0) + 1
+            if target_taxid != read_taxid:
+                continue
+            restored = "\t".join(cols)
+            handles[read_taxid].write(restored + "\n")
+            rows[read_taxid].append((int(float(cols[7])), restored, cols))
+
+    for handle in handles.values():
+        handle.close()
+
+    for taxid in counts:
+        stats = stats_for(rows[taxid], counts[taxid], args)
+        write_atomic(f"{args.prefix}_taxid{taxid}.minimap2_stats.json", render_stats(stats, args, taxid))
+        print(f"Minimap2 validation (combined): taxid {taxid}: {stats['hits']}/{stats['total_reads']} mapped "
+              f"({stats['hit_rate'] * 100:.1f}%), avg identity {stats['avg_id']:.1f}%, status: {stats['status']}",
+              file=sys.stderr)
+
+    summary = {
+        "sample_id": args.sample_id,
+        "batch_id": args.batch_id,
+        "min_mapq": args.min_mapq,
+        "reads_by_taxid": {taxid: counts[taxid] for taxid in sorted(counts, key=int)},
+        # extracted-for taxid -> taxid of the watchlist genome the read mapped best to
+        "cross_taxon": {taxid: dict(sorted(cross[taxid].items())) for taxid in sorted(cross, key=int)},
+        "cross_taxon_reads": sum(n for targets in cross.values() for n in targets.values()),
+    }
+    write_atomic(f"{args.prefix}.cross_taxon.json", json.dumps(summary, indent=2) + "\n")
+    if summary["cross_taxon_reads"]:
+        print(f"{summary['cross_taxon_reads']} read(s) mapped best to another watchlist genome", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -12,22 +12,528 @@ Metrics Tracked:
 - I/O throughput
 - File processing rates
 
+The "micro" suite benchmarks the pipeline's Python stages directly: every
+bin/*_to_canonical.py converter and the aggregators (the inline scripts of
+KRAKEN2_FINAL_AGGREGATOR, KRAKEN2_OUTPUT_MERGER and UPDATE_CUMULATIVE_STATS,
+and the bin scripts behind SEQKIT_MERGE_STATS and
+VALIDATION_CUMULATIVE_AGGREGATOR) run on generated inputs of 1k, 100k and 1M
+reads, taxa or alignments. Each run records wall time, peak RSS (the
+script's own high-water mark, not a sample) and throughput in rows/s and MB/s.
+
 Usage:
     python bin/performance_regression_tester.py run --test-suite baseline
+    python bin/performance_regression_tester.py run --test-suite micro --sizes 1k,100k
+    python bin/performance_regression_tester.py list
     python bin/performance_regression_tester.py compare --baseline v1.0 --current v1.1
     python bin/performance_regression_tester.py report --format html
+    python bin/performance_regression_tester.py run --test-suite micro --history perf_history.jsonl
+    python bin/performance_regression_tester.py trend --history perf_history.jsonl --window 10
+
+Every benchmark runs --warmup unmeasured times, then --repeats measured
+times; results hold the medians plus each run's samples. compare and trend
+judge time, peak RSS and throughput separately: the change in the median and
+its bootstrap confidence interval, against a threshold that --thresholds can
+set per benchmark and metric. They write a JSON verdict and exit 1 when any
+metric regressed.
 """
 
 import os
+import re
 import sys
 import json
 import time
+import random
+import shutil
+import textwrap
 import subprocess
 import psutil
 import statistics
 from pathlib import Path
 from datetime import datetime
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
+
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+BIN_DIR = REPO_ROOT / 'bin'
+MODULES_DIR = REPO_ROOT / 'modules' / 'local'
+
+# Input sizes of the micro suite, in rows of each benchmark's unit.
+SIZES = {'1k': 1_000, '100k': 100_000, '1M': 1_000_000}
+
+# Batches the aggregator benchmarks split their rows over.
+BATCHES = 10
+
+# A GString's escapes and ${...} interpolations, in one pass so an escaped
+# backslash is never read twice.
+_GSTRING_TOKEN = re.compile(r'\\\\|\\\$|\$\{([^}]*)\}')
+
+
+def render_inline_script(module: str, bindings: Dict[str, str]) -> str:
+    """
+    Render the script: block of modules/local/<module>/main.nf as the task
+    would run it.
+
+    Every ${...} interpolation must have a binding, keyed by its expression
+    text; an unbound one raises KeyError, so a module that grows a new
+    interpolation fails the benchmark instead of running a wrong script.
+    """
+    source = (MODULES_DIR / module / 'main.nf').read_text()
+    start = source.index('"""', source.index('script:')) + 3
+    body = source[start:source.index('"""', start)]
+
+    def substitute(match):
+        token = match.group(0)
+        if token == '\\\\':
+            return '\\'
+        if token == '\\$':
+            return '$'
+        expression = match.group(1).strip()
+        if expression not in bindings:
+            raise KeyError(f"{module}: no benchmark binding for ${{{expression}}}")
+        return str(bindings[expression])
+
+    return textwrap.dedent(_GSTRING_TOKEN.sub(substitute, body)).lstrip('\n')
+
+
+def _write_lines(path: Path, lines) -> None:
+    with open(path, 'w') as f:
+        for line in lines:
+            f.write(line)
+            f.write('\n')
+
+
+def _kreport_lines(taxa: int, rng: random.Random):
+    """A depth-first Kraken2 report of `taxa` rows (unclassified and root first)."""
+    yield f"5.00\t{rng.randint(100, 1000)}\t0\tU\t0\tunclassified"
+    yield f"95.00\t{rng.randint(10000, 100000)}\t0\tR\t1\troot"
+    for i in range(max(0, taxa - 2)):
+        depth = 1 + i % 7
+        reads = rng.randint(0, 500)
+        yield f"0.01\t{reads * (8 - depth)}\t{reads}\t{'DPCOFGS'[depth - 1]}\t{i + 2}\t{'  ' * depth}taxon_{i + 2}"
+
+
+def _paf_line(i: int, rng: random.Random) -> str:
+    qlen = rng.randint(500, 5000)
+    alen = qlen - rng.randint(0, 100)
+    tstart = rng.randint(0, 4_990_000 - alen)
+    return (f"read_{i}\t{qlen}\t0\t{alen}\t+\tref_1\t5000000\t{tstart}\t{tstart + alen}\t"
+            f"{alen - rng.randint(0, 50)}\t{alen}\t{rng.randint(0, 60)}\ttp:A:P\tdv:f:{rng.random() / 20:.4f}")
+
+
+def _blast_line(i: int, rng: random.Random) -> str:
+    length = rng.randint(500, 5000)
+    sstart = rng.randint(1, 4_990_000 - length)
+    return (f"read_{i}\tref_1\t{rng.uniform(85, 100):.2f}\t{length}\t{rng.randint(0, 50)}\t0\t1\t{length}\t"
+            f"{sstart}\t{sstart + length - 1}\t1e-{rng.randint(20, 180)}\t{length * 1.8:.1f}\t{length}\t5000000\t"
+            f"{rng.uniform(80, 100):.1f}")
+
+
+def _kraken2_output_line(i: int, rng: random.Random) -> str:
+    if rng.random() < 0.1:
+        return f"U\tread_{i}\t0\t{rng.randint(200, 20000)}\t0:100"
+    taxid = rng.randint(2, 5000)
+    return f"C\tread_{i}\t{taxid}\t{rng.randint(200, 20000)}\t{taxid}:{rng.randint(1, 80)} 0:12"
+
+
+def _split(n: int, parts: int) -> List[int]:
+    return [n // parts + (1 if k < n % parts else 0) for k in range(parts)]
+
+
+def _python(script: str, *args: str) -> List[str]:
+    return [str(BIN_DIR / script), *args]
+
+
+def _inline(workdir: Path, module: str, bindings: Dict[str, str]) -> List[str]:
+    script = workdir / f'{module}.py'
+    script.write_text(render_inline_script(module, {'task.process': module.upper(), **bindings}))
+    return [script.name]
+
+
+# Runs a script (argv[2:]) and writes its peak RSS in bytes to argv[1] at
+# exit. Linux carries the parent's high-water mark into an exec'd child's
+# ru_maxrss, so wait4 would report at least this tester's own footprint;
+# VmHWM belongs to the script's own address space.
+_PEAK_RSS_RUNNER = """\
+import atexit, os, runpy, sys
+def report(path=sys.argv[1]):
+    try:
+        with open('/proc/self/status') as f:
+            peak = next(int(line.split()[1]) * 1024 for line in f if line.startswith('VmHWM:'))
+    except (OSError, StopIteration):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        peak = peak if sys.platform == 'darwin' else peak * 1024
+    with open(path, 'w') as f:
+        f.write(str(peak))
+atexit.register(report)
+sys.argv = sys.argv[2:]
+sys.path[0] = os.path.dirname(os.path.abspath(sys.argv[0]))
+runpy.run_path(sys.argv[0], run_name='__main__')
+"""
+
+
+# Each setup writes the inputs for n rows into workdir and returns
+# (script argv, input files); the script runs with workdir as its cwd.
+
+def _setup_kreport_to_canonical(workdir: Path, n: int, rng: random.Random):
+    _write_lines(workdir / 'input.kreport.txt', _kreport_lines(n, rng))
+    return _python('kreport_to_canonical.py', '--input', 'input.kreport.txt', '--tool', 'kraken2',
+                   '--tool-version', '2.1.3', '--sample', 'bench', '--mode', 'batch',
+                   '--output', 'canonical.json', '--sidecar', 'sidecar.json'), ['input.kreport.txt']
+
+
+def _setup_alignment_to_canonical_paf(workdir: Path, n: int, rng: random.Random):
+    _write_lines(workdir / 'input.paf', (_paf_line(i, rng) for i in range(n)))
+    return _python('alignment_to_canonical.py', '--input', 'input.paf', '--tool', 'minimap2',
+                   '--format', 'paf', '--sample', 'bench', '--taxid', '562',
+                   '--output', 'canonical.tsv'), ['input.paf']
+
+
+def _setup_alignment_to_canonical_blast(workdir: Path, n: int, rng: random.Random):
+    _write_lines(workdir / 'input.blast.tsv', (_blast_line(i, rng) for i in range(n)))
+    return _python('alignment_to_canonical.py', '--input', 'input.blast.tsv', '--tool', 'blast',
+                   '--format', 'blast', '--sample', 'bench', '--taxid', '562',
+                   '--output', 'canonical.tsv'), ['input.blast.tsv']
+
+
+def _setup_qc_to_canonical(workdir: Path, n: int, rng: random.Random):
+    summary = {'total_reads': n * 10, 'total_bases': n * 40000, 'q20_rate': 0.9, 'q30_rate': 0.8,
+               'gc_content': 0.5, 'mean_length': 4000.0}
+    fastp = {
+        'summary': {'before_filtering': summary, 'after_filtering': summary},
+        'filtering_result': {'passed_filter_reads': n * 10, 'low_quality_reads': 0},
+        'read_length_histogram': {str(100 + i): rng.randint(1, 20) for i in range(n)},
+    }
+    with open(workdir / 'input.fastp.json', 'w') as f:
+        json.dump(fastp, f)
+    return _python('qc_to_canonical.py', '--input', 'input.fastp.json', '--tool', 'fastp',
+                   '--tool-version', '0.23.4', '--sample', 'bench', '--mode', 'batch',
+                   '--output', 'canonical.json', '--sidecar', 'sidecar.json'), ['input.fastp.json']
+
+
+def _setup_assembly_to_canonical(workdir: Path, n: int, rng: random.Random):
+    info = ['#seq_name\tlength\tcov.\tcirc.\trepeat\tmult.\talt_group\tgraph_path']
+    fasta = []
+    for i in range(n):
+        seq = ''.join(rng.choices('ACGT', k=50))
+        info.append(f"contig_{i}\t{len(seq)}\t{rng.randint(5, 200)}\t{rng.choice('NY')}\tN\t1\t*\t{i}")
+        fasta.append(f">contig_{i}\n{seq}")
+    _write_lines(workdir / 'assembly_info.txt', info)
+    _write_lines(workdir / 'assembly.fasta', fasta)
+    return _python('assembly_to_canonical.py', '--input', 'assembly_info.txt', '--tool', 'flye',
+                   '--tool-version', '2.9.3', '--sample', 'bench', '--fasta', 'assembly.fasta',
+                   '--output', 'canonical.json', '--sidecar', 'sidecar.json'), ['assembly_info.txt', 'assembly.fasta']
+
+
+def _setup_kraken2_output_merger(workdir: Path, n: int, rng: random.Random):
+    _write_lines(workdir / 'input.kraken2.output.txt', (_kraken2_output_line(i, rng) for i in range(n)))
+    _write_lines(workdir / 'input.kraken2.report.txt', _kreport_lines(500, rng))
+    command = _inline(workdir, 'kraken2_output_merger', {
+        'batch_id': '1', 'prefix': 'bench',
+        'kraken2_output': 'input.kraken2.output.txt', 'batch_report': 'input.kraken2.report.txt',
+    })
+    return command, ['input.kraken2.output.txt', 'input.kraken2.report.txt']
+
+
+def _setup_kraken2_final_aggregator(workdir: Path, n: int, rng: random.Random):
+    inputs = []
+    start = 0
+    for batch, reads in enumerate(_split(n, BATCHES), start=1):
+        output, report = f'batch_{batch}.kraken2.output.txt', f'batch_{batch}.kraken2.report.txt'
+        _write_lines(workdir / output, (_kraken2_output_line(i, rng) for i in range(start, start + reads)))
+        _write_lines(workdir / report, _kreport_lines(max(50, n // 100), rng))
+        inputs += [output, report]
+        start += reads
+    command = _inline(workdir, 'kraken2_final_aggregator', {'meta.id': 'bench', 'meta.batch_count ?: 0': str(BATCHES)})
+    return command, inputs
+
+
+def _setup_seqkit_merge_stats(workdir: Path, n: int, rng: random.Random):
+    keys, stats, histograms = [], [], []
+    spread = min(n, 20000)
+    for batch, reads in enumerate(_split(n, BATCHES), start=1):
+        histogram = {}
+        for _ in range(reads):
+            length = 200 + rng.randrange(spread)
+            histogram[length] = histogram.get(length, 0) + 1
+        sum_len = sum(length * count for length, count in histogram.items())
+        lengths = sorted(histogram)
+        row = [f'batch_{batch}.fastq.gz', 'FASTQ', 'DNA', reads, sum_len, lengths[0], round(sum_len / reads, 1),
+               lengths[-1], 0.0, 0.0, 0.0, 0, 0, 0, 85.0, 70.0, 14.5, 48.0, 0]
+        stats.append(f'batch_{batch}.tsv')
+        histograms.append(f'hist_{batch}.tsv')
+        keys.append(f'batch_{batch}')
+        _write_lines(workdir / stats[-1], ['\t'.join(['file', 'format', 'type', 'num_seqs', 'sum_len', 'min_len',
+                                                       'avg_len', 'max_len', 'Q1', 'Q2', 'Q3', 'sum_gap', 'N50',
+                                                       'N50_num', 'Q20(%)', 'Q30(%)', 'AvgQual', 'GC(%)', 'sum_n']),
+                                             '\t'.join(str(v) for v in row)])
+        _write_lines(workdir / histograms[-1], (f'{length}\t{histogram[length]}' for length in lengths))
+    return _python('seqkit_merge_stats.py', '--prefix', 'bench', '--sample-id', 'bench',
+                   '--batch-keys', *keys, '--stats', *stats, '--histograms', *histograms), stats + histograms
+
+
+def _setup_validation_cumulative_aggregator(method: str):
+    def setup(workdir: Path, n: int, rng: random.Random):
+        ids, files, stats = [], [], []
+        start = 0
+        for batch, reads in enumerate(_split(n, BATCHES), start=1):
+            line = _paf_line if method == 'minimap2' else _blast_line
+            ids.append(f'batch_{batch}')
+            files.append(f'batch_input_{batch}')
+            stats.append(f'batch_stats_{batch}')
+            _write_lines(workdir / files[-1], (line(i, rng) for i in range(start, start + reads)))
+            (workdir / stats[-1]).write_text(json.dumps({'total_reads': reads * 2}))
+            start += reads
+        return _python('validation_cumulative_aggregator.py', '--method', method, '--prefix', 'bench',
+                       '--sample-id', 'bench', '--taxid', '562', '--batch-ids', *ids,
+                       '--batch-files', *files, '--batch-stats', *stats), files + stats
+    return setup
+
+
+def _setup_update_cumulative_stats(workdir: Path, n: int, rng: random.Random):
+    now = int(time.time() * 1000)
+    directories = [f'/data/run/dir_{i}' for i in range(max(1, n // 100))]
+    snapshot = {
+        'batch_info': {'batch_id': 101, 'processing_timestamp': now, 'processing_time_formatted': 'now'},
+        'file_statistics': {'file_count': 50, 'total_size_bytes': 5 << 30, 'total_size_mb': 5120.0,
+                            'estimated_total_reads': 400000, 'compressed_files': 50},
+        'quality_indicators': {'compressed_ratio': 1.0, 'large_files_ratio': 0.2},
+        'priority_analysis': {'average_priority': 50.0},
+        'source_analysis': {'watch_directories': directories[:1],
+                            'sample_ids': [f'sample_{i}' for i in range(n)],
+                            'directory_file_counts': {d: rng.randint(1, 50) for d in directories}},
+        'timing_analysis': {'average_file_age_ms': 60000},
+    }
+    trend = list(range(100))
+    previous = {
+        'session_info': {'session_start': now - 3_600_000, 'session_start_formatted': 'then',
+                         'total_batches': 100, 'last_update': now - 60000},
+        'totals': {'total_files': 5000, 'total_size_bytes': 500 << 30, 'total_size_mb': 512000.0,
+                   'total_estimated_reads': 40000000, 'total_compressed_files': 5000},
+        'averages': {}, 'performance': {},
+        'trends': {key: list(trend) for key in ['batch_timestamps', 'batch_file_counts', 'batch_sizes_mb', 'batch_read_counts']},
+        'quality_trends': {key: list(trend) for key in ['compression_ratios', 'priority_scores', 'large_file_ratios']},
+        'source_summary': {'unique_directories': directories[:1],
+                           'unique_samples': [f'sample_{i}' for i in range(n // 2, n + n // 2)],
+                           'directory_totals': {d: 100 for d in directories}},
+    }
+    (workdir / 'snapshot.json').write_text(json.dumps(snapshot))
+    (workdir / 'previous.json').write_text(json.dumps(previous))
+    config = {'performance_thresholds': {'min_files_per_second': 1.0, 'max_avg_file_age_minutes': 30},
+              'quality_thresholds': {'min_compression_ratio': 0.5}}
+    command = _inline(workdir, 'update_cumulative_stats', {
+        'snapshot_stats': 'snapshot.json', 'has_previous_py': 'True', 'previous_cumulative': 'previous.json',
+        'new groovy.json.JsonBuilder(stats_config).toString()': json.dumps(config),
+    })
+    return command, ['snapshot.json', 'previous.json']
+
+
+# Micro-benchmark registry: name -> description, the unit one row counts and
+# the setup writing n rows of input. Rows/s in the results is in that unit.
+MICRO_BENCHMARKS: Dict[str, Dict] = {
+    'kreport_to_canonical': {
+        'description': 'kreport_to_canonical.py on a Kraken2 report',
+        'unit': 'taxa',
+        'setup': _setup_kreport_to_canonical,
+    },
+    'alignment_to_canonical_paf': {
+        'description': 'alignment_to_canonical.py on minimap2 PAF',
+        'unit': 'alignments',
+        'setup': _setup_alignment_to_canonical_paf,
+    },
+    'alignment_to_canonical_blast': {
+        'description': 'alignment_to_canonical.py on BLAST outfmt 6',
+        'unit': 'alignments',
+        'setup': _setup_alignment_to_canonical_blast,
+    },
+    'qc_to_canonical': {
+        'description': 'qc_to_canonical.py on fastp JSON with a read length histogram',
+        'unit': 'length bins',
+        'setup': _setup_qc_to_canonical,
+    },
+    'assembly_to_canonical': {
+        'description': 'assembly_to_canonical.py on Flye assembly_info plus FASTA (GC per contig)',
+        'unit': 'contigs',
+        'setup': _setup_assembly_to_canonical,
+    },
+    'kraken2_output_merger': {
+        'description': 'KRAKEN2_OUTPUT_MERGER inline script on one batch',
+        'unit': 'reads',
+        'setup': _setup_kraken2_output_merger,
+    },
+    'kraken2_final_aggregator': {
+        'description': f'KRAKEN2_FINAL_AGGREGATOR inline script over {BATCHES} batches',
+        'unit': 'reads',
+        'setup': _setup_kraken2_final_aggregator,
+    },
+    'seqkit_merge_stats': {
+        'description': f'SEQKIT_MERGE_STATS (seqkit_merge_stats.py) over {BATCHES} batches',
+        'unit': 'reads',
+        'setup': _setup_seqkit_merge_stats,
+    },
+    'validation_cumulative_aggregator_minimap2': {
+        'description': f'VALIDATION_CUMULATIVE_AGGREGATOR (minimap2) over {BATCHES} batches',
+        'unit': 'alignments',
+        'setup': _setup_validation_cumulative_aggregator('minimap2'),
+    },
+    'validation_cumulative_aggregator_blast': {
+        'description': f'VALIDATION_CUMULATIVE_AGGREGATOR (blast) over {BATCHES} batches',
+        'unit': 'alignments',
+        'setup': _setup_validation_cumulative_aggregator('blast'),
+    },
+    'update_cumulative_stats': {
+        'description': 'UPDATE_CUMULATIVE_STATS inline script folding one snapshot',
+        'unit': 'samples',
+        'setup': _setup_update_cumulative_stats,
+    },
+}
+
+
+# Metrics compare judges: name -> (its value in one run's metrics, which
+# direction is better).
+COMPARED_METRICS = {
+    'time': (lambda m: m.get('execution_time'), 'lower'),
+    'peak_rss': (lambda m: m.get('memory_usage', {}).get('peak'), 'lower'),
+    'throughput': (lambda m: m.get('throughput', {}).get('rows_per_second'), 'higher'),
+}
+
+BOOTSTRAP_RESAMPLES = 2000
+CONFIDENCE = 0.95
+# Fewer runs than this per side and a confidence interval means little.
+MIN_SAMPLES = 3
+
+
+def _median_fields(runs: List[Dict]) -> Dict:
+    """Median of every numeric field over runs, recursing into dicts."""
+    out = {}
+    for key, value in runs[0].items():
+        if isinstance(value, dict):
+            out[key] = _median_fields([r.get(key, {}) for r in runs])
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            out[key] = statistics.median(r.get(key, value) for r in runs)
+        else:
+            out[key] = value
+    return out
+
+
+def summarize_runs(runs: List[Dict], warmup: int) -> Dict:
+    """
+    One metrics entry for repeated runs of a benchmark: the median of every
+    field over the successful runs, in the single-run layout, plus each
+    run's value of the compared metrics under 'samples'.
+    """
+    measured = [r for r in runs if r.get('success')] or runs
+    summary = _median_fields(measured)
+    summary['success'] = all(r.get('success') for r in runs)
+    failed = [r for r in runs if not r.get('success')]
+    if failed:
+        summary['returncode'] = failed[0].get('returncode')
+    summary['runs'] = len(runs)
+    summary['warmup'] = warmup
+    summary['samples'] = {}
+    for metric, (value, _) in COMPARED_METRICS.items():
+        values = [value(r) for r in measured if r.get('success')]
+        if values and all(values):
+            summary['samples'][metric] = values
+    return summary
+
+
+def metric_samples(metrics: Dict) -> Dict[str, List[float]]:
+    """Per-run values of each compared metric. A result recorded before
+    repeated runs counts as one sample."""
+    if 'samples' in metrics:
+        return metrics['samples']
+    samples = {}
+    for metric, (value, _) in COMPARED_METRICS.items():
+        if metrics.get('success', True) and value(metrics):
+            samples[metric] = [value(metrics)]
+    return samples
+
+
+def bootstrap_change(baseline: List[float], current: List[float], seed: int = 0) -> Tuple[float, float, float]:
+    """
+    Relative change of the median, current / baseline - 1, and its
+    percentile bootstrap confidence interval. With one sample per side the
+    interval collapses to the point estimate.
+    """
+    rng = random.Random(seed)
+    point = statistics.median(current) / statistics.median(baseline) - 1
+    changes = sorted(
+        statistics.median(rng.choices(current, k=len(current)))
+        / statistics.median(rng.choices(baseline, k=len(baseline))) - 1
+        for _ in range(BOOTSTRAP_RESAMPLES)
+    )
+    tail = (1 - CONFIDENCE) / 2
+    return point, changes[int(tail * BOOTSTRAP_RESAMPLES)], changes[int((1 - tail) * BOOTSTRAP_RESAMPLES) - 1]
+
+
+def judge(metric: str, baseline: List[float], current: List[float], threshold: float) -> Dict:
+    """
+    Compare one metric's samples. A regression (improvement) needs the whole
+    confidence interval of the change beyond the threshold in the worse
+    (better) direction; a median change beyond the threshold whose interval
+    still reaches inside it is inconclusive.
+    """
+    change, low, high = bootstrap_change(baseline, current)
+    # Positive is worse, whichever direction the metric improves in.
+    sign = 1 if COMPARED_METRICS[metric][1] == 'lower' else -1
+    worse, worse_low, worse_high = sign * change, min(sign * low, sign * high), max(sign * low, sign * high)
+    if worse_low > threshold:
+        verdict = 'regression'
+    elif worse_high < -threshold:
+        verdict = 'improvement'
+    elif abs(worse) > threshold:
+        verdict = 'inconclusive'
+    else:
+        verdict = 'stable'
+    return {
+        'metric': metric,
+        'verdict': verdict,
+        'baseline_median': statistics.median(baseline),
+        'current_median': statistics.median(current),
+        'delta_percent': change * 100,
+        'ci_percent': [low * 100, high * 100],
+        'threshold_percent': threshold * 100,
+        'samples': [len(baseline), len(current)],
+    }
+
+
+def load_thresholds(path: Optional[str]) -> Dict:
+    """
+    Per-benchmark thresholds, as JSON:
+
+        {"default": {"time": 0.1, "peak_rss": 0.1, "throughput": 0.1},
+         "benchmarks": {"update_cumulative_stats": {"time": 0.25},
+                        "kreport_to_canonical[1M]": {"peak_rss": 0.05}}}
+
+    A benchmark key is a full test name or a micro-benchmark name, which
+    covers all of its sizes.
+    """
+    if not path:
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def threshold_for(test: str, metric: str, thresholds: Dict, default: float) -> float:
+    """The most specific threshold: test name, then benchmark name, then default."""
+    benchmarks = thresholds.get('benchmarks', {})
+    for scope in (benchmarks.get(test, {}), benchmarks.get(test.split('[')[0], {}), thresholds.get('default', {})):
+        if metric in scope:
+            return float(scope[metric])
+    return default
+
+
+def git_commit() -> Optional[str]:
+    """The checked-out commit of this repository, if it is a git checkout."""
+    try:
+        result = subprocess.run(['git', '-C', str(REPO_ROOT), 'rev-parse', '--short', 'HEAD'],
+                                capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    if result.returncode != 0:
+        return None
+    return result.stdout.strip() or None
 
 
 class PerformanceBenchmark:
@@ -119,7 +625,112 @@ class PerformanceBenchmark:
 
         return metrics
 
-    def run_test_suite(self, suite_name: str = "baseline") -> Dict:
+    def benchmark_micro(self, name: str, size: str, workdir: Path,
+                        repeats: int = 5, warmup: int = 1) -> Dict:
+        """Benchmark one registered micro-benchmark at one input size."""
+        spec = MICRO_BENCHMARKS[name]
+        rows = SIZES[size]
+        print(f"\n🔬 Benchmarking: {name} [{size} {spec['unit']}], {warmup} warmup + {repeats} runs")
+
+        if workdir.exists():
+            shutil.rmtree(workdir)
+        workdir.mkdir(parents=True)
+        # Seeded, so every run of a size benchmarks the same input.
+        argv, inputs = spec['setup'](workdir, rows, random.Random(f"{name}:{rows}"))
+        input_bytes = sum((workdir / path).stat().st_size for path in inputs)
+
+        runs = []
+        for run in range(warmup + repeats):
+            metrics = self._run_micro_once(argv, workdir)
+            if metrics['success'] and metrics['execution_time'] > 0:
+                metrics['throughput'] = {
+                    'rows_per_second': rows / metrics['execution_time'],
+                    'mb_per_second': input_bytes / 1024 / 1024 / metrics['execution_time']
+                }
+            if not metrics['success']:
+                tail = (workdir / 'benchmark.log').read_text(errors='replace').splitlines()[-10:]
+                print(f"   ✗ Failed with exit code {metrics['returncode']}")
+                for line in tail:
+                    print(f"     {line}")
+                runs.append(metrics)
+                break
+            # Warmup runs fill the page cache and the interpreter's file
+            # caches; they are not measured.
+            if run >= warmup:
+                runs.append(metrics)
+
+        summary = summarize_runs(runs, warmup)
+        summary.update({'size': size, 'rows': rows, 'unit': spec['unit'], 'input_bytes': input_bytes})
+
+        if summary['success']:
+            times = summary['samples']['time']
+            print(f"   ✓ Median {summary['execution_time']:.3f}s (min {min(times):.3f}s, max {max(times):.3f}s)")
+            print(f"   Memory: {summary['memory_usage']['peak'] / 1024 / 1024:.1f} MB peak")
+            print(f"   Throughput: {summary['throughput']['rows_per_second']:,.0f} {spec['unit']}/s, "
+                  f"{summary['throughput']['mb_per_second']:.1f} MB/s")
+        return summary
+
+    def _run_micro_once(self, argv: List[str], workdir: Path) -> Dict:
+        """Run a benchmark script once, in workdir."""
+        # The peak is the script's own high-water mark, which polling misses
+        # for runs shorter than a sample; wait4 gives its exact CPU time.
+        peak_path = workdir / 'benchmark.peak_rss'
+        peak_path.unlink(missing_ok=True)
+        command = [sys.executable, '-c', _PEAK_RSS_RUNNER, str(peak_path), *argv]
+        start_time = time.perf_counter()
+        with open(workdir / 'benchmark.log', 'wb') as log:
+            proc = subprocess.Popen(command, cwd=workdir, stdout=log, stderr=subprocess.STDOUT)
+            _, status, usage = os.wait4(proc.pid, 0)
+        execution_time = time.perf_counter() - start_time
+        proc.returncode = os.waitstatus_to_exitcode(status)
+
+        cpu_time = usage.ru_utime + usage.ru_stime
+        return {
+            'success': proc.returncode == 0,
+            'execution_time': execution_time,
+            'memory_usage': {
+                'peak': int(peak_path.read_text()) if peak_path.exists() else 0
+            },
+            'cpu_usage': {
+                'average': cpu_time / execution_time * 100 if execution_time > 0 else 0,
+                'cpu_time': cpu_time
+            },
+            'returncode': proc.returncode
+        }
+
+    def run_micro_suite(self, suite_name: str = "micro", names: Optional[List[str]] = None,
+                        sizes: Optional[List[str]] = None, repeats: int = 5, warmup: int = 1) -> Dict:
+        """Run the registered micro-benchmarks at each input size."""
+        names = names or list(MICRO_BENCHMARKS)
+        sizes = sizes or list(SIZES)
+        print(f"\n{'='*80}")
+        print(f"PERFORMANCE MICRO-BENCHMARK SUITE: {suite_name}")
+        print(f"{'='*80}")
+
+        workroot = self.output_dir / 'micro_work'
+        for name in names:
+            for size in sizes:
+                metrics = self.benchmark_micro(name, size, workroot / f"{name}_{size}", repeats, warmup)
+                # One entry per benchmark and size, so compare pairs them up.
+                self.metrics['benchmarks'][f"{name}[{size}]"] = {
+                    'description': MICRO_BENCHMARKS[name]['description'],
+                    'metrics': metrics
+                }
+        shutil.rmtree(workroot, ignore_errors=True)
+
+        return self._save_results(suite_name)
+
+    def _save_results(self, suite_name: str) -> Dict:
+        self.metrics['suite'] = suite_name
+        self.metrics['commit'] = git_commit()
+        results_file = self.output_dir / f"benchmark_{suite_name}_{int(time.time())}.json"
+        with open(results_file, 'w') as f:
+            json.dump(self.metrics, f, indent=2)
+
+        print(f"\n✅ Benchmark results saved to: {results_file}")
+        return self.metrics
+
+    def run_test_suite(self, suite_name: str = "baseline", repeats: int = 5, warmup: int = 1) -> Dict:
         """Run complete performance test suite."""
         print(f"\n{'='*80}")
         print(f"PERFORMANCE REGRESSION TEST SUITE: {suite_name}")
@@ -154,10 +765,17 @@ class PerformanceBenchmark:
             print(f"\n--- Test Case: {test_case['name']} ---")
             print(f"Description: {test_case['description']}")
 
-            metrics = self.benchmark_process(
-                test_case['name'],
-                test_case['command']
-            )
+            runs = []
+            for run in range(warmup + repeats):
+                metrics = self.benchmark_process(
+                    test_case['name'],
+                    test_case['command']
+                )
+                if run >= warmup or not metrics.get('success'):
+                    runs.append(metrics)
+                if not metrics.get('success'):
+                    break
+            metrics = summarize_runs(runs, warmup)
 
             self.metrics['benchmarks'][test_case['name']] = {
                 'description': test_case['description'],
@@ -165,15 +783,11 @@ class PerformanceBenchmark:
             }
 
         # Save results
-        results_file = self.output_dir / f"benchmark_{suite_name}_{int(time.time())}.json"
-        with open(results_file, 'w') as f:
-            json.dump(self.metrics, f, indent=2)
-
-        print(f"\n✅ Benchmark results saved to: {results_file}")
-        return self.metrics
+        return self._save_results(suite_name)
 
     def compare_benchmarks(self, baseline_file: str, current_file: str,
-                          threshold: float = 0.1) -> Dict:
+                          threshold: float = 0.1, thresholds: Optional[Dict] = None,
+                          output: Optional[str] = None) -> Dict:
         """Compare two benchmark runs."""
         print(f"\n{'='*80}")
         print("PERFORMANCE REGRESSION COMPARISON")
@@ -185,66 +799,136 @@ class PerformanceBenchmark:
         with open(current_file, 'r') as f:
             current = json.load(f)
 
+        baseline_samples = {name: metric_samples(test['metrics']) for name, test in baseline.get('benchmarks', {}).items()}
+        current_samples = {name: metric_samples(test['metrics']) for name, test in current.get('benchmarks', {}).items()}
+
         comparison = {
             'baseline': baseline_file,
             'current': current_file,
+            **self._compare_samples(baseline_samples, current_samples, threshold, thresholds or {})
+        }
+        return self._save_comparison(comparison, output)
+
+    def trend(self, history_file: str, suite: Optional[str] = None, window: int = 10,
+              threshold: float = 0.1, thresholds: Optional[Dict] = None,
+              output: Optional[str] = None) -> Dict:
+        """
+        Compare the newest run in a history file against the runs of the
+        previous `window` entries of the same suite, their samples pooled.
+        """
+        with open(history_file) as f:
+            entries = [json.loads(line) for line in f if line.strip()]
+        suite = suite or (entries[-1]['suite'] if entries else None)
+        entries = [e for e in entries if e.get('suite') == suite]
+        if len(entries) < 2:
+            raise ValueError(f"{history_file}: need two runs of suite '{suite}' to compare, found {len(entries)}")
+        current, previous = entries[-1], entries[-1 - window:-1]
+
+        print(f"\n{'='*80}")
+        print(f"PERFORMANCE TREND: {suite}, {len(previous)} previous runs")
+        print(f"{'='*80}")
+        print("Commits: " + " ".join(e.get('commit') or '?' for e in previous + [current]))
+        for name in sorted(current['benchmarks']):
+            medians = []
+            for entry in previous + [current]:
+                times = entry['benchmarks'].get(name, {}).get('samples', {}).get('time')
+                medians.append(f"{statistics.median(times):.3f}" if times else '-')
+            print(f"  {name}: time {' '.join(medians[:-1])} → {medians[-1]}")
+
+        baseline_samples = {}
+        for entry in previous:
+            for name, test in entry['benchmarks'].items():
+                for metric, values in test.get('samples', {}).items():
+                    baseline_samples.setdefault(name, {}).setdefault(metric, []).extend(values)
+        current_samples = {name: test.get('samples', {}) for name, test in current['benchmarks'].items()}
+
+        comparison = {
+            'history': history_file,
+            'suite': suite,
+            'baseline_commits': [e.get('commit') for e in previous],
+            'current_commit': current.get('commit'),
+            **self._compare_samples(baseline_samples, current_samples, threshold, thresholds or {})
+        }
+        return self._save_comparison(comparison, output)
+
+    def _compare_samples(self, baseline: Dict, current: Dict, threshold: float, thresholds: Dict) -> Dict:
+        """Judge every metric both sides have samples of."""
+        result = {
             'regressions': [],
             'improvements': [],
+            'inconclusive': [],
             'stable': []
         }
+        few_samples = []
 
-        for test_name in baseline.get('benchmarks', {}).keys():
-            if test_name not in current.get('benchmarks', {}):
+        for test_name in baseline:
+            if test_name not in current:
                 continue
-
-            baseline_metrics = baseline['benchmarks'][test_name]['metrics']
-            current_metrics = current['benchmarks'][test_name]['metrics']
-
-            # Compare execution time
-            baseline_time = baseline_metrics.get('execution_time', 0)
-            current_time = current_metrics.get('execution_time', 0)
-
-            if baseline_time > 0:
-                time_delta = (current_time - baseline_time) / baseline_time
-
-                test_comparison = {
-                    'test': test_name,
-                    'baseline_time': baseline_time,
-                    'current_time': current_time,
-                    'delta_percent': time_delta * 100
-                }
-
-                if time_delta > threshold:
-                    comparison['regressions'].append(test_comparison)
-                    print(f"⚠️  REGRESSION: {test_name}")
-                    print(f"   Slowdown: {time_delta * 100:.1f}%")
-                    print(f"   Baseline: {baseline_time:.2f}s → Current: {current_time:.2f}s")
-                elif time_delta < -threshold:
-                    comparison['improvements'].append(test_comparison)
-                    print(f"✅ IMPROVEMENT: {test_name}")
-                    print(f"   Speedup: {abs(time_delta) * 100:.1f}%")
-                    print(f"   Baseline: {baseline_time:.2f}s → Current: {current_time:.2f}s")
-                else:
-                    comparison['stable'].append(test_comparison)
-                    print(f"➡️  STABLE: {test_name}")
-                    print(f"   Change: {time_delta * 100:.1f}%")
+            for metric in COMPARED_METRICS:
+                baseline_values = baseline[test_name].get(metric)
+                current_values = current[test_name].get(metric)
+                if not baseline_values or not current_values:
+                    continue
+                if min(len(baseline_values), len(current_values)) < MIN_SAMPLES:
+                    few_samples.append(f"{test_name}:{metric}")
+
+                limit = threshold_for(test_name, metric, thresholds, threshold)
+                test_comparison = {'test': test_name, **judge(metric, baseline_values, current_values, limit)}
+                verdict = test_comparison['verdict']
+                result['regressions' if verdict == 'regression' else
+                       'improvements' if verdict == 'improvement' else verdict].append(test_comparison)
+
+                label = {'regression': '⚠️  REGRESSION', 'improvement': '✅ IMPROVEMENT',
+                         'inconclusive': '❔ INCONCLUSIVE', 'stable': '➡️  STABLE'}[verdict]
+                low, high = test_comparison['ci_percent']
+                print(f"{label}: {test_name} [{metric}]")
+                print(f"   Change: {test_comparison['delta_percent']:+.1f}% "
+                      f"({CONFIDENCE:.0%} CI {low:+.1f}% to {high:+.1f}%, threshold {limit:.0%}, "
+                      f"n={len(baseline_values)}/{len(current_values)})")
 
         # Generate summary
         print(f"\n{'='*80}")
         print("SUMMARY")
         print(f"{'='*80}")
-        print(f"Regressions: {len(comparison['regressions'])}")
-        print(f"Improvements: {len(comparison['improvements'])}")
-        print(f"Stable: {len(comparison['stable'])}")
-
+        print(f"Regressions: {len(result['regressions'])}")
+        print(f"Improvements: {len(result['improvements'])}")
+        print(f"Inconclusive: {len(result['inconclusive'])}")
+        print(f"Stable: {len(result['stable'])}")
+        if few_samples:
+            print(f"Note: fewer than {MIN_SAMPLES} runs per side for {len(few_samples)} metric(s); "
+                  f"their intervals are not meaningful (run with --repeats)")
+
+        result['few_samples'] = few_samples
+        result['verdict'] = 'regression' if result['regressions'] else 'pass'
+        result['exit_code'] = 1 if result['regressions'] else 0
+        print(f"Verdict: {result['verdict'].upper()}")
+        return result
+
+    def _save_comparison(self, comparison: Dict, output: Optional[str]) -> Dict:
         # Save comparison
-        comparison_file = self.output_dir / f"comparison_{int(time.time())}.json"
+        comparison_file = Path(output) if output else self.output_dir / f"comparison_{int(time.time())}.json"
         with open(comparison_file, 'w') as f:
             json.dump(comparison, f, indent=2)
 
         print(f"\n✅ Comparison saved to: {comparison_file}")
         return comparison
 
+    def append_history(self, history_file: str) -> None:
+        """Append this run's per-run samples to a JSON-lines history file."""
+        entry = {
+            'timestamp': self.metrics['timestamp'],
+            'commit': self.metrics.get('commit'),
+            'suite': self.metrics.get('suite'),
+            'system_info': {key: self.metrics['system_info'][key] for key in ('cpu_count', 'memory_total', 'platform')},
+            'benchmarks': {
+                name: {'success': test['metrics'].get('success'), 'samples': metric_samples(test['metrics'])}
+                for name, test in self.metrics['benchmarks'].items()
+            }
+        }
+        with open(history_file, 'a') as f:
+            f.write(json.dumps(entry) + '\n')
+        print(f"✅ Appended to history: {history_file}")
+
     def generate_report(self, format: str = 'markdown') -> str:
         """Generate performance report."""
         if format == 'markdown':
@@ -373,12 +1057,32 @@ def main():
     run_parser = subparsers.add_parser('run', help='Run performance benchmarks')
     run_parser.add_argument('--test-suite', default='baseline', help='Test suite name')
     run_parser.add_argument('--output-dir', default='.performance_tests', help='Output directory')
+    run_parser.add_argument('--benchmarks', help='Comma-separated micro-benchmarks (suite "micro"; default: all)')
+    run_parser.add_argument('--sizes', default=','.join(SIZES),
+                            help=f'Comma-separated input sizes (suite "micro"; of {", ".join(SIZES)})')
+    run_parser.add_argument('--repeats', type=int, default=5, help='Measured runs per benchmark')
+    run_parser.add_argument('--warmup', type=int, default=1, help='Unmeasured runs before them')
+    run_parser.add_argument('--history', help='JSON-lines history file to append this run to')
+
+    # List micro-benchmarks
+    subparsers.add_parser('list', help='List the micro-benchmarks')
 
     # Compare benchmarks
     compare_parser = subparsers.add_parser('compare', help='Compare benchmark results')
     compare_parser.add_argument('--baseline', required=True, help='Baseline benchmark file')
     compare_parser.add_argument('--current', required=True, help='Current benchmark file')
-    compare_parser.add_argument('--threshold', type=float, default=0.1, help='Regression threshold (0.1 = 10%)')
+    compare_parser.add_argument('--threshold', type=float, default=0.1, help='Regression threshold (0.1 = 10%%)')
+    compare_parser.add_argument('--thresholds', help='JSON file of per-benchmark, per-metric thresholds')
+    compare_parser.add_argument('--output', help='Comparison JSON file (default: .performance_tests/comparison_<time>.json)')
+
+    # Trend over a history file
+    trend_parser = subparsers.add_parser('trend', help='Compare the newest run in a history file with earlier ones')
+    trend_parser.add_argument('--history', required=True, help='JSON-lines history file (run --history)')
+    trend_parser.add_argument('--suite', help='Suite to follow (default: that of the newest entry)')
+    trend_parser.add_argument('--window', type=int, default=10, help='Previous runs pooled as the baseline')
+    trend_parser.add_argument('--threshold', type=float, default=0.1, help='Regression threshold (0.1 = 10%%)')
+    trend_parser.add_argument('--thresholds', help='JSON file of per-benchmark, per-metric thresholds')
+    trend_parser.add_argument('--output', help='Comparison JSON file (default: .performance_tests/comparison_<time>.json)')
 
     # Generate report
     report_parser = subparsers.add_parser('report', help='Generate performance report')
@@ -388,12 +1092,40 @@ def main():
     args = parser.parse_args()
 
     if args.command == 'run':
+        if args.repeats < 1 or args.warmup < 0:
+            parser.error("--repeats must be at least 1 and --warmup at least 0")
         benchmark = PerformanceBenchmark(args.output_dir)
-        benchmark.run_test_suite(args.test_suite)
+        if args.test_suite == 'micro':
+            names = args.benchmarks.split(',') if args.benchmarks else None
+            sizes = args.sizes.split(',')
+            unknown = [n for n in names or [] if n not in MICRO_BENCHMARKS] + [s for s in sizes if s not in SIZES]
+            if unknown:
+                parser.error(f"unknown benchmark or size: {', '.join(unknown)}")
+            benchmark.run_micro_suite(args.test_suite, names, sizes, args.repeats, args.warmup)
+        else:
+            benchmark.run_test_suite(args.test_suite, args.repeats, args.warmup)
+        if args.history:
+            benchmark.append_history(args.history)
+
+    elif args.command == 'list':
+        for name, spec in MICRO_BENCHMARKS.items():
+            print(f"{name:<44} {spec['unit']:<12} {spec['description']}")
 
     elif args.command == 'compare':
         benchmark = PerformanceBenchmark()
-        benchmark.compare_benchmarks(args.baseline, args.current, args.threshold)
+        comparison = benchmark.compare_benchmarks(args.baseline, args.current, args.threshold,
+                                                  load_thresholds(args.thresholds), args.output)
+        sys.exit(comparison['exit_code'])
+
+    elif args.command == 'trend':
+        benchmark = PerformanceBenchmark()
+        try:
+            comparison = benchmark.trend(args.history, args.suite, args.window, args.threshold,
+                                         load_thresholds(args.thresholds), args.output)
+        except ValueError as e:
+            print(f"ERROR: {e}", file=sys.stderr)
+            sys.exit(2)
+        sys.exit(comparison['exit_code'])
 
     elif args.command == 'report':
         benchmark = PerformanceBenchmark()
@@ -0,0 +1,225 @@
+#!/usr/bin/env bash
+#
+# proc_sampler.sh -- run a command and sample its process tree's resources.
+#
+# What it does
+# ------------
+# Runs COMMAND as a child and, every INTERVAL seconds until it exits, reads
+# for each process in its tree (found through /proc/<pid>/task/*/children):
+#
+#   /proc/<pid>/stat          page faults, including reaped children's
+#   /proc/<pid>/status        VmRSS, VmHWM (the kernel's own per-process peak)
+#   /proc/<pid>/io            read_bytes (storage), rchar (all reads)
+#   /proc/<pid>/smaps_rollup  Pss, every --pss-every samples and at RSS peaks
+#
+# PSS matters for a memory-mapped Kraken2 database: RSS counts every shared
+# database page in full in every process, PSS splits each page between the
+# processes that map it, so concurrent classifiers are not over-counted.
+#
+# When COMMAND exits, OUTPUT holds one JSON object:
+#
+#   {"command": ..., "exit_code": N, "interval_seconds": ..., "samples": N,
+#    "wall_seconds": ..., "cpu_user_seconds": ..., "cpu_system_seconds": ...,
+#    "peak_rss_kb": N, "peak_process_hwm_kb": N, "peak_pss_kb": N,
+#    "minor_faults": N, "major_faults": N, "read_bytes": N, "rchar_bytes": N,
+#    "max_processes": N}
+#
+# peak_* are maxima of the tree total over samples (peak_process_hwm_kb is
+# exact: the largest VmHWM of any one process). Faults and bytes read are the
+# tree totals at the last sample, so they miss at most one interval. CPU
+# times are exact: they come from the shell's rusage for its reaped children,
+# and the sampling loop itself never forks (bash builtins only), so COMMAND
+# is the only child counted. Anything /proc does not expose to this user is
+# reported as null.
+#
+# Why
+# ---
+# KRAKEN2_OPTIMIZED polled `ps aux | grep kraken2` every 5 seconds, which
+# picked up every kraken2 on the node (other samples' tasks included) and
+# forked three processes per poll. This follows exactly COMMAND's tree, at
+# sub-second resolution, for any module: shell only, so it runs in images
+# without Python.
+#
+# Usage
+# -----
+#   proc_sampler.sh [--interval SECONDS] [--pss-every N] --output OUT.json \
+#       -- COMMAND [ARGS...]
+#
+# Exits with COMMAND's exit status (128+signal when it is killed), so retry
+# strategies keyed on exit codes see the same status as without the wrapper.
+#
+set -uo pipefail
+
+interval=0.5
+pss_every=4
+output=""
+while [[ $# -gt 0 ]]; do
+    case "$1" in
+        --interval) interval="$2"; shift 2 ;;
+        --pss-every) pss_every="$2"; shift 2 ;;
+        --output) output="$2"; shift 2 ;;
+        --) shift; break ;;
+        *) echo "proc_sampler.sh: unknown option: $1" >&2; exit 2 ;;
+    esac
+done
+if [[ $# -eq 0 ]] || [[ -z "$output" ]]; then
+    echo "usage: proc_sampler.sh [--interval SECONDS] [--pss-every N] --output OUT.json -- COMMAND [ARGS...]" >&2
+    exit 2
+fi
+
+# Microseconds since the epoch, without forking date.
+now_us() {
+    if [[ -n "${EPOCHREALTIME:-}" ]]; then
+        local t="${EPOCHREALTIME/[.,]/}"
+        echo $(( 10#$t ))
+    else
+        echo $(( SECONDS * 1000000 ))
+    fi
+}
+
+# A timed read on a pipe no one writes to: a sleep that is a builtin.
+exec {tick_fd}<> <(:)
+
+peak_rss=0
+peak_hwm=0
+peak_pss=null
+max_procs=0
+minflt=null
+majflt=null
+read_bytes=null
+rchar=null
+samples=0
+
+# Collect the tree under $1 into the global array `tree`.
+collect_tree() {
+    tree=()
+    local queue=("$1") pid task kid kids
+    while [[ ${#queue[@]} -gt 0 ]]; do
+        pid="${queue[0]}"
+        queue=("${queue[@]:1}")
+        [[ -d /proc/$pid ]] || continue
+        tree+=("$pid")
+        for task in /proc/"$pid"/task/*; do
+            [[ -r "$task/children" ]] || continue
+            read -ra kids 2>/dev/null < "$task/children" || true
+            for kid in "${kids[@]}"; do
+                queue+=("$kid")
+            done
+        done
+    done
+}
+
+sample() {
+    local root="$1" with_pss="$2"
+    local pid line key value rest
+    local rss=0 hwm=0 pss=0 minf=0 majf=0 rb=0 rc=0
+    local have_pss=1 have_io=1 have_stat=0
+    collect_tree "$root"
+    for pid in "${tree[@]}"; do
+        # Processes exit mid-sample. Redirections apply left to right, so
+        # stderr is silenced before the open that can fail, not after it.
+        if read -r line 2>/dev/null < /proc/"$pid"/stat; then
+            # Fields after the parenthesised command name, which may hold spaces.
+            rest="${line##*) }"
+            read -ra f <<< "$rest"
+            # f[0] is field 3 (state): minflt 10, cminflt 11, majflt 12, cmajflt 13.
+            [[ "${f[0]}" == "Z" ]] && continue
+            minf=$(( minf + f[7] + f[8] ))
+            majf=$(( majf + f[9] + f[10] ))
+            have_stat=1
+        else
+            continue
+        fi
+        {
+            while read -r key value rest; do
+                case "$key" in
+                    VmRSS:) rss=$(( rss + value )) ;;
+                    VmHWM:) (( value > hwm )) && hwm=$value ;;
+                esac
+            done < /proc/"$pid"/status
+        } 2>/dev/null
+        if [[ -r /proc/$pid/io ]] && { exec {io_fd}< /proc/"$pid"/io; } 2>/dev/null; then
+            while read -r key value <&"$io_fd"; do
+                case "$key" in
+                    rchar:) rc=$(( rc + value )) ;;
+                    read_bytes:) rb=$(( rb + value )) ;;
+                esac
+            done
+            exec {io_fd}<&-
+        else
+            have_io=0
+        fi
+    done
+    [[ "$have_stat" == 1 ]] || return 1
+
+    # smaps_rollup walks every mapping's page tables, which is not free with
+    # a mapped database: read it every --pss-every samples, and whenever RSS
+    # reaches a new peak, where the PSS peak is.
+    if [[ "$with_pss" == 1 ]] || (( rss > peak_rss )); then
+        with_pss=1
+        for pid in "${tree[@]}"; do
+            if [[ -r /proc/$pid/smaps_rollup ]] && { exec {pss_fd}< /proc/"$pid"/smaps_rollup; } 2>/dev/null; then
+                while read -r key value rest <&"$pss_fd"; do
+                    [[ "$key" == "Pss:" ]] && pss=$(( pss + value ))
+                done
+                exec {pss_fd}<&-
+            else
+                have_pss=0
+            fi
+        done
+    fi
+
+    samples=$(( samples + 1 ))
+    (( ${#tree[@]} > max_procs )) && max_procs=${#tree[@]}
+    (( rss > peak_rss )) && peak_rss=$rss
+    (( hwm > peak_hwm )) && peak_hwm=$hwm
+    if [[ "$with_pss" == 1 && "$have_pss" == 1 ]]; then
+        if [[ "$peak_pss" == null ]] || (( pss > peak_pss )); then
+            peak_pss=$pss
+        fi
+    fi
+    minflt=$minf
+    majflt=$majf
+    if [[ "$have_io" == 1 ]]; then
+        read_bytes=$rb
+        rchar=$rc
+    fi
+    return 0
+}
+
+start_us=$(now_us)
+# The subshell wakes the sampling loop as soon as COMMAND exits instead of
+# at the next tick; it is the root of the sampled tree.
+{ "$@"; status=$?; printf 'x\n' >&"$tick_fd"; exit "$status"; } &
+cmd_pid=$!
+
+n=0
+while sample "$cmd_pid" $(( n % pss_every == 0 ? 1 : 0 )); do
+    n=$(( n + 1 ))
+    read -r -t "$interval" -u "$tick_fd" _ && break
+done
+
+wait "$cmd_pid"
+exit_code=$?
+end_us=$(now_us)
+exec {tick_fd}<&-
+
+# `times` line 2: user and system time of reaped children, i.e. COMMAND.
+to_seconds() {
+    local m="${1%%m*}" s="${1#*m}"
+    s="${s%s}"
+    awk -v m="$m" -v s="$s" 'BEGIN { printf "%.3f", m * 60 + s }'
+}
+times > "$output.times"
+{ read -r _ _; read -r child_user child_sys; } < "$output.times"
+rm -f "$output.times"
+wall_us=$(( end_us - start_us ))
+
+printf '{"command": "%s", "exit_code": %d, "interval_seconds": %s, "samples": %d, "wall_seconds": %d.%03d, "cpu_user_seconds": %s, "cpu_system_seconds": %s, "peak_rss_kb": %d, "peak_process_hwm_kb": %d, "peak_pss_kb": %s, "minor_faults": %s, "major_faults": %s, "read_bytes": %s, "rchar_bytes": %s, "max_processes": %d}\n' \
+    "$(basename -- "$1" | sed 's/["\\]/\\&/g')" "$exit_code" "$interval" "$samples" \
+    $(( wall_us / 1000000 )) $(( wall_us / 1000 % 1000 )) \
+    "$(to_seconds "$child_user")" "$(to_seconds "$child_sys")" \
+    "$peak_rss" "$peak_hwm" "$peak_pss" "$minflt" "$majflt" "$read_bytes" "$rchar" "$max_procs" \
+    > "$output"
+
+exit "$exit_code"
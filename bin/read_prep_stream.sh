@@ -0,0 +1,64 @@
+#!/usr/bin/env bash
+#
+# read_prep_stream.sh -- one streaming pass over a validation read set.
+#
+# What it does
+# ------------
+# Decompresses READS once (plain FASTQ passes through unchanged), writes the
+# records to stdout for the aligner to read as its query, and counts reads
+# and bases on the way. When the stream ends, STATS holds one line of JSON:
+#
+#   {"reads": <records>, "bases": <sequence bases>}
+#
+# With --fasta the records are written as FASTA (header line kept whole, as
+# `seqtk seq -A` writes it), for blastn.
+#
+# Why
+# ---
+# CONSENSUS_VALIDATION used to decompress the reads once to count them and
+# again in minimap2; BLASTN_VALIDATION wrote a full query.fasta with seqtk and
+# then grep'd it for the count. Here decompression happens once and no
+# temporary FASTA is written. The reads are 4-line FASTQ, as
+# EXTRACT_READS_BY_TAXID writes them; the count is the `NR % 4 == 1` count the
+# modules used before.
+#
+# Shell and awk only, so it runs in every validation container, including
+# minimap2/samtools images that carry no Python.
+#
+# Usage
+# -----
+#   read_prep_stream.sh [--fasta] --stats STATS.json READS | minimap2 ... ref -
+#   read_prep_stream.sh --fasta --stats STATS.json READS | blastn -query - ...
+#
+# With `set -o pipefail` in the caller, a failing aligner fails the pipeline
+# (this end then dies of SIGPIPE); STATS is complete only when the whole
+# stream was read.
+#
+set -euo pipefail
+
+fasta=0
+stats=""
+while [[ $# -gt 0 ]]; do
+    case "$1" in
+        --fasta) fasta=1; shift ;;
+        --stats) stats="$2"; shift 2 ;;
+        -*) echo "read_prep_stream.sh: unknown option: $1" >&2; exit 2 ;;
+        *) break ;;
+    esac
+done
+
+if [[ $# -ne 1 ]] || [[ -z "$stats" ]]; then
+    echo "usage: read_prep_stream.sh [--fasta] --stats STATS.json READS" >&2
+    exit 2
+fi
+
+gzip -cdf -- "$1" | awk -v fasta="$fasta" -v stats="$stats" '
+    NR % 4 == 1 {
+        reads++
+        if (fasta) { print ">" substr($0, 2); next }
+    }
+    NR % 4 == 2 { bases += length($0) }
+    fasta && NR % 4 != 2 { next }
+    { print }
+    END { printf "{\"reads\": %d, \"bases\": %d}\n", reads, bases > stats }
+'
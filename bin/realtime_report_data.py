@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""Write the per-batch data file behind the realtime report page.
+
+The realtime report is a static page (assets/realtime_report.html, published
+once as realtime_reports/index.html) that renders whatever is in
+``report_data.js`` beside it and reloads that file on the refresh interval.
+Per batch, only the data is rewritten:
+
+  report_data.json   the report data, for the dashboard and scripts
+  report_data.js     the same object as ``window.NANOMETA_REPORT_DATA = {...};``
+                     A script tag loads from file:// where fetch() of a JSON
+                     file is blocked, so the page works opened straight from
+                     the results directory.
+
+With ``--history-keep N`` a copy of the data is also written as
+``history/report_data_<stamp>.json`` and all but the newest N are removed.
+Used by GENERATE_REALTIME_REPORT and by realtime_stats_service.py.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+SCHEMA_VERSION = 1
+DATA_JS_VARIABLE = "NANOMETA_REPORT_DATA"
+MAX_SOURCE_DIRECTORIES = 5
+
+
+def write_atomic(filepath: str, text: str) -> None:
+    """Write text via a temporary file and rename."""
+    dir_name = os.path.dirname(filepath) or "."
+    os.makedirs(dir_name, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=dir_name, prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+        os.replace(tmp_path, filepath)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def build_report_data(
+    snapshot: Dict[str, Any],
+    cumulative: Dict[str, Any],
+    alerts: List[Dict[str, Any]],
+    stats_config: Dict[str, Any],
+) -> Dict[str, Any]:
+    """Select the figures the report page shows from snapshot + cumulative stats.
+
+    Only what the page renders is carried: the trend arrays in the cumulative
+    state are left out, so the file stays a few KB however long the session.
+    """
+    fstats = snapshot["file_statistics"]
+    timing = snapshot["timing_analysis"]
+    source = cumulative["source_summary"]
+    directories = source["unique_directories"]
+
+    return {
+        "schema_version": SCHEMA_VERSION,
+        "generated_at": datetime.now().isoformat(),
+        "refresh_interval_ms": stats_config.get("refresh_interval_ms", stats_config.get("stats_interval", 30000)),
+        "pipeline_version": stats_config.get("pipeline_version", "1.0"),
+        "batch": {
+            "batch_id": snapshot["batch_info"]["batch_id"],
+            "batch_time": snapshot["batch_info"]["batch_time"],
+            "processing_time": snapshot["batch_info"]["processing_time_formatted"],
+            "file_count": fstats["file_count"],
+            "total_size_mb": fstats["total_size_mb"],
+            "estimated_total_reads": fstats["estimated_total_reads"],
+            "compressed_files": fstats["compressed_files"],
+        },
+        "session": {
+            "session_start": cumulative["session_info"]["session_start_formatted"],
+            "total_batches": cumulative["session_info"]["total_batches"],
+            "total_files": cumulative["totals"]["total_files"],
+            "total_size_mb": cumulative["totals"]["total_size_mb"],
+            "total_estimated_reads": cumulative["totals"]["total_estimated_reads"],
+            "session_duration_seconds": cumulative["performance"]["session_duration_seconds"],
+        },
+        "performance": {
+            key: cumulative["performance"][key]
+            for key in ("files_per_second", "mb_per_second", "reads_per_second", "batches_per_minute")
+        },
+        "quality": {
+            "compressed_ratio": snapshot["quality_indicators"]["compressed_ratio"],
+            "large_files_ratio": snapshot["quality_indicators"]["large_files_ratio"],
+            "high_priority_files": snapshot["priority_analysis"]["high_priority_files"],
+        },
+        "sources": {
+            "directory_count": len(directories),
+            "directories": [
+                {"path": d, "files": source["directory_totals"].get(d, 0)}
+                for d in directories[:MAX_SOURCE_DIRECTORIES]
+            ],
+            "unique_samples": len(source["unique_samples"]),
+        },
+        "timing": {
+            "average_file_age_minutes": round(timing["average_file_age_ms"] / 60000, 1),
+            "oldest_file_age_minutes": round(timing["oldest_file_age_ms"] / 60000, 1),
+            "newest_file_age_minutes": round(timing["newest_file_age_ms"] / 60000, 1),
+        },
+        "alerts": [
+            {"type": a.get("type", ""), "level": a.get("level", "info"), "message": a.get("message", "")}
+            for a in alerts
+        ],
+    }
+
+
+def write_report_data(
+    report_dir: str,
+    data: Dict[str, Any],
+    history_keep: int = 0,
+    history_stamp: Optional[str] = None,
+) -> List[str]:
+    """Write report_data.json/.js (and a rotated history copy). Returns paths written."""
+    payload = json.dumps(data, indent=2)
+    json_path = os.path.join(report_dir, "report_data.json")
+    js_path = os.path.join(report_dir, "report_data.js")
+    write_atomic(json_path, payload + "\n")
+    write_atomic(js_path, f"window.{DATA_JS_VARIABLE} = {payload};\n")
+    written = [json_path, js_path]
+
+    if history_keep > 0:
+        stamp = history_stamp or str(data["batch"]["batch_time"])
+        history_dir = os.path.join(report_dir, "history")
+        history_path = os.path.join(history_dir, f"report_data_{stamp}.json")
+        write_atomic(history_path, payload + "\n")
+        written.append(history_path)
+        rotate_history(history_dir, history_keep)
+    return written
+
+
+def rotate_history(history_dir: str, keep: int) -> List[str]:
+    """Remove all but the newest ``keep`` history files (by name: stamps sort by time)."""
+    names = sorted(
+        n for n in os.listdir(history_dir) if n.startswith("report_data_") and n.endswith(".json")
+    )
+    removed = []
+    for name in names[:-keep] if keep > 0 else []:
+        os.unlink(os.path.join(history_dir, name))
+        removed.append(name)
+    return removed
+
+
+def load_json(path: Optional[str], default: Any = None) -> Any:
+    if not path or not os.path.exists(path) or os.path.getsize(path) == 0:
+        return default
+    with open(path) as f:
+        return json.load(f)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--snapshot", required=True, help="Snapshot statistics JSON")
+    parser.add_argument("--cumulative", required=True, help="Cumulative statistics JSON")
+    parser.add_argument("--alerts", help="Alerts JSON (optional; missing file means no alerts)")
+    parser.add_argument("--config", help="Statistics config JSON")
+    parser.add_argument("--outdir", default=".", help="Report directory to write into")
+    parser.add_argument("--history-keep", type=int, default=0,
+                        help="Keep this many history copies under <outdir>/history (0 = none)")
+    parser.add_argument("--history-stamp", help="History file stamp (default: batch_time)")
+    args = parser.parse_args()
+
+    snapshot = load_json(args.snapshot)
+    cumulative = load_json(args.cumulative)
+    alerts = load_json(args.alerts, {}).get("alerts", [])
+    stats_config = load_json(args.config, {})
+
+    data = build_report_data(snapshot, cumulative, alerts, stats_config)
+    written = write_report_data(args.outdir, data, args.history_keep, args.history_stamp)
+    for path in written:
+        print(f"Wrote {path}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,667 @@
+#!/usr/bin/env python3
+"""Long-lived realtime statistics service.
+
+Replaces the per-batch GENERATE_SNAPSHOT_STATS -> UPDATE_CUMULATIVE_STATS ->
+GENERATE_REALTIME_REPORT task chain with one local process that keeps the
+cumulative state in memory. At a batch every few seconds the three container
+spawns per batch cost more than the statistics themselves.
+
+Batches arrive over one of two local transports (no network):
+
+  spool directory   <spool>/<batch_id>.batch.json
+                    {"batch_meta": {...}, "file_metas": [...]}
+                    <spool>/shutdown.json  {"expected_batches": N}
+  unix socket       one JSON object per line:
+                    {"op": "batch", "batch_meta": {...}, "file_metas": [...]}
+                    {"op": "status"} | {"op": "shutdown"}
+
+Spool writers MUST create each file under a dot-prefixed name and rename it
+into place; dotfiles are never read, so a half-written batch is invisible.
+The pipeline writes from the Nextflow head process (REALTIME_STATISTICS);
+the ``submit`` and ``shutdown`` subcommands are the local stand-in client.
+
+Outputs keep the file names and JSON layout of the per-batch modules, so the
+dashboard reads the same paths in either mode:
+
+  <outdir>/realtime_batch_stats/<batch_id>_snapshot.json   (every batch)
+  <outdir>/realtime_stats/cumulative_stats.json            (every checkpoint)
+  <outdir>/realtime_stats/cumulative_state.json
+  <outdir>/realtime_stats/alerts.json                      (when alerting)
+  <outdir>/realtime_reports/report_data.json, report_data.js
+                                     (data behind the static report page)
+
+A checkpoint (``realtime_stats/stats_service_checkpoint.json``) holds the
+cumulative state and the ids of every batch folded into it, written in one
+atomic rename. A restart resumes from it and skips batches it already holds,
+so a re-spooled batch is never counted twice.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional, Set
+
+from realtime_report_data import build_report_data, write_report_data
+
+VERSION = "1.0.0"
+
+MAX_TREND_POINTS = 100
+BATCH_SUFFIX = ".batch.json"
+SHUTDOWN_NAME = "shutdown.json"
+CHECKPOINT_NAME = "stats_service_checkpoint.json"
+
+
+def write_atomic(filepath: str, data: Any) -> None:
+    """Write JSON (or text, when ``data`` is a str) via temp file and rename."""
+    dir_name = os.path.dirname(filepath) or "."
+    os.makedirs(dir_name, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=dir_name, prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            if isinstance(data, str):
+                f.write(data)
+            else:
+                json.dump(data, f, indent=2)
+        os.replace(tmp_path, filepath)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+# ---------------------------------------------------------------------------
+# Statistics. These mirror the inline scripts of GENERATE_SNAPSHOT_STATS and
+# UPDATE_CUMULATIVE_STATS field for field; a change to one must be made to
+# the other, or the two modes publish different numbers.
+# ---------------------------------------------------------------------------
+
+def build_snapshot(batch_meta: Dict[str, Any], file_metas: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Snapshot statistics for one batch (GENERATE_SNAPSHOT_STATS layout)."""
+    n = len(file_metas)
+    total_size = sum(f.get("file_size", 0) for f in file_metas)
+    compressed = sum(1 for f in file_metas if f.get("is_compressed", False))
+    high_priority = sum(1 for f in file_metas if f.get("priority_score", 0) > 100)
+
+    directory_counts: Dict[str, int] = {}
+    for f in file_metas:
+        watch_dir = f.get("watch_dir", "unknown")
+        directory_counts[watch_dir] = directory_counts.get(watch_dir, 0) + 1
+
+    return {
+        "batch_info": {
+            "batch_id": batch_meta["batch_id"],
+            "batch_timestamp": batch_meta["batch_timestamp"],
+            "batch_time": batch_meta["batch_time"],
+            "batch_time_formatted": batch_meta["batch_time"],
+            "processing_timestamp": batch_meta["batch_timestamp"],
+            "processing_time_formatted": batch_meta["batch_time"],
+        },
+        "file_statistics": {
+            "file_count": n,
+            "total_size_bytes": total_size,
+            "total_size_mb": round(total_size / 1024 / 1024, 2),
+            "estimated_total_reads": sum(f.get("estimated_reads", 0) for f in file_metas),
+            "compressed_files": compressed,
+            "average_file_size_mb": round((total_size / n) / 1024 / 1024, 2) if n else 0,
+        },
+        "priority_analysis": {
+            "average_priority": round(sum(f.get("priority_score", 0) for f in file_metas) / n, 2) if n else 0,
+            "max_priority": max((f.get("priority_score", 0) for f in file_metas), default=0),
+            "min_priority": min((f.get("priority_score", 0) for f in file_metas), default=0),
+            "high_priority_files": high_priority,
+        },
+        "source_analysis": {
+            "watch_directories": sorted(set(f.get("watch_dir", "unknown") for f in file_metas)),
+            "directory_file_counts": directory_counts,
+            "sample_ids": sorted(set(f.get("sample_id", "unknown") for f in file_metas)),
+        },
+        "timing_analysis": {
+            "batch_creation_time_ms": batch_meta.get("batch_timestamp", 0),
+            "average_file_age_ms": round(sum(f.get("file_age_ms", 0) for f in file_metas) / n, 2) if n else 0,
+            "oldest_file_age_ms": max((f.get("file_age_ms", 0) for f in file_metas), default=0),
+            "newest_file_age_ms": min((f.get("file_age_ms", 0) for f in file_metas), default=0),
+        },
+        "performance_metrics": {
+            "files_per_second": 0,
+            "mb_per_second": 0,
+            "reads_per_second": 0,
+        },
+        "quality_indicators": {
+            "large_files_ratio": sum(1 for f in file_metas if f.get("file_size", 0) > 50_000_000) / n if n else 0,
+            "compressed_ratio": compressed / n if n else 0,
+            "high_priority_ratio": high_priority / n if n else 0,
+        },
+    }
+
+
+def new_cumulative(snapshot: Dict[str, Any]) -> Dict[str, Any]:
+    """Empty cumulative structure anchored at the first snapshot's time."""
+    return {
+        "session_info": {
+            "session_start": snapshot["batch_info"]["processing_timestamp"],
+            "session_start_formatted": snapshot["batch_info"]["processing_time_formatted"],
+            "total_batches": 0,
+            "last_update": 0,
+        },
+        "totals": {
+            "total_files": 0,
+            "total_size_bytes": 0,
+            "total_size_mb": 0,
+            "total_estimated_reads": 0,
+            "total_compressed_files": 0,
+        },
+        "averages": {
+            "avg_files_per_batch": 0,
+            "avg_batch_size_mb": 0,
+            "avg_reads_per_batch": 0,
+            "avg_file_size_mb": 0,
+        },
+        "performance": {
+            "files_per_second": 0,
+            "mb_per_second": 0,
+            "reads_per_second": 0,
+            "batches_per_minute": 0,
+            "session_duration_seconds": 0,
+        },
+        "trends": {
+            "batch_timestamps": [],
+            "batch_file_counts": [],
+            "batch_sizes_mb": [],
+            "batch_read_counts": [],
+        },
+        "quality_trends": {
+            "compression_ratios": [],
+            "priority_scores": [],
+            "large_file_ratios": [],
+        },
+        "source_summary": {
+            "unique_directories": [],
+            "unique_samples": [],
+            "directory_totals": {},
+        },
+    }
+
+
+def update_cumulative(cumulative: Dict[str, Any], snapshot: Dict[str, Any]) -> None:
+    """Fold one snapshot into the cumulative structure in place."""
+    current_time = snapshot["batch_info"]["processing_timestamp"]
+    session = cumulative["session_info"]
+    totals = cumulative["totals"]
+    perf = cumulative["performance"]
+    fstats = snapshot["file_statistics"]
+
+    session["total_batches"] += 1
+    session["last_update"] = current_time
+    session["last_update_formatted"] = snapshot["batch_info"]["processing_time_formatted"]
+
+    totals["total_files"] += fstats["file_count"]
+    totals["total_size_bytes"] += fstats["total_size_bytes"]
+    totals["total_size_mb"] += fstats["total_size_mb"]
+    totals["total_estimated_reads"] += fstats["estimated_total_reads"]
+    totals["total_compressed_files"] += fstats["compressed_files"]
+
+    session_duration = (current_time - session["session_start"]) / 1000.0
+    perf["session_duration_seconds"] = round(session_duration, 2)
+    if session_duration > 0:
+        perf["files_per_second"] = round(totals["total_files"] / session_duration, 2)
+        perf["mb_per_second"] = round(totals["total_size_mb"] / session_duration, 2)
+        perf["reads_per_second"] = round(totals["total_estimated_reads"] / session_duration, 0)
+        perf["batches_per_minute"] = round((session["total_batches"] / session_duration) * 60, 2)
+
+    total_batches = session["total_batches"]
+    averages = cumulative["averages"]
+    averages["avg_files_per_batch"] = round(totals["total_files"] / total_batches, 2)
+    averages["avg_batch_size_mb"] = round(totals["total_size_mb"] / total_batches, 2)
+    averages["avg_reads_per_batch"] = round(totals["total_estimated_reads"] / total_batches, 0)
+    if totals["total_files"] > 0:
+        averages["avg_file_size_mb"] = round(totals["total_size_mb"] / totals["total_files"], 2)
+
+    trends = cumulative["trends"]
+    trends["batch_timestamps"].append(current_time)
+    trends["batch_file_counts"].append(fstats["file_count"])
+    trends["batch_sizes_mb"].append(fstats["total_size_mb"])
+    trends["batch_read_counts"].append(fstats["estimated_total_reads"])
+
+    quality = cumulative["quality_trends"]
+    quality["compression_ratios"].append(snapshot["quality_indicators"]["compressed_ratio"])
+    quality["priority_scores"].append(snapshot["priority_analysis"]["average_priority"])
+    quality["large_file_ratios"].append(snapshot["quality_indicators"]["large_files_ratio"])
+
+    for series in (trends, quality):
+        for key, values in series.items():
+            if len(values) > MAX_TREND_POINTS:
+                series[key] = values[-MAX_TREND_POINTS:]
+
+    # Same set-then-list round trip as UPDATE_CUMULATIVE_STATS, so the list
+    # order in the published JSON matches the per-batch module's.
+    source = cumulative["source_summary"]
+    directories = set(source["unique_directories"])
+    directories.update(snapshot["source_analysis"]["watch_directories"])
+    samples = set(source["unique_samples"])
+    samples.update(snapshot["source_analysis"]["sample_ids"])
+    source["unique_directories"] = list(directories)
+    source["unique_samples"] = list(samples)
+    for directory, count in snapshot["source_analysis"]["directory_file_counts"].items():
+        source["directory_totals"][directory] = source["directory_totals"].get(directory, 0) + count
+
+
+def evaluate_alerts(
+    cumulative: Dict[str, Any], snapshot: Dict[str, Any], stats_config: Dict[str, Any]
+) -> List[Dict[str, Any]]:
+    """Threshold alerts for the batch just folded in (UPDATE_CUMULATIVE_STATS rules)."""
+    alerts = []
+    current_time = snapshot["batch_info"]["processing_timestamp"]
+
+    thresholds = stats_config.get("performance_thresholds", {})
+    if "min_files_per_second" in thresholds:
+        fps = cumulative["performance"]["files_per_second"]
+        if fps < thresholds["min_files_per_second"]:
+            alerts.append({
+                "type": "performance",
+                "level": "warning",
+                "message": f"Low throughput: {fps} files/sec (threshold: {thresholds['min_files_per_second']})",
+                "timestamp": current_time,
+                "metric": "files_per_second",
+                "value": fps,
+                "threshold": thresholds["min_files_per_second"],
+            })
+    if "max_avg_file_age_minutes" in thresholds:
+        avg_age = snapshot["timing_analysis"]["average_file_age_ms"] / 60000
+        if avg_age > thresholds["max_avg_file_age_minutes"]:
+            alerts.append({
+                "type": "latency",
+                "level": "warning",
+                "message": f"High file age: {avg_age:.1f} minutes (threshold: {thresholds['max_avg_file_age_minutes']})",
+                "timestamp": current_time,
+                "metric": "average_file_age_minutes",
+                "value": avg_age,
+                "threshold": thresholds["max_avg_file_age_minutes"],
+            })
+
+    quality_thresholds = stats_config.get("quality_thresholds", {})
+    if "min_compression_ratio" in quality_thresholds:
+        ratio = snapshot["quality_indicators"]["compressed_ratio"]
+        if ratio < quality_thresholds["min_compression_ratio"]:
+            alerts.append({
+                "type": "quality",
+                "level": "info",
+                "message": f"Low compression ratio: {ratio:.2f} (threshold: {quality_thresholds['min_compression_ratio']})",
+                "timestamp": current_time,
+                "metric": "compression_ratio",
+                "value": ratio,
+                "threshold": quality_thresholds["min_compression_ratio"],
+            })
+    return alerts
+
+
+# ---------------------------------------------------------------------------
+# Service
+# ---------------------------------------------------------------------------
+
+class StatsService:
+    """In-memory cumulative statistics fed from a spool directory or socket."""
+
+    def __init__(
+        self,
+        outdir: str,
+        stats_config: Dict[str, Any],
+        spool: Optional[str] = None,
+        socket_path: Optional[str] = None,
+        checkpoint_interval: float = 30.0,
+        poll_interval: float = 1.0,
+        max_idle_seconds: float = 0.0,
+        history_keep: int = 0,
+    ) -> None:
+        self.outdir = outdir
+        self.stats_config = stats_config
+        self.spool = spool
+        self.socket_path = socket_path
+        self.checkpoint_interval = checkpoint_interval
+        self.poll_interval = poll_interval
+        self.max_idle_seconds = max_idle_seconds
+        self.history_keep = history_keep
+
+        self.stats_dir = os.path.join(outdir, "realtime_stats")
+        self.snapshot_dir = os.path.join(outdir, "realtime_batch_stats")
+        self.report_dir = os.path.join(outdir, "realtime_reports")
+
+        self.cumulative: Optional[Dict[str, Any]] = None
+        self.ingested: Set[str] = set()
+        self.last_snapshot: Optional[Dict[str, Any]] = None
+        self.last_alerts: List[Dict[str, Any]] = []
+        self.pending_spool: List[str] = []
+        self.dirty = False
+        self.shutdown_requested = False
+        self.expected_batches: Optional[int] = None
+        self.batches_this_run = 0
+        self.duplicates_skipped = 0
+        self.last_activity = time.monotonic()
+
+    # -- state ------------------------------------------------------------
+
+    def load_checkpoint(self) -> None:
+        """Resume from the last checkpoint, if one exists."""
+        path = os.path.join(self.stats_dir, CHECKPOINT_NAME)
+        if not os.path.exists(path):
+            return
+        try:
+            with open(path) as f:
+                checkpoint = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"WARNING: ignoring unreadable checkpoint {path}: {e}", file=sys.stderr)
+            return
+        self.cumulative = checkpoint.get("cumulative")
+        self.ingested = set(checkpoint.get("ingested_batch_ids", []))
+        self.last_snapshot = checkpoint.get("last_snapshot")
+        self.last_alerts = checkpoint.get("last_alerts", [])
+        print(f"Resumed from checkpoint: {len(self.ingested)} batch(es) already folded in")
+
+    def ingest(self, batch_meta: Dict[str, Any], file_metas: List[Dict[str, Any]]) -> bool:
+        """Fold one batch into the in-memory state. Returns False for a duplicate."""
+        self.last_activity = time.monotonic()
+        batch_id = str(batch_meta["batch_id"])
+        if batch_id in self.ingested:
+            self.duplicates_skipped += 1
+            return False
+
+        snapshot = build_snapshot(batch_meta, file_metas)
+        write_atomic(os.path.join(self.snapshot_dir, f"{batch_id}_snapshot.json"), snapshot)
+
+        if self.cumulative is None:
+            self.cumulative = new_cumulative(snapshot)
+        update_cumulative(self.cumulative, snapshot)
+        self.last_alerts = evaluate_alerts(self.cumulative, snapshot, self.stats_config)
+        self.last_snapshot = snapshot
+        self.ingested.add(batch_id)
+        self.batches_this_run += 1
+        self.dirty = True
+        return True
+
+    def checkpoint(self) -> None:
+        """Persist state, publish cumulative outputs and the report."""
+        if self.cumulative is None:
+            return
+        # The checkpoint is the single source of truth for resume: state and
+        # the ids it covers land in one rename, so they cannot disagree.
+        write_atomic(os.path.join(self.stats_dir, CHECKPOINT_NAME), {
+            "version": VERSION,
+            "cumulative": self.cumulative,
+            "ingested_batch_ids": sorted(self.ingested),
+            "last_snapshot": self.last_snapshot,
+            "last_alerts": self.last_alerts,
+        })
+        write_atomic(os.path.join(self.stats_dir, "cumulative_stats.json"), self.cumulative)
+        write_atomic(os.path.join(self.stats_dir, "cumulative_state.json"), self.cumulative)
+        if self.last_alerts:
+            write_atomic(os.path.join(self.stats_dir, "alerts.json"), {
+                "batch_id": self.last_snapshot["batch_info"]["batch_id"],
+                "timestamp": self.last_snapshot["batch_info"]["processing_timestamp"],
+                "alert_count": len(self.last_alerts),
+                "alerts": self.last_alerts,
+            })
+        if self.last_snapshot is not None:
+            write_report_data(
+                self.report_dir,
+                build_report_data(self.last_snapshot, self.cumulative, self.last_alerts, self.stats_config),
+                history_keep=self.history_keep,
+            )
+
+        # Spool files are removed only once the state covering them is on
+        # disk; a crash before this point re-reads them and the id check
+        # skips whatever the checkpoint already holds.
+        for path in self.pending_spool:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+        self.pending_spool = []
+        self.dirty = False
+
+    # -- transports -------------------------------------------------------
+
+    def scan_spool(self) -> None:
+        """Ingest every complete batch file currently in the spool."""
+        if not self.spool:
+            return
+        pending = set(self.pending_spool)
+        names = []
+        with os.scandir(self.spool) as entries:
+            for entry in entries:
+                if entry.name.startswith(".") or not entry.is_file():
+                    continue
+                if entry.name == SHUTDOWN_NAME:
+                    if not self.shutdown_requested:
+                        self._read_shutdown(entry.path)
+                elif entry.name.endswith(BATCH_SUFFIX) and entry.path not in pending:
+                    names.append(entry.name)
+
+        for name in sorted(names):
+            path = os.path.join(self.spool, name)
+            try:
+                with open(path) as f:
+                    payload = json.load(f)
+                self.ingest(payload["batch_meta"], payload.get("file_metas", []))
+            except (OSError, ValueError, KeyError) as e:
+                print(f"WARNING: skipping malformed spool file {name}: {e}", file=sys.stderr)
+            self.pending_spool.append(path)
+
+    def _read_shutdown(self, path: str) -> None:
+        try:
+            with open(path) as f:
+                self.expected_batches = json.load(f).get("expected_batches")
+        except (OSError, ValueError):
+            self.expected_batches = None
+        self.shutdown_requested = True
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Serve JSON-lines requests on the unix socket."""
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            try:
+                request = json.loads(line)
+                op = request.get("op")
+                if op == "batch":
+                    accepted = self.ingest(request["batch_meta"], request.get("file_metas", []))
+                    reply = {"ok": True, "accepted": accepted}
+                elif op == "status":
+                    reply = {"ok": True, **self.status()}
+                elif op == "shutdown":
+                    self.shutdown_requested = True
+                    self.expected_batches = request.get("expected_batches")
+                    reply = {"ok": True}
+                else:
+                    reply = {"ok": False, "error": f"unknown op: {op}"}
+            except (ValueError, KeyError, TypeError) as e:
+                reply = {"ok": False, "error": str(e)}
+            writer.write((json.dumps(reply) + "\n").encode())
+            await writer.drain()
+        writer.close()
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "batches_total": len(self.ingested),
+            "batches_this_run": self.batches_this_run,
+            "duplicates_skipped": self.duplicates_skipped,
+            "dirty": self.dirty,
+        }
+
+    # -- main loop --------------------------------------------------------
+
+    async def run(self) -> Dict[str, Any]:
+        self.load_checkpoint()
+        server = None
+        if self.socket_path:
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+            server = await asyncio.start_unix_server(self.handle_client, path=self.socket_path)
+
+        last_checkpoint = time.monotonic()
+        try:
+            while True:
+                self.scan_spool()
+                now = time.monotonic()
+                if self.dirty and now - last_checkpoint >= self.checkpoint_interval:
+                    self.checkpoint()
+                    last_checkpoint = now
+                if self.shutdown_requested:
+                    # The spool writer renames every batch into place before
+                    # it writes the sentinel, so one more scan drains them.
+                    self.scan_spool()
+                    break
+                if self.max_idle_seconds > 0 and now - self.last_activity > self.max_idle_seconds:
+                    print(f"No batches for {self.max_idle_seconds:.0f}s and no shutdown request; exiting")
+                    break
+                await asyncio.sleep(self.poll_interval)
+        finally:
+            if server is not None:
+                server.close()
+                await server.wait_closed()
+                if os.path.exists(self.socket_path):
+                    os.unlink(self.socket_path)
+            self.checkpoint()
+            # Consume the sentinel so a restarted service does not stop at once.
+            if self.shutdown_requested and self.spool:
+                try:
+                    os.unlink(os.path.join(self.spool, SHUTDOWN_NAME))
+                except FileNotFoundError:
+                    pass
+
+        summary = self.status()
+        summary["expected_batches"] = self.expected_batches
+        if self.expected_batches is not None and self.batches_this_run + self.duplicates_skipped < self.expected_batches:
+            print(
+                f"WARNING: shutdown expected {self.expected_batches} batch(es), "
+                f"received {self.batches_this_run + self.duplicates_skipped}",
+                file=sys.stderr,
+            )
+        return summary
+
+
+# ---------------------------------------------------------------------------
+# Stand-in client
+# ---------------------------------------------------------------------------
+
+def spool_write(spool: str, name: str, payload: Dict[str, Any]) -> str:
+    """Write ``payload`` into the spool under a dotfile, then rename into place."""
+    os.makedirs(spool, exist_ok=True)
+    target = os.path.join(spool, name)
+    fd, tmp_path = tempfile.mkstemp(dir=spool, prefix=".", suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(payload, f)
+    os.replace(tmp_path, target)
+    return target
+
+
+def socket_request(socket_path: str, request: Dict[str, Any]) -> Dict[str, Any]:
+    async def _send() -> Dict[str, Any]:
+        reader, writer = await asyncio.open_unix_connection(socket_path)
+        writer.write((json.dumps(request) + "\n").encode())
+        await writer.drain()
+        reply = json.loads(await reader.readline())
+        writer.close()
+        await writer.wait_closed()
+        return reply
+
+    return asyncio.run(_send())
+
+
+def load_json_arg(value: str) -> Any:
+    """Accept either inline JSON or a path to a JSON file."""
+    if os.path.exists(value):
+        with open(value) as f:
+            return json.load(f)
+    return json.loads(value)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    serve = sub.add_parser("serve", help="Run the statistics service until shutdown")
+    serve.add_argument("--outdir", required=True, help="Pipeline output directory to publish into")
+    serve.add_argument("--spool", help="Spool directory to watch for *.batch.json")
+    serve.add_argument("--socket", help="Unix socket path to listen on")
+    serve.add_argument("--config", default="{}", help="Statistics config (JSON or path)")
+    serve.add_argument("--checkpoint-interval", type=float, default=30.0, help="Seconds between checkpoints")
+    serve.add_argument("--poll-interval", type=float, default=1.0, help="Seconds between spool scans")
+    serve.add_argument("--max-idle-seconds", type=float, default=0.0,
+                       help="Exit after this long without a batch (0 = wait for shutdown)")
+    serve.add_argument("--history-keep", type=int, default=0,
+                       help="Keep this many report data snapshots under realtime_reports/history (0 = none)")
+    serve.add_argument("--final-dir", help="Also copy the final cumulative outputs here")
+
+    submit = sub.add_parser("submit", help="Send one batch to a running service")
+    submit.add_argument("--spool")
+    submit.add_argument("--socket")
+    submit.add_argument("--batch-meta", required=True, help="Batch meta (JSON or path)")
+    submit.add_argument("--file-metas", required=True, help="File metas (JSON or path)")
+
+    stop = sub.add_parser("shutdown", help="Ask a running service to drain and exit")
+    stop.add_argument("--spool")
+    stop.add_argument("--socket")
+    stop.add_argument("--expected-batches", type=int)
+
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        if not args.spool and not args.socket:
+            parser.error("serve needs --spool and/or --socket")
+        if args.spool:
+            os.makedirs(args.spool, exist_ok=True)
+        service = StatsService(
+            outdir=args.outdir,
+            stats_config=load_json_arg(args.config),
+            spool=args.spool,
+            socket_path=args.socket,
+            checkpoint_interval=args.checkpoint_interval,
+            poll_interval=args.poll_interval,
+            max_idle_seconds=args.max_idle_seconds,
+            history_keep=args.history_keep,
+        )
+        summary = asyncio.run(service.run())
+        print(f"Statistics service stopped: {json.dumps(summary)}")
+        if args.final_dir:
+            os.makedirs(args.final_dir, exist_ok=True)
+            write_atomic(os.path.join(args.final_dir, "service_summary.json"), summary)
+            if service.cumulative is not None:
+                write_atomic(os.path.join(args.final_dir, "cumulative_stats.json"), service.cumulative)
+                if service.last_alerts:
+                    write_atomic(os.path.join(args.final_dir, "alerts.json"), {
+                        "batch_id": service.last_snapshot["batch_info"]["batch_id"],
+                        "timestamp": service.last_snapshot["batch_info"]["processing_timestamp"],
+                        "alert_count": len(service.last_alerts),
+                        "alerts": service.last_alerts,
+                    })
+            if service.last_snapshot is not None:
+                write_report_data(
+                    args.final_dir,
+                    build_report_data(service.last_snapshot, service.cumulative, service.last_alerts, service.stats_config),
+                )
+        return
+
+    if not args.spool and not args.socket:
+        parser.error(f"{args.command} needs --spool or --socket")
+
+    if args.command == "submit":
+        batch_meta = load_json_arg(args.batch_meta)
+        file_metas = load_json_arg(args.file_metas)
+        if args.socket:
+            print(json.dumps(socket_request(args.socket, {"op": "batch", "batch_meta": batch_meta, "file_metas": file_metas})))
+        else:
+            print(spool_write(args.spool, f"{batch_meta['batch_id']}{BATCH_SUFFIX}",
+                              {"batch_meta": batch_meta, "file_metas": file_metas}))
+    elif args.command == "shutdown":
+        if args.socket:
+            print(json.dumps(socket_request(args.socket, {"op": "shutdown", "expected_batches": args.expected_batches})))
+        else:
+            print(spool_write(args.spool, SHUTDOWN_NAME, {"expected_batches": args.expected_batches}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""Fold per-batch SeqKit statistics into exact cumulative statistics.
+
+Each batch contributes its ``seqkit stats --all`` row and a read-length
+histogram (``length<TAB>count``, from SEQKIT_LENGTH_HISTOGRAM). Both merge
+exactly: counts and base totals add, the percentage columns are base-weighted
+means, and the union of length histograms is the cumulative length
+distribution, so Q1/Q2/Q3, N50 and N50_num are the values ``seqkit stats``
+would report on the concatenated reads rather than estimates from the mean.
+
+With ``--state`` the merged totals and histogram are carried between calls in
+a JSON file, keyed by batch so each call only reads the batches it has not
+seen before. A batch key already in the state is skipped, which makes a
+retried or resumed task a no-op instead of a double count. The state file is
+locked for the whole read-fold-write, so concurrent calls for one sample
+serialise rather than lose each other's batches.
+"""
+
+import argparse
+import fcntl
+import json
+import os
+import sys
+import tempfile
+from bisect import bisect_left
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+STATE_VERSION = 1
+
+SEQKIT_HEADER = [
+    "file", "format", "type", "num_seqs", "sum_len", "min_len", "avg_len", "max_len",
+    "Q1", "Q2", "Q3", "sum_gap", "N50", "N50_num", "Q20(%)", "Q30(%)", "AvgQual", "GC(%)", "sum_n",
+]
+
+# Percentage columns merged as base-weighted means: (state key, TSV column index)
+WEIGHTED_COLUMNS = [("q20", 14), ("q30", 15), ("avg_qual", 16), ("gc", 17)]
+
+
+def write_atomic(filepath: str, text: str) -> None:
+    """Write text via a temporary file and rename."""
+    dir_name = os.path.dirname(filepath) or "."
+    os.makedirs(dir_name, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=dir_name, prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+        os.replace(tmp_path, filepath)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def safe_int(value: Any) -> int:
+    try:
+        return int(value)
+    except (ValueError, TypeError):
+        return 0
+
+
+def safe_float(value: Any) -> float:
+    try:
+        return float(str(value).replace("%", ""))
+    except (ValueError, TypeError):
+        return 0.0
+
+
+def new_state(sample_id: str) -> Dict[str, Any]:
+    return {
+        "state_version": STATE_VERSION,
+        "sample_id": sample_id,
+        "header": "\t".join(SEQKIT_HEADER),
+        "batches": {},
+        "totals": {"num_seqs": 0, "sum_len": 0, "sum_gap": 0, "sum_n": 0, "min_len": None, "max_len": 0},
+        "weighted": {key: 0.0 for key, _ in WEIGHTED_COLUMNS},
+        "length_histogram": {},
+    }
+
+
+def read_stats_row(path: str) -> Tuple[Optional[str], Optional[List[str]]]:
+    """Return (header, first data row) of a ``seqkit stats --tabular`` file."""
+    with open(path) as f:
+        lines = [line.rstrip("\n") for line in f if line.strip()]
+    if not lines:
+        return None, None
+    return lines[0], (lines[1].split("\t") if len(lines) > 1 else None)
+
+
+def read_histogram(path: str) -> Dict[int, int]:
+    histogram: Dict[int, int] = {}
+    with open(path) as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) >= 2:
+                length = int(fields[0])
+                histogram[length] = histogram.get(length, 0) + int(fields[1])
+    return histogram
+
+
+def fold_batch(state: Dict[str, Any], key: str, stats_path: str, hist_path: str) -> bool:
+    """Add one batch to the state. Returns False if the key was already merged."""
+    if key in state["batches"]:
+        return False
+
+    header, row = read_stats_row(stats_path)
+    if header:
+        state["header"] = header
+    row = row or []
+    num_seqs = safe_int(row[3]) if len(row) > 3 else 0
+    sum_len = safe_int(row[4]) if len(row) > 4 else 0
+
+    histogram = read_histogram(hist_path)
+    hist_reads = sum(histogram.values())
+    hist_bases = sum(length * count for length, count in histogram.items())
+    if (hist_reads, hist_bases) != (num_seqs, sum_len):
+        raise ValueError(
+            f"length histogram {hist_path} ({hist_reads} reads, {hist_bases} bp) does not match "
+            f"{stats_path} ({num_seqs} reads, {sum_len} bp)"
+        )
+
+    totals = state["totals"]
+    totals["num_seqs"] += num_seqs
+    totals["sum_len"] += sum_len
+    totals["sum_gap"] += safe_int(row[11]) if len(row) > 11 else 0
+    totals["sum_n"] += safe_int(row[18]) if len(row) > 18 else 0
+    # Empty batches report min_len = 0; ignore them so the cumulative
+    # min_len reflects only batches that contributed reads.
+    if num_seqs > 0:
+        this_min = safe_int(row[5])
+        totals["min_len"] = this_min if totals["min_len"] is None else min(totals["min_len"], this_min)
+        totals["max_len"] = max(totals["max_len"], safe_int(row[7]))
+
+    for name, column in WEIGHTED_COLUMNS:
+        state["weighted"][name] += (safe_float(row[column]) if len(row) > column else 0.0) * sum_len
+
+    merged = state["length_histogram"]
+    for length, count in histogram.items():
+        merged[str(length)] = merged.get(str(length), 0) + count
+
+    state["batches"][key] = {"num_seqs": num_seqs, "sum_len": sum_len}
+    return True
+
+
+def length_distribution(histogram: Dict[str, int]) -> Tuple[List[int], List[int]]:
+    """Sorted lengths and the running read count up to and including each."""
+    lengths = sorted(int(length) for length in histogram)
+    cumulative = []
+    running = 0
+    for length in lengths:
+        running += histogram[str(length)]
+        cumulative.append(running)
+    return lengths, cumulative
+
+
+def nth_length(lengths: List[int], cumulative: List[int], index: int) -> int:
+    """Length of the read at 0-based ``index`` in ascending order."""
+    return lengths[bisect_left(cumulative, index + 1)]
+
+
+def median_of_range(lengths: List[int], cumulative: List[int], start: int, stop: int) -> float:
+    """Median of the sorted reads in [start, stop), as seqkit computes it."""
+    size = stop - start
+    if size <= 0:
+        return 0.0
+    middle = start + size // 2
+    if size % 2:
+        return float(nth_length(lengths, cumulative, middle))
+    return (nth_length(lengths, cumulative, middle - 1) + nth_length(lengths, cumulative, middle)) / 2
+
+
+def quartiles(histogram: Dict[str, int]) -> Tuple[float, float, float]:
+    """Q1/Q2/Q3 with seqkit's convention: Q1 and Q3 are the medians of the
+    lower and upper halves, excluding the middle read when the count is odd."""
+    lengths, cumulative = length_distribution(histogram)
+    total = cumulative[-1] if cumulative else 0
+    if total == 0:
+        return 0.0, 0.0, 0.0
+    lower_stop = total // 2
+    upper_start = total // 2 + total % 2
+    return (
+        median_of_range(lengths, cumulative, 0, lower_stop),
+        median_of_range(lengths, cumulative, 0, total),
+        median_of_range(lengths, cumulative, upper_start, total),
+    )
+
+
+def n50(histogram: Dict[str, int]) -> Tuple[int, int]:
+    """N50 and N50_num: the length, and the number of longest reads, at which
+    the running base count from the longest read down reaches half the total."""
+    total_bases = sum(int(length) * count for length, count in histogram.items())
+    if total_bases == 0:
+        return 0, 0
+    bases = 0
+    reads = 0
+    for length in sorted((int(length) for length in histogram), reverse=True):
+        count = histogram[str(length)]
+        if (bases + length * count) * 2 >= total_bases:
+            needed = -(-(total_bases - 2 * bases) // (2 * length))
+            return length, reads + needed
+        bases += length * count
+        reads += count
+    return 0, 0
+
+
+def render_row(state: Dict[str, Any], prefix: str) -> List[str]:
+    totals = state["totals"]
+    num_seqs = totals["num_seqs"]
+    sum_len = totals["sum_len"]
+    q1, q2, q3 = quartiles(state["length_histogram"])
+    n50_len, n50_num = n50(state["length_histogram"])
+
+    def weighted(name: str) -> str:
+        return "{:.2f}".format(state["weighted"][name] / sum_len if sum_len > 0 else 0.0)
+
+    return [
+        f"{prefix}.cumulative.fastq.gz",
+        "FASTQ",
+        "DNA",
+        str(num_seqs),
+        str(sum_len),
+        str(totals["min_len"] or 0),
+        "{:.1f}".format(sum_len / num_seqs if num_seqs > 0 else 0),
+        str(totals["max_len"]),
+        "{:.1f}".format(q1),
+        "{:.1f}".format(q2),
+        "{:.1f}".format(q3),
+        str(totals["sum_gap"]),
+        str(n50_len),
+        str(n50_num),
+        weighted("q20"),
+        weighted("q30"),
+        weighted("avg_qual"),
+        weighted("gc"),
+        str(totals["sum_n"]),
+    ]
+
+
+@contextmanager
+def locked_state(path: Optional[str], sample_id: str) -> Iterator[Dict[str, Any]]:
+    """Yield the carried-forward state under an exclusive lock and save it on exit."""
+    if not path:
+        yield new_state(sample_id)
+        return
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path + ".lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        state = new_state(sample_id)
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path) as f:
+                loaded = json.load(f)
+            if loaded.get("state_version") == STATE_VERSION:
+                state = loaded
+            else:
+                print(f"WARNING: ignoring {path} with unknown state_version", file=sys.stderr)
+        yield state
+        write_atomic(path, json.dumps(state, separators=(",", ":")) + "\n")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--prefix", required=True, help="Output file prefix")
+    parser.add_argument("--sample-id", required=True)
+    parser.add_argument("--barcode", default="no_barcode")
+    parser.add_argument("--batch-keys", nargs="+", required=True,
+                        help="One stable key per batch (e.g. the batch's stats file path)")
+    parser.add_argument("--stats", nargs="+", required=True, help="Per-batch seqkit stats TSVs, in key order")
+    parser.add_argument("--histograms", nargs="+", required=True,
+                        help="Per-batch read-length histograms, in key order")
+    parser.add_argument("--state", help="Carried-forward state JSON (created if missing)")
+    args = parser.parse_args()
+
+    if not (len(args.batch_keys) == len(args.stats) == len(args.histograms)):
+        print("ERROR: --batch-keys, --stats and --histograms must have the same length", file=sys.stderr)
+        sys.exit(1)
+
+    merged_now = []
+    try:
+        with locked_state(args.state, args.sample_id) as state:
+            for key, stats_path, hist_path in zip(args.batch_keys, args.stats, args.histograms):
+                if fold_batch(state, key, stats_path, hist_path):
+                    merged_now.append(key)
+            row = render_row(state, args.prefix)
+            header = state["header"]
+            num_batches = len(state["batches"])
+    except ValueError as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    write_atomic(f"{args.prefix}.cumulative.tsv", header + "\n" + "\t".join(row) + "\n")
+
+    manifest = {
+        "sample_id": args.sample_id,
+        "barcode": args.barcode,
+        "merge_timestamp": datetime.now().strftime("%Y%m%d_%H%M%S"),
+        "num_batches_merged": num_batches,
+        "num_batches_new": len(merged_now),
+        "num_batches_skipped": len(args.batch_keys) - len(merged_now),
+        "total_sequences": int(row[3]),
+        "total_bases": int(row[4]),
+        "length_histogram_bins": len(state["length_histogram"]),
+        "new_batch_keys": merged_now,
+    }
+    write_atomic(f"{args.prefix}.merge_stats.json", json.dumps(manifest, indent=2) + "\n")
+
+    print(f"Merged {len(merged_now)} new batch(es); {num_batches} in total", file=sys.stderr)
+    print(f"Total sequences: {int(row[3]):,}", file=sys.stderr)
+    print(f"Total bases: {int(row[4]):,}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,478 @@
+#!/usr/bin/env python3
+"""Fold per-batch validation results into run-so-far cumulative statistics.
+
+Realtime validation emits one PAF (minimap2) or hit table (blast) per batch
+for each (sample, taxid). VALIDATION_CUMULATIVE_AGGREGATOR is handed the whole
+batch set so far by CumulativeBatchAccumulator, and reports statistics over
+the merged alignments in the schema of MINIMAP2_VALIDATION /
+BLASTN_VALIDATION.
+
+Re-parsing every batch on every call makes batch N cost N files. With
+``--state`` the summary is instead carried between calls: the merged coverage
+intervals and the running sums behind the averages in a small JSON, the
+deduplicated read names as 8-byte BLAKE2b digests in an append-only sidecar
+(``<state>.seen``), and the merged alignment file itself, which each call
+appends to. Parsing therefore costs the size of the new batches, not of the
+run so far. The output is a copy of the carried file, never the file itself:
+later calls append to it, and an output must keep holding exactly the batches
+its stats JSON counts (cached by -resume, or published after this call).
+
+Each call folds in only the batches the state has not seen. A batch is keyed
+by its id and the size and mtime of its result file, so a re-emitted batch is
+a no-op rather than a double count, while a batch replaced under the same id
+no longer matches and forces a recompute. Batches are folded in the order
+given, and the running sums continue in that order, so the statistics are
+bit-identical to a full recompute over the same batch list. If the state does
+not match the front of the batch list (a stale or replaced batch, or a call
+with fewer batches than the state already holds) the call recomputes from its
+inputs instead, and only saves the result when it is at least as complete as
+the state it replaces.
+"""
+
+import argparse
+import fcntl
+import json
+import os
+import shutil
+import sys
+import tempfile
+from array import array
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager
+from hashlib import blake2b
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+STATE_VERSION = 3
+# Width of a read-name digest in the .seen sidecar; array('Q') items.
+DIGEST_BYTES = 8
+
+
+def write_atomic(filepath: str, text: str) -> None:
+    """Write text via a temporary file and rename."""
+    dir_name = os.path.dirname(filepath) or "."
+    os.makedirs(dir_name, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=dir_name, prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+        os.replace(tmp_path, filepath)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def number(value: str) -> Any:
+    """A parameter as the module used to interpolate it: int if it is one."""
+    try:
+        return int(value)
+    except ValueError:
+        return float(value)
+
+
+def total_reads_of(path: str) -> int:
+    """The batch's classified-read count. It is not in the alignment file."""
+    if path and os.path.exists(path) and os.path.getsize(path) > 0:
+        try:
+            with open(path) as f:
+                return int(json.load(f).get("total_reads", 0) or 0)
+        except Exception:
+            return 0
+    return 0
+
+
+def batch_key(batch_id: str, result_path: str) -> str:
+    """A batch's identity in the state: its id plus its result file's size and mtime."""
+    st = os.stat(result_path)
+    return f"{batch_id}:{st.st_size}:{st.st_mtime_ns}"
+
+
+def new_state(method: str) -> Dict[str, Any]:
+    state: Dict[str, Any] = {
+        "state_version": STATE_VERSION,
+        "method": method,
+        "batches": [],
+        "alignments_bytes": 0,
+        "total_reads": 0,
+        "seen_count": 0,
+        "hits": 0,
+    }
+    if method == "minimap2":
+        state.update({
+            "mapq_sum": 0.0, "mapq_n": 0,
+            "id_sum": 0.0, "id_n": 0,
+            "cov_sum": 0.0, "cov_n": 0,
+            "ref_max_len": 0, "ref_max_name": "",
+            "intervals": [],
+            "aligned_bp": 0,
+        })
+    else:
+        state.update({
+            "id_sum": 0.0,
+            "cov_sum": 0.0,
+            "min_evalue": None,
+        })
+    return state
+
+
+class IntervalUnion:
+    """Union of half-open reference intervals, kept as sorted disjoint runs.
+
+    Starts and ends live in two ``array('q')`` columns, so memory scales with
+    the number of covered segments rather than alignments: deep amplicon
+    coverage collapses into a handful of runs however many reads pile onto
+    them. ``add`` finds the runs an interval overlaps or touches by bisection
+    and replaces them with one; the covered length is updated as it goes.
+    """
+
+    __slots__ = ("starts", "ends", "covered")
+
+    def __init__(self) -> None:
+        self.starts = array("q")
+        self.ends = array("q")
+        self.covered = 0
+
+    def add(self, start: int, end: int) -> None:
+        first = bisect_left(self.ends, start)
+        stop = bisect_right(self.starts, end, first)
+        if first == stop:
+            self.starts.insert(first, start)
+            self.ends.insert(first, end)
+            self.covered += end - start
+            return
+        merged_start = min(start, self.starts[first])
+        merged_end = max(end, self.ends[stop - 1])
+        for i in range(first, stop):
+            self.covered -= self.ends[i] - self.starts[i]
+        self.covered += merged_end - merged_start
+        self.starts[first:stop] = array("q", [merged_start])
+        self.ends[first:stop] = array("q", [merged_end])
+
+    def to_list(self) -> List[int]:
+        """Flat [start0, end0, start1, end1, ...] for the state file."""
+        flat = [0] * (2 * len(self.starts))
+        flat[0::2] = self.starts
+        flat[1::2] = self.ends
+        return flat
+
+    @classmethod
+    def from_list(cls, flat: List[int]) -> "IntervalUnion":
+        union = cls()
+        union.starts = array("q", flat[0::2])
+        union.ends = array("q", flat[1::2])
+        union.covered = sum(union.ends) - sum(union.starts)
+        return union
+
+
+class SeenReads:
+    """Read names already counted, held as fixed-width digests.
+
+    A name is stored as the first DIGEST_BYTES of its BLAKE2b hash, read
+    back as an unsigned 64-bit int; at a million reads a collision is about
+    a 1-in-30-million event. ``added`` collects this call's new digests so
+    they can be appended to the sidecar instead of rewriting it.
+    """
+
+    __slots__ = ("digests", "added")
+
+    def __init__(self, digests: Iterable[int] = ()) -> None:
+        self.digests = set(digests)
+        self.added = array("Q")
+
+    def first(self, name: str) -> bool:
+        """True, and remember the name, if it has not been seen before."""
+        key = int.from_bytes(blake2b(name.encode(), digest_size=DIGEST_BYTES).digest(), "little")
+        if key in self.digests:
+            return False
+        self.digests.add(key)
+        self.added.append(key)
+        return True
+
+    @classmethod
+    def load(cls, path: str, count: int) -> "SeenReads":
+        """The first ``count`` digests of the sidecar; later bytes are dropped."""
+        digests = array("Q")
+        with open(path, "ab+") as f:
+            f.truncate(count * DIGEST_BYTES)
+            f.seek(0)
+            digests.fromfile(f, count)
+        return cls(digests)
+
+    def append_to(self, path: str) -> None:
+        with open(path, "ab") as f:
+            self.added.tofile(f)
+
+
+def fold_paf(state: Dict[str, Any], seen: SeenReads, coverage: IntervalUnion, path: str, min_mapq: float) -> None:
+    """Add one batch PAF, continuing the running sums in file order."""
+    with open(path) as fh:
+        for line in fh:
+            cols = line.rstrip("\n").split("\t")
+            if len(cols) < 12:
+                continue
+            qname = cols[0]
+            qlen = int(cols[1]); qstart = int(cols[2]); qend = int(cols[3])
+            tname = cols[5]; tlen = int(cols[6])
+            tstart = int(cols[7]); tend = int(cols[8])
+            nmatch = int(cols[9]); alen = int(cols[10]); mapq = int(cols[11])
+            if tlen > state["ref_max_len"]:
+                state["ref_max_len"] = tlen; state["ref_max_name"] = tname
+            if mapq < min_mapq:
+                continue
+            # Genome breadth intervals: every mapq-passing alignment
+            # contributes (mirrors MINIMAP2_VALIDATION's awk, which adds
+            # intervals before the per-read dedup).
+            if tend > tstart and tend <= tlen:
+                coverage.add(tstart, tend)
+                state["aligned_bp"] += tend - tstart
+            if not seen.first(qname):
+                continue
+            state["hits"] += 1
+            state["mapq_sum"] += mapq; state["mapq_n"] += 1
+            identity = -1.0
+            for tag in cols[12:]:
+                if tag.startswith("dv:f:"):
+                    identity = (1.0 - float(tag.split(":")[2])) * 100.0
+                    break
+            if identity < 0 and alen > 0:
+                identity = nmatch / alen * 100.0
+            if identity >= 0:
+                state["id_sum"] += identity; state["id_n"] += 1
+            if qlen > 0:
+                state["cov_sum"] += abs(qend - qstart) / qlen; state["cov_n"] += 1
+
+
+def fold_blast(state: Dict[str, Any], seen: SeenReads, path: str) -> None:
+    """Add one batch hit table, keeping the first hit per query."""
+    with open(path) as fh:
+        for line in fh:
+            cols = line.strip().split("\t")
+            if len(cols) < 15:
+                continue
+            if not seen.first(cols[0]):
+                continue
+            state["hits"] += 1
+            state["id_sum"] += float(cols[2])
+            state["cov_sum"] += float(cols[14]) / 100.0
+            evalue = float(cols[10])
+            if state["min_evalue"] is None or evalue < state["min_evalue"]:
+                state["min_evalue"] = evalue
+
+
+def minimap2_stats(state: Dict[str, Any], args: argparse.Namespace) -> Dict[str, Any]:
+    cum_total = state["total_reads"]
+    hits = state["hits"]
+    covered_bp = IntervalUnion.from_list(state["intervals"]).covered
+    ref_max_name = state["ref_max_name"] or "unknown"
+    ref_max_len = state["ref_max_len"] if state["ref_max_name"] else 0
+    # Genome breadth over the merged batch set: interval-merge, not additive --
+    # the same measure MINIMAP2_VALIDATION emits per batch and nanometa_live's
+    # paf_breadth() recomputes from the cumulative PAF.
+    genome_breadth = covered_bp / ref_max_len if ref_max_len > 0 else 0.0
+    local_depth = state["aligned_bp"] / covered_bp if covered_bp > 0 else 0.0
+    # Amplicon-like coverage -- a small share of the genome at high local depth --
+    # is legitimate and must stay confirmable. Same rule as the per-batch module
+    # and the GUI coverage plots.
+    concentrated = genome_breadth <= 0.05 and local_depth >= 10 and covered_bp >= 200
+
+    hit_rate = hits / cum_total if cum_total > 0 else 0.0
+    avg_mapq = state["mapq_sum"] / state["mapq_n"] if state["mapq_n"] > 0 else 0.0
+    avg_id = state["id_sum"] / state["id_n"] if state["id_n"] > 0 else 0.0
+    avg_cov = state["cov_sum"] / state["cov_n"] if state["cov_n"] > 0 else 0.0
+    if (hit_rate >= args.hit_threshold and avg_id >= args.identity_threshold
+            and hits >= args.min_reads
+            and (genome_breadth >= args.min_breadth or concentrated)):
+        status = "confirmed"
+    elif hit_rate >= args.hit_threshold * 0.5 or avg_id >= args.identity_threshold * 0.9:
+        status = "uncertain"
+    else:
+        status = "rejected"
+
+    return {
+        "sample_id": args.sample_id,
+        "taxid": int(args.taxid),
+        "validation_method": "minimap2",
+        "total_reads": cum_total,
+        "mapped_reads": hits,
+        "hit_rate": round(hit_rate, 6),
+        "avg_mapq": round(avg_mapq, 2),
+        "avg_identity": round(avg_id, 2),
+        "avg_coverage": round(avg_cov, 4),
+        "genome_breadth": round(genome_breadth, 6),
+        "validation_status": status,
+        "ref_name": ref_max_name,
+        "ref_length": ref_max_len,
+        "parameters": {"preset": args.preset, "min_mapq": args.min_mapq},
+    }
+
+
+def blast_stats(state: Dict[str, Any], args: argparse.Namespace) -> Dict[str, Any]:
+    cum_total = state["total_reads"]
+    hits = state["hits"]
+    hit_rate = hits / cum_total if cum_total > 0 else 0.0
+    avg_identity = state["id_sum"] / hits if hits else 0.0
+    avg_coverage = state["cov_sum"] / hits if hits else 0.0
+    min_evalue = state["min_evalue"] if state["min_evalue"] is not None else 1.0
+    # min_reads floor as in BLASTN_VALIDATION: percentages are unstable at low n,
+    # and a single index-hopped read at 100% hit rate must not confirm. Breadth is
+    # deliberately not applied to BLAST (qcovs is per-read query coverage).
+    if (hit_rate >= args.hit_threshold and avg_identity >= args.identity_threshold
+            and hits >= args.min_reads):
+        status = "confirmed"
+    elif hit_rate >= args.hit_threshold * 0.5 or avg_identity >= args.identity_threshold * 0.9:
+        status = "uncertain"
+    else:
+        status = "rejected"
+
+    return {
+        "sample_id": args.sample_id,
+        "taxid": int(args.taxid),
+        "validation_method": "blast",
+        "total_reads": cum_total,
+        "blast_hits": hits,
+        "hit_rate": round(hit_rate, 6),
+        "avg_identity": round(avg_identity, 2),
+        "avg_coverage": round(avg_coverage, 4),
+        "min_evalue": min_evalue,
+        "validation_status": status,
+        "thresholds": {
+            "evalue": args.blast_evalue,
+            "perc_identity": args.blast_perc_identity,
+            "max_target_seqs": args.blast_max_target_seqs,
+        },
+    }
+
+
+def fold_batches(state: Dict[str, Any], batches: List[Tuple[str, str, str, str]],
+                 alignments: str, seen: SeenReads, min_mapq: float) -> List[str]:
+    """Fold the batches the state has not seen, appending their alignments.
+
+    ``batches`` holds (key, id, result, stats) tuples. Returns the keys
+    folded by this call.
+    """
+    known = {key.rsplit(":", 2)[0] for key in state["batches"]}
+    coverage = IntervalUnion.from_list(state["intervals"]) if state["method"] == "minimap2" else None
+    folded = []
+    with open(alignments, "ab") as out:
+        for key, batch_id, result_path, stats_path in batches:
+            if batch_id in known:
+                continue
+            known.add(batch_id)
+            state["total_reads"] += total_reads_of(stats_path)
+            if state["method"] == "minimap2":
+                fold_paf(state, seen, coverage, result_path, min_mapq)
+            else:
+                fold_blast(state, seen, result_path)
+            if os.path.getsize(result_path) > 0:
+                with open(result_path, "rb") as src:
+                    shutil.copyfileobj(src, out)
+            state["batches"].append(key)
+            folded.append(key)
+        state["alignments_bytes"] = out.tell()
+    state["seen_count"] += len(seen.added)
+    if coverage is not None:
+        state["intervals"] = coverage.to_list()
+    return folded
+
+
+@contextmanager
+def locked_state(path: Optional[str]) -> Iterator[Optional[Dict[str, Any]]]:
+    """Yield the carried-forward state (None if absent) under an exclusive lock."""
+    if not path:
+        yield None
+        return
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path + ".lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        state = None
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path) as f:
+                loaded = json.load(f)
+            if loaded.get("state_version") == STATE_VERSION:
+                state = loaded
+            else:
+                print(f"WARNING: ignoring {path} with unknown state_version", file=sys.stderr)
+        yield state
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--method", required=True, choices=["minimap2", "blast"])
+    parser.add_argument("--prefix", required=True, help="Output file prefix")
+    parser.add_argument("--sample-id", required=True)
+    parser.add_argument("--taxid", required=True)
+    parser.add_argument("--batch-ids", nargs="+", required=True, help="One id per batch, in accumulation order")
+    parser.add_argument("--batch-files", nargs="+", required=True, help="Per-batch PAF / hit tables, in id order")
+    parser.add_argument("--batch-stats", nargs="+", required=True, help="Per-batch stats JSONs, in id order")
+    parser.add_argument("--state", help="Carried-forward state JSON (created if missing)")
+    parser.add_argument("--hit-threshold", type=float, default=0.5)
+    parser.add_argument("--identity-threshold", type=float, default=90.0)
+    parser.add_argument("--min-reads", type=number, default=10)
+    parser.add_argument("--min-breadth", type=float, default=0.05)
+    parser.add_argument("--min-mapq", type=number, default=10)
+    parser.add_argument("--preset", default="map-ont")
+    parser.add_argument("--blast-evalue", default="1e-10")
+    parser.add_argument("--blast-perc-identity", type=number, default=90)
+    parser.add_argument("--blast-max-target-seqs", type=number, default=1)
+    args = parser.parse_args()
+
+    if not (len(args.batch_ids) == len(args.batch_files) == len(args.batch_stats)):
+        print("ERROR: --batch-ids, --batch-files and --batch-stats must have the same length", file=sys.stderr)
+        sys.exit(1)
+    # The first occurrence of an id is the one folded; later ones are no-ops.
+    batches, input_keys, ids = [], [], set()
+    for batch_id, result_path, stats_path in zip(args.batch_ids, args.batch_files, args.batch_stats):
+        key = batch_key(batch_id, result_path)
+        batches.append((key, batch_id, result_path, stats_path))
+        if batch_id not in ids:
+            ids.add(batch_id)
+            input_keys.append(key)
+
+    suffix = "paf" if args.method == "minimap2" else "blast.tsv"
+    output = f"{args.prefix}.{suffix}"
+
+    with locked_state(args.state) as carried:
+        alignments = f"{args.state}.{suffix}" if args.state else output
+        seen_path = f"{args.state}.seen" if args.state else None
+        state = carried
+        if state is not None and (
+            state.get("method") != args.method or state["batches"] != input_keys[:len(state["batches"])]
+        ):
+            print(f"State holds batches {state['batches']} that are not a prefix of this call's "
+                  f"{input_keys}; recomputing from inputs", file=sys.stderr)
+            state = None
+        stale = carried is not None and state is None and len(input_keys) < len(carried["batches"])
+
+        if state is None:
+            state = new_state(args.method)
+            seen = SeenReads()
+            if stale:
+                alignments, seen_path = output, None
+            open(alignments, "wb").close()
+            if seen_path:
+                open(seen_path, "wb").close()
+        else:
+            # Drop anything appended after the last save (a task killed between
+            # the append and the state write) so no batch is counted twice.
+            with open(alignments, "ab") as f:
+                f.truncate(state["alignments_bytes"])
+            seen = SeenReads.load(seen_path, state["seen_count"])
+
+        folded = fold_batches(state, batches, alignments, seen, args.min_mapq)
+
+        if args.state and not stale:
+            seen.append_to(seen_path)
+            write_atomic(args.state, json.dumps(state, separators=(",", ":")) + "\n")
+        if alignments != output:
+            shutil.copyfile(alignments, output)
+
+    stats = minimap2_stats(state, args) if args.method == "minimap2" else blast_stats(state, args)
+    with open(f"{args.prefix}.{args.method}_stats.json", "w") as out:
+        json.dump(stats, out, indent=2)
+
+    print(f"Folded {len(folded)} new batch(es); {len(state['batches'])} in total", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
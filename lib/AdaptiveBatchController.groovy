@@ -0,0 +1,227 @@
+import java.util.concurrent.ConcurrentHashMap
+
+/**
+ * Feedback-controlled batch size for the realtime file stream.
+ *
+ * --adaptive_batching used to scale --batch_size by --batch_size_factor once,
+ * at startup, and clamp it to [min_batch_size, max_batch_size]; nothing
+ * adapted afterwards. With a target end-to-end latency set
+ * (--batch_target_latency_seconds) BatchUtils.batchWithTimeout reads its
+ * flush threshold from this controller instead, and the controller re-sizes
+ * it from two measurements:
+ *
+ *   - the file arrival rate (files/s over the last rateWindowSeconds), fed by
+ *     the batcher for every file it receives, and
+ *   - the classifier's per-batch duration (batch_metadata.json
+ *     duration_seconds), fed back from TAXONOMIC_CLASSIFICATION.
+ *
+ * A file's latency is roughly the time its batch takes to fill, plus the
+ * wait for a classifier slot behind the files already in flight, plus its own
+ * classification. So the fill-time budget is
+ *
+ *     budget = target - duration - (inFlight / parallelism) * duration
+ *
+ * and the batch that fills in that budget at the current rate is
+ * rate * budget files. The size moves halfway towards that each time, so one
+ * slow batch does not swing it. When the budget is gone (the classifier is
+ * behind) holding files back costs no latency -- they would queue anyway --
+ * so the size grows by half, and fewer, larger batches cut the per-batch
+ * tasks downstream. The size always stays within [minSize, maxSize].
+ *
+ * In-flight files are counted per emitted batch, and a completion settles the
+ * oldest batch first. A classification that fails never reports a duration,
+ * so a batch still unsettled IN_FLIGHT_EXPIRY target latencies after it was
+ * emitted is written off; otherwise every failure would count as in flight
+ * for the rest of the run and keep the controller in 'classifier behind'.
+ *
+ * Every change is recorded as a decision (time, from, to, reason and the
+ * measurements behind it); the runtime-metrics snapshot in
+ * REALTIME_MONITORING reports them. The controller is registered by name so
+ * TAXONOMIC_CLASSIFICATION can find the one REALTIME_MONITORING created
+ * without threading it through both subworkflows' inputs.
+ */
+class AdaptiveBatchController {
+
+    private static final Map<String, AdaptiveBatchController> REGISTRY = new ConcurrentHashMap<>()
+
+    /** Decisions kept for the snapshot; older ones are only counted. */
+    static final int MAX_DECISIONS = 20
+    /** Weight of the newest duration in the moving average. */
+    static final double DURATION_ALPHA = 0.3
+    /** Target latencies after which an unsettled batch is no longer in flight. */
+    static final double IN_FLIGHT_EXPIRY = 4.0d
+
+    final int minSize
+    final int maxSize
+    final double targetLatencySeconds
+    final int parallelism
+    final double rateWindowSeconds
+
+    /** Milliseconds clock; replaceable so tests can replay a timeline. */
+    Closure<Long> clock = { System.currentTimeMillis() }
+    /** Called with each decision map, e.g. to log it. */
+    Closure onDecision = null
+
+    private int size
+    private final ArrayDeque<Long> arrivals = new ArrayDeque<>()
+    private Double fileSeconds = null
+    /** [emitted at (ms), files not yet completed] per batch, oldest first. */
+    private final ArrayDeque<long[]> inFlightBatches = new ArrayDeque<>()
+    private long expiredFiles = 0L
+    private long decisionCount = 0L
+    private final List<Map> decisions = []
+
+    AdaptiveBatchController(int initialSize, int minSize, int maxSize, double targetLatencySeconds,
+                            int parallelism = 1, double rateWindowSeconds = 120.0d) {
+        this.minSize = Math.max(1, minSize)
+        this.maxSize = Math.max(this.minSize, maxSize)
+        this.targetLatencySeconds = targetLatencySeconds
+        this.parallelism = Math.max(1, parallelism)
+        this.rateWindowSeconds = rateWindowSeconds
+        this.size = clamp(initialSize)
+    }
+
+    static AdaptiveBatchController register(String name, AdaptiveBatchController controller) {
+        REGISTRY[name] = controller
+        return controller
+    }
+
+    static AdaptiveBatchController lookup(String name) {
+        return REGISTRY[name]
+    }
+
+    private int clamp(long n) {
+        return (int) Math.max(minSize, Math.min(maxSize, n))
+    }
+
+    /** Current flush threshold, in files. */
+    synchronized int batchSize() {
+        return size
+    }
+
+    /** One file reached the batcher. */
+    synchronized void recordArrival() {
+        long now = clock.call()
+        arrivals.addLast(now)
+        pruneArrivals(now)
+    }
+
+    /** A batch of n files left the batcher. */
+    synchronized void recordEmit(int files) {
+        if (files > 0) {
+            inFlightBatches.addLast([clock.call(), (long) files] as long[])
+        }
+    }
+
+    /**
+     * A downstream classification finished after durationSeconds; re-size.
+     *
+     * @param durationSeconds  batch_metadata.json duration_seconds
+     * @param files            files the classification covered (realtime
+     *                         classifies one file per task)
+     */
+    synchronized void recordCompletion(double durationSeconds, int files = 1) {
+        long settle = files
+        while (settle > 0 && !inFlightBatches.isEmpty()) {
+            long[] batch = inFlightBatches.peekFirst()
+            long n = Math.min(settle, batch[1])
+            batch[1] -= n
+            settle -= n
+            if (batch[1] == 0) {
+                inFlightBatches.pollFirst()
+            }
+        }
+        double perFile = durationSeconds / Math.max(1, files)
+        fileSeconds = fileSeconds == null ? perFile : DURATION_ALPHA * perFile + (1 - DURATION_ALPHA) * fileSeconds
+        adjust()
+    }
+
+    /** Files per second over the rate window; 0 until two files arrived. */
+    synchronized double arrivalRate() {
+        pruneArrivals(clock.call())
+        if (arrivals.size() < 2) {
+            return 0.0d
+        }
+        double span = (arrivals.peekLast() - arrivals.peekFirst()) / 1000.0d
+        return span > 0 ? (arrivals.size() - 1) / span : 0.0d
+    }
+
+    /** Files emitted and not yet completed, after writing off expired batches. */
+    private long inFlight() {
+        long horizon = clock.call() - (long) (IN_FLIGHT_EXPIRY * targetLatencySeconds * 1000)
+        while (!inFlightBatches.isEmpty() && inFlightBatches.peekFirst()[0] < horizon) {
+            expiredFiles += inFlightBatches.pollFirst()[1]
+        }
+        long files = 0L
+        inFlightBatches.each { files += it[1] }
+        return files
+    }
+
+    private void pruneArrivals(long now) {
+        long horizon = now - (long) (rateWindowSeconds * 1000)
+        while (!arrivals.isEmpty() && arrivals.peekFirst() < horizon) {
+            arrivals.pollFirst()
+        }
+    }
+
+    private void adjust() {
+        if (fileSeconds == null) {
+            return
+        }
+        double rate = arrivalRate()
+        long inFlight = inFlight()
+        double backlogWait = (inFlight / (double) parallelism) * fileSeconds
+        double budget = targetLatencySeconds - fileSeconds - backlogWait
+        int next
+        String reason
+        if (budget <= 0) {
+            next = clamp((long) Math.ceil(size * 1.5d))
+            reason = String.format('classifier behind: %.1fs per file, %d in flight, target %.0fs', fileSeconds, inFlight, targetLatencySeconds)
+        } else if (rate <= 0) {
+            return
+        } else {
+            long step = clamp((long) Math.floor(rate * budget)) - size
+            // Half the way, rounded away from the current size, so the size
+            // still reaches a goal one file away.
+            next = clamp(size + (long) (step > 0 ? Math.ceil(step / 2.0d) : Math.floor(step / 2.0d)))
+            reason = String.format('%.1fs fill budget at %.2f files/s', budget, rate)
+        }
+        if (next == size) {
+            return
+        }
+        def decision = [
+            time_ms          : clock.call(),
+            from             : size,
+            to               : next,
+            reason           : reason,
+            arrival_rate     : Math.round(rate * 1000) / 1000.0d,
+            file_seconds     : Math.round(fileSeconds * 1000) / 1000.0d,
+            in_flight        : inFlight,
+        ]
+        size = next
+        decisionCount++
+        decisions.add(decision)
+        if (decisions.size() > MAX_DECISIONS) {
+            decisions.remove(0)
+        }
+        onDecision?.call(decision)
+    }
+
+    /** Current state for the runtime-metrics snapshot. */
+    synchronized Map snapshot() {
+        return [
+            batch_size      : size,
+            arrival_rate    : Math.round(arrivalRate() * 1000) / 1000.0d,
+            file_seconds    : fileSeconds == null ? null : Math.round(fileSeconds * 1000) / 1000.0d,
+            in_flight       : inFlight(),
+            expired_files   : expiredFiles,
+            decisions       : decisionCount,
+            last_decision   : decisions ? new LinkedHashMap(decisions.last()) : null,
+        ]
+    }
+
+    /** The most recent decisions, oldest first. */
+    synchronized List<Map> recentDecisions() {
+        return decisions.collect { new LinkedHashMap(it) }
+    }
+}
@@ -1,3 +1,5 @@
+import java.nio.file.Files
+import java.nio.file.Path
 import java.util.concurrent.ConcurrentLinkedDeque
 import groovyx.gpars.dataflow.DataflowQueue
 import groovyx.gpars.dataflow.operator.PoisonPill
@@ -6,7 +8,8 @@ import groovyx.gpars.dataflow.operator.PoisonPill
  * Utility for count-or-timeout batch flushing in real-time mode.
  *
  * Emits a batch (as a list) when either:
- *   - batchSize items have accumulated, or
+ *   - batchSize items have accumulated (or, with options.batchBytes,
+ *     the buffered items add up to that many bytes), or
  *   - timeoutSeconds have elapsed since the last flush, with at least
  *     one pending item in the buffer.
  *
@@ -32,6 +35,18 @@ import groovyx.gpars.dataflow.operator.PoisonPill
  *   - timeoutSeconds <= 0 falls back to the previous count-only
  *     behaviour, so callers that explicitly want no timeout can pass
  *     0 or a negative value.
+ *   - With an AdaptiveBatchController (options.controller) the count
+ *     threshold is the controller's current batch size, re-read for
+ *     every item, so a re-size takes effect on the batch being filled.
+ *   - With options.batchBytes the threshold is a size budget instead of
+ *     a file count: MinKNOW files range from kilobytes to hundreds of
+ *     megabytes, so equal-count batches are not equal work. A file that
+ *     would push the buffer over the budget flushes the buffer first, so
+ *     no batch exceeds the budget except a file at or over it, which is
+ *     emitted as a batch of its own.
+ *   - batchPerBarcode is the per-barcode variant: one buffer per
+ *     barcode, batches released in weighted fair order (see
+ *     FairBatchScheduler).
  */
 class BatchUtils {
 
@@ -63,18 +78,42 @@ class BatchUtils {
      * @return New channel emitting lists of items
      */
     static def batchWithTimeout(ch_input, int batchSize, int timeoutSeconds) {
+        return batchWithTimeout(ch_input, batchSize, timeoutSeconds, [:])
+    }
+
+    /**
+     * batchWithTimeout with options.
+     *
+     * @param options  controller: an AdaptiveBatchController; the flush
+     *                 threshold is read from it for every item (batchSize is
+     *                 then only its starting point), and every arrival and
+     *                 emitted batch is reported to it
+     *                 batchBytes: flush once the buffered items total this
+     *                 many bytes; replaces the count threshold (batchSize and
+     *                 the controller's size are not used for flushing)
+     *                 sizeOf: closure returning an item's size in bytes
+     *                 (default itemBytes)
+     */
+    static def batchWithTimeout(ch_input, int batchSize, int timeoutSeconds, Map options) {
+        final AdaptiveBatchController controller = options?.controller as AdaptiveBatchController
+        final long batchBytes = (options?.batchBytes ?: 0L) as long
+        final Closure sizeOf = (options?.sizeOf ?: { item -> itemBytes(item) }) as Closure
+
         // Edge case: no timeout requested -- preserve the prior simple behaviour.
-        if (timeoutSeconds <= 0) {
+        if (timeoutSeconds <= 0 && controller == null && batchBytes <= 0) {
             return ch_input.buffer(size: batchSize, remainder: true)
         }
 
         final DataflowQueue ch_output = new DataflowQueue()
         final ConcurrentLinkedDeque buffer = new ConcurrentLinkedDeque()
         final Object lock = new Object()
+        // Bytes currently buffered (batchBytes mode). Guarded by `lock`.
+        long bufferedBytes = 0L
 
         // Drain the current buffer into a list and emit it as one batch.
         // Caller must hold `lock`.
         Closure drainAndEmit = {
+            bufferedBytes = 0L
             if (buffer.isEmpty()) {
                 return
             }
@@ -86,6 +125,7 @@ class BatchUtils {
             }
             try {
                 ch_output.bind(batch)
+                controller?.recordEmit(batch.size())
             } catch (Exception e) {
                 // Output already closed; nothing more we can do.
             }
@@ -96,17 +136,19 @@ class BatchUtils {
         // first flush only fires after timeoutSeconds (callers that emit
         // a quick burst should reach the size threshold before this
         // first tick).
-        final long periodMs = timeoutSeconds * 1000L
         final Timer timer = new Timer('batch-timeout-flush', /* daemon */ true)
-        timer.scheduleAtFixedRate({
-            try {
-                synchronized(lock) {
-                    drainAndEmit()
+        if (timeoutSeconds > 0) {
+            final long periodMs = timeoutSeconds * 1000L
+            timer.scheduleAtFixedRate({
+                try {
+                    synchronized(lock) {
+                        drainAndEmit()
+                    }
+                } catch (Exception e) {
+                    timer.cancel()
                 }
-            } catch (Exception e) {
-                timer.cancel()
-            }
-        } as TimerTask, periodMs, periodMs)
+            } as TimerTask, periodMs, periodMs)
+        }
 
         // Drive the buffer from ch_input via subscribe. Nextflow's
         // subscribe binds to a Dataflow.operator, so it acts as the
@@ -117,8 +159,19 @@ class BatchUtils {
         ch_input.subscribe(
             onNext: { item ->
                 synchronized(lock) {
+                    long bytes = batchBytes > 0 ? sizeOf.call(item) as long : 0L
+                    // Flush what fits before an item that would overflow it.
+                    if (batchBytes > 0 && !buffer.isEmpty() && bufferedBytes + bytes > batchBytes) {
+                        drainAndEmit()
+                    }
                     buffer.add(item)
-                    if (buffer.size() >= batchSize) {
+                    controller?.recordArrival()
+                    if (batchBytes > 0) {
+                        bufferedBytes += bytes
+                        if (bufferedBytes >= batchBytes) {
+                            drainAndEmit()
+                        }
+                    } else if (buffer.size() >= (controller != null ? controller.batchSize() : batchSize)) {
                         drainAndEmit()
                     }
                 }
@@ -139,6 +192,142 @@ class BatchUtils {
         return ch_output
     }
 
+    /**
+     * Batch per barcode: one buffer per key, each flushed on its own count (or
+     * byte) threshold, and all of them on the timeout. Full buffers go to a
+     * FairBatchScheduler, which releases them every scheduleMillis in weighted
+     * deficit round robin order, so a startup backlog is served across barcodes
+     * instead of in arrival order. Every emitted batch holds one key's items.
+     *
+     * @param ch_input         Input channel of individual items
+     * @param batchSize        Items per key before that key's batch is queued
+     * @param timeoutSeconds   Max seconds before partial buffers are queued; <= 0 disables
+     * @param options          keyOf: closure item -> key (default: parent directory name)
+     *                         weightOf: closure key -> weight for the scheduler (default 1)
+     *                         batchBytes: per-key byte budget replacing batchSize
+     *                         sizeOf: closure item -> bytes (default itemBytes)
+     *                         scheduleMillis: scheduler interval (default 1000)
+     *                         scheduler: a FairBatchScheduler to use (e.g. to read served())
+     * @return New channel emitting lists of items
+     */
+    static def batchPerBarcode(ch_input, int batchSize, int timeoutSeconds, Map options = [:]) {
+        final Closure keyOf = (options?.keyOf ?: { item -> item?.parent?.name ?: 'unknown' }) as Closure
+        final long batchBytes = (options?.batchBytes ?: 0L) as long
+        final Closure sizeOf = (options?.sizeOf ?: { item -> itemBytes(item) }) as Closure
+        final long scheduleMs = (options?.scheduleMillis ?: 1000L) as long
+        final FairBatchScheduler scheduler = (options?.scheduler
+            ?: new FairBatchScheduler(options?.weightOf as Closure, batchBytes)) as FairBatchScheduler
+
+        final DataflowQueue ch_output = new DataflowQueue()
+        final Map<String, List> buffers = new LinkedHashMap<>()
+        final Map<String, Long> bufferedBytes = [:]
+        final Object lock = new Object()
+        boolean closed = false
+
+        // Hand one key's buffer to the scheduler. Caller must hold `lock`.
+        Closure release = { String key ->
+            def items = buffers.remove(key)
+            long bytes = bufferedBytes.remove(key) ?: 0L
+            if (items) {
+                scheduler.enqueue(key, items, bytes)
+            }
+        }
+
+        // Emit everything the scheduler holds, in its order. Caller must
+        // hold `lock`.
+        Closure emitScheduled = {
+            if (closed) {
+                return
+            }
+            scheduler.drain().each { entry ->
+                try {
+                    ch_output.bind(entry.batch)
+                } catch (Exception e) {
+                    // Output already closed; nothing more we can do.
+                }
+            }
+        }
+
+        // Daemon Timer, as in batchWithTimeout: one task releases the
+        // scheduler's batches, the other queues partial buffers on timeout.
+        final Timer timer = new Timer('barcode-batch-scheduler', /* daemon */ true)
+        timer.scheduleAtFixedRate({
+            try {
+                synchronized(lock) {
+                    emitScheduled()
+                }
+            } catch (Exception e) {
+                timer.cancel()
+            }
+        } as TimerTask, scheduleMs, scheduleMs)
+        if (timeoutSeconds > 0) {
+            final long periodMs = timeoutSeconds * 1000L
+            timer.scheduleAtFixedRate({
+                try {
+                    synchronized(lock) {
+                        new ArrayList(buffers.keySet()).each { release(it) }
+                    }
+                } catch (Exception e) {
+                    timer.cancel()
+                }
+            } as TimerTask, periodMs, periodMs)
+        }
+
+        ch_input.subscribe(
+            onNext: { item ->
+                synchronized(lock) {
+                    String key = keyOf.call(item) as String
+                    long itemSize = sizeOf.call(item) as long
+                    // As in batchWithTimeout: release what fits first.
+                    if (batchBytes > 0 && buffers[key] && (bufferedBytes[key] ?: 0L) + itemSize > batchBytes) {
+                        release(key)
+                    }
+                    def items = buffers.computeIfAbsent(key, { [] })
+                    items.add(item)
+                    long bytes = (bufferedBytes[key] ?: 0L) + itemSize
+                    bufferedBytes[key] = bytes
+                    if (batchBytes > 0 ? bytes >= batchBytes : items.size() >= batchSize) {
+                        release(key)
+                    }
+                }
+            },
+            onComplete: {
+                try {
+                    synchronized(lock) {
+                        new ArrayList(buffers.keySet()).each { release(it) }
+                        emitScheduled()
+                        closed = true
+                    }
+                    ch_output.bind(PoisonPill.instance)
+                } catch (Exception e) {
+                    // Already closed.
+                }
+                timer.cancel()
+            }
+        )
+
+        return ch_output
+    }
+
+    /**
+     * Size in bytes of a batched item: a file's size on disk, 0 for anything
+     * else or when the file cannot be read (it then never fills a batch on
+     * its own; the timeout still flushes it).
+     */
+    static long itemBytes(Object item) {
+        try {
+            if (item instanceof Path) {
+                return Files.size((Path) item)
+            }
+            if (item instanceof File) {
+                return ((File) item).length()
+            }
+        } catch (IOException e) {
+            // Removed or unreadable since it was detected.
+        }
+        return 0L
+    }
+
     /**
      * Round-robin interleave a list of files by their parent directory
      * (typically the barcode folder), so downstream per-file consumption
@@ -25,10 +25,11 @@
  *     aggregator finish the job: submission order equals completion order, so
  *     the most complete result for a key is also the last one written.
  *
- * The cost is that batch N re-merges N per-taxid files instead of two. These
- * files are small (one taxon's alignments from one batch) and correctness is
- * not worth trading for the incremental form, which cannot be made safe while
- * its state lives in the publish directory.
+ * Handing over the full set does not mean re-reading it: ``accumulateWithIds``
+ * also reports the batch ids, and the aggregator keys a summary it carries
+ * under the work directory by them, so each task folds in only the batches
+ * that summary has not seen. That state never lives in the publish directory,
+ * and the aggregator falls back to the full set whenever it does not match.
  *
  * ``accumulate`` is synchronized because Nextflow may run the calling operator
  * on multiple threads, and it returns fresh lists so callers never see the
@@ -50,14 +51,27 @@ class CumulativeBatchAccumulator {
      *          batch seen so far for this key, ordered by first appearance
      */
     synchronized List accumulate(String key, Object batchId, Object resultFile, Object statsFile) {
+        def accumulated = accumulateWithIds(key, batchId, resultFile, statsFile)
+        return [accumulated[1], accumulated[2]]
+    }
+
+    /**
+     * As ``accumulate``, but also report the id of each batch in the set.
+     *
+     * @return  a three-element list [ batch ids, result files, stats files ],
+     *          index-aligned and ordered by first appearance
+     */
+    synchronized List accumulateWithIds(String key, Object batchId, Object resultFile, Object statsFile) {
         def perKey = store.get(key, [:])
         perKey[String.valueOf(batchId)] = [resultFile, statsFile]
+        def ids = []
         def results = []
         def stats = []
-        perKey.values().each { entry ->
+        perKey.each { id, entry ->
+            ids.add(id)
             results.add(entry[0])
             stats.add(entry[1])
         }
-        return [results, stats]
+        return [ids, results, stats]
     }
 }
@@ -0,0 +1,111 @@
+/**
+ * Weighted fair order for per-barcode realtime batches (deficit round robin
+ * by bytes).
+ *
+ * With --per_barcode_batching, BatchUtils.batchPerBarcode keeps one buffer per
+ * barcode and hands each full (or timed-out) buffer here as a batch. The order
+ * batches leave the scheduler is the order they are queued for classification,
+ * so it decides which barcode is served next. At startup every pre-existing
+ * file arrives at once: in arrival order a 96-barcode backlog would be drained
+ * one barcode after another, and the last barcode would wait for all the
+ * others.
+ *
+ * drain() empties every queue in deficit round robin order (Shreedhar and
+ * Varghese). Each visit a barcode's deficit grows by quantumBytes times its
+ * weight, and it emits batches from the head of its queue while they fit in
+ * the deficit. Service is therefore shared by bytes, not by batch count: a
+ * barcode of many small files does not lose out to one of few large files.
+ * Priority samples get a larger weight, i.e. a larger share of each round.
+ * A barcode's wait is bounded by one round over the other barcodes.
+ *
+ * The quantum is the byte budget when batches are sized by bytes; otherwise
+ * it is the largest batch waiting, so every barcode emits at least one batch
+ * per round and no round is empty. Barcodes are visited in the order they
+ * first had a batch waiting. Like CrossBatchInterleaver this only orders
+ * batches: every batch is emitted once, at the next drain, and nothing is held
+ * back. Methods are synchronized because the batcher's timer and subscriber
+ * threads both call in.
+ */
+class FairBatchScheduler {
+
+    private final Closure weightOf
+    private final long quantumBytes
+
+    private final Map<String, ArrayDeque<Map>> queues = [:]
+    private final ArrayDeque<String> active = new ArrayDeque<>()
+    private final Map<String, Long> deficit = [:]
+    private final Map<String, Long> servedBytes = [:]
+    private final Map<String, Long> servedBatches = [:]
+
+    /**
+     * @param weightOf      closure key -> weight (>= 1); default 1 for all
+     * @param quantumBytes  bytes added per visit and unit of weight; <= 0 uses
+     *                      the largest waiting batch
+     */
+    FairBatchScheduler(Closure weightOf = null, long quantumBytes = 0L) {
+        this.weightOf = weightOf
+        this.quantumBytes = quantumBytes
+    }
+
+    /** Queue one barcode's batch of `bytes` total size. */
+    synchronized void enqueue(String key, List batch, long bytes) {
+        def queue = queues.computeIfAbsent(key, { new ArrayDeque<Map>() })
+        if (queue.isEmpty()) {
+            active.addLast(key)
+        }
+        queue.addLast([key: key, batch: batch, bytes: Math.max(0L, bytes)])
+    }
+
+    /** Batches waiting, over all barcodes. */
+    synchronized int pending() {
+        return (queues.values().sum { it.size() } ?: 0) as int
+    }
+
+    /**
+     * Remove every waiting batch, in weighted deficit round robin order.
+     *
+     * @return list of [key, batch, bytes] maps
+     */
+    synchronized List<Map> drain() {
+        def out = []
+        if (active.isEmpty()) {
+            return out
+        }
+        long quantum = quantumBytes > 0 ? quantumBytes
+            : Math.max(1L, queues.values().collect { q -> q.collect { it.bytes as long }.max() ?: 0L }.max() as long)
+        while (!active.isEmpty()) {
+            String key = active.pollFirst()
+            def queue = queues[key]
+            long credit = (deficit[key] ?: 0L) + quantum * weight(key)
+            while (!queue.isEmpty() && (queue.peekFirst().bytes as long) <= credit) {
+                def entry = queue.pollFirst()
+                credit -= entry.bytes as long
+                servedBytes[key] = (servedBytes[key] ?: 0L) + (entry.bytes as long)
+                servedBatches[key] = (servedBatches[key] ?: 0L) + 1L
+                out.add(entry)
+            }
+            if (queue.isEmpty()) {
+                // An idle barcode keeps no credit (standard DRR).
+                deficit[key] = 0L
+            } else {
+                deficit[key] = credit
+                active.addLast(key)
+            }
+        }
+        return out
+    }
+
+    /** Bytes and batches served per barcode so far. */
+    synchronized Map<String, Map> served() {
+        return servedBatches.keySet().collectEntries { key ->
+            [(key): [batches: servedBatches[key], bytes: servedBytes[key]]]
+        }
+    }
+
+    private long weight(String key) {
+        if (weightOf == null) {
+            return 1L
+        }
+        return Math.max(1L, (weightOf.call(key) ?: 1) as long)
+    }
+}
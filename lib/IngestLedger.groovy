@@ -0,0 +1,285 @@
+import java.nio.file.Files
+import java.nio.file.Path
+import java.nio.file.Paths
+import java.nio.file.StandardOpenOption
+import java.security.MessageDigest
+import java.util.concurrent.ConcurrentHashMap
+
+/**
+ * Append-only ledger of the realtime input files already processed.
+ *
+ * A restarted or resumed realtime run lists the watch directory again, and
+ * watchPath re-emits every existing file. Without a record of what the last
+ * run took, max_files counts from zero and every file is batched and
+ * classified again, unless the task cache happens to hit. With --ingest_ledger
+ * REALTIME_MONITORING checks each file against this ledger before batching and
+ * skips the ones an earlier run already processed.
+ *
+ * A file is recorded twice: 'formed' when its batch is formed, and 'done'
+ * once that batch has been classified (or, with no classification, has left
+ * QC). Only done files are skipped on restart. A run killed between the two
+ * leaves its in-flight batches formed, and the next run admits their files
+ * again rather than losing them.
+ *
+ * The ledger is a tab-separated flat file, one line per file and state:
+ *
+ *     path  size  mtime_ms  hash_prefix  batch_id  recorded_at  state
+ *
+ * Lines without a state column (ledgers written before it existed) count as
+ * done.
+ *
+ * hash_prefix is the SHA-256 of the first HASH_BYTES of the file, cut to 16
+ * hex digits. On load, the lines become two in-memory sets:
+ *
+ *   - (path, size, mtime): the same file, unchanged. This is an O(1) check
+ *     that needs no read, so a restart over a huge watch directory costs one
+ *     stat per file.
+ *   - (size, hash_prefix): the same content under another path, e.g. a file
+ *     that was moved. The prefix is only read when an unmatched file has the
+ *     size of a recorded one.
+ *
+ * A file that changed since it was recorded (different size or mtime at the
+ * same path, and no content match) is batched again. Within a run, claim()
+ * also remembers every file it let through, formed or not, so a watchPath
+ * 'modify' event for an unchanged file cannot batch it twice.
+ *
+ * The ledger is appended to, never rewritten. Each write is flushed. Methods
+ * are synchronized because the filter, the batch tap and the completion
+ * subscriber run on different operator threads. The ledger is registered by
+ * name so the workflow can mark files done without threading it through the
+ * subworkflows' inputs.
+ */
+class IngestLedger {
+
+    private static final Map<String, IngestLedger> REGISTRY = new ConcurrentHashMap<>()
+
+    static final String HEADER = '#path\tsize\tmtime_ms\thash_prefix\tbatch_id\trecorded_at\tstate'
+    /** Bytes of content hashed into hash_prefix. */
+    static final int HASH_BYTES = 65536
+    static final String FORMED = 'formed'
+    static final String DONE = 'done'
+
+    final Path path
+
+    private final Set<String> identities = new HashSet<>()
+    private final Set<String> contents = new HashSet<>()
+    private final Set<Long> sizes = new HashSet<>()
+    /** Files formed into a batch this run and not yet done, by absolute path. */
+    private final Map<String, List> pending = [:]
+    private final Set<String> finished = new HashSet<>()
+    private final Set<String> formedEarlier = new HashSet<>()
+    private int loaded = 0
+    private BufferedWriter writer = null
+
+    /**
+     * Open the ledger at `path`, loading any existing records. The file and
+     * its parent directory are created on the first record.
+     */
+    IngestLedger(Path path) {
+        this.path = path
+        if (Files.exists(path)) {
+            def formed = new LinkedHashSet<String>()
+            path.withReader { reader ->
+                reader.eachLine { line ->
+                    if (!line || line.startsWith('#')) {
+                        return
+                    }
+                    def f = line.split('\t', -1)
+                    if (f.length < 4) {
+                        return
+                    }
+                    def id = identity(f[0], f[1] as long, f[2] as long)
+                    if (f.length >= 7 && f[6] == FORMED) {
+                        formed.add(id)
+                        return
+                    }
+                    identities.add(id)
+                    if (f[3]) {
+                        contents.add(content(f[1] as long, f[3]))
+                        sizes.add(f[1] as long)
+                    }
+                    loaded++
+                }
+            }
+            formed.removeAll(identities)
+            formedEarlier.addAll(formed)
+        }
+    }
+
+    static IngestLedger register(String name, IngestLedger ledger) {
+        REGISTRY[name] = ledger
+        return ledger
+    }
+
+    static IngestLedger lookup(String name) {
+        return REGISTRY[name]
+    }
+
+    /** Done records loaded from an earlier run. */
+    int loadedCount() {
+        return loaded
+    }
+
+    /**
+     * Files an earlier run formed into a batch but never finished; they are
+     * admitted again.
+     */
+    int unfinishedCount() {
+        return formedEarlier.size()
+    }
+
+    /**
+     * True if `file` was processed by an earlier run, or (same path, size
+     * and mtime) claimed earlier in this one.
+     */
+    synchronized boolean contains(Path file) {
+        def attrs = stat(file)
+        if (attrs == null) {
+            return false
+        }
+        if (identities.contains(identity(file.toAbsolutePath().toString(), attrs.size, attrs.mtime))) {
+            return true
+        }
+        if (!sizes.contains(attrs.size)) {
+            return false
+        }
+        def prefix = hashPrefix(file)
+        return prefix != null && contents.contains(content(attrs.size, prefix))
+    }
+
+    /**
+     * Let `file` through once: false if the ledger already holds it,
+     * otherwise remember it for the rest of this run and return true.
+     */
+    synchronized boolean claim(Path file) {
+        if (contains(file)) {
+            return false
+        }
+        def attrs = stat(file)
+        if (attrs != null) {
+            identities.add(identity(file.toAbsolutePath().toString(), attrs.size, attrs.mtime))
+        }
+        return true
+    }
+
+    /**
+     * Record one batch's files as formed. They are skipped for the rest of
+     * this run but admitted again by a restart until done() marks them.
+     *
+     * @param files    the batch's files
+     * @param batchId  the batch id written with each line
+     */
+    synchronized void formed(List files, Object batchId) {
+        if (!files) {
+            return
+        }
+        long now = System.currentTimeMillis()
+        files.each { f ->
+            Path file = f as Path
+            def attrs = stat(file)
+            if (attrs == null) {
+                return
+            }
+            def absolute = file.toAbsolutePath().toString()
+            identities.add(identity(absolute, attrs.size, attrs.mtime))
+            def fields = [absolute, attrs.size, attrs.mtime, hashPrefix(file) ?: '', batchId]
+            if (!finished.contains(absolute)) {
+                pending[absolute] = fields
+            }
+            append(fields + [now, FORMED])
+        }
+        flush()
+    }
+
+    /**
+     * Record `file` as done: its batch was processed, so a restart skips it.
+     * The line repeats the size, mtime and hash recorded when the batch was
+     * formed, so a file that grew in between is processed again.
+     */
+    synchronized void done(Object file) {
+        if (file == null) {
+            return
+        }
+        def absolute = file instanceof Path ? file.toAbsolutePath().toString() : file.toString()
+        if (!finished.add(absolute)) {
+            return
+        }
+        def fields = pending.remove(absolute)
+        if (fields == null) {
+            // The completion overtook the batch tap that records 'formed'.
+            Path input = Paths.get(absolute)
+            def attrs = stat(input)
+            if (attrs == null) {
+                return
+            }
+            fields = [absolute, attrs.size, attrs.mtime, hashPrefix(input) ?: '', '']
+        }
+        def prefix = fields[3] as String
+        if (prefix) {
+            contents.add(content(fields[1] as long, prefix))
+            sizes.add(fields[1] as long)
+        }
+        append(fields + [System.currentTimeMillis(), DONE])
+        flush()
+    }
+
+    /** Files formed into a batch this run and not yet done. */
+    synchronized int pendingCount() {
+        return pending.size()
+    }
+
+    private void append(List fields) {
+        if (writer == null) {
+            if (path.parent != null) {
+                Files.createDirectories(path.parent)
+            }
+            boolean fresh = !Files.exists(path) || Files.size(path) == 0
+            writer = Files.newBufferedWriter(path, StandardOpenOption.CREATE, StandardOpenOption.APPEND)
+            if (fresh) {
+                writer.write(HEADER)
+                writer.newLine()
+            }
+        }
+        writer.write(fields.join('\t'))
+        writer.newLine()
+    }
+
+    private void flush() {
+        writer?.flush()
+    }
+
+    /** First 16 hex digits of the SHA-256 of the file's first HASH_BYTES. */
+    static String hashPrefix(Path file) {
+        try {
+            def digest = MessageDigest.getInstance('SHA-256')
+            byte[] buffer = new byte[HASH_BYTES]
+            int total = 0
+            Files.newInputStream(file).withCloseable { input ->
+                int n
+                while (total < HASH_BYTES && (n = input.read(buffer, total, HASH_BYTES - total)) > 0) {
+                    total += n
+                }
+            }
+            digest.update(buffer, 0, total)
+            return digest.digest().encodeHex().toString().substring(0, 16)
+        } catch (IOException e) {
+            return null
+        }
+    }
+
+    private static Map stat(Path file) {
+        try {
+            return [size: Files.size(file), mtime: Files.getLastModifiedTime(file).toMillis()]
+        } catch (IOException e) {
+            return null
+        }
+    }
+
+    private static String identity(String path, long size, long mtime) {
+        return "${path}\t${size}\t${mtime}".toString()
+    }
+
+    private static String content(long size, String prefix) {
+        return "${size}\t${prefix}".toString()
+    }
+}
@@ -38,6 +38,14 @@ class InputDetector {
         return hasBarcodeDirs ? 'barcode_subdirs' : 'flat'
     }
 
+    /**
+     * detectStructure answered from an InputSnapshot, without listing the
+     * directory again.
+     */
+    static String detectStructure(InputSnapshot snapshot) {
+        return snapshot.structure()
+    }
+
     /**
      * Extract sample ID from a file path using a priority chain:
      * 1. Parent directory name if it matches barcode pattern
@@ -0,0 +1,268 @@
+import groovy.json.JsonOutput
+import groovy.json.JsonSlurper
+import java.nio.file.Files
+import java.nio.file.Path
+import java.nio.file.Paths
+import java.nio.file.attribute.BasicFileAttributes
+import java.security.MessageDigest
+
+/**
+ * One walk of a scan-mode input directory, cached between runs.
+ *
+ * INPUT_SCANNER used to discover its inputs three times over: InputDetector
+ * .detectStructure listed the top level and every barcode directory, and the
+ * file channels then globbed the tree again (`*` plus `**\/*` in flat mode,
+ * Channel.fromPath plus eachFileMatch per barcode directory). On a network
+ * filesystem holding tens of thousands of FASTQ chunks each of those passes is
+ * one metadata round trip per file, and startup took minutes.
+ *
+ * scan() walks the tree once. Each directory is listed with one attribute read
+ * per entry (the JVM's counterpart of os.scandir plus stat), and the result is
+ * a snapshot: every FASTQ file's path, size, mtime and inferred sample, plus
+ * every directory's mtime and subdirectories. Structure detection
+ * (structure()) and sample grouping (barcodeGroups(), sampleGroups()) both
+ * read the snapshot, so nothing is listed twice.
+ *
+ * The snapshot is saved as JSON and refreshed incrementally on the next scan.
+ * Adding, removing or renaming an entry changes its directory's mtime, so a
+ * directory whose mtime matches the cached one keeps its cached listing; an
+ * unchanged tree costs one stat per directory instead of one per file. A
+ * directory modified within MTIME_SLACK_MS of the previous scan is listed
+ * again anyway, because coarse filesystem timestamps could hide a later change
+ * in the same tick. A file rewritten in place keeps its directory's mtime, so
+ * its cached size is not refreshed; sequencer output is written once and never
+ * rewritten, which is what this relies on.
+ *
+ * Hidden files and directories (leading dot, e.g. macOS "._" AppleDouble
+ * sidecars) are never part of the snapshot.
+ */
+class InputSnapshot {
+
+    static final int FORMAT_VERSION = 1
+    /** Directories modified this close to the previous scan are re-listed. */
+    static final long MTIME_SLACK_MS = 2000L
+    /** Same match as INPUT_SCANNER's former eachFileMatch / fromPath globs. */
+    static final String FASTQ_PATTERN = /[^.].*\.(fastq|fastq\.gz|fq|fq\.gz)$/
+
+    final Path root
+    final String sampleRegex
+    final String sampleName
+
+    /** Relative directory path ('' for the root) -> [mtime, subdirs, files]. */
+    private final Map<String, Map> dirs = new TreeMap<>()
+    private int listedDirs = 0
+    private int reusedDirs = 0
+    private long scannedAt = 0L
+
+    private InputSnapshot(Path root, String sampleRegex, String sampleName) {
+        this.root = root
+        this.sampleRegex = sampleRegex
+        this.sampleName = sampleName
+    }
+
+    /**
+     * Walk `dir` (reusing the snapshot cached at `cache`, when given) and save
+     * the refreshed snapshot back to `cache`.
+     *
+     * @param dir          input directory (String, File or Path)
+     * @param cache        snapshot file (String or Path); null disables caching
+     * @param sampleRegex  as for InputDetector.extractSampleId
+     * @param sampleName   as for InputDetector.extractSampleId
+     */
+    static InputSnapshot scan(dir, cache = null, String sampleRegex = null, String sampleName = null) {
+        def snapshot = new InputSnapshot(toPath(dir), sampleRegex, sampleName)
+        Path cachePath = cache != null ? toPath(cache) : null
+        Map previous = cachePath != null ? snapshot.loadCache(cachePath) : null
+        snapshot.scannedAt = System.currentTimeMillis()
+        if (Files.isDirectory(snapshot.root)) {
+            snapshot.walk(snapshot.root, '', previous?.dirs ?: [:], (previous?.scanned_at ?: 0L) as long, new HashSet<Path>())
+        }
+        if (cachePath != null) {
+            snapshot.saveCache(cachePath)
+        }
+        return snapshot
+    }
+
+    /** Default cache file for `dir` under a work directory. */
+    static Path defaultCachePath(workDir, dir) {
+        def digest = MessageDigest.getInstance('MD5').digest(toPath(dir).toAbsolutePath().toString().bytes)
+        return toPath(workDir).resolve('input_snapshots').resolve(digest.encodeHex().toString() + '.json')
+    }
+
+    private static Path toPath(input) {
+        if (input instanceof Path) return (Path) input
+        if (input instanceof File) return ((File) input).toPath()
+        return Paths.get(input.toString())
+    }
+
+    private Map loadCache(Path cachePath) {
+        try {
+            if (!Files.exists(cachePath)) {
+                return null
+            }
+            def cached = new JsonSlurper().parseText(new String(Files.readAllBytes(cachePath), 'UTF-8')) as Map
+            if (cached.version != FORMAT_VERSION || cached.root != root.toAbsolutePath().toString()) {
+                return null
+            }
+            // Samples are inferred at scan time; other naming options mean
+            // the cached ones are wrong, though the listings are still good.
+            if (cached.sample_regex != sampleRegex || cached.sample_name != sampleName) {
+                cached.dirs.values().each { entry -> entry.files.each { it.remove('sample') } }
+            }
+            return cached
+        } catch (Exception e) {
+            // Unreadable or from another version: scan from scratch.
+            return null
+        }
+    }
+
+    private void saveCache(Path cachePath) {
+        try {
+            Files.createDirectories(cachePath.parent)
+            def tmp = cachePath.resolveSibling(".${cachePath.fileName}.tmp")
+            def json = JsonOutput.toJson([
+                version     : FORMAT_VERSION,
+                root        : root.toAbsolutePath().toString(),
+                sample_regex: sampleRegex,
+                sample_name : sampleName,
+                scanned_at  : scannedAt,
+                dirs        : dirs,
+            ])
+            Files.write(tmp, json.getBytes('UTF-8'))
+            Files.move(tmp, cachePath, java.nio.file.StandardCopyOption.REPLACE_EXISTING, java.nio.file.StandardCopyOption.ATOMIC_MOVE)
+        } catch (Exception e) {
+            // The cache only saves time; a run never fails on it.
+        }
+    }
+
+    private void walk(Path dir, String rel, Map cachedDirs, long cachedAt, Set<Path> visited) {
+        long mtime
+        try {
+            // Symlinked directories are followed, once each.
+            Path real
+            try {
+                real = dir.toRealPath()
+            } catch (UnsupportedOperationException e) {
+                real = dir.toAbsolutePath()
+            }
+            if (!visited.add(real)) {
+                return
+            }
+            mtime = Files.getLastModifiedTime(dir).toMillis()
+        } catch (IOException e) {
+            return
+        }
+        Map cached = cachedDirs[rel] as Map
+        Map entry
+        // Object stores report no directory mtime (0): always list those.
+        if (cached != null && mtime > 0 && (cached.mtime as long) == mtime && mtime < cachedAt - MTIME_SLACK_MS) {
+            entry = cached
+            reusedDirs++
+        } else {
+            entry = list(dir, mtime)
+            listedDirs++
+        }
+        entry.files.each { f ->
+            if (f.sample == null) {
+                f.sample = InputDetector.extractSampleId(dir.resolve(f.name as String).toString(), sampleRegex, sampleName)
+            }
+        }
+        dirs[rel] = entry
+        entry.subdirs.each { sub ->
+            walk(dir.resolve(sub as String), rel ? "${rel}/${sub}".toString() : sub as String, cachedDirs, cachedAt, visited)
+        }
+    }
+
+    private static Map list(Path dir, long mtime) {
+        def subdirs = []
+        def files = []
+        try {
+            Files.newDirectoryStream(dir).withCloseable { stream ->
+                stream.each { Path p ->
+                    String name = p.fileName.toString()
+                    if (name.startsWith('.')) {
+                        return
+                    }
+                    BasicFileAttributes attrs
+                    try {
+                        attrs = Files.readAttributes(p, BasicFileAttributes)
+                    } catch (IOException e) {
+                        return
+                    }
+                    if (attrs.isDirectory()) {
+                        subdirs.add(name)
+                    } else if (attrs.isRegularFile() && name ==~ FASTQ_PATTERN) {
+                        files.add([name: name, size: attrs.size(), mtime: attrs.lastModifiedTime().toMillis()])
+                    }
+                }
+            }
+        } catch (IOException e) {
+            // Vanished or unreadable: an empty listing.
+        }
+        return [mtime: mtime, subdirs: subdirs.sort(), files: files.sort { it.name }]
+    }
+
+    /** Directories listed by this scan, and taken unchanged from the cache. */
+    int listedCount() { listedDirs }
+    int reusedCount() { reusedDirs }
+    int dirCount() { dirs.size() }
+    int fileCount() { (dirs.values().sum { it.files.size() } ?: 0) as int }
+
+    /**
+     * Every FASTQ file: [path, size, mtime, sample, dir], dir relative to
+     * the root ('' for files in the root).
+     */
+    List<Map> files() {
+        def out = []
+        dirs.each { rel, entry ->
+            Path dir = rel ? root.resolve(rel as String) : root
+            entry.files.each { f ->
+                out.add([path: dir.resolve(f.name as String).toString(), size: f.size, mtime: f.mtime, sample: f.sample, dir: rel])
+            }
+        }
+        return out
+    }
+
+    /**
+     * 'barcode_subdirs' when a top-level barcodeNN directory holds FASTQ
+     * files directly, otherwise 'flat' -- InputDetector.detectStructure's
+     * rule, answered from the snapshot.
+     */
+    String structure() {
+        def top = dirs[''] as Map
+        if (top == null) {
+            return 'flat'
+        }
+        def barcode_dir = top.subdirs.find { sub -> sub ==~ /^barcode\d+$/ && dirs[sub as String]?.files }
+        return barcode_dir ? 'barcode_subdirs' : 'flat'
+    }
+
+    /**
+     * Barcode layout: files directly inside each top-level barcode* and
+     * unclassified directory, keyed by directory name. Directories without
+     * FASTQ files are left out.
+     */
+    Map<String, List<String>> barcodeGroups() {
+        def groups = new TreeMap<String, List<String>>()
+        def top = dirs[''] as Map
+        top?.subdirs?.each { sub ->
+            if (!(sub.startsWith('barcode') || sub == 'unclassified')) {
+                return
+            }
+            def entry = dirs[sub as String] as Map
+            if (entry?.files) {
+                groups[sub as String] = entry.files.collect { root.resolve(sub as String).resolve(it.name as String).toString() }
+            }
+        }
+        return groups
+    }
+
+    /** Flat layout: every file at any depth, grouped by inferred sample. */
+    Map<String, List<String>> sampleGroups() {
+        def groups = new TreeMap<String, List<String>>()
+        files().each { f ->
+            groups.computeIfAbsent(f.sample as String, { [] }).add(f.path as String)
+        }
+        return groups
+    }
+}
@@ -24,8 +24,14 @@
  * Row order must not depend on which batch happened to finish first, because in
  * a realtime run that order is nondeterministic.
  *
+ * The same recovered parentage backs clade-level read extraction: cladeIndex
+ * maps every taxid in a batch report to the watched taxon it falls under, so
+ * the validation subworkflow can gate and extract a whole clade in one lookup
+ * per read.
+ *
  * Pure and side-effect free: every method returns new collections and mutates
- * nothing shared, so it is safe to call from the Nextflow head process.
+ * nothing shared (reportRows only reads its file), so it is safe to call from
+ * the Nextflow head process.
  */
 class KreportTree {
 
@@ -136,4 +142,95 @@ class KreportTree {
         }
         return ordered
     }
+
+    /**
+     * [taxid, name] rows of a Kraken2 report file, in file order.
+     *
+     * Accepts the standard six-column report and the eight-column form written
+     * with --report-minimizer-data; in both the taxid and the indented name are
+     * the last two columns. Rows whose taxid is not numeric (a header line, a
+     * comment) are skipped. Uses the NIO Path API so a work directory on object
+     * storage reads the same as a local one.
+     *
+     * @param report  Kraken2 report (Path, File or path string)
+     * @return        list of [taxid, name] rows, or null if the file could not
+     *                be read -- callers must not treat that as an empty tree
+     */
+    static List reportRows(Object report) {
+        if (report == null) {
+            return null
+        }
+        java.nio.file.Path path
+        if (report instanceof java.nio.file.Path) {
+            path = (java.nio.file.Path) report
+        } else if (report instanceof File) {
+            path = ((File) report).toPath()
+        } else {
+            path = new File(report.toString()).toPath()
+        }
+        if (!java.nio.file.Files.exists(path)) {
+            return null
+        }
+        def rows = []
+        try {
+            path.eachLine { line ->
+                def cols = line.split('\t')
+                if (cols.size() >= 6 && cols[-2].trim().isInteger()) {
+                    rows.add([cols[-2].trim(), cols[-1]])
+                }
+            }
+        } catch (Exception e) {
+            return null
+        }
+        return rows
+    }
+
+    /**
+     * Subtree index: every taxid in a report mapped to its nearest watched
+     * ancestor, the taxid itself included.
+     *
+     * Built once per batch, it turns clade-level read extraction into the same
+     * single dictionary lookup per read as exact matching. When watched taxa
+     * nest (a genus and one of its species), a read goes to the most specific
+     * watched taxon above it, so no read is extracted twice.
+     *
+     * @param parents  taxid -> parent taxid map, as from parentsFromRows
+     * @param watched  watched taxids
+     * @return         map of taxid (String) -> watched taxid (String) for every
+     *                 taxid at or below a watched one; others are absent
+     */
+    static Map cladeIndex(Map parents, Collection watched) {
+        def targets = watched.collect { it.toString() } as Set
+        def index = [:]
+        def resolved = [:]
+        parents.keySet().each { start ->
+            // Walk up to the first watched or already-resolved taxid, then
+            // record the answer for the whole path. The step bound guards
+            // against a cycle in the recovered links.
+            def path = []
+            def taxid = start.toString()
+            def found = null
+            int steps = 0
+            while (taxid != null && steps++ <= parents.size()) {
+                if (resolved.containsKey(taxid)) {
+                    found = resolved[taxid]
+                    break
+                }
+                path.add(taxid)
+                if (targets.contains(taxid)) {
+                    found = taxid
+                    break
+                }
+                def parent = parents[taxid]
+                taxid = parent == null ? null : parent.toString()
+            }
+            path.each { resolved[it] = found }
+        }
+        resolved.each { taxid, target ->
+            if (target != null) {
+                index[taxid] = target
+            }
+        }
+        return index
+    }
 }
@@ -205,6 +205,24 @@ It will be clamped on first adjustment. Consider setting batch_size within range
             Nextflow.error("ERROR: --batch_size_factor must be > 0, got: ${params.batch_size_factor}")
         }
 
+        // Validate batch_target_latency_seconds
+        if (params.batch_target_latency_seconds != null && params.batch_target_latency_seconds < 0) {
+            Nextflow.error("ERROR: --batch_target_latency_seconds must be >= 0, got: ${params.batch_target_latency_seconds}")
+        }
+
+        // Validate batch_split_reads
+        if (params.batch_split_reads != null && params.batch_split_reads < 0) {
+            Nextflow.error("ERROR: --batch_split_reads must be >= 0, got: ${params.batch_split_reads}")
+        }
+        if (params.batch_split_reads && !params.batch_bytes) {
+            log.warn "WARNING: --batch_split_reads has no effect without --batch_bytes"
+        }
+
+        // Validate priority_weight
+        if (params.priority_weight != null && params.priority_weight < 1) {
+            Nextflow.error("ERROR: --priority_weight must be >= 1, got: ${params.priority_weight}")
+        }
+
         log.info "OK Batching parameter validation passed"
     }
 
@@ -8,6 +8,8 @@ process BLASTN_VALIDATION {
         'community.wave.seqera.io/library/blast_seqtk_python:0c6e3044e41ecb64' }"
 
     input:
+    // reference: a VALIDATION_BLAST_DB directory (as the validation subworkflow
+    // passes it), a FASTA (a database is built in the task), or a database prefix.
     tuple val(meta), path(reads), path(reference)
     val blast_evalue
     val blast_perc_identity
@@ -37,21 +39,18 @@ process BLASTN_VALIDATION {
     #!/bin/bash
     set -euo pipefail
 
-    # Convert FASTQ to FASTA for BLAST
-    seqtk seq -A "${reads}" > query.fasta
-
-    # Count query sequences. `grep -c` prints 0 AND exits 1 on no match, so the
-    # old `|| echo 0` appended a second line and TOTAL_READS became "0\\n0" --
-    # which made the arithmetic test below print "integer expression expected"
-    # and only happened to reach the right branch. `|| true` keeps the count,
-    # and the default fills in if grep produced nothing at all.
-    TOTAL_READS=\$(grep -c "^>" query.fasta || true)
-    TOTAL_READS=\${TOTAL_READS:-0}
+    # Any reads at all? Only the first byte is decompressed here; the reads
+    # are converted to FASTA and counted in one pass as blastn reads them.
+    HAS_READS=\$( { gzip -cdf "${reads}" 2>/dev/null || true; } | head -c 1 | wc -c | tr -d ' ')
+    TOTAL_READS=0
 
     # Determine if reference is a FASTA file or pre-built BLAST database
     # Check for BLAST database index files (.nhr, .nin, .nsq)
     BLAST_DB=""
-    if [[ -f "${reference}.nhr" ]] || [[ -f "${reference}.nin" ]] || [[ -f "${reference}.nsq" ]]; then
+    if [[ -d "${reference}" ]] && [[ -f "${reference}/ref.nhr" ]]; then
+        # Database directory from VALIDATION_BLAST_DB (the subworkflow path)
+        BLAST_DB="${reference}/ref"
+    elif [[ -f "${reference}.nhr" ]] || [[ -f "${reference}.nin" ]] || [[ -f "${reference}.nsq" ]]; then
         # Pre-built BLAST database
         BLAST_DB="${reference}"
     elif [[ "${reference}" == *.fasta ]] || [[ "${reference}" == *.fa ]] || [[ "${reference}" == *.fna ]] || [[ "${reference}" == *.fasta.gz ]] || [[ "${reference}" == *.fa.gz ]]; then
@@ -90,17 +89,19 @@ process BLASTN_VALIDATION {
         fi
     fi
 
-    if [ "\$TOTAL_READS" -gt 0 ]; then
-        # Run BLAST
-        blastn \\
-            -query query.fasta \\
-            -db "\$BLAST_DB" \\
-            -out "${prefix}.blast.tsv" \\
-            -outfmt "6 qseqid sseqid pident length mismatch gapopen qstart qend sstart send evalue bitscore qlen slen qcovs" \\
-            -evalue ${evalue} \\
-            -max_target_seqs ${max_target_seqs} \\
-            -perc_identity ${perc_identity} \\
-            -num_threads ${task.cpus}
+    if [ "\$HAS_READS" -gt 0 ]; then
+        # Run BLAST on the FASTA stream; no query.fasta is written
+        read_prep_stream.sh --fasta --stats read_prep.json "${reads}" \\
+            | blastn \\
+                -query - \\
+                -db "\$BLAST_DB" \\
+                -out "${prefix}.blast.tsv" \\
+                -outfmt "6 qseqid sseqid pident length mismatch gapopen qstart qend sstart send evalue bitscore qlen slen qcovs" \\
+                -evalue ${evalue} \\
+                -max_target_seqs ${max_target_seqs} \\
+                -perc_identity ${perc_identity} \\
+                -num_threads ${task.cpus}
+        TOTAL_READS=\$(sed -n 's/.*"reads": \\([0-9]*\\).*/\\1/p' read_prep.json)
     else
         # Create empty output if no reads
         touch "${prefix}.blast.tsv"
@@ -190,18 +191,13 @@ with open("${prefix}.blast_stats.json", "w") as out:
 print(f"BLAST validation: {hits}/{total_reads} hits ({hit_rate*100:.1f}%), avg identity {avg_identity:.1f}%, status: {status}", file=sys.stderr)
 EOF
 
-    # versions.yml: each value MUST be a single line. seqtk writes its
-    # help (Version: 1.4-rNNN ...) to stderr; on some builds the help
-    # mentions "Version:" more than once, so grep -oE returned a multi-
-    # line scalar that broke the YAML parser at the next module's
-    # `python:` key (the embedded newline pushed the python line to an
-    # over-indented position relative to the mapping). ``head -n1``
-    # constrains the substitution to the first match; ``tr -d '\\n'``
-    # is belt-and-braces against any trailing whitespace from sed.
+    # versions.yml: each value MUST be a single line; a multi-line scalar
+    # breaks the YAML parser at the next key. ``head -n1`` keeps the first
+    # line only; ``tr -d '\\n'`` is belt-and-braces against any trailing
+    # whitespace from sed.
     cat <<-END_VERSIONS > versions.yml
 "${task.process}":
     blastn: \$(blastn -version 2>&1 | head -n1 | sed 's/blastn: //' | tr -d '\\n')
-    seqtk: \$(seqtk 2>&1 | grep -oE 'Version: [0-9.]+' | head -n1 | sed 's/Version: //' | tr -d '\\n' || echo "1.4")
     python: \$(python3 --version 2>&1 | head -n1 | sed 's/Python //' | tr -d '\\n')
 END_VERSIONS
     """
@@ -230,7 +226,6 @@ EOF
     cat <<-END_VERSIONS > versions.yml
 "${task.process}":
     blastn: 2.16.0
-    seqtk: 1.4
     python: 3.11.0
 END_VERSIONS
     """
@@ -0,0 +1,80 @@
+// Run-so-far consensus per (sample, taxid) during realtime processing, the
+// consensus counterpart of VALIDATION_CUMULATIVE_AGGREGATOR. CONSENSUS_VALIDATION
+// calls a consensus from one batch's reads; merging every batch's BAM and
+// re-running samtools consensus would cost the whole run's alignments on each
+// batch. Instead bin/consensus_cumulative_aggregator.py folds each batch's
+// alignments table into a per-position A/C/G/T/N count matrix and re-calls the
+// depth-masked consensus over the windows the batch covers.
+//
+// The batch set arrives through the channel, from CumulativeBatchAccumulator,
+// and nothing here reads the publish directory (see the aggregator note in
+// VALIDATION_CUMULATIVE_AGGREGATOR). With ext.state_dir set, the matrix is
+// carried between tasks under the work directory, keyed by batch id, so each
+// task folds in only the batches it has not seen; a state that does not match
+// the front of the batch list is ignored and the task recomputes from its
+// inputs.
+process CONSENSUS_CUMULATIVE_AGGREGATOR {
+    tag "${meta.id}:taxid${taxid}"
+    label 'process_single'
+
+    conda "${moduleDir}/environment.yml"
+    container "${ workflow.containerEngine in ['singularity', 'apptainer'] && !task.ext.singularity_pull_docker_container ?
+        'https://depot.galaxyproject.org/singularity/python:3.12' :
+        'quay.io/biocontainers/python:3.12' }"
+
+    input:
+    // Per-batch <prefix>.consensus_alignments.tsv.gz and .consensus_stats.json,
+    // all sharing one basename; the indexed stageAs keeps them apart and out of
+    // the output matching set, as in VALIDATION_CUMULATIVE_AGGREGATOR.
+    tuple val(meta), val(taxid), val(batch_ids),
+        path(batch_files, stageAs: 'batch_input_*'),
+        path(batch_stats, stageAs: 'batch_stats_*')
+    val min_depth
+
+    output:
+    tuple val(meta), val(taxid), path("*.consensus.fasta"),      emit: consensus
+    tuple val(meta), val(taxid), path("*.consensus_stats.json"), emit: stats
+    path "versions.yml",                                         emit: versions
+
+    when:
+    task.ext.when == null || task.ext.when
+
+    script:
+    def prefix = "${meta.id}_taxid${taxid}"
+    def depth = task.ext.min_depth ?: min_depth ?: 10
+    def state = task.ext.state_dir ? "--state '${task.ext.state_dir}/${prefix}.consensus.json'" : ''
+    def ids = batch_ids instanceof List ? batch_ids : [batch_ids]
+    def files = batch_files instanceof List ? batch_files : [batch_files]
+    def stats = batch_stats instanceof List ? batch_stats : [batch_stats]
+    """
+    consensus_cumulative_aggregator.py \\
+        --prefix ${prefix} \\
+        --sample-id '${meta.id}' \\
+        --taxid ${taxid} \\
+        --batch-ids ${ids.collect { "'${it}'" }.join(' ')} \\
+        --batch-files ${files.join(' ')} \\
+        --batch-stats ${stats.join(' ')} \\
+        --min-depth ${depth} \\
+        ${state}
+
+    cat <<-END_VERSIONS > versions.yml
+"${task.process}":
+    consensus_cumulative_aggregator.py: 1.0.0
+    python: \$(python3 --version | sed 's/Python //')
+END_VERSIONS
+    """
+
+    stub:
+    def prefix = "${meta.id}_taxid${taxid}"
+    def depth = task.ext.min_depth ?: min_depth ?: 10
+    """
+    printf ">%s no_consensus\\n" "${prefix}" > "${prefix}.consensus.fasta"
+    echo '{"sample_id": "${meta.id}", "taxid": ${taxid}, "validation_method": "consensus", "ref_name": "unknown", "ref_length": 0, "covered_start": 0, "covered_end": 0, "span": 0, "mean_depth": 0.0, "min_depth_threshold": ${depth}, "n_count": 0, "consensus_length": 0, "total_reads": 0, "mapped_reads": 0, "num_batches": 0}' > "${prefix}.consensus_stats.json"
+
+    cat <<-END_VERSIONS > versions.yml
+"${task.process}":
+    consensus_cumulative_aggregator.py: 1.0.0
+    python: 3.12.0
+END_VERSIONS
+    """
+}
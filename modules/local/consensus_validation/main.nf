@@ -8,6 +8,9 @@ process CONSENSUS_VALIDATION {
         'community.wave.seqera.io/library/minimap2_samtools:33bb43c18d22e29c' }"
 
     input:
+    // reference: a .mmi from VALIDATION_MINIMAP2_INDEX (as the validation
+    // subworkflow passes it) or a FASTA. minimap2 takes either as its target;
+    // the .mmi must have been built with the same preset.
     tuple val(meta), path(reads), path(reference)
     val minimap2_preset
     val min_depth
@@ -15,6 +18,10 @@ process CONSENSUS_VALIDATION {
     output:
     tuple val(meta), path("*.consensus.fasta"),       emit: consensus
     tuple val(meta), path("*.consensus_stats.json"),  emit: stats
+    // Reference name, position, CIGAR and read sequence of every alignment
+    // samtools depth counts, after @SQ name/length lines: the input
+    // CONSENSUS_CUMULATIVE_AGGREGATOR folds into its per-position base counts.
+    tuple val(meta), path("*.consensus_alignments.tsv.gz"), emit: alignments
     path "versions.yml",                              emit: versions
 
     when:
@@ -27,13 +34,11 @@ process CONSENSUS_VALIDATION {
     // only the covered region (the amplicon), while interior low-depth bases
     // remain N. No primer scheme is required.
     //
-    // Realtime note: ``reads`` are the reads extracted in THIS batch, so in
-    // realtime mode the consensus reflects the latest batch (last-batch-wins).
-    // A true run-so-far consensus would need a cumulative aggregator that
-    // persists per-batch sorted BAMs, runs ``samtools merge`` with the prior
-    // cumulative BAM, and re-calls the consensus -- mirroring
-    // BLAST_CUMULATIVE_AGGREGATOR / MINIMAP2_CUMULATIVE_AGGREGATOR. That is a
-    // deliberate follow-up, not part of this version.
+    // Realtime note: ``reads`` are the reads extracted in THIS batch, so this
+    // consensus covers the batch alone. The run-so-far consensus comes from
+    // CONSENSUS_CUMULATIVE_AGGREGATOR, which folds each batch's alignments
+    // table into a persisted per-position base-count matrix rather than
+    // merging BAMs, so a batch costs its own alignments, not the run's.
     script:
     def prefix = task.ext.prefix ?: "${meta.id}_taxid${meta.taxid}"
     def preset = task.ext.preset ?: minimap2_preset ?: "map-ont"
@@ -44,13 +49,11 @@ process CONSENSUS_VALIDATION {
     #!/bin/bash
     set -euo pipefail
 
-    # Count input reads (handle gzipped files)
-    if [[ "${reads}" == *.gz ]]; then
-        TOTAL_READS=\$(gunzip -c "${reads}" | awk 'NR%4==1' | wc -l | tr -d ' ')
-    else
-        TOTAL_READS=\$(awk 'NR%4==1' "${reads}" | wc -l | tr -d ' ')
-    fi
+    # Any reads at all? Only the first byte is decompressed here; the reads
+    # are decompressed in full once, below, as they stream into minimap2.
+    HAS_READS=\$( { gzip -cdf "${reads}" 2>/dev/null || true; } | head -c 1 | wc -c | tr -d ' ')
 
+    TOTAL_READS=0
     MAPPED_READS=0
     REF_NAME="unknown"
     REF_LEN=0
@@ -61,14 +64,31 @@ process CONSENSUS_VALIDATION {
     N_COUNT=0
     CONS_LEN=0
 
-    if [ "\$TOTAL_READS" -gt 0 ]; then
-        # Map reads to the reference and produce a sorted, indexed BAM
-        minimap2 -a -x ${preset} -t ${task.cpus} "${reference}" "${reads}" \\
+    if [ "\$HAS_READS" -gt 0 ]; then
+        # Map reads to the reference and produce a sorted, indexed BAM. The
+        # read-prep stream counts reads (and bases) as minimap2 consumes them.
+        read_prep_stream.sh --stats read_prep.json "${reads}" \\
+            | minimap2 -a -x ${preset} -t ${task.cpus} "${reference}" - \\
             | samtools sort -@ ${task.cpus} -o "${prefix}.sorted.bam" -
         samtools index "${prefix}.sorted.bam"
+        TOTAL_READS=\$(sed -n 's/.*"reads": \\([0-9]*\\).*/\\1/p' read_prep.json)
 
         MAPPED_READS=\$(samtools view -c -F 0x904 "${prefix}.sorted.bam")
 
+        # Alignments for the cumulative consensus: the records samtools depth
+        # counts by default (mapped, not secondary, QC-failed or duplicate).
+        {
+            samtools view -H "${prefix}.sorted.bam" | awk -F '\\t' '
+                \$1 == "@SQ" {
+                    for (i = 2; i <= NF; i++) {
+                        if (\$i ~ /^SN:/) sn = substr(\$i, 4)
+                        if (\$i ~ /^LN:/) ln = substr(\$i, 4)
+                    }
+                    print "@SQ\\t" sn "\\t" ln
+                }'
+            samtools view -F 0x704 "${prefix}.sorted.bam" | cut -f 3,4,6,10
+        } | gzip -c > "${prefix}.consensus_alignments.tsv.gz"
+
         # Per-position depth (1-based). The reference contig with the most
         # positions at or above the depth threshold is the amplicon target.
         samtools depth -a "${prefix}.sorted.bam" > depth.txt || true
@@ -127,6 +147,7 @@ process CONSENSUS_VALIDATION {
         fi
     else
         printf ">%s no_consensus\\n" "${prefix}" > "${prefix}.consensus.fasta"
+        gzip -c < /dev/null > "${prefix}.consensus_alignments.tsv.gz"
     fi
 
     # Write consensus stats JSON. Newline escapes are doubled so one Groovy
@@ -169,6 +190,7 @@ process CONSENSUS_VALIDATION {
     def depth = task.ext.min_depth ?: min_depth ?: 10
     """
     printf ">%s no_consensus\\n" "${prefix}" > "${prefix}.consensus.fasta"
+    gzip -c < /dev/null > "${prefix}.consensus_alignments.tsv.gz"
     cat > "${prefix}.consensus_stats.json" << EOF
     {
         "sample_id": "${meta.id}",
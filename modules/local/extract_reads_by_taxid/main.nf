@@ -1,14 +1,22 @@
 process EXTRACT_READS_BY_TAXID {
-    tag "${meta.id}:taxid${taxid}"
+    tag "${meta.id}:${taxids instanceof List ? taxids.size() : 1} taxids"
     label 'process_low'
 
     conda "${moduleDir}/environment.yml"
     container "${ workflow.containerEngine in ['singularity', 'apptainer'] && !task.ext.singularity_pull_docker_container ?
-        'https://depot.galaxyproject.org/singularity/seqtk:1.4--he4a0461_2' :
-        'quay.io/biocontainers/seqtk:1.4--he4a0461_2' }"
+        'https://depot.galaxyproject.org/singularity/python:3.12' :
+        'quay.io/biocontainers/python:3.12' }"
 
     input:
-    tuple val(meta), path(reads), path(kraken_output), val(taxid)
+    // One task per (sample, batch) for the whole watchlist. The per-taxid form
+    // re-read the Kraken2 output twice and the FASTQ once for every taxid, so a
+    // 30-taxon watchlist scanned the same files 90 times per batch; the script
+    // reads each once and demultiplexes the reads into per-taxid outputs.
+    //
+    // clade_index maps descendant taxids to the watched taxid they fall under
+    // (KreportTree.cladeIndex over this batch's Kraken2 report). Empty means
+    // exact-taxid matching.
+    tuple val(meta), path(reads), path(kraken_output), val(taxids), val(clade_index)
 
     output:
     // ``reads`` is optional: a taxid with zero classified reads in this batch
@@ -16,8 +24,10 @@ process EXTRACT_READS_BY_TAXID {
     // scheduled for it. In a realtime run most watchlist taxids are absent from
     // any given batch; validating them on empty input was the bulk of the
     // per-batch x per-taxid task explosion (see issue #29). ``stats`` is always
-    // emitted so the extracted-read count is still recorded.
-    tuple val(meta), path("*_taxid${taxid}.fastq.gz"), emit: reads, optional: true
+    // emitted, one JSON per requested taxid, so the extracted-read count is
+    // still recorded. Both carry the sample meta; the taxid is in the file
+    // name (<prefix>_taxid<taxid>...), from which the subworkflow fans out.
+    tuple val(meta), path("*_taxid*.fastq.gz"), emit: reads, optional: true
     tuple val(meta), path("*_extraction_stats.json"), emit: stats
     path "versions.yml", emit: versions
 
@@ -25,67 +35,44 @@ process EXTRACT_READS_BY_TAXID {
     task.ext.when == null || task.ext.when
 
     script:
+    def args = task.ext.args ?: ''
     def prefix = task.ext.prefix ?: "${meta.id}"
+    def taxid_list = (taxids instanceof List ? taxids : [taxids]).join(' ')
+    def clade_entries = clade_index ?: [:]
+    def clade_tsv = clade_entries.collect { taxid, target -> "${taxid}\t${target}" }.join('\n')
+    def clade_arg = clade_entries ? '--clade-index clade_index.tsv' : ''
     """
-    #!/bin/bash
-    set -euo pipefail
+    cat <<'END_CLADE_INDEX' > clade_index.tsv
+${clade_tsv}
+END_CLADE_INDEX
 
-    # Extract read IDs classified under this taxid
-    # Kraken2 output format: C/U <tab> read_id <tab> taxid <tab> length <tab> kmers
-    awk -F'\\t' -v taxid="${taxid}" '\$1 == "C" && \$3 == taxid {print \$2}' "${kraken_output}" > read_ids.txt
-
-    # Count extracted read IDs
-    EXTRACTED_COUNT=\$(wc -l < read_ids.txt | tr -d ' ')
-
-    if [ "\$EXTRACTED_COUNT" -gt 0 ]; then
-        # Extract reads using seqtk
-        seqtk subseq "${reads}" read_ids.txt | gzip -c > "${prefix}_taxid${taxid}.fastq.gz"
-        echo "Extracted \$EXTRACTED_COUNT reads for taxid ${taxid} from sample ${prefix}" >&2
-    else
-        # No reads for this taxid in this batch: emit NO FASTQ (the reads output
-        # is optional) so the downstream validators skip it. Nothing to validate
-        # on an empty extraction, and scheduling BLAST/minimap2 on it was pure
-        # overhead. The stats JSON below still records the zero count.
-        echo "No reads found for taxid ${taxid} in sample ${prefix}; skipping validation for this batch" >&2
-    fi
-
-    # Count total classified reads for this sample
-    TOTAL_CLASSIFIED=\$(awk -F'\\t' '\$1 == "C"' "${kraken_output}" | wc -l | tr -d ' ')
-
-    # Calculate extraction rate using awk (avoids bc dependency)
-    EXTRACTION_RATE=\$(awk -v ext="\$EXTRACTED_COUNT" -v tot="\$TOTAL_CLASSIFIED" 'BEGIN {
-        if (tot > 0) printf "%.6f", ext / tot
-        else printf "0.000000"
-    }')
-
-    # Generate extraction stats JSON
-    cat > "${prefix}_taxid${taxid}_extraction_stats.json" << EOF
-{
-    "sample_id": "${meta.id}",
-    "taxid": ${taxid},
-    "extracted_reads": \${EXTRACTED_COUNT},
-    "total_classified_reads": \${TOTAL_CLASSIFIED},
-    "extraction_rate": \${EXTRACTION_RATE},
-    "source_file": "${reads}",
-    "kraken_output": "${kraken_output}"
-}
-EOF
+    extract_reads_by_taxid.py \\
+        --reads "${reads}" \\
+        --kraken-output "${kraken_output}" \\
+        --taxids ${taxid_list} \\
+        ${clade_arg} \\
+        --prefix "${prefix}" \\
+        --sample-id "${meta.id}" \\
+        --threads ${task.cpus} \\
+        ${args}
 
     cat <<-END_VERSIONS > versions.yml
 "${task.process}":
-    seqtk: \$(seqtk 2>&1 | grep -oE '[0-9]+\\.[0-9]+(-r[0-9]+)?' | head -1)
-    bash: \$(echo \${BASH_VERSION})
+    extract_reads_by_taxid.py: 1.0.0
+    python: \$(python3 --version | sed 's/Python //')
 END_VERSIONS
     """
 
     stub:
     def prefix = task.ext.prefix ?: "${meta.id}"
+    def taxid_list = taxids instanceof List ? taxids : [taxids]
     """
-    echo "@stub_read_1" | gzip > "${prefix}_taxid${taxid}.fastq.gz"
-    cat > "${prefix}_taxid${taxid}_extraction_stats.json" << EOF
+    for taxid in ${taxid_list.join(' ')}; do
+        echo "@stub_read_1" | gzip > "${prefix}_taxid\${taxid}.fastq.gz"
+        cat > "${prefix}_taxid\${taxid}_extraction_stats.json" << EOF
 {
     "sample_id": "${meta.id}",
-    "taxid": ${taxid},
+    "taxid": \${taxid},
     "extracted_reads": 0,
     "total_classified_reads": 0,
     "extraction_rate": 0.0,
@@ -93,11 +80,12 @@ END_VERSIONS
     "kraken_output": "stub"
 }
 EOF
+    done
 
     cat <<-END_VERSIONS > versions.yml
 "${task.process}":
-    seqtk: 1.4
-    bash: 5.0
+    extract_reads_by_taxid.py: 1.0.0
+    python: 3.12.0
 END_VERSIONS
     """
 }
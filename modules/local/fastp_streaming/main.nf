@@ -1,6 +1,6 @@
 // Local module: FASTP_STREAMING
 // Purpose: Wrapper around fastp that accepts one or more FASTQ files per sample
-//          and concatenates them before quality trimming. Required for the streaming
+//          and streams them into fastp in one pass. Required for the streaming
 //          (watchPath) architecture, which delivers batched reads as multiple files
 //          per sample per batch cycle.
 // Interface differences from nf-core/fastp:
@@ -42,30 +42,44 @@ process FASTP_STREAMING {
     def out_fq1 = discard_trimmed_pass ?: ( meta.single_end ? "--out1 ${prefix}.fastp.fastq.gz" : "--out1 ${prefix}_1.fastp.fastq.gz" )
     def out_fq2 = discard_trimmed_pass ?: "--out2 ${prefix}_2.fastp.fastq.gz"
     def input_files = reads instanceof List ? reads : [reads]
-    // Concatenate/normalise the batch into one genuinely-gzipped stream.
-    // The previous cat/symlink trusted the .gz suffix: a plain FASTQ got a
-    // .fastq.gz name and fastp failed on the missing gzip header, and a
-    // mixed plain+gz batch cat'ed into an invalid stream. Sniff the gzip
-    // magic per file and gzip what is not already gzip (concatenated gzip
-    // members are a valid gzip stream). A distinct intermediate name avoids
-    // self-append when an input is staged as ${prefix}.fastq.gz.
+    // Feed the batch to fastp in one pass, without an intermediate copy.
+    // fastp chooses gzip decoding by the .gz suffix, so a lone file is read
+    // in place only when its suffix agrees with its gzip magic. Anything
+    // else -- several files, or a mis-suffixed one -- is decompressed once
+    // by `gzip -cdf` (which passes plain FASTQ through unchanged) and
+    // streamed in on STDIN. Nothing is recompressed. Earlier revisions
+    // re-gzipped every plain file single-threaded into ${prefix}.concat.fastq.gz
+    // first; before that, a cat/symlink trusted the .gz suffix and failed on
+    // plain or mixed batches.
     def normalise_input = """
-        rm -f ${prefix}.concat.fastq.gz
-        for f in ${input_files.join(' ')}; do
-            if [ "\$(head -c 2 "\$f" | od -An -tx1 | tr -dc '0-9a-f')" = "1f8b" ]; then
-                cat "\$f" >> ${prefix}.concat.fastq.gz
-            else
-                gzip -c "\$f" >> ${prefix}.concat.fastq.gz
+        fastp_in="--stdin"
+        if [ ${input_files.size()} -eq 1 ]; then
+            magic=\$(head -c 2 "${input_files[0]}" | od -An -tx1 | tr -dc '0-9a-f')
+            case "${input_files[0]}" in
+                *.gz) [ "\$magic" = "1f8b" ] && fastp_in="--in1 ${input_files[0]}" ;;
+                *)    [ "\$magic" != "1f8b" ] && fastp_in="--in1 ${input_files[0]}" ;;
+            esac
+        fi
+        read_input() {
+            if [ "\$fastp_in" = "--stdin" ]; then
+                gzip -cdf -- ${input_files.join(' ')}
             fi
-        done"""
+        }"""
     if ( task.ext.args?.contains('--interleaved_in') ) {
         """
         # Streaming mode: handle single or multiple input files
         ${normalise_input}
+        # The only file compressed here: use every core when pigz is there.
+        if command -v pigz >/dev/null 2>&1; then
+            compress="pigz -p ${task.cpus} -c"
+        else
+            compress="gzip -c"
+        fi
 
-        fastp \\
+        read_input \\
+        | fastp \\
             --stdout \\
-            --in1 ${prefix}.concat.fastq.gz \\
+            \$fastp_in \\
             --thread $task.cpus \\
             --json ${prefix}.fastp.json \\
             --html ${prefix}.fastp.html \\
@@ -73,7 +87,7 @@ process FASTP_STREAMING {
             $fail_fastq \\
             $args \\
             2>| >(tee ${prefix}.fastp.log >&2) \\
-        | gzip -c > ${prefix}.fastp.fastq.gz
+        | \$compress > ${prefix}.fastp.fastq.gz
 
         cat <<-END_VERSIONS > versions.yml
         "${task.process}":
@@ -85,8 +99,9 @@ process FASTP_STREAMING {
         # Streaming mode: handle single or multiple input files for single-end data
         ${normalise_input}
 
-        fastp \\
-            --in1 ${prefix}.concat.fastq.gz \\
+        read_input \\
+        | fastp \\
+            \$fastp_in \\
             $out_fq1 \\
             --thread $task.cpus \\
             --json ${prefix}.fastp.json \\
@@ -59,6 +59,18 @@ process KRAKEN2_INCREMENTAL_CLASSIFIER {
     // may deliver uncompressed files.
     def read_list = reads instanceof List ? reads : [reads]
     def gzip_flag = read_list.every { it.name.endsWith('.gz') } ? "--gzip-compressed" : ""
+    // With --kraken2_server the batch is classified by KRAKEN2_SERVER, which
+    // holds the database resident, instead of a kraken2 started here: the
+    // request names this directory and the same report/output files, so the
+    // rest of the script is unchanged. A retry classifies locally, as the
+    // memory-mapping fallback above does. A server that never answers exits
+    // 75 (EX_TEMPFAIL), which conf/error_isolation.config retries; exit 1
+    // would be ignored there as a per-sample failure and drop the batch.
+    def server_spool = (task.ext.server_spool && task.attempt == 1) ? task.ext.server_spool : ''
+    def server_start_timeout = task.ext.server_start_timeout ?: 600
+    def server_args = groovy.json.JsonOutput.toJson(
+        [gzip_flag, unclassified_option, classified_option, paired, args].join(' ').tokenize())
+    def server_reads = read_list.collect { "\"\$PWD/${it}\"" }.join(', ')
 
     """
     #!/bin/bash
@@ -75,18 +87,59 @@ process KRAKEN2_INCREMENTAL_CLASSIFIER {
         echo "Retry attempt ${task.attempt}: --memory-mapping disabled (previous attempt segfaulted, likely NFS mmap issue)" >&2
     fi
 
-    kraken2 \\
-        --db ${db} \\
-        --threads ${task.cpus} \\
-        --report ${prefix}.kraken2.report.txt \\
-        $gzip_flag \\
-        $memory_mapping \\
-        $unclassified_option \\
-        $classified_option \\
-        $readclassification_option \\
-        $paired \\
-        $args \\
-        ${reads}
+    if [ -n "${server_spool}" ]; then
+        SPOOL="${server_spool}"
+        REQUEST_ID="${prefix}.\$\$.\$(date +%s%N)"
+        heartbeat_age() {
+            [ -f "\$SPOOL/server.json" ] || { echo 999999; return; }
+            echo \$(( \$(date +%s) - \$(stat -c %Y "\$SPOOL/server.json") ))
+        }
+
+        # The service may still be mapping the database; wait for its heartbeat.
+        waited=0
+        until [ "\$(heartbeat_age)" -le 60 ]; do
+            if [ "\$waited" -ge ${server_start_timeout} ]; then
+                echo "ERROR: no KRAKEN2_SERVER heartbeat in \$SPOOL after ${server_start_timeout}s" >&2
+                exit 75
+            fi
+            sleep 1
+            waited=\$((waited + 1))
+        done
+
+        cat > "\$SPOOL/.\$REQUEST_ID.tmp" <<END_REQUEST
+{"id": "\$REQUEST_ID", "workdir": "\$PWD", "reads": [${server_reads}], "report": "${prefix}.kraken2.report.txt", "output": "${prefix}.kraken2.output.txt", "args": ${server_args}}
+END_REQUEST
+        mv "\$SPOOL/.\$REQUEST_ID.tmp" "\$SPOOL/\$REQUEST_ID.request.json"
+
+        REPLY="\$SPOOL/replies/\$REQUEST_ID.json"
+        until [ -f "\$REPLY" ]; do
+            if [ "\$(heartbeat_age)" -gt 60 ]; then
+                echo "ERROR: KRAKEN2_SERVER stopped before answering \$REQUEST_ID" >&2
+                exit 75
+            fi
+            sleep 0.2
+        done
+        cat "\$REPLY" >&2
+        EXIT_CODE=\$(sed -n 's/.*"exit_code": \\(-\\{0,1\\}[0-9]*\\).*/\\1/p' "\$REPLY")
+        rm -f "\$REPLY"
+        if [ "\$EXIT_CODE" != "0" ]; then
+            echo "ERROR: kraken2 exited with \$EXIT_CODE in KRAKEN2_SERVER" >&2
+            exit \$(( EXIT_CODE < 0 ? 128 - EXIT_CODE : EXIT_CODE ))
+        fi
+    else
+        kraken2 \\
+            --db ${db} \\
+            --threads ${task.cpus} \\
+            --report ${prefix}.kraken2.report.txt \\
+            $gzip_flag \\
+            $memory_mapping \\
+            $unclassified_option \\
+            $classified_option \\
+            $readclassification_option \\
+            $paired \\
+            $args \\
+            ${reads}
+    fi
 
     # The reads-assignment emit is the same per-read stream under its
     # published name; keep it a copy so both consumers stay independent.
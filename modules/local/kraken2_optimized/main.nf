@@ -51,6 +51,7 @@ process KRAKEN2_OPTIMIZED {
     // may deliver uncompressed files.
     def read_list = reads instanceof List ? reads : [reads]
     def gzip_flag = read_list.every { it.name.endsWith('.gz') } ? "--gzip-compressed" : ""
+    def sample_interval = task.ext.sample_interval ?: 0.5
 
     """
     #!/bin/bash
@@ -60,36 +61,33 @@ process KRAKEN2_OPTIMIZED {
     START_TIME=\$(date +%s)
     START_TIMESTAMP=\$(date -Iseconds)
 
-    # Memory usage monitoring (background process)
-    (while true; do
-        ps aux | grep kraken2 | grep -v grep | awk '{print \$6}' >> mem_usage.tmp 2>/dev/null || true
-        sleep 5
-    done) &
-    MONITOR_PID=\$!
-
     # Run Kraken2 with optimizations
     echo "Running Kraken2 with optimizations:" >&2
     echo "  Memory mapping: ${use_memory_mapping}" >&2
     echo "  Confidence threshold: ${confidence_threshold}" >&2
     echo "  Minimum hit groups: ${minimum_hit_groups}" >&2
 
-    kraken2 \\
-        --db $db \\
-        --threads $task.cpus \\
-        --report ${prefix}.kraken2.report.txt \\
-        $gzip_flag \\
-        $memory_mapping \\
-        $confidence \\
-        $min_hit_groups \\
-        $unclassified_option \\
-        $classified_option \\
-        $readclassification_option \\
-        $paired \\
-        $args \\
-        $reads
-
-    # Stop memory monitoring
-    kill \$MONITOR_PID 2>/dev/null || true
+    # proc_sampler.sh samples this kraken2's own process tree from /proc
+    # (RSS, PSS, faults, bytes read, CPU) and exits with kraken2's status,
+    # so the exit-139 retry still applies.
+    proc_sampler.sh \\
+        --interval ${sample_interval} \\
+        --output ${prefix}.kraken2.resources.json \\
+        -- \\
+        kraken2 \\
+            --db $db \\
+            --threads $task.cpus \\
+            --report ${prefix}.kraken2.report.txt \\
+            $gzip_flag \\
+            $memory_mapping \\
+            $confidence \\
+            $min_hit_groups \\
+            $unclassified_option \\
+            $classified_option \\
+            $readclassification_option \\
+            $paired \\
+            $args \\
+            $reads
 
     # Compress output FASTQs if required
     $compress_reads_command
@@ -109,14 +107,12 @@ process KRAKEN2_OPTIMIZED {
     CLASSIFIED_SEQS=\$(awk '\$4!="U" {total+=\$3} END {print total+0}' ${prefix}.kraken2.report.txt)
     UNCLASSIFIED_SEQS=\$(awk '\$4=="U" {print \$3; found=1} END {if(!found) print 0}' ${prefix}.kraken2.report.txt)
 
-    # Calculate peak memory usage
-    if [ -f mem_usage.tmp ]; then
-        PEAK_MEM_KB=\$(sort -n mem_usage.tmp | tail -1)
-        PEAK_MEM_MB=\$((PEAK_MEM_KB / 1024))
-        rm -f mem_usage.tmp
-    else
-        PEAK_MEM_MB=0
-    fi
+    # Peak memory of this task's kraken2 tree. resource_usage adds PSS, which
+    # splits a memory-mapped database's shared pages between the concurrent
+    # classifiers that map it, where RSS counts them in full in each.
+    RESOURCES=\$(cat ${prefix}.kraken2.resources.json)
+    PEAK_RSS_KB=\$(sed -n 's/.*"peak_rss_kb": \\([0-9]*\\).*/\\1/p' ${prefix}.kraken2.resources.json)
+    PEAK_MEM_MB=\$(( \${PEAK_RSS_KB:-0} / 1024 ))
 
     # Rates are computed BEFORE the heredoc with a single-quoted awk program
     # and -v variables. The previous double-quoted awk inside the heredoc's
@@ -145,6 +141,7 @@ process KRAKEN2_OPTIMIZED {
     "peak_memory_mb": \$PEAK_MEM_MB,
     "threads_used": $task.cpus
   },
+  "resource_usage": \$RESOURCES,
   "optimization_settings": {
     "memory_mapping_enabled": ${use_memory_mapping},
     "confidence_threshold": ${confidence_threshold},
@@ -0,0 +1,70 @@
+process KRAKEN2_SERVER {
+    tag "kraken2_server"
+    label 'process_high'
+    label 'process_long'
+
+    // The service needs Python beside kraken2 and there is no published image
+    // carrying both, so it runs from environment.yml (conda, or a Wave build
+    // under -profile wave). It shares the spool and the requesters' work
+    // directories with them, so it is local-executor only in any case.
+    conda "${moduleDir}/environment.yml"
+
+    // One task for the whole realtime session. Its inputs are identical on
+    // every run, so a cached result would be a previous session's summary and
+    // the service would never start on -resume.
+    cache false
+
+    input:
+    path db
+    val spool_dir       // absolute path KRAKEN2_INCREMENTAL_CLASSIFIER spools requests into
+
+    output:
+    path "kraken2_server_summary.json", emit: summary
+    path "versions.yml",                emit: versions
+
+    when:
+    task.ext.when == null || task.ext.when
+
+    script:
+    def args = task.ext.args ?: ''
+    def kraken2 = task.ext.kraken2 ?: 'kraken2'
+    def workers = (task.ext.workers ?: 1) as int
+    def threads = Math.max(1, (task.cpus as int).intdiv(workers))
+    def lock = task.ext.lock_budget ? "--lock-budget ${task.ext.lock_budget}" : task.ext.lock ? '--lock' : ''
+    // Safety net for a head process that died without writing the shutdown
+    // sentinel, as for REALTIME_STATS_SERVICE.
+    def idle_minutes = params.realtime_timeout_minutes ?
+        (params.realtime_timeout_minutes as int) + ((params.realtime_processing_grace_period ?: 5) as int) : 0
+    def idle_seconds = idle_minutes * 60
+    """
+    kraken2_server.py serve \\
+        --db ${db} \\
+        --spool "${spool_dir}" \\
+        --kraken2 "${kraken2}" \\
+        --threads ${threads} \\
+        --workers ${workers} \\
+        --max-idle-seconds ${idle_seconds} \\
+        --summary kraken2_server_summary.json \\
+        ${lock} \\
+        ${args}
+
+    cat <<-END_VERSIONS > versions.yml
+"${task.process}":
+    kraken2_server.py: 1.0.0
+    kraken2: \$(kraken2 --version 2>&1 | head -1 | sed 's/.*version //')
+    python: \$(python3 --version | sed 's/Python //')
+END_VERSIONS
+    """
+
+    stub:
+    """
+    echo '{"requests_served": 0, "requests_failed": 0, "stub": true}' > kraken2_server_summary.json
+
+    cat <<-END_VERSIONS > versions.yml
+"${task.process}":
+    kraken2_server.py: 1.0.0
+    kraken2: 2.1.6
+    python: 3.12.0
+END_VERSIONS
+    """
+}
@@ -0,0 +1,18 @@
+#!/usr/bin/env bash
+# Stand-in for kraken2 in KRAKEN2_SERVER tests: accepts the options the
+# service passes, marks every read unclassified, and writes the report and
+# per-read output where kraken2 would.
+set -euo pipefail
+while [[ $# -gt 0 ]]; do
+    case "$1" in
+        --report) report="$2"; shift 2 ;;
+        --output) output="$2"; shift 2 ;;
+        --db|--threads|--classified-out|--unclassified-out) shift 2 ;;
+        --*) shift ;;
+        *) reads="$1"; shift ;;
+    esac
+done
+gzip -cdf "$reads" | awk -v output="$output" '
+    NR % 4 == 1 { n++; print "U\t" substr($1, 2) "\t0\t0\t0:0" > output }
+    END { printf "100.00\t%d\t%d\tU\t0\tunclassified\n", n, n }
+' > "$report"
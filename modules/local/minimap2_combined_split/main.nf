@@ -0,0 +1,89 @@
+process MINIMAP2_COMBINED_SPLIT {
+    tag "${meta.id}"
+    label 'process_single'
+
+    conda "${moduleDir}/environment.yml"
+    container "${ workflow.containerEngine in ['singularity', 'apptainer'] && !task.ext.singularity_pull_docker_container ?
+        'https://depot.galaxyproject.org/singularity/python:3.12' :
+        'quay.io/biocontainers/python:3.12' }"
+
+    input:
+    tuple val(meta), path(paf), path(read_counts)
+    val minimap2_preset
+    val minimap2_min_mapq
+    val validation_hit_rate_threshold
+    val validation_identity_threshold
+
+    output:
+    // Per taxid, the same <meta.id>_taxid<taxid>.paf / .minimap2_stats.json
+    // MINIMAP2_VALIDATION writes, so publishing, the cumulative aggregator and
+    // the final aggregation need no combined-mode case. The subworkflow fans
+    // them out per taxid by file name.
+    tuple val(meta), path("*_taxid*.paf"), emit: alignments
+    tuple val(meta), path("*.minimap2_stats.json"), emit: stats
+    tuple val(meta), path("*.cross_taxon.json"), emit: cross_taxon
+    path "versions.yml", emit: versions
+
+    when:
+    task.ext.when == null || task.ext.when
+
+    script:
+    def prefix = task.ext.prefix ?: "${meta.id}"
+    def preset = task.ext.preset ?: minimap2_preset ?: "map-ont"
+    def min_mapq = task.ext.min_mapq ?: minimap2_min_mapq ?: 10
+    def hit_threshold = validation_hit_rate_threshold ?: 0.5
+    def identity_threshold = validation_identity_threshold ?: 90.0
+    // Same confirmation floors as MINIMAP2_VALIDATION; see the note there.
+    def min_reads = params.validation_min_reads ?: 10
+    def min_breadth = params.validation_min_breadth ?: 0.05
+    def batch_arg = meta.batch_id != null ? "--batch-id '${meta.batch_id}'" : ''
+    """
+    minimap2_combined_split.py \\
+        --paf "${paf}" \\
+        --read-counts "${read_counts}" \\
+        --prefix "${prefix}" \\
+        --sample-id "${meta.id}" \\
+        ${batch_arg} \\
+        --preset "${preset}" \\
+        --min-mapq ${min_mapq} \\
+        --hit-threshold ${hit_threshold} \\
+        --identity-threshold ${identity_threshold} \\
+        --min-reads ${min_reads} \\
+        --min-breadth ${min_breadth}
+
+    cat <<-END_VERSIONS > versions.yml
+"${task.process}":
+    minimap2_combined_split.py: 1.0.0
+    python: \$(python3 --version | sed 's/Python //')
+END_VERSIONS
+    """
+
+    stub:
+    def prefix = task.ext.prefix ?: "${meta.id}"
+    """
+    while read -r taxid count; do
+        touch "${prefix}_taxid\${taxid}.paf"
+        cat > "${prefix}_taxid\${taxid}.minimap2_stats.json" << EOF
+{
+    "sample_id": "${meta.id}",
+    "taxid": \${taxid},
+    "validation_method": "minimap2",
+    "total_reads": 0,
+    "mapped_reads": 0,
+    "hit_rate": 0.0,
+    "avg_mapq": 0.0,
+    "avg_identity": 0.0,
+    "avg_coverage": 0.0,
+    "validation_status": "stub"
+}
+EOF
+    done < "${read_counts}"
+    echo '{"sample_id": "${meta.id}", "cross_taxon": {}, "cross_taxon_reads": 0}' > "${prefix}.cross_taxon.json"
+
+    cat <<-END_VERSIONS > versions.yml
+"${task.process}":
+    minimap2_combined_split.py: 1.0.0
+    python: 3.12.0
+END_VERSIONS
+    """
+}
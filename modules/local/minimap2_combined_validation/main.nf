@@ -0,0 +1,78 @@
+process MINIMAP2_COMBINED_VALIDATION {
+    tag "${meta.id}:${reads instanceof List ? reads.size() : 1} taxids"
+    label 'process_medium'
+
+    conda "${moduleDir}/environment.yml"
+    container "${ workflow.containerEngine in ['singularity', 'apptainer'] && !task.ext.singularity_pull_docker_container ?
+        'https://depot.galaxyproject.org/singularity/minimap2:2.28--he4a0461_0' :
+        'quay.io/biocontainers/minimap2:2.28--he4a0461_0' }"
+
+    input:
+    // All of one (sample, batch)'s extracted reads, <prefix>_taxid<taxid>.fastq.gz
+    // as EXTRACT_READS_BY_TAXID names them, and the combined watchlist index
+    // (VALIDATION_COMBINED_REFERENCE + VALIDATION_COMBINED_INDEX). One task and
+    // one minimap2 run replace a MINIMAP2_VALIDATION task per taxid.
+    tuple val(meta), path(reads, stageAs: 'reads/*'), path(index)
+    val minimap2_preset
+
+    output:
+    // Read names in the PAF are prefixed <taxid>|, the taxid the read was
+    // extracted for; MINIMAP2_COMBINED_SPLIT routes on that and on the
+    // <taxid>| prefix of the contig names.
+    tuple val(meta), path("*.combined.paf"), path("*.read_counts.tsv"), emit: alignments
+    path "versions.yml", emit: versions
+
+    when:
+    task.ext.when == null || task.ext.when
+
+    script:
+    def prefix = task.ext.prefix ?: "${meta.id}"
+    // Must be the preset the combined index was built with (see
+    // VALIDATION_MINIMAP2_INDEX): indexing parameters come from the .mmi.
+    def preset = task.ext.preset ?: minimap2_preset ?: "map-ont"
+    """
+    #!/bin/bash
+    set -euo pipefail
+
+    : > "${prefix}.read_counts.tsv"
+    for fastq in reads/*; do
+        name=\$(basename "\$fastq")
+        taxid=\${name##*_taxid}
+        taxid=\${taxid%.fastq.gz}
+        # Tag each read with its taxid and count it, as MINIMAP2_VALIDATION
+        # counts TOTAL_READS (one per 4-line record).
+        gzip -cd "\$fastq" | awk -v taxid="\$taxid" -v counts="${prefix}.read_counts.tsv" '
+            NR % 4 == 1 { sub(/^@/, "@" taxid "|"); n++ }
+            { print }
+            END { print taxid "\\t" n + 0 >> counts }
+        '
+    done | minimap2 \\
+        -x ${preset} \\
+        -t ${task.cpus} \\
+        --secondary=no \\
+        -o "${prefix}.combined.paf" \\
+        "${index}" \\
+        -
+
+    cat <<-END_VERSIONS > versions.yml
+"${task.process}":
+    minimap2: \$(minimap2 --version)
+END_VERSIONS
+    """
+
+    stub:
+    def prefix = task.ext.prefix ?: "${meta.id}"
+    """
+    touch "${prefix}.combined.paf"
+    for fastq in reads/*; do
+        name=\$(basename "\$fastq")
+        taxid=\${name##*_taxid}
+        printf '%s\\t0\\n' "\${taxid%.fastq.gz}" >> "${prefix}.read_counts.tsv"
+    done
+
+    cat <<-END_VERSIONS > versions.yml
+"${task.process}":
+    minimap2: 2.28
+END_VERSIONS
+    """
+}
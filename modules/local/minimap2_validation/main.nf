@@ -8,6 +8,9 @@ process MINIMAP2_VALIDATION {
         'quay.io/biocontainers/minimap2:2.28--he4a0461_0' }"
 
     input:
+    // reference: a .mmi from VALIDATION_MINIMAP2_INDEX (as the validation
+    // subworkflow passes it) or a FASTA. minimap2 takes either as its target;
+    // the .mmi must have been built with the same preset.
     tuple val(meta), path(reads), path(reference)
     val minimap2_preset
     val minimap2_min_mapq
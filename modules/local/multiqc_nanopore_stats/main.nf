@@ -33,85 +33,106 @@ process MULTIQC_NANOPORE_STATS {
     import os
     import sys
 
-    # Parse SeqKit stats TSV files and FASTP JSON files. Inputs are
-    # staged under numbered subdirectories (stageAs: '?/*') so multiple
-    # per-batch files for the same sample do not collide. We walk every
-    # subdirectory and key by sample_id; later batches overwrite earlier
-    # ones for the same sample, leaving the final/cumulative stats
-    # visible to MultiQC. This matches the realtime-mode contract where
-    # the operator wants the latest per-sample numbers, not a per-batch
-    # history.
-    samples = {}
-
-    # Sort by the NUMERIC stage index, not lexicographically. Inputs are staged
+    from concurrent.futures import ThreadPoolExecutor
+
+    # Inputs are SeqKit stats TSV and FASTP JSON files, staged under numbered
+    # subdirectories (stageAs: '?/*') so per-batch files for the same sample
+    # do not collide. Only the latest file per sample is reported -- the
+    # realtime contract is the latest per-sample numbers, not a per-batch
+    # history -- so that file is picked from the path alone and only the
+    # picks are opened. The workflow already narrows the input to the latest
+    # file per sample before staging; the selection here keeps the module
+    # correct for callers that pass every batch.
+
+    # Order by the NUMERIC stage index, not lexicographically. Inputs are staged
     # under '1/', '2/', ... '10/', '11/' and a plain sort orders those as
-    # 1, 10, 11, 2 -- so with "later overwrites earlier" the surviving row for a
-    # sample was whichever batch happened to land in the highest-sorting-by-string
-    # directory, typically batch 9, not the latest one. Files whose parent is not
-    # a number sort last but keep a stable relative order.
+    # 1, 10, 11, 2 -- so the pick for a sample was whichever batch happened to
+    # land in the highest-sorting-by-string directory, typically batch 9, not
+    # the latest one. Files whose parent is not a number sort last but keep a
+    # stable relative order. FASTP JSON outranks a SeqKit TSV for the same
+    # sample, as it did when the JSON pass ran second and overwrote.
     def stage_order(path):
         parent = os.path.basename(os.path.dirname(path))
-        return (0, int(parent), path) if parent.isdigit() else (1, 0, path)
-
-    tsv_files = sorted(glob.glob('*/*.tsv'), key=stage_order)
-    json_files = sorted(glob.glob('*/*.json'), key=stage_order)
-
-    for f in tsv_files:
-        # SeqKit stats TSV format
-        with open(f) as fh:
-            reader = csv.DictReader(fh, delimiter='\\t')
-            for row in reader:
-                # SeqKit stats columns: file, format, type, num_seqs, sum_len,
-                # min_len, avg_len, max_len, Q1, Q2, Q3, sum_gap, N50, Q20(%), Q30(%)
-                sample_id = os.path.splitext(os.path.basename(f))[0]
-                # Strip .chopped suffix if present
-                sample_id = sample_id.replace('.chopped', '')
-                samples[sample_id] = {
-                    'Total Reads': int(row.get('num_seqs', 0)),
-                    'Total Bases': int(row.get('sum_len', 0)),
-                    'Mean Read Length': round(float(row.get('avg_len', 0)), 1),
-                    'Min Read Length': int(row.get('min_len', 0)),
-                    'Max Read Length': int(row.get('max_len', 0)),
-                    'N50': int(row.get('N50', 0)),
-                }
-                # AvgQual is the mean Phred quality; it is present because
-                # SEQKIT_STATS runs with --all (see the module's ext.args
-                # default) and SEQKIT_MERGE_STATS carries the column through.
-                # This used to read Q2, which in `seqkit stats` is the second
-                # quartile of read LENGTH -- so the "Mean Quality" column
-                # reported a median read length, e.g. 4821 shown as a Phred
-                # score. Omitted rather than faked when the column is absent.
-                if row.get('AvgQual'):
-                    samples[sample_id]['Mean Quality'] = round(float(row['AvgQual']), 1)
-
-    for f in json_files:
-        if os.path.basename(f).endswith('_mqc.json'):
-            continue
-        # FASTP JSON format
+        kind = 1 if path.endswith('.json') else 0
+        return (kind, 0, int(parent), path) if parent.isdigit() else (kind, 1, 0, path)
+
+    def sample_of(path):
+        stem = os.path.splitext(os.path.basename(path))[0]
+        # Strip the .chopped (SeqKit on CHOPPER output) / .fastp suffixes
+        return stem.replace('.fastp', '') if path.endswith('.json') else stem.replace('.chopped', '')
+
+    latest = {}
+    candidates = glob.glob('*/*.tsv') + [
+        f for f in glob.glob('*/*.json') if not os.path.basename(f).endswith('_mqc.json')
+    ]
+    for f in candidates:
+        sample_id = sample_of(f)
+        if sample_id not in latest or stage_order(f) > stage_order(latest[sample_id]):
+            latest[sample_id] = f
+
+    def parse_seqkit(path):
+        # SeqKit stats columns: file, format, type, num_seqs, sum_len,
+        # min_len, avg_len, max_len, Q1, Q2, Q3, sum_gap, N50, Q20(%), Q30(%)
+        row = None
+        with open(path) as fh:
+            for row in csv.DictReader(fh, delimiter='\t'):
+                pass
+        if row is None:
+            return None
+        stats = {
+            'Total Reads': int(row.get('num_seqs', 0)),
+            'Total Bases': int(row.get('sum_len', 0)),
+            'Mean Read Length': round(float(row.get('avg_len', 0)), 1),
+            'Min Read Length': int(row.get('min_len', 0)),
+            'Max Read Length': int(row.get('max_len', 0)),
+            'N50': int(row.get('N50', 0)),
+        }
+        # AvgQual is the mean Phred quality; it is present because
+        # SEQKIT_STATS runs with --all (see the module's ext.args
+        # default) and SEQKIT_MERGE_STATS carries the column through.
+        # This used to read Q2, which in `seqkit stats` is the second
+        # quartile of read LENGTH -- so the "Mean Quality" column
+        # reported a median read length, e.g. 4821 shown as a Phred
+        # score. Omitted rather than faked when the column is absent.
+        if row.get('AvgQual'):
+            stats['Mean Quality'] = round(float(row['AvgQual']), 1)
+        return stats
+
+    def parse_fastp(path):
         try:
-            with open(f) as fh:
+            with open(path) as fh:
                 data = json.load(fh)
-            sample_id = os.path.splitext(os.path.basename(f))[0].replace('.fastp', '')
-            summary = data.get('summary', {})
-            before = summary.get('before_filtering', {})
-            after = summary.get('after_filtering', {})
-            src = after if after else before
-            samples[sample_id] = {
-                'Total Reads': src.get('total_reads', 0),
-                'Total Bases': src.get('total_bases', 0),
-                'Mean Read Length': round(src.get('total_bases', 0) / max(src.get('total_reads', 1), 1), 1),
-                # No 'Mean Quality' here on purpose. fastp's summary carries no
-                # mean Phred score, and the previous q30_rate * 30 was arithmetic
-                # with no meaning: a run with 100% of bases at Q30+ reported
-                # exactly 30.0, and one at 50% reported 15.0, a score no read in
-                # it necessarily had. Q20/Q30 rates below are the real fastp
-                # quality figures; the seqkit branch supplies a true mean via
-                # AvgQual.
-                'Q20 Rate': round(src.get('q20_rate', 0) * 100, 1),
-                'Q30 Rate': round(src.get('q30_rate', 0) * 100, 1),
-            }
-        except (json.JSONDecodeError, KeyError):
-            pass
+        except json.JSONDecodeError:
+            return None
+        summary = data.get('summary', {})
+        before = summary.get('before_filtering', {})
+        after = summary.get('after_filtering', {})
+        src = after if after else before
+        return {
+            'Total Reads': src.get('total_reads', 0),
+            'Total Bases': src.get('total_bases', 0),
+            'Mean Read Length': round(src.get('total_bases', 0) / max(src.get('total_reads', 1), 1), 1),
+            # No 'Mean Quality' here on purpose. fastp's summary carries no
+            # mean Phred score, and the previous q30_rate * 30 was arithmetic
+            # with no meaning: a run with 100% of bases at Q30+ reported
+            # exactly 30.0, and one at 50% reported 15.0, a score no read in
+            # it necessarily had. Q20/Q30 rates below are the real fastp
+            # quality figures; the seqkit branch supplies a true mean via
+            # AvgQual.
+            'Q20 Rate': round(src.get('q20_rate', 0) * 100, 1),
+            'Q30 Rate': round(src.get('q30_rate', 0) * 100, 1),
+        }
+
+    def parse(path):
+        return parse_fastp(path) if path.endswith('.json') else parse_seqkit(path)
+
+    # One file per sample from here on; parse them concurrently. The work is
+    # mostly waiting on the (often network) filesystem, so threads overlap it
+    # even on the single CPU this process is given.
+    sample_ids = sorted(latest)
+    with ThreadPoolExecutor(max_workers=${task.cpus * 8}) as pool:
+        parsed = list(pool.map(parse, [latest[s] for s in sample_ids]))
+    samples = {s: stats for s, stats in zip(sample_ids, parsed) if stats is not None}
 
     # Generate MultiQC custom content
     general_stats = {
@@ -173,7 +194,8 @@ process MULTIQC_NANOPORE_STATS {
     with open('${prefix}_quality_mqc.json', 'w') as f:
         json.dump(quality_data, f, indent=2)
 
-    print(f"Generated MultiQC custom content for {len(samples)} samples", file=sys.stderr)
+    print(f"Generated MultiQC custom content for {len(samples)} samples "
+          f"from {len(candidates)} stats files", file=sys.stderr)
 
     # Write versions
     with open('versions.yml', 'w') as f:
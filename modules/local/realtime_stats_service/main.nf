@@ -0,0 +1,72 @@
+process REALTIME_STATS_SERVICE {
+    tag "stats_service"
+    label 'process_single'
+    label 'process_long'
+
+    conda "${moduleDir}/environment.yml"
+    container "${ workflow.containerEngine in ['singularity', 'apptainer'] && !task.ext.singularity_pull_docker_container ?
+        'https://depot.galaxyproject.org/singularity/python:3.11' :
+        'quay.io/biocontainers/python:3.11' }"
+
+    // One task for the whole realtime session. Its inputs are identical on
+    // every run, so a cached result would be a previous session's summary and
+    // the service would never start on -resume.
+    cache false
+
+    input:
+    val spool_dir       // absolute path the head process spools batches into
+    val live_outdir     // absolute pipeline outdir; snapshots, cumulative stats and the report are written here as they change
+    val stats_config
+
+    output:
+    path "cumulative_stats.json", emit: cumulative_stats, optional: true
+    path "alerts.json",           emit: alerts,           optional: true
+    path "report_data.json",      emit: report_data,      optional: true
+    path "service_summary.json",  emit: summary
+    path "versions.yml",          emit: versions
+
+    when:
+    task.ext.when == null || task.ext.when
+
+    script:
+    def args = task.ext.args ?: ''
+    def checkpoint_seconds = Math.max(1, ((stats_config.stats_interval ?: 30000) as long).intdiv(1000))
+    // Safety net for a head process that died without writing the shutdown
+    // sentinel: give up after the inactivity timeout plus grace period.
+    def idle_minutes = params.realtime_timeout_minutes ?
+        (params.realtime_timeout_minutes as int) + ((params.realtime_processing_grace_period ?: 5) as int) : 0
+    def idle_seconds = idle_minutes * 60
+    def config_json = groovy.json.JsonOutput.toJson(stats_config)
+    """
+    cat <<'END_CONFIG' > stats_config.json
+${config_json}
+END_CONFIG
+
+    realtime_stats_service.py serve \\
+        --spool "${spool_dir}" \\
+        --outdir "${live_outdir}" \\
+        --config stats_config.json \\
+        --checkpoint-interval ${checkpoint_seconds} \\
+        --max-idle-seconds ${idle_seconds} \\
+        --history-keep ${params.realtime_report_history ?: 0} \\
+        --final-dir . \\
+        ${args}
+
+    cat <<-END_VERSIONS > versions.yml
+"${task.process}":
+    realtime_stats_service.py: 1.0.0
+    python: \$(python3 --version | sed 's/Python //')
+END_VERSIONS
+    """
+
+    stub:
+    """
+    echo '{"batches_total": 0, "batches_this_run": 0, "duplicates_skipped": 0, "stub": true}' > service_summary.json
+
+    cat <<-END_VERSIONS > versions.yml
+"${task.process}":
+    realtime_stats_service.py: 1.0.0
+    python: 3.11.0
+END_VERSIONS
+    """
+}
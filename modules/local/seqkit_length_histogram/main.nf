@@ -0,0 +1,53 @@
+process SEQKIT_LENGTH_HISTOGRAM {
+    tag "${meta.id}"
+    label 'process_low'
+
+    conda "${moduleDir}/environment.yml"
+    container "${workflow.containerEngine in ['singularity', 'apptainer'] && !task.ext.singularity_pull_docker_container
+        ? 'https://depot.galaxyproject.org/singularity/seqkit:2.9.0--h9ee0642_0'
+        : 'biocontainers/seqkit:2.9.0--h9ee0642_0'}"
+
+    input:
+    tuple val(meta), path(reads)
+
+    output:
+    tuple val(meta), path("*.length_hist.tsv"), emit: histogram
+    path "versions.yml"                       , emit: versions
+
+    when:
+    task.ext.when == null || task.ext.when
+
+    script:
+    def prefix = task.ext.prefix ?: "${meta.id}"
+    // Exact read-length histogram (length<TAB>count, ascending) for the batch.
+    // Histograms from different batches add, so SEQKIT_MERGE_STATS can derive
+    // exact cumulative quartiles and N50 without the reads. awk holds one
+    // counter per distinct length, never the reads themselves.
+    """
+    seqkit fx2tab \\
+        --name \\
+        --only-id \\
+        --length \\
+        --threads ${task.cpus} \\
+        ${reads} \\
+        | cut -f 2 \\
+        | awk '{ count[\$1]++ } END { for (len in count) print len "\\t" count[len] }' \\
+        | sort -n -k1,1 > '${prefix}.length_hist.tsv'
+
+    cat <<-END_VERSIONS > versions.yml
+"${task.process}":
+    seqkit: \$(seqkit version | sed 's/seqkit v//')
+END_VERSIONS
+    """
+
+    stub:
+    def prefix = task.ext.prefix ?: "${meta.id}"
+    """
+    touch ${prefix}.length_hist.tsv
+
+    cat <<-END_VERSIONS > versions.yml
+"${task.process}":
+    seqkit: 2.9.0
+END_VERSIONS
+    """
+}
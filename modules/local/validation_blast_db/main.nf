@@ -0,0 +1,89 @@
+process VALIDATION_BLAST_DB {
+    tag "taxid${taxid}"
+    label 'process_low'
+
+    conda "${moduleDir}/environment.yml"
+    container "${ workflow.containerEngine in ['singularity', 'apptainer'] && !task.ext.singularity_pull_docker_container ?
+        'oras://community.wave.seqera.io/library/blast_seqtk_python:0c6e3044e41ecb64' :
+        'community.wave.seqera.io/library/blast_seqtk_python:0c6e3044e41ecb64' }"
+
+    input:
+    // One task per reference genome, not per (sample, batch, taxid): the
+    // validators consume the database this emits, so the reference gunzip and
+    // makeblastdb are off the per-batch critical path.
+    tuple val(taxid), path(reference)
+
+    output:
+    // blastdb/ref.* -- pass the directory as the BLASTN_VALIDATION reference.
+    tuple val(taxid), path("blastdb"), emit: db
+    path "versions.yml", emit: versions
+
+    when:
+    task.ext.when == null || task.ext.when
+
+    script:
+    def args = task.ext.args ?: ''
+    // Cross-run cache (params.validation_db_cache via ext.cache_dir). Entries
+    // are keyed by the md5 of the reference bytes and the makeblastdb version,
+    // so a changed genome or a BLAST+ upgrade builds a new entry rather than
+    // reusing a stale or incompatible one. Unset means build once per run.
+    def cache_dir = task.ext.cache_dir ?: ''
+    """
+    #!/bin/bash
+    set -euo pipefail
+
+    TOOL_VERSION=\$(makeblastdb -version 2>&1 | head -n1 | sed 's/makeblastdb: //')
+    KEY=\$( { md5sum < "${reference}" | cut -c1-32; echo "\$TOOL_VERSION ${args}"; } | md5sum | cut -c1-32)
+    CACHE_DIR="${cache_dir}"
+    ENTRY="\${CACHE_DIR:+\$CACHE_DIR/blast/\$KEY}"
+
+    mkdir blastdb
+    if [[ -n "\$ENTRY" ]] && [[ -f "\$ENTRY/.complete" ]]; then
+        echo "BLAST database cache hit for taxid ${taxid}: \$ENTRY" >&2
+        cp "\$ENTRY"/ref.* blastdb/
+    else
+        if [[ "${reference}" == *.gz ]]; then
+            if ! gunzip -c "${reference}" > reference.fasta; then
+                echo "ERROR: Failed to decompress reference file: ${reference}" >&2
+                exit 1
+            fi
+            REF_FASTA="reference.fasta"
+        else
+            REF_FASTA="${reference}"
+        fi
+
+        if [ ! -s "\$REF_FASTA" ]; then
+            echo "ERROR: Reference FASTA file is empty: \$REF_FASTA" >&2
+            exit 1
+        fi
+
+        makeblastdb -in "\$REF_FASTA" -dbtype nucl -out blastdb/ref -title "validation_ref" ${args}
+
+        if [[ -n "\$ENTRY" ]]; then
+            # Publish by rename so a concurrent run never sees a half-written
+            # entry; if another run got there first, its entry is kept.
+            mkdir -p "\$CACHE_DIR/blast"
+            STAGING=\$(mktemp -d "\$CACHE_DIR/blast/.\$KEY.XXXXXX")
+            cp blastdb/ref.* "\$STAGING"/
+            touch "\$STAGING/.complete"
+            mv -T "\$STAGING" "\$ENTRY" 2>/dev/null || rm -rf "\$STAGING"
+        fi
+    fi
+
+    cat <<-END_VERSIONS > versions.yml
+"${task.process}":
+    makeblastdb: \$(echo "\$TOOL_VERSION" | tr -d '\\n')
+END_VERSIONS
+    """
+
+    stub:
+    """
+    mkdir blastdb
+    touch blastdb/ref.nhr blastdb/ref.nin blastdb/ref.nsq
+
+    cat <<-END_VERSIONS > versions.yml
+"${task.process}":
+    makeblastdb: 2.16.0+
+END_VERSIONS
+    """
+}
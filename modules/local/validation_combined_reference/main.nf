@@ -0,0 +1,59 @@
+process VALIDATION_COMBINED_REFERENCE {
+    tag "${taxids instanceof List ? taxids.size() : 1} genomes"
+    label 'process_single'
+
+    conda "${moduleDir}/environment.yml"
+    container "${ workflow.containerEngine in ['singularity', 'apptainer'] && !task.ext.singularity_pull_docker_container ?
+        'https://depot.galaxyproject.org/singularity/python:3.12' :
+        'quay.io/biocontainers/python:3.12' }"
+
+    input:
+    // Every watchlist genome, in taxid order so the combined FASTA (and so its
+    // cache key) is the same from run to run. Each file is staged in its own
+    // directory: genomes downloaded per taxid often share a file name.
+    tuple val(taxids), path(references, stageAs: 'genome*/*')
+
+    output:
+    // Contigs are renamed <taxid>|<contig>: the contig -> taxid map travels in
+    // the name, and equal contig names from different genomes stay distinct.
+    tuple val('combined'), path("combined_reference.fasta"), emit: reference
+    path "versions.yml", emit: versions
+
+    when:
+    task.ext.when == null || task.ext.when
+
+    script:
+    def taxid_list = taxids instanceof List ? taxids : [taxids]
+    def reference_list = references instanceof List ? references : [references]
+    """
+    #!/usr/bin/env python3
+    import gzip
+    import sys
+
+    taxids = "${taxid_list.join(' ')}".split()
+    references = [${reference_list.collect { "\"${it}\"" }.join(', ')}]
+
+    with open("combined_reference.fasta", "w") as out:
+        for taxid, reference in zip(taxids, references):
+            opener = gzip.open if reference.endswith(".gz") else open
+            with opener(reference, "rt") as f:
+                for line in f:
+                    if line.startswith(">"):
+                        line = ">" + taxid + "|" + line[1:]
+                    out.write(line if line.endswith("\\n") else line + "\\n")
+
+    with open('versions.yml', 'w') as v:
+        v.write('"${task.process}":\\n')
+        v.write(f'    python: {sys.version.split()[0]}\\n')
+    """
+
+    stub:
+    """
+    touch combined_reference.fasta
+
+    cat <<-END_VERSIONS > versions.yml
+"${task.process}":
+    python: 3.12.0
+END_VERSIONS
+    """
+}
@@ -11,6 +11,17 @@
 // writes it and silently dropped batches. Nothing in this module may read the
 // publish directory: the result must be a pure function of its inputs, so that
 // a concurrent or late aggregation can only ever be less complete, never wrong.
+//
+// With ext.state_dir set, bin/validation_cumulative_aggregator.py carries the
+// merged summary (coverage intervals and running sums, read-name digests in an
+// append-only sidecar, and the cumulative alignment file) between tasks under
+// the work directory, keyed by batch id plus the batch file's size and mtime,
+// and folds in only the batches it has not seen. New alignments are appended to
+// the carried file; the task's output is a copy of it, so a finished task's
+// output never changes when later tasks append. The statistics are identical to a full recompute over the same batch
+// list; a state that does not match the front of that list (including a batch
+// replaced under the same id) is ignored and the task recomputes from its
+// inputs, so the pure-function property above still holds.
 process VALIDATION_CUMULATIVE_AGGREGATOR {
     tag "${meta.id}:taxid${taxid}:${method}"
     label 'process_single'
@@ -28,7 +39,9 @@ process VALIDATION_CUMULATIVE_AGGREGATOR {
     // not collide in the work directory, and the generic prefix keeps them out
     // of the output matching set (an input sharing the output name is excluded
     // from it, giving "Missing output file").
-    tuple val(meta), val(taxid),
+    // batch_ids names each entry of batch_files / batch_stats, in the same
+    // (accumulation) order; the carried state is keyed by it.
+    tuple val(meta), val(taxid), val(batch_ids),
         path(batch_files, stageAs: 'batch_input_*'),
         path(batch_stats, stageAs: 'batch_stats_*')
     val method
@@ -63,244 +76,36 @@ process VALIDATION_CUMULATIVE_AGGREGATOR {
     def blast_evalue = params.blast_evalue ?: "1e-10"
     def blast_perc_identity = params.blast_perc_identity ?: 90
     def blast_max_target_seqs = params.blast_max_target_seqs ?: 1
-    if (method == 'minimap2') {
-        """
-        #!/bin/bash
-        set -euo pipefail
-
-        # Merge every batch PAF seen so far for this (sample, taxid). The
-        # per-read dedup in the recompute below collapses any duplicate primary
-        # alignments seen across batches.
-        : > merged.paf
-        for batch_paf in batch_input_*; do
-            if [ -s "\$batch_paf" ]; then cat "\$batch_paf" >> merged.paf; fi
-        done
-        cp merged.paf "${prefix}.paf"
-
-        python3 << 'PYEOF'
-import json
-from pathlib import Path
-
-min_mapq = ${min_mapq}
-hit_threshold = ${hit_threshold}
-identity_threshold = ${identity_threshold}
-min_reads = ${min_reads}
-min_breadth = ${min_breadth}
-
-def total_reads_of(path):
-    if path and Path(path).exists() and Path(path).stat().st_size > 0:
-        try:
-            return int(json.load(open(path)).get("total_reads", 0) or 0)
-        except Exception:
-            return 0
-    return 0
-
-# total_reads is the per-batch classified-read count and is NOT in the PAF, so
-# sum it over the batch stats. Summing the batch set rather than carrying a
-# running total means a re-run of the same batch cannot inflate the figure.
-cum_total = sum(total_reads_of(p) for p in sorted(Path(".").glob("batch_stats_*")))
-
-seen = set()
-hits = 0
-mapq_sum = 0.0; mapq_n = 0
-id_sum = 0.0; id_n = 0
-cov_sum = 0.0; cov_n = 0
-ref_max_len = 0; ref_max_name = ""
-intervals = []
-aligned_bp = 0
-
-with open("merged.paf") as fh:
-    for line in fh:
-        cols = line.rstrip("\\n").split("\\t")
-        if len(cols) < 12:
-            continue
-        qname = cols[0]
-        qlen = int(cols[1]); qstart = int(cols[2]); qend = int(cols[3])
-        tname = cols[5]; tlen = int(cols[6])
-        tstart = int(cols[7]); tend = int(cols[8])
-        nmatch = int(cols[9]); alen = int(cols[10]); mapq = int(cols[11])
-        if tlen > ref_max_len:
-            ref_max_len = tlen; ref_max_name = tname
-        if mapq >= min_mapq:
-            # Genome breadth intervals: every mapq-passing alignment
-            # contributes (mirrors MINIMAP2_VALIDATION's awk, which adds
-            # intervals before the per-read dedup).
-            if tend > tstart and tend <= tlen:
-                intervals.append((tstart, tend))
-                aligned_bp += tend - tstart
-            if qname not in seen:
-                seen.add(qname)
-                hits += 1
-                mapq_sum += mapq; mapq_n += 1
-                identity = -1.0
-                for tag in cols[12:]:
-                    if tag.startswith("dv:f:"):
-                        identity = (1.0 - float(tag.split(":")[2])) * 100.0
-                        break
-                if identity < 0 and alen > 0:
-                    identity = nmatch / alen * 100.0
-                if identity >= 0:
-                    id_sum += identity; id_n += 1
-                span = abs(qend - qstart)
-                if qlen > 0:
-                    cov_sum += span / qlen; cov_n += 1
-
-# Genome breadth over the merged batch set: interval-merge, not additive --
-# the same measure MINIMAP2_VALIDATION emits per batch and nanometa_live's
-# paf_breadth() recomputes from the cumulative PAF.
-covered_bp = 0
-intervals.sort()
-cur_start = cur_end = None
-for s, e in intervals:
-    if cur_start is None:
-        cur_start, cur_end = s, e
-    elif s > cur_end:
-        covered_bp += cur_end - cur_start
-        cur_start, cur_end = s, e
-    elif e > cur_end:
-        cur_end = e
-if cur_start is not None:
-    covered_bp += cur_end - cur_start
-
-if ref_max_name == "":
-    ref_max_name = "unknown"; ref_max_len = 0
-genome_breadth = covered_bp / ref_max_len if ref_max_len > 0 else 0.0
-local_depth = aligned_bp / covered_bp if covered_bp > 0 else 0.0
-# Amplicon-like coverage -- a small share of the genome at high local depth --
-# is legitimate and must stay confirmable. Same rule as the per-batch module
-# and the GUI coverage plots.
-concentrated = genome_breadth <= 0.05 and local_depth >= 10 and covered_bp >= 200
-
-hit_rate = hits / cum_total if cum_total > 0 else 0.0
-avg_mapq = mapq_sum / mapq_n if mapq_n > 0 else 0.0
-avg_id = id_sum / id_n if id_n > 0 else 0.0
-avg_cov = cov_sum / cov_n if cov_n > 0 else 0.0
-if (hit_rate >= hit_threshold and avg_id >= identity_threshold
-        and hits >= min_reads
-        and (genome_breadth >= min_breadth or concentrated)):
-    status = "confirmed"
-elif hit_rate >= hit_threshold * 0.5 or avg_id >= identity_threshold * 0.9:
-    status = "uncertain"
-else:
-    status = "rejected"
-
-stats = {
-    "sample_id": "${sample_id}",
-    "taxid": ${taxid},
-    "validation_method": "minimap2",
-    "total_reads": cum_total,
-    "mapped_reads": hits,
-    "hit_rate": round(hit_rate, 6),
-    "avg_mapq": round(avg_mapq, 2),
-    "avg_identity": round(avg_id, 2),
-    "avg_coverage": round(avg_cov, 4),
-    "genome_breadth": round(genome_breadth, 6),
-    "validation_status": status,
-    "ref_name": ref_max_name,
-    "ref_length": ref_max_len,
-    "parameters": {"preset": "${preset}", "min_mapq": ${min_mapq}},
-}
-with open("${prefix}.minimap2_stats.json", "w") as out:
-    json.dump(stats, out, indent=2)
-PYEOF
-
-        cat <<-END_VERSIONS > versions.yml
-"${task.process}":
-    python: \$(python3 --version | sed 's/Python //')
-END_VERSIONS
-        """
-    } else {
-        """
-        #!/bin/bash
-        set -euo pipefail
-
-        # Merge every batch BLAST table seen so far for this (sample, taxid).
-        # The per-qseqid dedup in the recompute keeps the merged hit set
-        # well-defined.
-        : > merged.blast.tsv
-        for batch_tsv in batch_input_*; do
-            if [ -s "\$batch_tsv" ]; then cat "\$batch_tsv" >> merged.blast.tsv; fi
-        done
-        cp merged.blast.tsv "${prefix}.blast.tsv"
-
-        python3 << 'PYEOF'
-import json
-from pathlib import Path
-
-hit_threshold = ${hit_threshold}
-identity_threshold = ${identity_threshold}
-min_reads = ${min_reads}
-
-def total_reads_of(path):
-    if path and Path(path).exists() and Path(path).stat().st_size > 0:
-        try:
-            return int(json.load(open(path)).get("total_reads", 0) or 0)
-        except Exception:
-            return 0
-    return 0
-
-cum_total = sum(total_reads_of(p) for p in sorted(Path(".").glob("batch_stats_*")))
-
-hits = 0
-seen = set()
-identities = []
-coverages = []
-evalues = []
-with open("merged.blast.tsv") as fh:
-    for line in fh:
-        cols = line.strip().split("\\t")
-        if len(cols) >= 15:
-            qseqid = cols[0]
-            if qseqid in seen:
-                continue
-            seen.add(qseqid)
-            hits += 1
-            identities.append(float(cols[2]))
-            coverages.append(float(cols[14]) / 100.0)
-            evalues.append(float(cols[10]))
-
-hit_rate = hits / cum_total if cum_total > 0 else 0.0
-avg_identity = sum(identities) / len(identities) if identities else 0.0
-avg_coverage = sum(coverages) / len(coverages) if coverages else 0.0
-min_evalue = min(evalues) if evalues else 1.0
-# min_reads floor as in BLASTN_VALIDATION: percentages are unstable at low n,
-# and a single index-hopped read at 100% hit rate must not confirm. Breadth is
-# deliberately not applied to BLAST (qcovs is per-read query coverage).
-if (hit_rate >= hit_threshold and avg_identity >= identity_threshold
-        and hits >= min_reads):
-    status = "confirmed"
-elif hit_rate >= hit_threshold * 0.5 or avg_identity >= identity_threshold * 0.9:
-    status = "uncertain"
-else:
-    status = "rejected"
-
-stats = {
-    "sample_id": "${sample_id}",
-    "taxid": ${taxid},
-    "validation_method": "blast",
-    "total_reads": cum_total,
-    "blast_hits": hits,
-    "hit_rate": round(hit_rate, 6),
-    "avg_identity": round(avg_identity, 2),
-    "avg_coverage": round(avg_coverage, 4),
-    "min_evalue": min_evalue,
-    "validation_status": status,
-    "thresholds": {
-        "evalue": "${blast_evalue}",
-        "perc_identity": ${blast_perc_identity},
-        "max_target_seqs": ${blast_max_target_seqs},
-    },
-}
-with open("${prefix}.blast_stats.json", "w") as out:
-    json.dump(stats, out, indent=2)
-PYEOF
-
-        cat <<-END_VERSIONS > versions.yml
+    def state = task.ext.state_dir ? "--state '${task.ext.state_dir}/${prefix}.${method}.json'" : ''
+    def ids = batch_ids instanceof List ? batch_ids : [batch_ids]
+    def files = batch_files instanceof List ? batch_files : [batch_files]
+    def stats = batch_stats instanceof List ? batch_stats : [batch_stats]
+    """
+    validation_cumulative_aggregator.py \\
+        --method ${method} \\
+        --prefix ${prefix} \\
+        --sample-id '${sample_id}' \\
+        --taxid ${taxid} \\
+        --batch-ids ${ids.collect { "'${it}'" }.join(' ')} \\
+        --batch-files ${files.join(' ')} \\
+        --batch-stats ${stats.join(' ')} \\
+        --hit-threshold ${hit_threshold} \\
+        --identity-threshold ${identity_threshold} \\
+        --min-reads ${min_reads} \\
+        --min-breadth ${min_breadth} \\
+        --min-mapq ${min_mapq} \\
+        --preset '${preset}' \\
+        --blast-evalue '${blast_evalue}' \\
+        --blast-perc-identity ${blast_perc_identity} \\
+        --blast-max-target-seqs ${blast_max_target_seqs} \\
+        ${state}
+
+    cat <<-END_VERSIONS > versions.yml
 "${task.process}":
+    validation_cumulative_aggregator.py: 1.0.0
     python: \$(python3 --version | sed 's/Python //')
 END_VERSIONS
-        """
-    }
+    """
 
     stub:
     def prefix = "${meta.id}_taxid${taxid}"
@@ -311,6 +116,7 @@ END_VERSIONS
 
         cat <<-END_VERSIONS > versions.yml
 "${task.process}":
+    validation_cumulative_aggregator.py: 1.0.0
     python: \$(python3 --version | sed 's/Python //')
 END_VERSIONS
         """
@@ -321,6 +127,7 @@ END_VERSIONS
 
         cat <<-END_VERSIONS > versions.yml
 "${task.process}":
+    validation_cumulative_aggregator.py: 1.0.0
     python: \$(python3 --version | sed 's/Python //')
 END_VERSIONS
         """
@@ -0,0 +1,120 @@
+process VALIDATION_MINIMAP2_INDEX {
+    tag "taxid${taxid}"
+    label 'process_low'
+
+    conda "${moduleDir}/environment.yml"
+    container "${ workflow.containerEngine in ['singularity', 'apptainer'] && !task.ext.singularity_pull_docker_container ?
+        'https://depot.galaxyproject.org/singularity/minimap2:2.28--he4a0461_0' :
+        'quay.io/biocontainers/minimap2:2.28--he4a0461_0' }"
+
+    input:
+    // One task per reference genome. MINIMAP2_VALIDATION and
+    // CONSENSUS_VALIDATION take the .mmi in place of the FASTA -- minimap2
+    // reads either as its target -- so neither re-indexes the genome per batch.
+    tuple val(taxid), path(reference)
+    val minimap2_preset
+
+    output:
+    tuple val(taxid), path("*.mmi"), emit: index
+    tuple val(taxid), path("*.minimap2_index.json"), emit: report
+    path "versions.yml", emit: versions
+
+    when:
+    task.ext.when == null || task.ext.when
+
+    script:
+    // The preset sets k, w and homopolymer compression, which are baked into
+    // the index; mapping with a .mmi ignores them. The validators must
+    // therefore map with the preset the index was built with.
+    def preset = task.ext.preset ?: minimap2_preset ?: "map-ont"
+    def prefix = task.ext.prefix ?: "taxid${taxid}.${preset.replaceAll(/[^A-Za-z0-9_.-]/, '_')}"
+    // Cross-run cache (params.validation_db_cache via ext.cache_dir), keyed by
+    // the md5 of the reference bytes, the preset and the minimap2 version.
+    def cache_dir = task.ext.cache_dir ?: ''
+    // 'combined' for the watchlist-wide index (VALIDATION_COMBINED_INDEX).
+    def taxid_json = taxid.toString().isInteger() ? taxid : "\"${taxid}\""
+    """
+    #!/bin/bash
+    set -euo pipefail
+
+    TOOL_VERSION=\$(minimap2 --version)
+    KEY=\$( { md5sum < "${reference}" | cut -c1-32; echo "\$TOOL_VERSION ${preset}"; } | md5sum | cut -c1-32)
+    CACHE_DIR="${cache_dir}"
+    ENTRY="\${CACHE_DIR:+\$CACHE_DIR/minimap2/\$KEY}"
+
+    # minimap2 logs the wall time at which the index was ready:
+    # [M::main::<seconds>*<cpu ratio>] loaded/built the index for N target sequence(s)
+    index_seconds() {
+        sed -n 's/^\\[M::main::\\([0-9.]*\\)\\*.*loaded\\/built the index.*/\\1/p' "\$1" | head -n1
+    }
+
+    CACHE_HIT=false
+    if [[ -n "\$ENTRY" ]] && [[ -f "\$ENTRY.mmi" ]]; then
+        echo "minimap2 index cache hit for taxid ${taxid}: \$ENTRY.mmi" >&2
+        cp "\$ENTRY.mmi" "${prefix}.mmi"
+        BUILD_SECONDS=\$(cat "\$ENTRY.build_seconds" 2>/dev/null || true)
+        CACHE_HIT=true
+    else
+        minimap2 -x ${preset} -t ${task.cpus} -d "${prefix}.mmi" "${reference}" 2> build.log
+        BUILD_SECONDS=\$(index_seconds build.log)
+
+        if [[ -n "\$ENTRY" ]]; then
+            # The .mmi is renamed into place last, so its presence marks a
+            # complete entry; concurrent runs write identical files.
+            mkdir -p "\$CACHE_DIR/minimap2"
+            echo "\$BUILD_SECONDS" > "\$ENTRY.build_seconds"
+            STAGING=\$(mktemp "\$CACHE_DIR/minimap2/.\$KEY.XXXXXX")
+            cp "${prefix}.mmi" "\$STAGING"
+            mv -f "\$STAGING" "\$ENTRY.mmi"
+        fi
+    fi
+
+    # Per-batch cost of the reference step, before and after: every batch
+    # used to build the index (build_seconds); now it only loads it.
+    minimap2 -t 1 "${prefix}.mmi" /dev/null > /dev/null 2> load.log
+    LOAD_SECONDS=\$(index_seconds load.log)
+
+    cat > "${prefix}.minimap2_index.json" <<EOF
+{
+    "taxid": ${taxid_json},
+    "preset": "${preset}",
+    "cache_key": "\$KEY",
+    "cache_hit": \$CACHE_HIT,
+    "reference_bytes": \$(wc -c < "${reference}" | tr -d ' '),
+    "index_bytes": \$(wc -c < "${prefix}.mmi" | tr -d ' '),
+    "per_batch_seconds_before": \${BUILD_SECONDS:-null},
+    "per_batch_seconds_after": \${LOAD_SECONDS:-null}
+}
+EOF
+
+    cat <<-END_VERSIONS > versions.yml
+"${task.process}":
+    minimap2: \$TOOL_VERSION
+END_VERSIONS
+    """
+
+    stub:
+    def preset = task.ext.preset ?: minimap2_preset ?: "map-ont"
+    def prefix = task.ext.prefix ?: "taxid${taxid}.${preset.replaceAll(/[^A-Za-z0-9_.-]/, '_')}"
+    def taxid_json = taxid.toString().isInteger() ? taxid : "\"${taxid}\""
+    """
+    touch "${prefix}.mmi"
+    cat > "${prefix}.minimap2_index.json" <<EOF
+{
+    "taxid": ${taxid_json},
+    "preset": "${preset}",
+    "cache_key": "stub",
+    "cache_hit": false,
+    "reference_bytes": 0,
+    "index_bytes": 0,
+    "per_batch_seconds_before": null,
+    "per_batch_seconds_after": null
+}
+EOF
+
+    cat <<-END_VERSIONS > versions.yml
+"${task.process}":
+    minimap2: 2.28
+END_VERSIONS
+    """
+}
@@ -12,92 +12,57 @@ workflow INPUT_SCANNER {
     main:
     ch_versions = Channel.empty()
 
-    def structure = InputDetector.detectStructure(input_dir)
+    //
+    // One walk of the input directory serves both structure detection and
+    // sample grouping (see InputSnapshot). The snapshot is cached, by default
+    // under the work directory, and a later run (e.g. -resume) only re-lists
+    // directories whose mtime changed. Hidden files -- macOS AppleDouble
+    // sidecars ("._sample.fastq.gz", written beside every file on exFAT/USB
+    // media) failed CHOPPER with "not in gzip format" (2026-08-17) -- are
+    // never part of the snapshot.
+    //
+    def snapshot_cache = params.input_snapshot_cache ?: InputSnapshot.defaultCachePath(workflow.workDir, input_dir)
+    def snapshot = InputSnapshot.scan(input_dir, snapshot_cache, sample_regex, params.sample_name)
+    log.info "Input directory scanned: ${snapshot.fileCount()} FASTQ files in ${snapshot.dirCount()} directories (${snapshot.reusedCount()} unchanged since the cached snapshot)"
+
+    def structure = InputDetector.detectStructure(snapshot)
     log.info "Input directory structure detected: ${structure}"
 
     if (structure == 'barcode_subdirs') {
         //
-        // Barcode subdirectory mode: one sample per barcode dir
+        // Barcode subdirectory mode: one sample per barcode dir, plus the
+        // unclassified directory when present
         //
-        ch_samples = Channel.fromPath("${input_dir}/barcode*", type: 'dir')
-            .filter { it.isDirectory() }
-            .map { barcode_dir ->
-                def barcode = barcode_dir.getName()
-                def fastq_files = []
-                barcode_dir.eachFileMatch(~/[^.].*\.(fastq|fastq\.gz|fq|fq\.gz)$/) { f ->
-                    fastq_files.add(f)
-                }
-                if (fastq_files.size() > 0) {
-                    def meta = [
-                        id: barcode,
-                        barcode: barcode,
-                        single_end: true,
-                        demultiplexed: true,
-                        demux_source: "input_scanner"
-                    ]
-                    return [ meta, fastq_files ]
-                }
-                return null
-            }
-            .filter { it != null }
-
-        // Also pick up unclassified directory
-        ch_unclassified = Channel.fromPath("${input_dir}/unclassified", type: 'dir')
-            .filter { it.isDirectory() }
-            .map { unclass_dir ->
-                def fastq_files = []
-                unclass_dir.eachFileMatch(~/[^.].*\.(fastq|fastq\.gz|fq|fq\.gz)$/) { f ->
-                    fastq_files.add(f)
-                }
-                if (fastq_files.size() > 0) {
-                    def meta = [
-                        id: "unclassified",
-                        barcode: "unclassified",
-                        single_end: true,
-                        demultiplexed: true,
-                        demux_source: "input_scanner"
-                    ]
-                    return [ meta, fastq_files ]
-                }
-                return null
-            }
-            .filter { it != null }
-
-        ch_all_samples = ch_samples.mix(ch_unclassified)
+        def barcode_samples = snapshot.barcodeGroups().collect { barcode, paths ->
+            def meta = [
+                id: barcode,
+                barcode: barcode,
+                single_end: true,
+                demultiplexed: true,
+                demux_source: "input_scanner"
+            ]
+            [ meta, paths.collect { file(it) } ]
+        }
+        ch_all_samples = Channel.fromList(barcode_samples)
 
     } else {
         //
-        // Flat directory mode: group by sample ID
+        // Flat directory mode: group by sample ID (files at any depth)
         //
-        // The extra filter drops hidden files: Java NIO globs match leading
-        // dots, so macOS AppleDouble sidecars ("._sample.fastq.gz", written
-        // beside every file on exFAT/USB media) were scanned as real FASTQ
-        // inputs and failed CHOPPER with "not in gzip format" (2026-08-17).
-        ch_all_samples = Channel.fromPath(["${input_dir}/*.{fastq,fastq.gz,fq,fq.gz}", "${input_dir}/**/*.{fastq,fastq.gz,fq,fq.gz}"])
-            .filter { !it.name.startsWith('.') }
-            .map { f ->
-                def sample_id = InputDetector.extractSampleId(
-                    f,
-                    sample_regex,
-                    params.sample_name
-                )
-                def meta = [
-                    id: sample_id,
-                    single_end: true,
-                    demux_source: "input_scanner"
-                ]
-                // Add barcode to meta if sample_id looks like a barcode
-                if (sample_id =~ /^barcode\d+$/) {
-                    meta.barcode = sample_id
-                    meta.demultiplexed = true
-                }
-                return [ meta, f ]
-            }
-            .groupTuple(by: 0)
-            .map { meta, files ->
-                // groupTuple wraps files in extra list; flatten
-                [ meta, files.flatten() ]
+        def flat_samples = snapshot.sampleGroups().collect { sample_id, paths ->
+            def meta = [
+                id: sample_id,
+                single_end: true,
+                demux_source: "input_scanner"
+            ]
+            // Add barcode to meta if sample_id looks like a barcode
+            if (sample_id =~ /^barcode\d+$/) {
+                meta.barcode = sample_id
+                meta.demultiplexed = true
             }
+            [ meta, paths.collect { file(it) } ]
+        }
+        ch_all_samples = Channel.fromList(flat_samples)
     }
 
     // .ifEmpty returns a NEW channel; calling it without binding the result only
@@ -26,6 +26,7 @@ include { NANOPLOT                } from '../../../modules/nf-core/nanoplot/main
 include { FASTQC                  } from '../../../modules/nf-core/fastqc/main'
 include { SEQKIT_STATS            } from '../../../modules/nf-core/seqkit/stats/main'
 include { SEQKIT_MERGE_STATS      } from '../../../modules/local/seqkit_merge_stats/main'
+include { SEQKIT_LENGTH_HISTOGRAM } from '../../../modules/local/seqkit_length_histogram/main'
 include { CANONICAL_QC_WRITER    } from '../../../modules/local/canonical_qc_writer/main'
 
 workflow QC_ANALYSIS {
@@ -41,6 +42,7 @@ workflow QC_ANALYSIS {
     ch_qc_json = Channel.empty()
     ch_fastqc_html = Channel.empty()
     ch_seqkit_stats = Channel.empty()
+    ch_seqkit_reads = Channel.empty()
 
     //
     // INPUT NORMALISATION: accept plain Lists alongside Channels.
@@ -175,6 +177,7 @@ workflow QC_ANALYSIS {
             SEQKIT_STATS (
                 FILTLONG.out.reads
             )
+            ch_seqkit_reads = FILTLONG.out.reads
             // SEQKIT_STATS uses topic: versions pattern - no .out.versions channel
             ch_seqkit_stats = SEQKIT_STATS.out.stats.ifEmpty([])
 
@@ -212,6 +215,7 @@ workflow QC_ANALYSIS {
             SEQKIT_STATS (
                 CHOPPER.out.fastq
             )
+            ch_seqkit_reads = CHOPPER.out.fastq
             // SEQKIT_STATS uses topic: versions pattern - no .out.versions channel
             ch_seqkit_stats = SEQKIT_STATS.out.stats.ifEmpty([])
 
@@ -252,29 +256,55 @@ workflow QC_ANALYSIS {
     if (enable_incremental && (qc_tool == 'chopper' || qc_tool == 'filtlong')) {
         log.info "Using incremental QC statistics aggregation for ${qc_tool}"
 
-        // Group batch-level seqkit stats by sample id. The full meta map
-        // carries a per-batch batch_time stamp set in REALTIME_MONITORING
-        // (line 285), so two batches for the same sample compare unequal
-        // and groupTuple(by: 0) on the raw meta would never collapse them.
-        // Re-key by meta.id, then rebuild a stable sample-level meta from
-        // the first emitted item (id, single_end, optional barcode) so
-        // SEQKIT_MERGE_STATS receives the canonical per-sample tuple it
-        // expects. remainder: true flushes the partial group when the
-        // upstream watchPath channel finally closes.
-        def ch_grouped_batch_stats = ch_seqkit_stats
-            .map { meta, stats -> tuple(meta.id, meta, stats) }
-            .groupTuple(by: 0)
-            .map { sample_id, metas, stats_list ->
-                def base = metas[0] ?: [:]
-                def cumulative_meta = [
-                    id: sample_id,
-                    single_end: base.single_end != null ? base.single_end : true
-                ]
-                if (base.barcode) {
-                    cumulative_meta.barcode = base.barcode
-                }
-                tuple(cumulative_meta, stats_list)
+        // Exact read-length histogram per batch, beside its seqkit stats row.
+        // Histograms add across batches, which is what lets SEQKIT_MERGE_STATS
+        // report exact cumulative Q1/Q2/Q3/N50 instead of approximations.
+        SEQKIT_LENGTH_HISTOGRAM(ch_seqkit_reads)
+        ch_versions = ch_versions.mix(SEQKIT_LENGTH_HISTOGRAM.out.versions.first())
+
+        // The full per-batch meta (including batch_time) is the join key, so
+        // each stats row pairs with the histogram of the same batch. The
+        // stats file's path is the batch key SEQKIT_MERGE_STATS dedups on:
+        // unique per batch task and stable across -resume.
+        def ch_batch_stats = ch_seqkit_stats
+            .filter { it instanceof List && it.size() >= 2 && it[1] != null }
+            .join(SEQKIT_LENGTH_HISTOGRAM.out.histogram)
+            .map { meta, stats, histogram -> tuple(meta.id, meta, stats.toString(), stats, histogram) }
+
+        // Rebuild a stable sample-level meta (id, single_end, optional
+        // barcode) from a per-batch one. The per-batch meta carries a
+        // batch_time stamp set in REALTIME_MONITORING, so two batches of the
+        // same sample compare unequal and cannot serve as a sample key.
+        def sample_meta = { sample_id, base ->
+            def cumulative_meta = [
+                id: sample_id,
+                single_end: base?.single_end != null ? base.single_end : true
+            ]
+            if (base?.barcode) {
+                cumulative_meta.barcode = base.barcode
             }
+            cumulative_meta
+        }
+
+        def ch_grouped_batch_stats
+        if (is_realtime_mode) {
+            // One merge per batch: SEQKIT_MERGE_STATS carries the merged
+            // state forward between calls and folds in only the new batch,
+            // so the published seqkit/{sample}.tsv is cumulative after every
+            // batch rather than only once the watch channel closes.
+            ch_grouped_batch_stats = ch_batch_stats
+                .map { sample_id, meta, key, stats, histogram ->
+                    tuple(sample_meta(sample_id, meta), [key], [stats], [histogram])
+                }
+        } else {
+            // Batch mode: group by sample id and merge once, when the
+            // upstream channel closes.
+            ch_grouped_batch_stats = ch_batch_stats
+                .groupTuple(by: 0)
+                .map { sample_id, metas, keys, stats_list, histograms ->
+                    tuple(sample_meta(sample_id, metas[0]), keys, stats_list, histograms)
+                }
+        }
 
         // Merge batch statistics into cumulative statistics
         SEQKIT_MERGE_STATS(
@@ -104,7 +104,18 @@ workflow REALTIME_MONITORING {
                     long min_per_sample = per_barcode_batches.values()
                         .collect { it.get() }
                         .min() ?: 0L
-                    log.info "[runtime-metrics] elapsed_s=${elapsed_s} files=${files} batches=${batches} barcodes=${sample_count} batches_per_barcode_min=${min_per_sample} batches_per_barcode_max=${max_per_sample}"
+                    def line = "[runtime-metrics] elapsed_s=${elapsed_s} files=${files} batches=${batches} barcodes=${sample_count} batches_per_barcode_min=${min_per_sample} batches_per_barcode_max=${max_per_sample}"
+                    // Feedback batching (--batch_target_latency_seconds):
+                    // the controller's state and its latest re-size.
+                    def controller = AdaptiveBatchController.lookup('realtime')
+                    if (controller != null) {
+                        def state = controller.snapshot()
+                        line += " batch_size=${state.batch_size} arrival_rate=${state.arrival_rate} file_seconds=${state.file_seconds} in_flight=${state.in_flight} batch_size_decisions=${state.decisions}"
+                        if (state.last_decision) {
+                            line += " last_decision=\"${state.last_decision.from}->${state.last_decision.to}: ${state.last_decision.reason}\""
+                        }
+                    }
+                    log.info line
                 } catch (Exception e) {
                     log.debug "[runtime-metrics] snapshot failed: ${e.message}"
                 }
@@ -128,6 +139,25 @@ workflow REALTIME_MONITORING {
         // matches them, and gzip then fails the QC process (2026-08-17).
         existing_list = existing_list.findAll { !it.name.startsWith('.') }
 
+        // Ingest ledger (--ingest_ledger): files an earlier run already
+        // processed are skipped, here and for watchPath events below, so a
+        // restarted run neither re-classifies them nor counts them towards
+        // max_files. Each batch's files are recorded as formed here; the
+        // workflow marks them done once the batch is classified, and only
+        // done files are skipped, so a batch in flight when a run dies is
+        // taken up again by the next one.
+        IngestLedger ingest_ledger = null
+        if (params.ingest_ledger) {
+            ingest_ledger = IngestLedger.register('realtime', new IngestLedger(file(params.ingest_ledger)))
+            def listed_count = existing_list.size()
+            existing_list = existing_list.findAll { ingest_ledger.claim(it) }
+            log.info "Ingest ledger: ${params.ingest_ledger} (${ingest_ledger.loadedCount()} records)"
+            log.info "  Skipping ${listed_count - existing_list.size()} existing files already processed by an earlier run"
+            if (ingest_ledger.unfinishedCount() > 0) {
+                log.info "  Re-admitting ${ingest_ledger.unfinishedCount()} files whose batch an earlier run never finished"
+            }
+        }
+
         // Round-robin interleave existing files by parent (barcode) directory so
         // take(max_files) selects fairly across all barcodes rather than in
         // filesystem order. See BatchUtils.interleaveFilesByParentDir.
@@ -164,7 +194,10 @@ workflow REALTIME_MONITORING {
         // exFAT/USB media and the glob matches them (gzip then fails the
         // QC process). The PoisonPill never reaches the filter closure --
         // operators terminate on it without invoking user code.
-        def ch_watched = ch_existing.mix(ch_new)
+        // Existing files were checked against the ingest ledger above;
+        // watchPath events are checked here.
+        def ch_watched = ch_existing
+            .mix(ingest_ledger != null ? ch_new.filter { ingest_ledger.claim(it) } : ch_new)
             .filter { !it.name.startsWith('.') }
 
         //
@@ -328,6 +361,11 @@ workflow REALTIME_MONITORING {
         // ADAPTIVE BATCHING: Dynamic batch size adjustment (v1.2.1+)
         //
         def effective_batch_size = batch_size
+        AdaptiveBatchController batch_controller = null
+
+        // Size-aware batching (--batch_bytes): flush on total file size
+        // rather than file count, so batches carry comparable work.
+        long batch_bytes = params.batch_bytes ? (params.batch_bytes as MemoryUnit).toBytes() : 0L
 
         if (params.adaptive_batching) {
             log.info "Adaptive batching ENABLED"
@@ -343,12 +381,72 @@ workflow REALTIME_MONITORING {
             log.info "  Batch size range: ${min_size} - ${max_size}"
             log.info "  Batch size factor: ${factor}"
             log.info "  Effective batch size: ${effective_batch_size}"
+
+            // Feedback mode: with a target latency, the batch size keeps
+            // adapting to the arrival rate and the classifier's per-batch
+            // duration (see AdaptiveBatchController), starting from the size
+            // above. TAXONOMIC_CLASSIFICATION reports each classification's
+            // duration to the controller registered here.
+            def target_latency = (params.batch_target_latency_seconds ?: 0) as double
+            if (target_latency > 0 && batch_bytes > 0) {
+                log.warn "  --batch_target_latency_seconds is ignored with --batch_bytes (batches are sized by bytes)"
+            } else if (target_latency > 0 && params.per_barcode_batching) {
+                log.warn "  --batch_target_latency_seconds is ignored with --per_barcode_batching"
+            } else if (target_latency > 0) {
+                batch_controller = AdaptiveBatchController.register('realtime', new AdaptiveBatchController(
+                    effective_batch_size, min_size as int, max_size as int, target_latency,
+                    max_classification_forks as int
+                ))
+                batch_controller.onDecision = { d ->
+                    log.info "[adaptive-batching] batch size ${d.from} -> ${d.to}: ${d.reason}"
+                }
+                log.info "  Target end-to-end latency: ${target_latency}s (batch size adapts to arrival rate and classifier duration)"
+            }
         }
 
+        if (batch_bytes > 0) {
+            log.info "Size-aware batching ENABLED"
+            log.info "  Flush at: ${params.batch_bytes} of input per batch"
+            if (params.batch_split_reads) {
+                log.info "  Larger files are split into chunks of ${params.batch_split_reads} reads"
+            }
+        }
+
+        //
+        // PER-BARCODE BATCHING: sample-homogeneous batches in fair order
         //
-        // PRIORITY ROUTING: Process priority samples first (v1.2.1+)
+        // One buffer per sample; each full (or timed-out) buffer is a batch,
+        // and FairBatchScheduler releases them in deficit round robin order
+        // by bytes, so a startup backlog is drained across all barcodes at
+        // once rather than one barcode after another. Priority samples get
+        // --priority_weight times the share of each round.
         //
-        if (params.priority_samples && params.priority_samples.size() > 0) {
+        if (params.per_barcode_batching) {
+            def priority_patterns = params.priority_samples instanceof String
+                ? params.priority_samples.tokenize(',')*.trim()
+                : (params.priority_samples ?: [])
+            def priority_weight = (params.priority_weight ?: 1) as int
+            def batch_timeout_val = params.batch_timeout ?: 60
+            log.info "Per-barcode batching ENABLED (weighted fair order by bytes)"
+            if (priority_patterns) {
+                log.info "  Priority samples (${priority_patterns.size()}, weight ${priority_weight}): ${priority_patterns.join(', ')}"
+            }
+            ch_batched_files = BatchUtils.batchPerBarcode(
+                ch_input_files,
+                effective_batch_size,
+                batch_timeout_val,
+                [
+                    keyOf     : { f -> InputDetector.extractSampleId(f, params.sample_regex, params.sample_name) },
+                    weightOf  : { sample_id ->
+                        priority_patterns.any { p -> sample_id.contains(p) || sample_id.matches(p) } ? priority_weight : 1
+                    },
+                    batchBytes: batch_bytes,
+                ]
+            )
+        } else if (params.priority_samples && params.priority_samples.size() > 0) {
+            //
+            // PRIORITY ROUTING: Process priority samples first (v1.2.1+)
+            //
             log.info "Priority routing ENABLED"
             log.info "  Priority samples (${params.priority_samples.size()}): ${params.priority_samples.join(', ')}"
 
@@ -376,7 +474,8 @@ workflow REALTIME_MONITORING {
             ch_batched_files = BatchUtils.batchWithTimeout(
                 ch_branched_files.priority.mix(ch_branched_files.normal),
                 effective_batch_size,
-                batch_timeout_val
+                batch_timeout_val,
+                [controller: batch_controller, batchBytes: batch_bytes]
             )
 
             log.info "Priority samples will be processed before normal samples"
@@ -387,7 +486,8 @@ workflow REALTIME_MONITORING {
             ch_batched_files = BatchUtils.batchWithTimeout(
                 ch_input_files,
                 effective_batch_size,
-                batch_timeout_val
+                batch_timeout_val,
+                [controller: batch_controller, batchBytes: batch_bytes]
             )
         }
 
@@ -444,10 +544,35 @@ workflow REALTIME_MONITORING {
 
                 meta.single_end = true
                 meta.batch_time = new Date().format('yyyy-MM-dd_HH-mm-ss')
+                // The input file this sample came from, for marking it done
+                // in the ingest ledger once it is classified.
+                if (ingest_ledger != null) {
+                    meta.ingest_file = file.toAbsolutePath().toString()
+                }
 
                 return [ meta, file ]
             }
 
+        // A file over the byte budget is a batch on its own; with
+        // --batch_split_reads it is also split into read chunks, so one
+        // oversized file does not become one oversized classification.
+        // The chunks keep the file's meta (same sample), except ingest_file:
+        // the first chunk to finish would mark the whole file done, so a
+        // split file stays formed in the ledger and a restart re-reads it.
+        if (batch_bytes > 0 && params.batch_split_reads) {
+            ch_samples
+                .branch { meta, reads ->
+                    oversized: BatchUtils.itemBytes(reads) > batch_bytes
+                    fits: true
+                }
+                .set { ch_sized_samples }
+            ch_samples = ch_sized_samples.fits.mix(
+                ch_sized_samples.oversized
+                    .map { meta, reads -> [ meta.findAll { it.key != 'ingest_file' }, reads ] }
+                    .splitFastq(by: params.batch_split_reads as int, file: true, compress: true, elem: 1)
+            )
+        }
+
         // Transform batches for REALTIME_STATISTICS
         // GENERATE_SNAPSHOT_STATS expects: tuple val(batch_meta), val(file_metas)
         // where batch_meta is a map with batch_id, batch_timestamp, batch_time
@@ -459,6 +584,8 @@ workflow REALTIME_MONITORING {
                 // Use timestamp for unique batch ID (counter variables don't work in Nextflow dataflow)
                 def batch_id = "batch_${batch_timestamp}"
 
+                ingest_ledger?.formed(files, batch_id)
+
                 // Create batch metadata
                 def batch_meta = [
                     batch_id: batch_id,
@@ -13,13 +13,25 @@
     - Cumulative trend analysis
     - Performance monitoring
     - Quality threshold alerting
-    - JSON and HTML report generation
+    - JSON report data behind a static HTML page (realtime_reports/index.html)
+
+    Service mode (--realtime_stats_service):
+    The three modules above run as three container tasks PER BATCH, with the
+    cumulative state round-tripped through cumulative_state.json between
+    them. At a batch every few seconds the spawns cost more than the work.
+    Service mode instead runs REALTIME_STATS_SERVICE once for the session:
+    the head process spools each batch into a local directory and the
+    service folds it into in-memory state, checkpointing and re-rendering
+    the report on the stats interval. Output paths and JSON layout are the
+    same in both modes. The spool and the live outputs must be on a
+    filesystem shared by the head process and the task (local executor).
 ----------------------------------------------------------------------------------------
 */
 
 include { GENERATE_SNAPSHOT_STATS } from '../../../modules/local/generate_snapshot_stats/main'
 include { UPDATE_CUMULATIVE_STATS } from '../../../modules/local/update_cumulative_stats/main'
 include { GENERATE_REALTIME_REPORT } from '../../../modules/local/generate_realtime_report/main'
+include { REALTIME_STATS_SERVICE  } from '../../../modules/local/realtime_stats_service/main'
 
 workflow REALTIME_STATISTICS {
 
@@ -31,54 +43,135 @@ workflow REALTIME_STATISTICS {
 
     ch_versions = Channel.empty()
 
-    //
-    // Generate snapshot statistics for each batch
-    //
-    GENERATE_SNAPSHOT_STATS (
-        ch_batches,
-        stats_config
-    )
-    ch_versions = ch_versions.mix(GENERATE_SNAPSHOT_STATS.out.versions)
-
-    //
-    // Update cumulative statistics with each new batch
-    //
-    ch_cumulative_input = GENERATE_SNAPSHOT_STATS.out.snapshot_stats
-        .map { batch_meta, snapshot_stats ->
-            // Prepare input for cumulative update
-            [
-                batch_meta,
-                snapshot_stats,
-                file("${params.outdir}/realtime_stats/cumulative_state.json").exists() ?
-                    file("${params.outdir}/realtime_stats/cumulative_state.json") : []
-            ]
+    // The report page is static: publish it once and let it poll the data
+    // file written per batch (GENERATE_REALTIME_REPORT or the service).
+    def report_dir = file("${params.outdir}/realtime_reports")
+    report_dir.mkdirs()
+    file("${projectDir}/assets/realtime_report.html").copyTo(report_dir.resolve('index.html'))
+
+    if (params.realtime_stats_service) {
+        def spool_dir = file(params.realtime_stats_spool ?: "${workflow.workDir}/realtime_stats_spool")
+        spool_dir.mkdirs()
+        def live_outdir = file(params.outdir)
+
+        // Spool writes happen in the head process: temp dotfile, then rename,
+        // so the service never reads a half-written batch. The shutdown
+        // sentinel is written in onComplete, after every batch is in place.
+        def spooled = new java.util.concurrent.atomic.AtomicLong(0L)
+        def spool_write = { String name, Map payload ->
+            def tmp = spool_dir.resolve(".${name}.tmp")
+            tmp.text = groovy.json.JsonOutput.toJson(payload)
+            java.nio.file.Files.move(tmp, spool_dir.resolve(name), java.nio.file.StandardCopyOption.ATOMIC_MOVE)
         }
+        ch_batches.subscribe(
+            onNext: { item ->
+                def (batch_meta, file_metas) = item
+                try {
+                    spool_write("${batch_meta.batch_id}.batch.json", [batch_meta: batch_meta, file_metas: file_metas])
+                    spooled.incrementAndGet()
+                } catch (Exception e) {
+                    log.warn "Realtime stats service: failed to spool ${batch_meta.batch_id}: ${e.message}"
+                }
+            },
+            onComplete: {
+                try {
+                    spool_write('shutdown.json', [expected_batches: spooled.get()])
+                } catch (Exception e) {
+                    log.warn "Realtime stats service: failed to write shutdown sentinel: ${e.message}"
+                }
+            }
+        )
+
+        REALTIME_STATS_SERVICE (
+            spool_dir.toString(),
+            live_outdir.toString(),
+            stats_config
+        )
+        ch_versions = ch_versions.mix(REALTIME_STATS_SERVICE.out.versions)
+
+        // Per-batch snapshots are written straight to realtime_batch_stats/
+        // by the service; the channels carry the end-of-session files.
+        def session_meta = [batch_id: 'session']
+        ch_snapshot_stats = Channel.empty()
+        ch_cumulative_stats = REALTIME_STATS_SERVICE.out.cumulative_stats.map { f -> [ session_meta, f ] }
+        ch_realtime_reports = REALTIME_STATS_SERVICE.out.report_data.map { f -> [ session_meta, f ] }
+        ch_alerts = REALTIME_STATS_SERVICE.out.alerts.map { f -> [ session_meta, f ] }
+
+    } else {
+        //
+        // Generate snapshot statistics for each batch
+        //
+        GENERATE_SNAPSHOT_STATS (
+            ch_batches,
+            stats_config
+        )
+        ch_versions = ch_versions.mix(GENERATE_SNAPSHOT_STATS.out.versions)
+
+        //
+        // Update cumulative statistics with each new batch
+        //
+        ch_cumulative_input = GENERATE_SNAPSHOT_STATS.out.snapshot_stats
+            .map { batch_meta, snapshot_stats ->
+                // Prepare input for cumulative update
+                [
+                    batch_meta,
+                    snapshot_stats,
+                    file("${params.outdir}/realtime_stats/cumulative_state.json").exists() ?
+                        file("${params.outdir}/realtime_stats/cumulative_state.json") : []
+                ]
+            }
+
+        UPDATE_CUMULATIVE_STATS (
+            ch_cumulative_input,
+            stats_config
+        )
+        ch_versions = ch_versions.mix(UPDATE_CUMULATIVE_STATS.out.versions)
+
+        //
+        // Generate real-time HTML reports
+        //
+        ch_report_input = GENERATE_SNAPSHOT_STATS.out.snapshot_stats
+            .join(UPDATE_CUMULATIVE_STATS.out.cumulative_stats, by: 0)
+            .map { batch_meta, snapshot_stats, cumulative_stats ->
+                [ batch_meta, snapshot_stats, cumulative_stats ]
+            }
+
+        GENERATE_REALTIME_REPORT (
+            ch_report_input,
+            stats_config
+        )
+        ch_versions = ch_versions.mix(GENERATE_REALTIME_REPORT.out.versions)
 
-    UPDATE_CUMULATIVE_STATS (
-        ch_cumulative_input,
-        stats_config
-    )
-    ch_versions = ch_versions.mix(UPDATE_CUMULATIVE_STATS.out.versions)
-
-    //
-    // Generate real-time HTML reports
-    //
-    ch_report_input = GENERATE_SNAPSHOT_STATS.out.snapshot_stats
-        .join(UPDATE_CUMULATIVE_STATS.out.cumulative_stats, by: 0)
-        .map { batch_meta, snapshot_stats, cumulative_stats ->
-            [ batch_meta, snapshot_stats, cumulative_stats ]
+        // Each task holds only its own history copy, so retention is enforced
+        // on the published directory. Names carry the batch time, so a name
+        // sort is a time sort. A copy whose publish lands after a prune is
+        // caught by the next one.
+        def history_keep = (params.realtime_report_history ?: 0) as int
+        if (history_keep > 0) {
+            GENERATE_REALTIME_REPORT.out.history.subscribe { item ->
+                try {
+                    def history_dir = report_dir.resolve('history')
+                    def snapshots = history_dir.exists() ?
+                        history_dir.listFiles().findAll { it.name.startsWith('report_data_') }.sort { it.name } : []
+                    if (snapshots.size() > history_keep) {
+                        snapshots.take(snapshots.size() - history_keep).each { it.delete() }
+                    }
+                } catch (Exception e) {
+                    log.warn "Realtime report history rotation failed: ${e.message}"
+                }
+            }
         }
 
-    GENERATE_REALTIME_REPORT (
-        ch_report_input,
-        stats_config
-    )
-    ch_versions = ch_versions.mix(GENERATE_REALTIME_REPORT.out.versions)
+        ch_snapshot_stats = GENERATE_SNAPSHOT_STATS.out.snapshot_stats
+        ch_cumulative_stats = UPDATE_CUMULATIVE_STATS.out.cumulative_stats
+        ch_realtime_reports = GENERATE_REALTIME_REPORT.out.data
+        ch_alerts = UPDATE_CUMULATIVE_STATS.out.alerts
+    }
 
     emit:
-    snapshot_stats = GENERATE_SNAPSHOT_STATS.out.snapshot_stats      // channel: [ val(batch_meta), path(snapshot.json) ]
-    cumulative_stats = UPDATE_CUMULATIVE_STATS.out.cumulative_stats  // channel: [ val(batch_meta), path(cumulative.json) ]
-    realtime_reports = GENERATE_REALTIME_REPORT.out.html             // channel: [ val(batch_meta), path(report.html) ]
-    alert_notifications = UPDATE_CUMULATIVE_STATS.out.alerts         // channel: [ val(batch_meta), path(alerts.json) ]
-    versions = ch_versions                                            // channel: [ path(versions.yml) ]
+    snapshot_stats = ch_snapshot_stats        // channel: [ val(batch_meta), path(snapshot.json) ] (empty in service mode)
+    cumulative_stats = ch_cumulative_stats    // channel: [ val(batch_meta), path(cumulative.json) ]
+    realtime_reports = ch_realtime_reports    // channel: [ val(batch_meta), path(report_data.json) ]
+    alert_notifications = ch_alerts           // channel: [ val(batch_meta), path(alerts.json) ]
+    versions = ch_versions                    // channel: [ path(versions.yml) ]
 }
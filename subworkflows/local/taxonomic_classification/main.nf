@@ -19,6 +19,7 @@ include { KRAKEN2_KRAKEN2                } from '../../../modules/nf-core/kraken
 include { KRAKEN2_OPTIMIZED              } from '../../../modules/local/kraken2_optimized/main'
 include { KRAKEN2_INCREMENTAL_CLASSIFIER } from '../../../modules/local/kraken2_incremental_classifier/main'
 include { KRAKEN2_DB_PRELOAD             } from '../../../modules/local/kraken2_db_preload/main'
+include { KRAKEN2_SERVER                 } from '../../../modules/local/kraken2_server/main'
 include { KRAKEN2_OUTPUT_MERGER          } from '../../../modules/local/kraken2_output_merger/main'
 include { KRAKEN2_REPORT_GENERATOR       } from '../../../modules/local/kraken2_report_generator/main'
 include { KRAKEN2_FINAL_AGGREGATOR       } from '../../../modules/local/kraken2_final_aggregator/main'
@@ -161,13 +162,30 @@ workflow TAXONOMIC_CLASSIFICATION {
     // DATABASE PRELOAD: Load hash.k2d into OS page cache before classification
     // When memory-mapping is enabled, all Kraken2 forks share the cached pages.
     // The preloaded db channel ensures classification waits for preload completion.
+    // The preload measures what stayed resident. Low residency is only
+    // logged: without --memory-mapping every fork would load its own copy of
+    // the database, which fits even less where one cached copy did not.
+    // Skipped with --kraken2_server: KRAKEN2_SERVER maps the database and
+    // keeps it resident for the whole session, which covers the preload.
     //
-    if (use_memory_mapping && classifier == 'kraken2') {
+    def use_kraken2_server = params.kraken2_server && classifier == 'kraken2' &&
+        (params.kraken2_enable_incremental || params.realtime_mode)
+    if (use_memory_mapping && classifier == 'kraken2' && !use_kraken2_server) {
         KRAKEN2_DB_PRELOAD(ch_db)
         ch_db_ready = KRAKEN2_DB_PRELOAD.out.db
         ch_versions = ch_versions.mix(KRAKEN2_DB_PRELOAD.out.versions)
+        ch_memory_mapping = KRAKEN2_DB_PRELOAD.out.report
+            .map { report ->
+                def preload = new groovy.json.JsonSlurper().parseText(report.text)
+                if (preload.low_residency) {
+                    log.warn "Kraken2 database preload: ${preload.memory_mapping_reason}"
+                }
+                preload.memory_mapping != false
+            }
+            .first()
     } else {
         ch_db_ready = ch_db
+        ch_memory_mapping = use_memory_mapping
     }
 
     //
@@ -269,10 +287,62 @@ workflow TAXONOMIC_CLASSIFICATION {
                     ch_db_ready,
                     params.save_output_fastqs ?: false,
                     params.save_reads_assignment ?: false,
-                    use_memory_mapping
+                    ch_memory_mapping
                 )
                 ch_versions = ch_versions.mix(KRAKEN2_INCREMENTAL_CLASSIFIER.out.versions)
 
+                //
+                // Feedback batching (--batch_target_latency_seconds): each
+                // batch's classification time goes back to the controller
+                // REALTIME_MONITORING registered, which re-sizes the next
+                // batches from it.
+                //
+                def batch_controller = AdaptiveBatchController.lookup('realtime')
+                if (batch_controller != null) {
+                    KRAKEN2_INCREMENTAL_CLASSIFIER.out.batch_metadata.subscribe { meta, metadata ->
+                        try {
+                            def duration = new groovy.json.JsonSlurper().parseText(metadata.text).duration_seconds
+                            if (duration != null) {
+                                batch_controller.recordCompletion(duration as double)
+                            }
+                        } catch (Exception e) {
+                            log.debug "Adaptive batching: could not read ${metadata}: ${e.message}"
+                        }
+                    }
+                }
+
+                //
+                // MODULE: Warm Kraken2 service (--kraken2_server)
+                // One long-lived task holds the database resident and runs each
+                // batch's kraken2 against it; KRAKEN2_INCREMENTAL_CLASSIFIER
+                // tasks spool their requests and wait for the reply. The
+                // shutdown sentinel is written once every classifier task has
+                // finished, so no request can arrive after it.
+                //
+                if (use_kraken2_server) {
+                    def server_spool = file(params.kraken2_server_spool ?: "${workflow.workDir}/kraken2_server_spool")
+                    server_spool.mkdirs()
+                    def classified = new java.util.concurrent.atomic.AtomicLong(0L)
+                    KRAKEN2_INCREMENTAL_CLASSIFIER.out.versions.subscribe(
+                        onNext: { classified.incrementAndGet() },
+                        onComplete: {
+                            try {
+                                def tmp = server_spool.resolve('.shutdown.json.tmp')
+                                tmp.text = groovy.json.JsonOutput.toJson([expected_requests: classified.get()])
+                                java.nio.file.Files.move(tmp, server_spool.resolve('shutdown.json'), java.nio.file.StandardCopyOption.ATOMIC_MOVE)
+                            } catch (Exception e) {
+                                log.warn "Kraken2 server: failed to write shutdown sentinel: ${e.message}"
+                            }
+                        }
+                    )
+
+                    KRAKEN2_SERVER (
+                        ch_db_ready,
+                        server_spool.toString()
+                    )
+                    ch_versions = ch_versions.mix(KRAKEN2_SERVER.out.versions)
+                }
+
                 //
                 // SCALABLE STREAMING ARCHITECTURE (v1.5+)
                 // Per-sample parallelism with append-only batch storage
@@ -591,7 +661,7 @@ workflow TAXONOMIC_CLASSIFICATION {
                     ch_db_ready,
                     params.save_output_fastqs ?: false,
                     params.save_reads_assignment ?: false,
-                    use_memory_mapping,
+                    ch_memory_mapping,
                     params.kraken2_confidence ?: 0.0,
                     params.kraken2_minimum_hit_groups ?: 0
                 )
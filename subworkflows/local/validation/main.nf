@@ -8,8 +8,15 @@
 
 include { EXTRACT_READS_BY_TAXID        } from '../../../modules/local/extract_reads_by_taxid/main'
 include { BLASTN_VALIDATION             } from '../../../modules/local/blastn_validation/main'
+include { VALIDATION_BLAST_DB           } from '../../../modules/local/validation_blast_db/main'
+include { VALIDATION_MINIMAP2_INDEX     } from '../../../modules/local/validation_minimap2_index/main'
 include { MINIMAP2_VALIDATION           } from '../../../modules/local/minimap2_validation/main'
+include { VALIDATION_COMBINED_REFERENCE } from '../../../modules/local/validation_combined_reference/main'
+include { VALIDATION_MINIMAP2_INDEX as VALIDATION_COMBINED_INDEX } from '../../../modules/local/validation_minimap2_index/main'
+include { MINIMAP2_COMBINED_VALIDATION  } from '../../../modules/local/minimap2_combined_validation/main'
+include { MINIMAP2_COMBINED_SPLIT       } from '../../../modules/local/minimap2_combined_split/main'
 include { CONSENSUS_VALIDATION          } from '../../../modules/local/consensus_validation/main'
+include { CONSENSUS_CUMULATIVE_AGGREGATOR } from '../../../modules/local/consensus_cumulative_aggregator/main'
 include { AGGREGATE_VALIDATION_RESULTS  } from '../../../modules/local/aggregate_validation_results/main'
 include { AGGREGATE_VALIDATION_RESULTS as AGGREGATE_VALIDATION_LIVE } from '../../../modules/local/aggregate_validation_results/main'
 include { CANONICAL_VALIDATION_WRITER  } from '../../../modules/local/canonical_validation_writer/main'
@@ -180,8 +187,40 @@ workflow VALIDATION {
     // N per-taxid process launches with a single parse.
     //
     def reads_floor = Math.max(1, (min_batch_reads_for_validation ?: 1) as int)
-    ch_sample_with_hist = ch_sample_data
-        .map { meta, reads, kraken_output ->
+
+    //
+    // Clade-level extraction (params.validation_include_descendants): reads
+    // assigned to a strain or subspecies below a watched taxon count toward it.
+    // The parentage comes from the batch's own Kraken2 report, so each sample
+    // batch is paired with its report by (sample, batch id) and the report rows
+    // ride along; KreportTree.cladeIndex turns them into one taxid -> watched
+    // taxid map below, which both the gate and EXTRACT_READS_BY_TAXID use. A
+    // batch whose report is missing or unreadable falls back to exact matching
+    // rather than being dropped.
+    //
+    def include_descendants = params.validation_include_descendants as boolean
+    ch_sample_with_report = include_descendants ?
+        ch_sample_data
+            .map { meta, reads, kraken_output -> [ [meta.id, meta.batch_id], meta, reads, kraken_output ] }
+            .join(
+                ch_kraken_reports.map { meta, report -> [ [meta.id, meta.batch_id], report ] },
+                by: [0],
+                remainder: true
+            )
+            .filter { row -> row.size() >= 4 && row[1] != null }
+            .map { row ->
+                def report = row.size() >= 5 ? row[4] : null
+                def rows = KreportTree.reportRows(report)
+                if (rows == null) {
+                    log.warn "Validation: no readable Kraken2 report for sample '${row[1].id}' " +
+                             "batch '${row[1].batch_id}'; extracting exact taxids only for this batch."
+                }
+                [ row[1], row[2], row[3], rows ]
+            } :
+        ch_sample_data.map { meta, reads, kraken_output -> [ meta, reads, kraken_output, null ] }
+
+    ch_sample_with_hist = ch_sample_with_report
+        .map { meta, reads, kraken_output, report_rows ->
             // Exact-taxid read histogram for this batch, matching EXTRACT's rule.
             // null means the assignment file could not be read at all (a work
             // directory the NIO provider cannot reach, a truncated file). That is
@@ -195,47 +234,63 @@ workflow VALIDATION {
                          "Validating every requested taxid for this batch instead " +
                          "of gating on read counts."
             }
-            [ meta, reads, kraken_output, hist ]
+            [ meta, reads, kraken_output, hist, report_rows ]
         }
 
     //
-    // Combine each sample with each taxid that has a genome available, gating on
-    // the per-batch read count, then drop the histogram.
-    // Result: [ meta_with_taxid, reads, kraken_output, taxid, genome ]
+    // Pair each sample with the taxids that have a genome available, gating on
+    // the per-batch read count, then drop the histogram. The genome list is
+    // collected into a single value so each sample batch is combined with the
+    // whole watchlist at once (wrapped in a list so combine appends it as one
+    // element rather than spreading it). In clade mode a taxid's count is the
+    // sum over the histogram entries the subtree index sends to it, which is
+    // exactly what extraction will find.
+    // Result: [ meta, reads, kraken_output, [ [taxid, genome], ... ], clade_index ]
     //
     ch_validation_tasks = ch_sample_with_hist
-        .combine(ch_filtered_genomes)
-        .filter { meta, reads, kraken_output, hist, taxid, genome ->
-            // Fail open when the histogram is unavailable: the gate exists to
-            // avoid scheduling extractions that would find nothing, and being
-            // wrong in that direction only costs CPU, whereas being wrong in the
-            // other direction drops a detection.
-            if (hist == null) {
-                return true
+        .combine(ch_filtered_genomes.toList().map { genomes -> [ genomes ] })
+        .map { meta, reads, kraken_output, hist, report_rows, genomes ->
+            def clade_index = report_rows == null ? [:] :
+                KreportTree.cladeIndex(
+                    KreportTree.parentsFromRows(report_rows),
+                    genomes.collect { taxid, genome -> taxid })
+            def counts = hist
+            if (hist != null && clade_index) {
+                counts = [:]
+                hist.each { t, n ->
+                    def target = clade_index[t] ?: t
+                    counts[target] = (counts[target] ?: 0) + n
+                }
             }
-            def n = (hist[taxid.toString()] ?: 0)
-            def keep = n >= reads_floor
-            if (!keep) {
-                log.debug "Validation gate: sample '${meta.id}' taxid '${taxid}' has ${n} classified read(s) (< ${reads_floor}) -- skipping extraction this batch"
+            def kept = genomes.findAll { taxid, genome ->
+                // Fail open when the histogram is unavailable: the gate exists to
+                // avoid scheduling extractions that would find nothing, and being
+                // wrong in that direction only costs CPU, whereas being wrong in the
+                // other direction drops a detection.
+                if (counts == null) {
+                    return true
+                }
+                def n = (counts[taxid.toString()] ?: 0)
+                def keep = n >= reads_floor
+                if (!keep) {
+                    log.debug "Validation gate: sample '${meta.id}' taxid '${taxid}' has ${n} classified read(s) (< ${reads_floor}) -- skipping extraction this batch"
+                }
+                return keep
             }
-            return keep
-        }
-        .map { meta, reads, kraken_output, hist, taxid, genome ->
-            def new_meta = meta.clone()
-            new_meta.taxid = taxid.toInteger()
-            [ new_meta, reads, kraken_output, taxid, genome ]
+            [ meta, reads, kraken_output, kept, clade_index ]
         }
+        .filter { meta, reads, kraken_output, genomes, clade_index -> !genomes.isEmpty() }
 
     //
     // MODULE: Extract reads classified as each target taxid
-    // Input: combined tuple [ meta, reads, kraken_output, taxid ]
+    // One task per sample batch covering every gated taxid: [ meta, reads, kraken_output, taxids ]
     //
-    ch_extraction_input = ch_validation_tasks.map { meta, reads, kraken_output, taxid, genome ->
-        [ meta, reads, kraken_output, taxid ]
+    ch_extraction_input = ch_validation_tasks.map { meta, reads, kraken_output, genomes, clade_index ->
+        [ meta, reads, kraken_output, genomes.collect { taxid, genome -> taxid }, clade_index ]
     }
 
     EXTRACT_READS_BY_TAXID(ch_extraction_input)
-    // Use .first() to collapse the per-taxid scatter to a single versions
+    // Use .first() to collapse the per-batch scatter to a single versions
     // entry. Do NOT add .ifEmpty([]) -- a skipped process (e.g. a cumulative
     // aggregator in batch mode) would then inject an empty list `[]` into
     // ch_versions, and the nf-core softwareVersionsToYAML helper calls
@@ -243,6 +298,22 @@ workflow VALIDATION {
     // List. An empty channel mixed in contributes nothing, which is correct.
     ch_versions = ch_versions.mix(EXTRACT_READS_BY_TAXID.out.versions.first())
 
+    // Fan the per-sample outputs back out to one [ meta_with_taxid, file ] per
+    // taxid, the shape every downstream validator keys on. The taxid comes
+    // from the output name, <prefix>_taxid<taxid><suffix>.
+    def perTaxid = { meta, files, suffix ->
+        (files instanceof List ? files : [files]).collect { f ->
+            def name = f.name
+            def new_meta = meta.clone()
+            new_meta.taxid = name.substring(name.lastIndexOf('_taxid') + 6, name.length() - suffix.length()).toInteger()
+            [ new_meta, f ]
+        }
+    }
+    ch_extracted_reads = EXTRACT_READS_BY_TAXID.out.reads
+        .flatMap { meta, files -> perTaxid(meta, files, '.fastq.gz') }
+    ch_extraction_stats_by_taxid = EXTRACT_READS_BY_TAXID.out.stats
+        .flatMap { meta, files -> perTaxid(meta, files, '_extraction_stats.json') }
+
     //
     // Prepare validation input by combining extracted reads with genome references
     // Key by meta (which includes taxid) to properly join
@@ -253,11 +324,11 @@ workflow VALIDATION {
     // but a log.warn first records the drop so operators can trace why a
     // sample/taxid validation went missing rather than silently see it
     // disappear from the report.
-    ch_extracted_with_genome = EXTRACT_READS_BY_TAXID.out.reads
+    ch_extracted_with_genome = ch_extracted_reads
         .map { meta, reads -> [ [meta.id, meta.taxid.toString()], meta, reads ] }
         .join(
-            ch_validation_tasks.map { meta, reads, kraken_output, taxid, genome ->
-                [ [meta.id, taxid.toString()], genome ]
+            ch_validation_tasks.flatMap { meta, reads, kraken_output, genomes, clade_index ->
+                genomes.collect { taxid, genome -> [ [meta.id, taxid.toString()], genome ] }
             },
             by: [0],
             remainder: true
@@ -293,6 +364,46 @@ workflow VALIDATION {
         }
         .filter { it != null }
 
+    //
+    // Per-reference databases and indexes, built once per genome ahead of the
+    // batches rather than inside every (sample, batch, taxid) task. Anything
+    // that is not a FASTA is a prebuilt database or index and is passed
+    // through as-is.
+    //
+    ch_genome_references = ch_filtered_genomes
+        .branch { taxid, genome ->
+            fasta: genome.name ==~ /.*\.(fasta|fa|fna)(\.gz)?$/
+            prebuilt: true
+        }
+
+    // Swap the genome in ch_extracted_with_genome for the per-taxid reference
+    // built from it. combine (by taxid) rather than join: one reference serves
+    // every (sample, batch) of its taxid, and combine emits each read set as
+    // soon as its reference exists, so realtime batches are not held back.
+    def withReference = { ch_references ->
+        ch_extracted_with_genome
+            .map { meta, reads, genome -> [ meta.taxid.toString(), meta, reads ] }
+            .combine(ch_references, by: 0)
+            .map { taxid, meta, reads, reference -> [ meta, reads, reference ] }
+    }
+
+    // MINIMAP2_VALIDATION and CONSENSUS_VALIDATION share one .mmi per genome
+    // (built with params.minimap2_preset, the preset both map with), so
+    // neither re-indexes the reference per batch. In combined-reference mode
+    // minimap2 validation uses the watchlist-wide index instead, so the
+    // per-genome one is only needed for consensus.
+    def minimap2_enabled = validation_method == 'minimap2' || validation_method == 'both'
+    def combined_reference = params.validation_combined_reference as boolean
+    ch_minimap2_references = Channel.empty()
+    if ((minimap2_enabled && !combined_reference) || params.generate_consensus) {
+        VALIDATION_MINIMAP2_INDEX(
+            ch_genome_references.fasta,
+            params.minimap2_preset ?: "map-ont"
+        )
+        ch_minimap2_references = withReference(VALIDATION_MINIMAP2_INDEX.out.index.mix(ch_genome_references.prebuilt))
+        ch_versions = ch_versions.mix(VALIDATION_MINIMAP2_INDEX.out.versions.first())
+    }
+
     //
     // MODULE: Run BLAST validation (if enabled)
     //
@@ -300,8 +411,15 @@ workflow VALIDATION {
     ch_blast_results = Channel.empty()
 
     if (validation_method == 'blast' || validation_method == 'both') {
+        // Build each FASTA reference's BLAST database once, ahead of the
+        // batches, instead of gunzip + makeblastdb inside every (sample, batch,
+        // taxid) task. With params.validation_db_cache set the build itself is
+        // skipped for references seen by an earlier run.
+        VALIDATION_BLAST_DB(ch_genome_references.fasta)
+        ch_versions = ch_versions.mix(VALIDATION_BLAST_DB.out.versions.first())
+
         BLASTN_VALIDATION(
-            ch_extracted_with_genome,
+            withReference(VALIDATION_BLAST_DB.out.db.mix(ch_genome_references.prebuilt)),
             params.blast_evalue ?: "1e-10",
             params.blast_perc_identity ?: 90,
             params.blast_max_target_seqs ?: 1,
@@ -319,15 +437,16 @@ workflow VALIDATION {
         // that read is not ordered against the aggregator task writing the same
         // path, so concurrent batches both saw the same prior and the later
         // publish dropped the earlier batch's hits. The ext.when guard plus this
-        // filter keep it a no-op in batch mode.
+        // filter keep it a no-op in batch mode. The batch ids ride along so the
+        // aggregator can fold in only the batches its carried state lacks.
         def blast_batches = new CumulativeBatchAccumulator()
         ch_blast_cumulative_input = BLASTN_VALIDATION.out.results
             .join(BLASTN_VALIDATION.out.stats)
             .filter { meta, tsv, stats -> meta.batch_id != null }
             .map { meta, tsv, stats ->
-                def accumulated = blast_batches.accumulate(
+                def accumulated = blast_batches.accumulateWithIds(
                     "${meta.id}|${meta.taxid}", meta.batch_id, tsv, stats)
-                [ meta, meta.taxid, accumulated[0], accumulated[1] ]
+                [ meta, meta.taxid, accumulated[0], accumulated[1], accumulated[2] ]
             }
         BLAST_CUMULATIVE_AGGREGATOR(ch_blast_cumulative_input, 'blast')
         ch_versions = ch_versions.mix(BLAST_CUMULATIVE_AGGREGATOR.out.versions.first())
@@ -339,28 +458,84 @@ workflow VALIDATION {
     ch_minimap2_stats = Channel.empty()
     ch_minimap2_results = Channel.empty()
 
-    if (validation_method == 'minimap2' || validation_method == 'both') {
+    if (minimap2_enabled) {
+        ch_minimap2_per_taxid = ch_minimap2_references
+        ch_combined_alignments = Channel.empty()
+        ch_combined_stats = Channel.empty()
+
+        if (combined_reference) {
+            // Combined-reference mode: every watchlist genome in one index
+            // (contigs named <taxid>|<contig>), one minimap2 run per (sample,
+            // batch) over all of its extracted reads, and a streaming split
+            // back into the per-taxid PAF + stats MINIMAP2_VALIDATION would
+            // have written, plus a count of reads that map best to another
+            // watchlist genome. Genomes listed as prebuilt indexes cannot be
+            // concatenated and keep the per-taxid path.
+            VALIDATION_COMBINED_REFERENCE(
+                ch_genome_references.fasta
+                    .toSortedList { a, b -> a[0] <=> b[0] }
+                    .filter { genomes -> !genomes.isEmpty() }
+                    .map { genomes -> [ genomes.collect { it[0] }, genomes.collect { it[1] } ] }
+            )
+            VALIDATION_COMBINED_INDEX(
+                VALIDATION_COMBINED_REFERENCE.out.reference,
+                params.minimap2_preset ?: "map-ont"
+            )
+            ch_versions = ch_versions.mix(VALIDATION_COMBINED_REFERENCE.out.versions.first())
+            ch_versions = ch_versions.mix(VALIDATION_COMBINED_INDEX.out.versions.first())
+
+            ch_combined_taxids = ch_genome_references.fasta.map { taxid, genome -> taxid.toString() }.toList()
+            ch_combined_input = EXTRACT_READS_BY_TAXID.out.reads
+                .combine(ch_combined_taxids.map { taxids -> [ taxids ] })
+                .map { meta, files, taxids ->
+                    def own = perTaxid(meta, files, '.fastq.gz')
+                        .findAll { taxid_meta, f -> taxids.contains(taxid_meta.taxid.toString()) }
+                    [ meta, own.collect { taxid_meta, f -> f } ]
+                }
+                .filter { meta, files -> !files.isEmpty() }
+                .combine(VALIDATION_COMBINED_INDEX.out.index.map { key, index -> index })
+
+            MINIMAP2_COMBINED_VALIDATION(ch_combined_input, params.minimap2_preset ?: "map-ont")
+            MINIMAP2_COMBINED_SPLIT(
+                MINIMAP2_COMBINED_VALIDATION.out.alignments,
+                params.minimap2_preset ?: "map-ont",
+                params.minimap2_min_mapq ?: 10,
+                params.validation_hit_rate_threshold ?: 0.5,
+                params.validation_identity_threshold ?: 90.0
+            )
+            ch_versions = ch_versions.mix(MINIMAP2_COMBINED_VALIDATION.out.versions.first())
+            ch_versions = ch_versions.mix(MINIMAP2_COMBINED_SPLIT.out.versions.first())
+
+            ch_combined_alignments = MINIMAP2_COMBINED_SPLIT.out.alignments
+                .flatMap { meta, files -> perTaxid(meta, files, '.paf') }
+            ch_combined_stats = MINIMAP2_COMBINED_SPLIT.out.stats
+                .flatMap { meta, files -> perTaxid(meta, files, '.minimap2_stats.json') }
+            ch_minimap2_per_taxid = withReference(ch_genome_references.prebuilt)
+        }
+
         MINIMAP2_VALIDATION(
-            ch_extracted_with_genome,
+            ch_minimap2_per_taxid,
             params.minimap2_preset ?: "map-ont",
             params.minimap2_min_mapq ?: 10,
             params.validation_hit_rate_threshold ?: 0.5,
             params.validation_identity_threshold ?: 90.0
         )
-        ch_minimap2_stats = MINIMAP2_VALIDATION.out.stats.map { meta, stats -> stats }.ifEmpty([])
-        ch_minimap2_results = MINIMAP2_VALIDATION.out.alignments.ifEmpty([])
         ch_versions = ch_versions.mix(MINIMAP2_VALIDATION.out.versions.first())
+        ch_minimap2_alignments = MINIMAP2_VALIDATION.out.alignments.mix(ch_combined_alignments)
+        ch_minimap2_stats_by_taxid = MINIMAP2_VALIDATION.out.stats.mix(ch_combined_stats)
+        ch_minimap2_stats = ch_minimap2_stats_by_taxid.map { meta, stats -> stats }.ifEmpty([])
+        ch_minimap2_results = ch_minimap2_alignments.ifEmpty([])
 
         // Realtime only: maintain a run-so-far cumulative PAF + stats per
         // (sample, taxid). See the BLAST branch above for the rationale.
         def minimap2_batches = new CumulativeBatchAccumulator()
-        ch_minimap2_cumulative_input = MINIMAP2_VALIDATION.out.alignments
-            .join(MINIMAP2_VALIDATION.out.stats)
+        ch_minimap2_cumulative_input = ch_minimap2_alignments
+            .join(ch_minimap2_stats_by_taxid)
             .filter { meta, paf, stats -> meta.batch_id != null }
             .map { meta, paf, stats ->
-                def accumulated = minimap2_batches.accumulate(
+                def accumulated = minimap2_batches.accumulateWithIds(
                     "${meta.id}|${meta.taxid}", meta.batch_id, paf, stats)
-                [ meta, meta.taxid, accumulated[0], accumulated[1] ]
+                [ meta, meta.taxid, accumulated[0], accumulated[1], accumulated[2] ]
             }
         MINIMAP2_CUMULATIVE_AGGREGATOR(ch_minimap2_cumulative_input, 'minimap2')
         ch_versions = ch_versions.mix(MINIMAP2_CUMULATIVE_AGGREGATOR.out.versions.first())
@@ -370,26 +545,41 @@ workflow VALIDATION {
     // MODULE: Generate a consensus sequence per (sample, taxid) from read
     // mapping. Opt-in via params.generate_consensus, independent of
     // validation_method so it can run alongside BLAST-only or minimap2-only
-    // validation. Reuses ch_extracted_with_genome ([meta, reads, genome]).
+    // validation. Maps against the shared .mmi ([meta, reads, index]).
     //
     ch_consensus = Channel.empty()
     ch_consensus_stats = Channel.empty()
 
     if (params.generate_consensus) {
         CONSENSUS_VALIDATION(
-            ch_extracted_with_genome,
+            ch_minimap2_references,
             params.minimap2_preset ?: "map-ont",
             params.consensus_min_depth ?: 10
         )
         ch_consensus = CONSENSUS_VALIDATION.out.consensus
         ch_consensus_stats = CONSENSUS_VALIDATION.out.stats
         ch_versions = ch_versions.mix(CONSENSUS_VALIDATION.out.versions.first())
+
+        // Realtime only: a run-so-far consensus per (sample, taxid), called
+        // from base counts accumulated over every batch's alignments. See the
+        // BLAST branch above for why the batch set travels in the channel.
+        def consensus_batches = new CumulativeBatchAccumulator()
+        ch_consensus_cumulative_input = CONSENSUS_VALIDATION.out.alignments
+            .join(CONSENSUS_VALIDATION.out.stats)
+            .filter { meta, alignments, stats -> meta.batch_id != null }
+            .map { meta, alignments, stats ->
+                def accumulated = consensus_batches.accumulateWithIds(
+                    "${meta.id}|${meta.taxid}", meta.batch_id, alignments, stats)
+                [ meta, meta.taxid, accumulated[0], accumulated[1], accumulated[2] ]
+            }
+        CONSENSUS_CUMULATIVE_AGGREGATOR(ch_consensus_cumulative_input, params.consensus_min_depth ?: 10)
+        ch_versions = ch_versions.mix(CONSENSUS_CUMULATIVE_AGGREGATOR.out.versions.first())
     }
 
     //
     // MODULE: Aggregate all validation results into Nanometa Live JSON format
     //
-    ch_extraction_stats = EXTRACT_READS_BY_TAXID.out.stats.map { meta, stats -> stats }
+    ch_extraction_stats = ch_extraction_stats_by_taxid.map { meta, stats -> stats }
 
     // Collect Kraken2 reports for species name lookup
     ch_kraken_report_files = ch_kraken_reports.map { meta, report -> report }
@@ -520,12 +710,11 @@ workflow VALIDATION {
                 // batch report during the run, and the end-of-session cumulative
                 // one, which lands under its own key and so is never overwritten.
                 //
-                // The cost: mid-run, a taxon detected in an earlier batch and
-                // absent from the current one resolves no species name from the
-                // reports. params.validation_taxon_names is the authoritative
-                // seed for exactly this (Nanometa Live always writes it), and
-                // the end-of-session aggregation gets the complete cumulative
-                // report, so the artifact that lasts is fully named.
+                // Dropping the older reports loses no names: the live
+                // aggregator keeps a taxid -> species map in its carried-forward
+                // state (ext.state_dir), so a taxon named by an earlier batch's
+                // report stays named. params.validation_taxon_names remains the
+                // authoritative seed (Nanometa Live always writes it).
                 ch_kraken_reports
                     .map { meta, r ->
                         [ ValidationSnapshotAccumulator.krakenKey(meta.id, meta.batch_id), r, true ]
@@ -600,7 +789,7 @@ workflow VALIDATION {
     emit:
     validation_json        = ch_validation_json                         // path: validation_results.json
     validation_summary     = ch_validation_summary                      // path: validation_summary.tsv
-    extraction_stats       = EXTRACT_READS_BY_TAXID.out.stats           // channel: [ val(meta), path(json) ]
+    extraction_stats       = ch_extraction_stats_by_taxid               // channel: [ val(meta), path(json) ]
     blast_results          = ch_blast_results                           // channel: [ val(meta), path(tsv) ]
     minimap2_results       = ch_minimap2_results                        // channel: [ val(meta), path(paf) ]
     consensus              = ch_consensus                               // channel: [ val(meta), path(fasta) ]
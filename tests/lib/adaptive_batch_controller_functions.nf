@@ -0,0 +1,41 @@
+/*
+ * Thin wrapper for testing AdaptiveBatchController via nf-test.
+ * The class is auto-loaded from lib/ by Nextflow.
+ *
+ * Replays a timeline through ONE controller on a fake clock and returns the
+ * batch size after each event, the recorded decisions and the final snapshot.
+ * Events (times in seconds):
+ *   ['arrive', t]              one file reaches the batcher at t
+ *   ['emit', n]                a batch of n files leaves the batcher
+ *   ['complete', t, seconds]   a classification finishes at t after `seconds`
+ */
+
+def replayBatchController(Map config, List events) {
+    long now = 0L
+    def controller = new AdaptiveBatchController(
+        config.initial as int, config.min as int, config.max as int,
+        config.target as double, (config.parallelism ?: 1) as int
+    )
+    controller.clock = { now }
+    def sizes = events.collect { event ->
+        switch (event[0]) {
+            case 'arrive':
+                now = (long) (event[1] * 1000)
+                controller.recordArrival()
+                break
+            case 'emit':
+                controller.recordEmit(event[1] as int)
+                break
+            case 'complete':
+                now = (long) (event[1] * 1000)
+                controller.recordCompletion(event[2] as double)
+                break
+        }
+        controller.batchSize()
+    }
+    return [
+        sizes    : sizes,
+        decisions: controller.recentDecisions().collect { [from: it.from, to: it.to] },
+        snapshot : controller.snapshot(),
+    ]
+}
@@ -3,6 +3,9 @@
  * The BatchUtils class is auto-loaded from lib/ by Nextflow.
  */
 
+import groovyx.gpars.dataflow.DataflowQueue
+import groovyx.gpars.dataflow.operator.PoisonPill
+
 def interleaveFilesByParentDir(List files) {
     return BatchUtils.interleaveFilesByParentDir(files)
 }
@@ -10,3 +13,21 @@ def interleaveFilesByParentDir(List files) {
 def exactTaxidReadCounts(Object krakenOutput) {
     return BatchUtils.exactTaxidReadCounts(krakenOutput)
 }
+
+/*
+ * Feed `sizes` (each item is its own size in bytes) through the byte-budget
+ * batcher, with no timeout, and return the batches it emits.
+ */
+def batchesByBytes(List sizes, long batchBytes) {
+    def input = new DataflowQueue()
+    sizes.each { input.bind(it) }
+    input.bind(PoisonPill.instance)
+    def output = BatchUtils.batchWithTimeout(input, 1000, 0, [batchBytes: batchBytes, sizeOf: { it as long }])
+    def batches = []
+    def batch = output.getVal()
+    while (!(batch instanceof PoisonPill)) {
+        batches << batch
+        batch = output.getVal()
+    }
+    return batches
+}
@@ -5,10 +5,16 @@
  * Replays an ordered list of [key, batchId, resultFile, statsFile] events
  * through one accumulator instance and returns the [results, stats] set it
  * reported after each, so a test can assert the exact accumulation sequence
- * the realtime validation aggregator is fed.
+ * the realtime validation aggregator is fed. ``accumulateSequenceWithIds``
+ * does the same through ``accumulateWithIds``.
  */
 
 def accumulateSequence(List events) {
     def acc = new CumulativeBatchAccumulator()
     return events.collect { e -> acc.accumulate(e[0], e[1], e[2], e[3]) }
 }
+
+def accumulateSequenceWithIds(List events) {
+    def acc = new CumulativeBatchAccumulator()
+    return events.collect { e -> acc.accumulateWithIds(e[0], e[1], e[2], e[3]) }
+}
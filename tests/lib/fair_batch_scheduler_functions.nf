@@ -0,0 +1,25 @@
+/*
+ * Thin wrapper for testing FairBatchScheduler via nf-test.
+ * The class is auto-loaded from lib/ by Nextflow.
+ *
+ * Replays enqueues and drains through ONE scheduler and returns, per drain,
+ * the released batches as "key:bytes" -- so a test can assert the weighted
+ * deficit round robin order directly.
+ * Events:
+ *   ['enqueue', key, bytes]   one batch of `bytes` for barcode `key`
+ *   ['drain']                 release everything waiting
+ */
+
+def fairBatchOrder(Map config, List events) {
+    def weights = config.weights ?: [:]
+    def scheduler = new FairBatchScheduler({ key -> weights[key] ?: 1 }, (config.quantum ?: 0L) as long)
+    def drains = []
+    events.each { event ->
+        if (event[0] == 'enqueue') {
+            scheduler.enqueue(event[1] as String, [event[1]], event[2] as long)
+        } else {
+            drains << scheduler.drain().collect { "${it.key}:${it.bytes}".toString() }
+        }
+    }
+    return [drains: drains, pending: scheduler.pending(), served: scheduler.served()]
+}
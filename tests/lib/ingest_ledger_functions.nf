@@ -0,0 +1,54 @@
+/*
+ * Thin wrapper for testing IngestLedger via nf-test.
+ * The class is auto-loaded from lib/ by Nextflow.
+ *
+ * Forms a batch in a fresh ledger and (unless the scenario is a crash)
+ * marks it done, then reopens the ledger the way a restarted run would and
+ * reports which files it would skip.
+ */
+
+import java.nio.file.Files
+
+def ledgerRestart(String scenario) {
+    def dir = Files.createTempDirectory('ingest_ledger_test')
+    def a = dir.resolve('barcode01/a.fastq')
+    def b = dir.resolve('barcode01/b.fastq')
+    Files.createDirectories(a.parent)
+    a.text = '@r1\nACGT\n+\nIIII\n'
+    b.text = '@r2\nGGCCTT\n+\nIIIIII\n'
+    def ledger_path = dir.resolve('pipeline_info/ingest_ledger.tsv')
+
+    def first = new IngestLedger(ledger_path)
+    def claimed = [first.claim(a), first.claim(a)]
+    first.formed([a], 'batch_1')
+    def pending = first.pendingCount()
+    if (scenario != 'crashed') {
+        first.done(a)
+    }
+
+    switch (scenario) {
+        case 'appended':
+            a.text = a.text + '@r3\nTT\n+\nII\n'
+            break
+        case 'moved':
+            def moved = dir.resolve('barcode01/renamed.fastq')
+            Files.move(a, moved)
+            a = moved
+            break
+    }
+
+    def restarted = new IngestLedger(ledger_path)
+    return [
+        claimed_first_run: claimed,
+        pending_formed   : pending,
+        loaded           : restarted.loadedCount(),
+        unfinished       : restarted.unfinishedCount(),
+        skips_recorded   : restarted.contains(a),
+        skips_new        : restarted.contains(b),
+        ledger_lines     : ledger_path.readLines().size(),
+        batch_id         : ledger_path.readLines().last().split('\t')[4],
+        last_state       : ledger_path.readLines().last().split('\t')[6],
+        // Last: claim() remembers what it lets through.
+        claims_recorded  : restarted.claim(a),
+    ]
+}
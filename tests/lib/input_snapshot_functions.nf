@@ -0,0 +1,52 @@
+/*
+ * Thin wrapper functions for testing InputSnapshot via nf-test.
+ * The class is auto-loaded from lib/ by Nextflow.
+ */
+
+import java.nio.file.Files
+import java.nio.file.attribute.FileTime
+
+def snapshotSummary(String dirPath, String regex = null) {
+    def snapshot = InputSnapshot.scan(dirPath, null, regex, null)
+    return [
+        structure: snapshot.structure(),
+        barcodes : snapshot.barcodeGroups().keySet() as List,
+        samples  : snapshot.sampleGroups().keySet() as List,
+        files    : snapshot.fileCount(),
+    ]
+}
+
+/*
+ * Scan a temporary barcode tree with a cache, add a file to barcode02 and
+ * scan again: only the changed directory should be listed the second time.
+ * Directory mtimes are set explicitly so the test does not depend on the
+ * filesystem's timestamp granularity.
+ */
+def rescanAfterChange() {
+    def dir = Files.createTempDirectory('input_snapshot_test')
+    def cache = dir.resolve('cache/snapshot.json')
+    def input = dir.resolve('input')
+    Files.createDirectories(input.resolve('barcode01'))
+    Files.createDirectories(input.resolve('barcode02'))
+    input.resolve('barcode01/a.fastq').text = '@r1\nACGT\n+\nIIII\n'
+    input.resolve('barcode02/b.fastq').text = '@r2\nACGT\n+\nIIII\n'
+    input.resolve('barcode02/._b.fastq').text = 'AppleDouble'
+    long now = System.currentTimeMillis()
+    [input, input.resolve('barcode01'), input.resolve('barcode02')].each {
+        Files.setLastModifiedTime(it, FileTime.fromMillis(now - 60000L))
+    }
+
+    def first = InputSnapshot.scan(input, cache)
+
+    input.resolve('barcode02/c.fastq').text = '@r3\nACGT\n+\nIIII\n'
+    Files.setLastModifiedTime(input.resolve('barcode02'), FileTime.fromMillis(now - 30000L))
+
+    def second = InputSnapshot.scan(input, cache)
+    return [
+        first_listed : first.listedCount(),
+        second_listed: second.listedCount(),
+        second_reused: second.reusedCount(),
+        groups       : second.barcodeGroups().collectEntries { k, v -> [(k): v.collect { it.tokenize('/').last() }] },
+        cached       : Files.exists(cache),
+    ]
+}
@@ -45,3 +45,10 @@ def reportRoundTrip(List reports) {
     def emittedRows = order.collect { taxid -> [taxid, merged[taxid].name] }
     return [ order, KreportTree.parentsFromRows(emittedRows), sourceParents ]
 }
+
+/*
+ * Subtree index over one report: rows as [taxid, name] in report order.
+ */
+def cladeIndexOf(List rows, List watched) {
+    return KreportTree.cladeIndex(KreportTree.parentsFromRows(rows), watched)
+}
@@ -474,6 +474,21 @@ workflow NANOMETANF {
         }
     }
 
+    //
+    // Ingest ledger (--ingest_ledger, realtime): a file is done once its
+    // batch is classified -- or, with no classification, has left QC -- and
+    // only done files are skipped by a restart. A batch that fails or is cut
+    // off by a crash stays 'formed', and the next run admits its files again.
+    //
+    def ingest_ledger = IngestLedger.lookup('realtime')
+    if (ingest_ledger != null) {
+        def classifies_batches = params.kraken2_db && !params.skip_kraken2 && (params.classifier ?: 'kraken2') == 'kraken2'
+        def ch_ingest_done = classifies_batches ? TAXONOMIC_CLASSIFICATION.out.batch_reports : ch_qc_reads
+        ch_ingest_done
+            .filter { it instanceof List && it.size() >= 2 && it[0] instanceof Map }
+            .subscribe { item -> ingest_ledger.done(item[0].ingest_file) }
+    }
+
     //
     // MODULE: Write canonical run manifest
     // Collects tool identity and sample list for frontend discovery
@@ -647,10 +662,21 @@ workflow NANOMETANF {
         // skipped (skip_fastp + skip_nanoplot) QC_ANALYSIS is never invoked, so
         // referencing QC_ANALYSIS.out here aborts the run with "Access to
         // 'QC_ANALYSIS.out' is undefined".
+        //
+        // Only the latest stats file per sample is reported, so pick it here
+        // from the metadata rather than staging every per-batch file of a long
+        // realtime run. Latest is the highest batch_time (a sortable
+        // yyyy-MM-dd_HH-mm-ss stamp), then the later emission: the sort is
+        // stable, so emission order holds within one stamp.
         ch_stats_files = ch_qc_json
             .filter { it instanceof List && it.size() >= 2 && it[1] != null }
-            .map { meta, stats_file -> stats_file }
-            .collect()
+            .collect(flat: false)
+            .map { items ->
+                def latest = [:]
+                items.sort(false) { item -> (item[0]?.batch_time ?: '') as String }
+                    .each { meta, stats_file -> latest[meta?.id ?: stats_file.baseName] = stats_file }
+                latest.values().toList()
+            }
 
         MULTIQC_NANOPORE_STATS (
             ch_stats_files,